@@ -3,7 +3,27 @@ Módulo de funções auxiliares para estatísticas ponderadas no contexto do PIS
 """
 
 import numpy as np
-from typing import Iterable
+import pandas as pd
+from typing import Callable, Dict, Iterable, Optional, Sequence, Union
+
+
+QUARTIL_LABELS = ["Q1 (mais vulnerável)", "Q2", "Q3", "Q4 (mais favorecido)"]
+
+SCHOOL_PROFILE_MEASURES: Dict[str, str] = {
+    "read_mean_w": "READ",
+    "math_mean_w": "MATH",
+    "science_mean_w": "SCIENCE",
+    "escs_mean_w": "ESCS",
+    "disclima_mean_w": "DISCLIMA",
+    "belong_mean_w": "BELONG",
+}
+
+QUARTIL_MEASURES: Dict[str, str] = {
+    "READ_medio": "READ",
+    "DISCLIMA_medio": "DISCLIMA",
+    "BELONG_medio": "BELONG",
+    "clima_escola_medio": "disclima_mean_w",
+}
 
 
 def wavg(x: Iterable[float], w: Iterable[float]) -> float:
@@ -17,9 +37,99 @@ def wavg(x: Iterable[float], w: Iterable[float]) -> float:
         - x: variável de interesse (ex.: proficiência, índice, escala)
         - w: coluna de pesos (ex.: SENWT), já filtrada para o grupo/escola desejado
 
+    Com x ou w em float32 (modo de armazenamento `pisa_precision`), a soma é
+    feita em blocos float64 com compensação (`pisa_precision.wmean`).
+
     Retorna
     -------
     float
         Média ponderada de x.
     """
-    return float(np.average(x, weights=w))
+    xa, wa = np.asarray(x), np.asarray(w)
+    if xa.dtype == np.float32 or wa.dtype == np.float32:
+        import pisa_precision
+        return float(pisa_precision.wmean(xa, wa))
+    return float(np.average(xa, weights=wa))
+
+
+def wmeans_by(df: pd.DataFrame,
+              by,
+              weight: str,
+              measures: Dict[str, str],
+              count_name: Optional[str] = "n") -> pd.DataFrame:
+    """
+    Médias ponderadas de várias colunas por grupo, sem `apply` (somas vetorizadas).
+
+    `measures` mapeia nome de saída -> coluna. Cada média usa só as linhas em que
+    a coluna e o peso estão presentes (mesma regra de `$avg`/`$sum` no MongoDB);
+    sem valores ausentes, o resultado é idêntico a `wavg` por grupo.
+    """
+    w = df[weight].astype(float)
+    parts = {}
+    for out, col in measures.items():
+        x = df[col].astype(float)
+        ok = x.notna() & w.notna()
+        parts[f"{out}__sw"] = w.where(ok, 0.0)
+        parts[f"{out}__swx"] = (w * x).where(ok, 0.0)
+    keys = [df[k] for k in ([by] if isinstance(by, str) else by)]
+    sums = pd.DataFrame(parts, index=df.index).groupby(keys, observed=True, sort=True).sum()
+
+    out = pd.DataFrame(index=sums.index)
+    if count_name:
+        out[count_name] = df.groupby(keys, observed=True, sort=True).size()
+    for name in measures:
+        sw = sums[f"{name}__sw"]
+        out[name] = (sums[f"{name}__swx"] / sw).where(sw > 0)
+    return out.reset_index()
+
+
+def school_profile(df: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+                   school: str = "CNTSCHID",
+                   weight: str = "SENWT",
+                   measures: Optional[Dict[str, str]] = None,
+                   **ooc) -> pd.DataFrame:
+    """
+    Perfil ponderado por escola (mesmas colunas da célula `school_profile` do notebook).
+
+    Com um iterável de blocos em vez de DataFrame, agrega fora da memória
+    (`pisa_groupby.aggregate`; `ooc` repassa `max_groups`, `spill_dir`...).
+    """
+    measures = measures or SCHOOL_PROFILE_MEASURES
+    if not isinstance(df, pd.DataFrame):
+        import pisa_groupby
+        return pisa_groupby.aggregate(df, school, weight, measures, count_name="n_students", **ooc)
+    return wmeans_by(df, school, weight, measures, count_name="n_students")
+
+
+def quartil_summary(df: Union[pd.DataFrame, Callable[[], Iterable[pd.DataFrame]]],
+                    var: str = "ESCS",
+                    weight: str = "SENWT",
+                    measures: Optional[Dict[str, str]] = None,
+                    labels: Sequence[str] = QUARTIL_LABELS,
+                    label_name: str = "escs_quartil",
+                    weighted: bool = True,
+                    **ooc) -> pd.DataFrame:
+    """
+    Resumo ponderado por quartil de `var` (tabela `quartil_summary` do notebook).
+
+    Descarta linhas com ausentes em `var`, no peso ou nas medidas; quartis pelos
+    quantis ponderados por `weight` (`pisa_bins`, cada faixa com ~1/k da população
+    expandida) ou, com `weighted=False`, via `pd.qcut` (quantis não ponderados, o
+    método antigo do notebook). `df` também pode ser uma função que devolve blocos
+    novos a cada chamada (duas passadas fora da memória, `pisa_groupby.quartil_summary`).
+    """
+    measures = measures or QUARTIL_MEASURES
+    if callable(df):
+        import pisa_groupby
+        return pisa_groupby.quartil_summary(df, var, weight, measures, labels, label_name,
+                                            weighted=weighted, **ooc)
+    base = df.dropna(subset=[var, weight, *measures.values()])
+    if weighted:
+        import pisa_bins
+        q = pisa_bins.assign_bins(base, var, weight, labels, label_name=label_name)
+    else:
+        q = pd.qcut(base[var], q=len(labels), labels=list(labels)).rename(label_name)
+    out = wmeans_by(base.assign(**{label_name: q}), label_name, weight, measures, count_name="n_alunos")
+    peso = base.groupby(q, observed=True)[weight].sum()
+    out.insert(2, "peso_expandido", peso.to_numpy())
+    return out
@@ -6,16 +6,219 @@ Ferramentas para inspecionar variáveis categóricas em DataFrames pandas.
 Uso básico:
     from eda_categoricas import resumo_categoricas
     resumo_categoricas(df)
+
+Modo de perfil em uma passada (contadores somáveis, aceita blocos):
+    from exploratory import perfil_categoricas, resumo_categoricas
+    perfil = perfil_categoricas(pd.read_csv("STU.csv", chunksize=100_000), limite_exato=5_000)
+    perfil.to_frame()                       # níveis, missing, distintos (HLL quando aproximado)
+    resumo_categoricas(df, modo="aproximado")
 """
 
+from typing import Dict, Iterable, Optional, Union
+
+import numpy as np
 import pandas as pd
 
 
+# ------------------------------- Esboços somáveis -------------------------------
+
+class HyperLogLog:
+    """
+    Estimador HyperLogLog de distintos (2**p registradores, erro ~1.04/sqrt(2**p)).
+    Somável: `merge` toma o máximo registrador a registrador.
+    """
+
+    def __init__(self, p: int = 14) -> None:
+        self.p = p
+        self.m = 1 << p
+        self.reg = np.zeros(self.m, dtype=np.uint8)
+
+    def add(self, s: pd.Series) -> None:
+        s = s.dropna()
+        if s.empty:
+            return
+        h = pd.util.hash_pandas_object(s.astype(str), index=False).to_numpy(dtype=np.uint64)
+        idx = (h >> np.uint64(64 - self.p)).astype(np.int64)
+        w = (h << np.uint64(self.p)) | np.uint64((1 << self.p) - 1)  # sentinela evita w == 0
+        # posição do primeiro bit 1 (contando a partir do mais significativo) + 1
+        rank = (64 - np.floor(np.log2(w.astype(np.float64))).astype(np.int64)).astype(np.uint8)
+        np.maximum.at(self.reg, idx, rank)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        np.maximum(self.reg, other.reg, out=self.reg)
+        return self
+
+    def estimate(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        est = alpha * m * m / np.sum(np.ldexp(1.0, -self.reg.astype(np.int64)))
+        zeros = int((self.reg == 0).sum())
+        if est <= 2.5 * m and zeros:
+            est = m * np.log(m / zeros)  # correção para cardinalidades pequenas
+        return int(round(est))
+
+
+class TopK:
+    """
+    Resumo Misra–Gries com `capacidade` contadores: contagens são limites inferiores
+    com erro máximo `erro`; qualquer nível com frequência > erro está presente.
+    """
+
+    def __init__(self, capacidade: int = 100) -> None:
+        self.capacidade = capacidade
+        self.contagens = pd.Series(dtype="int64")
+        self.erro = 0
+
+    def _podar(self) -> None:
+        if len(self.contagens) > self.capacidade:
+            c = self.contagens.sort_values(ascending=False)
+            corte = int(c.iloc[self.capacidade])
+            self.erro += corte
+            c = c.iloc[: self.capacidade] - corte
+            self.contagens = c[c > 0]
+
+    def add_counts(self, vc: pd.Series) -> None:
+        self.contagens = self.contagens.add(vc, fill_value=0).astype("int64")
+        self._podar()
+
+    def merge(self, other: "TopK") -> "TopK":
+        self.erro += other.erro
+        self.add_counts(other.contagens)
+        return self
+
+    def top(self, k: int) -> pd.Series:
+        return self.contagens.sort_values(ascending=False).head(k)
+
+
+# ------------------------------- Perfil em uma passada -------------------------------
+
+class PerfilColuna:
+    """Contadores de uma coluna: exatos até `limite_exato` níveis, depois HLL + top-k."""
+
+    def __init__(self, limite_exato: int = 10_000, capacidade_topk: int = 200, hll_p: int = 14) -> None:
+        self.limite_exato = limite_exato
+        self.capacidade_topk = capacidade_topk
+        self.hll_p = hll_p
+        self.n = 0
+        self.missing = 0
+        self.contagens: Optional[pd.Series] = pd.Series(dtype="int64")
+        self.hll: Optional[HyperLogLog] = None
+        self.topk: Optional[TopK] = None
+
+    @property
+    def aproximado(self) -> bool:
+        return self.contagens is None
+
+    def _para_esboco(self) -> None:
+        self.hll = HyperLogLog(self.hll_p)
+        self.hll.add(pd.Series(self.contagens.index))
+        self.topk = TopK(self.capacidade_topk)
+        self.topk.add_counts(self.contagens)
+        self.contagens = None
+
+    def add(self, s: pd.Series) -> None:
+        # uma varredura: value_counts(dropna=False) dá níveis, missing e distintos;
+        # em dtype category ele lista também as categorias não observadas (contagem 0)
+        vc = s.value_counts(dropna=False, sort=False)
+        na = vc.index.isna()
+        self.n += len(s)
+        self.missing += int(vc[na].sum())
+        vc = vc[~na & (vc.to_numpy() > 0)].astype("int64")
+        if self.contagens is not None:
+            self.contagens = self.contagens.add(vc, fill_value=0).astype("int64")
+            if len(self.contagens) > self.limite_exato:
+                self._para_esboco()
+        else:
+            self.hll.add(pd.Series(vc.index))
+            self.topk.add_counts(vc)
+
+    def merge(self, other: "PerfilColuna") -> "PerfilColuna":
+        self.n += other.n
+        self.missing += other.missing
+        if self.contagens is not None and other.contagens is not None:
+            self.contagens = self.contagens.add(other.contagens, fill_value=0).astype("int64")
+            if len(self.contagens) > self.limite_exato:
+                self._para_esboco()
+            return self
+        if self.contagens is not None:
+            self._para_esboco()
+        if other.contagens is not None:
+            self.hll.add(pd.Series(other.contagens.index))
+            self.topk.add_counts(other.contagens)
+        else:
+            self.hll.merge(other.hll)
+            self.topk.merge(other.topk)
+        return self
+
+    def distintos(self) -> int:
+        return len(self.contagens) if self.contagens is not None else self.hll.estimate()
+
+    def top(self, k: int) -> pd.Series:
+        if self.contagens is not None:
+            return self.contagens.sort_values(ascending=False).head(k)
+        return self.topk.top(k)
+
+
+class PerfilCategoricas:
+    """Perfis somáveis de todas as colunas categóricas (um `PerfilColuna` por coluna)."""
+
+    def __init__(self, incluir_tipos=("object", "category"), **opcoes) -> None:
+        self.incluir_tipos = tuple(incluir_tipos)
+        self.opcoes = opcoes
+        self.colunas: Dict[str, PerfilColuna] = {}
+
+    def add(self, df: pd.DataFrame) -> "PerfilCategoricas":
+        for col in df.select_dtypes(include=list(self.incluir_tipos)).columns:
+            if col not in self.colunas:
+                self.colunas[col] = PerfilColuna(**self.opcoes)
+            self.colunas[col].add(df[col])
+        return self
+
+    def merge(self, other: "PerfilCategoricas") -> "PerfilCategoricas":
+        for col, p in other.colunas.items():
+            if col in self.colunas:
+                self.colunas[col].merge(p)
+            else:
+                self.colunas[col] = p
+        return self
+
+    def to_frame(self, max_levels: int = 10) -> pd.DataFrame:
+        linhas = []
+        for col, p in self.colunas.items():
+            top = p.top(max_levels)
+            linhas.append({
+                "variavel": col, "n": p.n, "missing": p.missing, "niveis": p.distintos(),
+                "aproximado": p.aproximado, "top": {str(k): int(v) for k, v in top.items()},
+            })
+        return pd.DataFrame(linhas, columns=["variavel", "n", "missing", "niveis", "aproximado", "top"])
+
+
+def perfil_categoricas(
+    dados: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+    incluir_tipos=("object", "category"),
+    limite_exato: int = 10_000,
+    capacidade_topk: int = 200,
+    hll_p: int = 14,
+) -> PerfilCategoricas:
+    """
+    Perfil das categóricas em uma passada por bloco. `dados` pode ser um DataFrame
+    ou um iterável de blocos (ex.: `pd.read_csv(..., chunksize=...)`); colunas com
+    mais de `limite_exato` níveis passam a usar HyperLogLog + top-k.
+    """
+    perfil = PerfilCategoricas(incluir_tipos, limite_exato=limite_exato,
+                               capacidade_topk=capacidade_topk, hll_p=hll_p)
+    for bloco in ([dados] if isinstance(dados, pd.DataFrame) else dados):
+        perfil.add(bloco)
+    return perfil
+
+
 def resumo_categoricas(
-    df: pd.DataFrame,
+    df: Union[pd.DataFrame, Iterable[pd.DataFrame]],
     max_levels: int = 10,
     mostrar_missing: bool = True,
     incluir_tipos=("object", "category"),
+    modo: str = "exato",
+    limite_exato: int = 10_000,
 ) -> None:
     """
     Imprime um resumo legível das variáveis categóricas do DataFrame.
@@ -36,8 +239,15 @@ def resumo_categoricas(
         Se True, mostra explícito o nível <NaN> quando existir.
     incluir_tipos : tuple, opcional
         Tipos considerados categóricos (default: ("object", "category")).
+    modo : {"exato", "aproximado"}, opcional
+        "aproximado" usa HyperLogLog/top-k nas colunas com mais de `limite_exato`
+        níveis. Com blocos (iterável de DataFrames) os contadores são somados.
     """
-    cat_cols = df.select_dtypes(include=list(incluir_tipos)).columns
+    if modo not in ("exato", "aproximado"):
+        raise ValueError("modo deve ser 'exato' ou 'aproximado'.")
+    limite = limite_exato if modo == "aproximado" else np.iinfo(np.int64).max
+    perfil = perfil_categoricas(df, incluir_tipos=incluir_tipos, limite_exato=limite)
+    cat_cols = list(perfil.colunas)
 
     if len(cat_cols) == 0:
         print("Nenhuma variável categórica encontrada.")
@@ -45,19 +255,22 @@ def resumo_categoricas(
 
     print("Variáveis categóricas:", ", ".join(cat_cols), "\n")
 
-    n = len(df)
-
     for col in cat_cols:
-        vc = df[col].value_counts(dropna=False)
-        missing_count = df[col].isna().sum()
-        n_categorias = df[col].nunique(dropna=True)
+        p = perfil.colunas[col]
+        n = p.n
+        missing_count = p.missing
+        n_categorias = p.distintos()
+        marca = "~" if p.aproximado else ""
 
-        print(f"[{col}]  (níveis: {n_categorias}, missing: {missing_count})")
+        print(f"[{col}]  (níveis: {marca}{n_categorias}, missing: {missing_count})")
 
-        vc_ordenado = vc.sort_values(ascending=False)
+        vc_ordenado = p.top(len(p.contagens) if p.contagens is not None else p.capacidade_topk)
+        if missing_count:
+            vc_ordenado = pd.concat([vc_ordenado, pd.Series([missing_count], index=[np.nan])])
+            vc_ordenado = vc_ordenado.sort_values(ascending=False, kind="stable")
         vc_mostrar = vc_ordenado.head(max_levels)
 
-        outros = vc_ordenado.iloc[max_levels:].sum() if len(vc_ordenado) > max_levels else 0
+        outros = n - int(vc_mostrar.sum()) if len(vc_ordenado) > max_levels or p.aproximado else 0
 
         for valor, qtd in vc_mostrar.items():
             if pd.isna(valor):
@@ -68,7 +281,7 @@ def resumo_categoricas(
                 label = str(valor)
 
             pct = 100.0 * qtd / n if n > 0 else 0.0
-            print(f"  {label:<30} {qtd:5d}  ({pct:5.1f}%)")
+            print(f"  {label:<30} {int(qtd):5d}  ({pct:5.1f}%)")
 
         if outros > 0:
             pct_outros = 100.0 * outros / n if n > 0 else 0.0
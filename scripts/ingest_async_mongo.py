@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Ingestão assíncrona de .xlsx -> MongoDB (asyncio), com um cliente compartilhado por processo.
+
+Mesmas regras de nome de `ingest_xlsx_to_mongo` (1 aba -> <arquivo>; várias ->
+<arquivo>__<aba>), mas:
+- um único cliente assíncrono por processo/loop/URI, com pool ajustado
+  (`get_async_client`), em vez de um MongoClient novo a cada conexão;
+- cada planilha é aberta uma vez (`pisa_inventory.XlsxReader`); a leitura da
+  próxima aba (em thread) corre em paralelo com a escrita da atual;
+- várias planilhas são ingeridas ao mesmo tempo, com limite global de
+  planilhas simultâneas e de lotes `insert_many` em voo.
+
+Driver: `pymongo.AsyncMongoClient` (pymongo >= 4.9) ou, na falta dele, Motor.
+
+Uso típico
+----------
+    # script
+    python scripts/ingest_async_mongo.py pisa2018 pisa2018 --uri mongodb://localhost:27017 --workbooks 4
+
+    # Jupyter (já existe um loop rodando: use await)
+    from ingest_async_mongo import ingest_folder_of_excels_async
+    res = await ingest_folder_of_excels_async("pisa2018", "pisa2018", uri="mongodb://localhost:27017",
+                                              create_indexes=True)
+
+`run_ingest_folder` (e `ingest_folder_of_excels(max_concurrency>1)`) também
+funciona com um loop ativo: a ingestão roda num loop próprio em outra thread.
+"""
+
+from __future__ import annotations
+import asyncio
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from ingest_xlsx_to_mongo import _chunked, _sanitize_for_collection, _to_records
+from pisa_inventory import XlsxReader
+from profiling import stage
+
+try:
+    from pymongo import AsyncMongoClient  # pymongo >= 4.9
+except Exception:
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient as AsyncMongoClient
+    except Exception:
+        AsyncMongoClient = None
+
+try:
+    from dotenv import load_dotenv
+except Exception:
+    load_dotenv = None  # opcional
+
+
+# Pool ajustado para ingestão: poucas conexões longas, sem fechar entre lotes.
+DEFAULT_POOL_OPTIONS: Dict[str, object] = {
+    "maxPoolSize": 16,
+    "minPoolSize": 2,
+    "maxIdleTimeMS": 300_000,
+    "waitQueueTimeoutMS": 120_000,
+    "retryWrites": True,
+}
+
+
+# ------------------------------ cliente compartilhado ------------------------------
+
+_CLIENTS: Dict[Tuple[int, int, str], object] = {}
+
+
+def _loop_id() -> int:
+    try:
+        return id(asyncio.get_running_loop())
+    except RuntimeError:
+        return 0
+
+
+def _resolve_uri(uri: Optional[str], dotenv_path: Optional[str], uri_env_key: str) -> str:
+    """Mesma prioridade de `connect_mongo`: uri explícita > .env > variável de ambiente."""
+    if uri is None:
+        if dotenv_path and load_dotenv:
+            load_dotenv(dotenv_path, override=True)
+        uri = os.environ.get(uri_env_key)
+    if not uri:
+        raise ValueError(
+            "Não foi possível obter a string de conexão. "
+            "Passe `uri` diretamente OU defina MONGO_URI (ou ajuste uri_env_key) "
+            "OU forneça dotenv_path com um arquivo .env contendo MONGO_URI."
+        )
+    return uri
+
+
+def get_async_client(uri: Optional[str] = None,
+                     dotenv_path: Optional[str] = None,
+                     uri_env_key: str = "MONGO_URI",
+                     **pool_options):
+    """
+    Devolve o cliente assíncrono deste processo e loop para a URI (cria na primeira chamada).
+
+    Opções de pool sobrepõem DEFAULT_POOL_OPTIONS apenas na criação; chamadas
+    seguintes reutilizam o mesmo cliente (e o mesmo pool de conexões).
+    A chave inclui o PID (processos filhos nunca herdam o cliente do pai) e o
+    loop (o cliente assíncrono fica preso ao loop em que foi criado).
+    """
+    if AsyncMongoClient is None:
+        raise RuntimeError("Driver assíncrono ausente. Rode: pip install 'pymongo>=4.9' (ou motor)")
+    uri = _resolve_uri(uri, dotenv_path, uri_env_key)
+    key = (os.getpid(), _loop_id(), uri)
+    client = _CLIENTS.get(key)
+    if client is None:
+        client = AsyncMongoClient(uri, **{**DEFAULT_POOL_OPTIONS, **pool_options})
+        _CLIENTS[key] = client
+    return client
+
+
+async def close_async_clients() -> None:
+    """Fecha os clientes criados por este processo no loop atual."""
+    pid, loop = os.getpid(), _loop_id()
+    for key in [k for k in _CLIENTS if k[:2] == (pid, loop)]:
+        res = _CLIENTS.pop(key).close()
+        if inspect.isawaitable(res):  # pymongo async: corrotina; motor: síncrono
+            await res
+
+
+# ------------------------------- leitura (em thread) --------------------------------
+
+def _read_sheet_records(reader: XlsxReader, sheet: str) -> List[dict]:
+    """Lê uma aba da planilha já aberta e converte para registros (NaN -> None), fora do loop."""
+    return _to_records(reader.read(sheet))
+
+
+# ---------------------------------- ingestão ----------------------------------------
+
+async def insert_xlsx_to_mongo_async(xlsx_path: str,
+                                     db,
+                                     drop_existing: bool = True,
+                                     batch_size: int = 50_000,
+                                     write_limit: Optional[asyncio.Semaphore] = None,
+                                     verbose: bool = True) -> List[str]:
+    """
+    Versão assíncrona de `insert_xlsx_to_mongo`.
+
+    A aba i+1 é lida em uma thread enquanto os lotes da aba i são gravados.
+    `write_limit` (compartilhado entre planilhas) limita os `insert_many` em voo.
+    Retorna a lista de coleções criadas/atualizadas.
+    """
+    if not os.path.exists(xlsx_path):
+        raise FileNotFoundError(f"Arquivo não encontrado: {xlsx_path}")
+    base = os.path.splitext(os.path.basename(xlsx_path))[0]
+    reader = await asyncio.to_thread(XlsxReader, xlsx_path)  # manifesto e strings lidos uma vez
+    try:
+        return await _insert_workbook(reader, base, db, drop_existing, batch_size,
+                                      write_limit or asyncio.Semaphore(4), verbose)
+    finally:
+        reader.close()
+
+
+async def _insert_workbook(reader: XlsxReader, base: str, db, drop_existing: bool, batch_size: int,
+                           write_limit: asyncio.Semaphore, verbose: bool) -> List[str]:
+    sheets = reader.sheet_names
+    if not sheets:
+        raise ValueError(f"Planilha sem abas: {reader.path}")
+    created: List[str] = []
+
+    async def _write(col_name: str, batch: List[dict]) -> None:
+        async with write_limit:
+            await db[col_name].insert_many(batch, ordered=False)
+
+    pending = asyncio.create_task(asyncio.to_thread(_read_sheet_records, reader, sheets[0]))
+    try:
+        for i, sheet_name in enumerate(sheets):
+            records = await pending
+            if i + 1 < len(sheets):
+                # pré-leitura da próxima aba enquanto esta é gravada
+                pending = asyncio.create_task(asyncio.to_thread(_read_sheet_records, reader, sheets[i + 1]))
+
+            col_name = _sanitize_for_collection(base if len(sheets) == 1 else f"{base}__{sheet_name}")
+            if verbose:
+                print(f"[{base}] aba '{sheet_name}' -> coleção: {col_name}  | linhas={len(records)}")
+            if drop_existing and col_name in await db.list_collection_names():
+                await db[col_name].drop()
+            if records:
+                with stage("ingest_async_mongo.insert_many", rows=len(records), collection=col_name):
+                    await asyncio.gather(*(_write(col_name, b) for b in _chunked(records, batch_size)))
+            created.append(col_name)
+    finally:
+        # falha na gravação: não deixa a pré-leitura órfã no loop
+        if not pending.done():
+            pending.cancel()
+
+    return created
+
+
+async def ingest_folder_of_excels_async(base_dir: str,
+                                        db_name: str,
+                                        uri: Optional[str] = None,
+                                        dotenv_path: Optional[str] = None,
+                                        uri_env_key: str = "MONGO_URI",
+                                        only_prefixes: Optional[List[str]] = None,
+                                        recursive: bool = True,
+                                        drop_existing: bool = True,
+                                        batch_size: int = 50_000,
+                                        max_workbooks: int = 4,
+                                        max_inflight_writes: int = 8,
+                                        verbose: bool = True,
+                                        create_indexes: bool = False,
+                                        **pool_options) -> Dict[str, List[str]]:
+    """
+    Ingestão concorrente de uma pasta de .xlsx.
+
+    Parâmetros
+    ----------
+    max_workbooks : planilhas processadas ao mesmo tempo (limite global).
+    max_inflight_writes : lotes `insert_many` simultâneos somando todas as planilhas;
+        mantenha <= maxPoolSize do cliente.
+    create_indexes : depois da carga, aplica o plano de `pisa_indexes` às coleções
+        criadas (em thread, com o cliente síncrono compartilhado de `connect_mongo`).
+    **pool_options : repassadas a `get_async_client` (ex.: maxPoolSize=32).
+
+    Retorna dict {xlsx_filename: [coleções_criadas]}; falhas são reportadas e
+    não interrompem as demais planilhas (mesmo comportamento da versão síncrona).
+    """
+    client = get_async_client(uri, dotenv_path=dotenv_path, uri_env_key=uri_env_key, **pool_options)
+    db = client[db_name]
+
+    files: List[str] = []
+    walk_iter = os.walk(base_dir) if recursive else [(base_dir, [], os.listdir(base_dir))]
+    for root, _, names in walk_iter:
+        for f in names:
+            if not f.lower().endswith(".xlsx"):
+                continue
+            if only_prefixes and not any(f.startswith(p) for p in only_prefixes):
+                continue
+            files.append(os.path.join(root, f))
+
+    book_limit = asyncio.Semaphore(max(1, max_workbooks))
+    write_limit = asyncio.Semaphore(max(1, max_inflight_writes))
+    results: Dict[str, List[str]] = {}
+
+    async def _one(path: str) -> None:
+        async with book_limit:
+            try:
+                results[os.path.basename(path)] = await insert_xlsx_to_mongo_async(
+                    path, db, drop_existing=drop_existing, batch_size=batch_size,
+                    write_limit=write_limit, verbose=verbose,
+                )
+            except Exception as e:
+                print(f"[ERRO] Falha ao ingerir '{os.path.basename(path)}': {e}")
+
+    await asyncio.gather(*(_one(p) for p in files))
+    if create_indexes:
+        from ingest_xlsx_to_mongo import _index_collections, connect_mongo
+        _, sync_db = connect_mongo(db_name, uri=uri, dotenv_path=dotenv_path, uri_env_key=uri_env_key)
+        await asyncio.to_thread(_index_collections, sync_db,
+                                [c for cols in results.values() for c in cols], verbose)
+    return results
+
+
+def run_ingest_folder(*args, **kwargs) -> Dict[str, List[str]]:
+    """
+    Ponto de entrada síncrono (scripts/CLI, `ingest_folder_of_excels`).
+    Com um loop já ativo (Jupyter) a ingestão roda num loop próprio em outra
+    thread; lá, `await ingest_folder_of_excels_async(...)` evita a thread extra.
+    """
+    async def _main():
+        try:
+            return await ingest_folder_of_excels_async(*args, **kwargs)
+        finally:
+            await close_async_clients()
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_main())
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        return ex.submit(lambda: asyncio.run(_main())).result()
+
+
+__all__ = [
+    "DEFAULT_POOL_OPTIONS", "get_async_client", "close_async_clients",
+    "insert_xlsx_to_mongo_async", "ingest_folder_of_excels_async", "run_ingest_folder",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Ingestão assíncrona de uma pasta de .xlsx no MongoDB.")
+    ap.add_argument("base_dir")
+    ap.add_argument("db_name")
+    ap.add_argument("--uri", default=None, help="padrão: variável MONGO_URI")
+    ap.add_argument("--prefix", nargs="*", default=None, help="ex.: STU_ SCH_")
+    ap.add_argument("--workbooks", type=int, default=4, help="planilhas simultâneas")
+    ap.add_argument("--writes", type=int, default=8, help="insert_many simultâneos (total)")
+    ap.add_argument("--batch-size", type=int, default=50_000)
+    args = ap.parse_args()
+
+    out = run_ingest_folder(args.base_dir, args.db_name, uri=args.uri, only_prefixes=args.prefix,
+                            max_workbooks=args.workbooks, max_inflight_writes=args.writes,
+                            batch_size=args.batch_size)
+    for f, cols in out.items():
+        print(f"[OK] {f}: {cols}")
@@ -18,6 +18,8 @@ from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 import pandas as pd
 import numpy as np
 
+from profiling import instrument, stage
+
 try:
     from pymongo import MongoClient
 except Exception as e:
@@ -64,6 +66,10 @@ def _to_records(df: pd.DataFrame) -> List[dict]:
 
 # ------------------------------ conexão ao Mongo ---------------------------------
 
+# um MongoClient (e um pool) por processo/URI; o PID evita herdar o cliente do pai
+_CLIENTS: Dict[Tuple[int, str], MongoClient] = {}
+
+
 def connect_mongo(
     db_name: str,
     uri: Optional[str] = None,
@@ -73,6 +79,9 @@ def connect_mongo(
     """
     Conecta ao MongoDB e retorna (client, db).
 
+    O cliente é compartilhado: chamadas com a mesma URI no mesmo processo
+    reutilizam o mesmo MongoClient e seu pool (feche com `close_mongo_clients`).
+
     Preferência:
       1) usa `uri` se fornecida,
       2) se `dotenv_path` for dado e houver python-dotenv, carrega e usa a var `MONGO_URI`,
@@ -93,13 +102,24 @@ def connect_mongo(
             "OU forneça dotenv_path com um arquivo .env contendo MONGO_URI."
         )
 
-    client = MongoClient(uri)
+    key = (os.getpid(), uri)
+    client = _CLIENTS.get(key)
+    if client is None:
+        client = _CLIENTS[key] = MongoClient(uri)
     db = client[db_name]
     return client, db
 
 
+def close_mongo_clients() -> None:
+    """Fecha os clientes compartilhados deste processo."""
+    pid = os.getpid()
+    for key in [k for k in _CLIENTS if k[0] == pid]:
+        _CLIENTS.pop(key).close()
+
+
 # ------------------------------ leitura de planilhas ------------------------------
 
+@instrument("ingest_xlsx_to_mongo._read_all_sheets")
 def _read_all_sheets(xlsx_path: str) -> Dict[str, pd.DataFrame]:
     """
     Lê todas as abas do .xlsx. Retorna {sheet_name: DataFrame}.
@@ -122,14 +142,31 @@ def insert_xlsx_to_mongo(
     drop_existing: bool = True,
     batch_size: int = 50_000,
     verbose: bool = True,
+    create_indexes: bool = False,
+    mode: str = "reload",
 ) -> List[str]:
     """
     Lê um .xlsx e insere no MongoDB.
     Se houver 1 aba -> coleção = basename(xlsx) sem '.xlsx'
     Se houver várias -> cada aba vira coleção '<basename>__<sheet>'
 
+    Com `create_indexes`, aplica o plano de `pisa_indexes` (campos brutos do PISA)
+    em cada coleção depois da carga.
+
+    `mode="sync"` aplica só inserts/updates/deletes por chave (ver `pisa_sync`),
+    preservando coleções e índices; `drop_existing` é ignorado nesse modo.
+
     Retorna lista com os nomes das coleções criadas/atualizadas.
     """
+    if mode == "sync":
+        from pisa_sync import sync_xlsx_to_mongo
+        created = sync_xlsx_to_mongo(xlsx_path, db, batch_size=batch_size, verbose=verbose)
+        if create_indexes:
+            _index_collections(db, created, verbose=verbose)
+        return created
+    if mode != "reload":
+        raise ValueError("mode deve ser 'reload' ou 'sync'")
+
     base = os.path.splitext(os.path.basename(xlsx_path))[0]
     all_sheets = _read_all_sheets(xlsx_path)
     created: List[str] = []
@@ -144,8 +181,9 @@ def insert_xlsx_to_mongo(
             db[col_name].drop()
         records = _to_records(df)
         if records:
-            for batch in _chunked(records, batch_size):
-                db[col_name].insert_many(batch)
+            with stage("ingest_xlsx_to_mongo.insert_many", rows=len(records), collection=col_name):
+                for batch in _chunked(records, batch_size):
+                    db[col_name].insert_many(batch)
         created.append(col_name)
     else:
         # Uma coleção por aba
@@ -157,13 +195,22 @@ def insert_xlsx_to_mongo(
                 db[col_name].drop()
             records = _to_records(df)
             if records:
-                for batch in _chunked(records, batch_size):
-                    db[col_name].insert_many(batch)
+                with stage("ingest_xlsx_to_mongo.insert_many", rows=len(records), collection=col_name):
+                    for batch in _chunked(records, batch_size):
+                        db[col_name].insert_many(batch)
             created.append(col_name)
 
+    if create_indexes:
+        _index_collections(db, created, verbose=verbose)
     return created
 
 
+def _index_collections(db, names: Iterable[str], verbose: bool = True) -> None:
+    from pisa_indexes import apply_mongo_indexes_auto
+    for name in names:
+        apply_mongo_indexes_auto(db[name], verbose=verbose)
+
+
 def ingest_folder_of_excels(
     base_dir: str,
     db_name: str,
@@ -175,11 +222,31 @@ def ingest_folder_of_excels(
     drop_existing: bool = True,
     batch_size: int = 50_000,
     verbose: bool = True,
+    max_concurrency: int = 1,
+    create_indexes: bool = False,
+    mode: str = "reload",
 ) -> Dict[str, List[str]]:
     """
     Percorre `base_dir`, encontra .xlsx e injeta todos no Mongo.
     Retorna dict {xlsx_filename: [coleções_criadas]}.
+
+    `max_concurrency` > 1 usa o caminho assíncrono (`ingest_async_mongo`): até
+    esse número de planilhas ao mesmo tempo, com um cliente compartilhado.
+    Funciona também em Jupyter (loop próprio em outra thread), mas lá
+    `await ingest_folder_of_excels_async(...)` é o caminho direto.
+
+    `create_indexes` cria os índices de `pisa_indexes` após a carga de cada planilha.
+    `mode="sync"` sincroniza incrementalmente (sempre sequencial).
     """
+    if max_concurrency > 1 and mode == "reload":
+        from ingest_async_mongo import run_ingest_folder  # import tardio: evita ciclo
+        return run_ingest_folder(
+            base_dir, db_name, uri=uri, dotenv_path=dotenv_path, uri_env_key=uri_env_key,
+            only_prefixes=only_prefixes, recursive=recursive, drop_existing=drop_existing,
+            batch_size=batch_size, max_workbooks=max_concurrency, verbose=verbose,
+            create_indexes=create_indexes,
+        )
+
     client, db = connect_mongo(db_name, uri=uri, dotenv_path=dotenv_path, uri_env_key=uri_env_key)
 
     results: Dict[str, List[str]] = {}
@@ -200,6 +267,8 @@ def ingest_folder_of_excels(
                     drop_existing=drop_existing,
                     batch_size=batch_size,
                     verbose=verbose,
+                    create_indexes=create_indexes,
+                    mode=mode,
                 )
                 results[f] = created
             except Exception as e:
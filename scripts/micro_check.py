@@ -5,6 +5,12 @@ from pathlib import Path
 import glob
 import shutil
 
+import pisa_audit
+from pisa_groupby import group_counts
+from pisa_inventory import XlsxReader
+from pisa_linkage import IdIndex
+from profiling import instrument
+
 
 # ===== Assumindo que você JÁ definiu: PV_READ, RWT, ALIASES, STU_CANON, SCH_CANON =====
 # (Se não, cole as suas definições acima deste bloco.)
@@ -27,28 +33,20 @@ def _local_copy_if_drive(path_str: str) -> str:
         return str(dst)
     return str(p)
 
+@instrument("micro_check._read_excel_selected")
 def _read_excel_selected(path, sheet, wanted_cols, alias_keys, engine="openpyxl"):
     """
-    Passo 1: lê só o cabeçalho (nrows=0) para descobrir as colunas presentes.
-    Passo 2: lê apenas o subconjunto necessário (usecols).
+    Uma abertura do arquivo (XlsxReader): o cabeçalho sai da 1ª linha da própria
+    passada de dados e só as colunas alvo (canônicas ou sinônimas) são convertidas.
+    `engine` fica por compatibilidade.
     """
-    # header pass (rápida)
-    hdr = pd.read_excel(path, sheet_name=sheet, nrows=0, engine=engine)
-    present = set(map(str, hdr.columns))
-    usecols = [c for c in (wanted_cols | alias_keys) if c in present]
-    if not usecols:
-        # fallback: se nada foi detectado (ex.: nomes diferentes), lê tudo
-        print("⚠️ Nenhuma coluna alvo detectada no cabeçalho; lendo a aba inteira (fallback).")
-        return pd.read_excel(path, sheet_name=sheet, engine=engine)
-    # read pass (selecionada)
-    return pd.read_excel(path, sheet_name=sheet, usecols=usecols, engine=engine)
-
-# --- suas funções utilitárias originais são reaproveitadas:
-# rename_with_aliases, check_required_columns, check_pv_rwt, check_ids_weights,
-# check_sentinels_and_ranges, format_report
-# (não repito aqui para brevidade)
-
-
+    with XlsxReader(path) as rd:
+        df = rd.read(sheet, columns=wanted_cols | alias_keys)  # ausentes são puladas
+        if df.shape[1] == 0:
+            # fallback: se nada foi detectado (ex.: nomes diferentes), lê tudo
+            print("⚠️ Nenhuma coluna alvo detectada no cabeçalho; lendo a aba inteira (fallback).")
+            return rd.read(sheet)
+        return df
 
 def _resolve_path(p):
     p = Path(p).expanduser()
@@ -83,85 +81,21 @@ def rename_with_aliases(df, aliases):
             ren[old] = new
     return df.rename(columns=ren)
 
-# ---------- checagens núcleo ----------
-def check_required_columns(df, required, aliases=None, label="(df)"):
-    """Garante canônicos; reporta ausências e extras."""
-    rpt = {"label": label}
-    df2 = rename_with_aliases(df, aliases or {})
-    present = set(df2.columns)
-    missing = [c for c in required if c not in present]
-    extras = sorted(list(present - set(required)))
-    rpt["n_cols"] = len(df2.columns)
-    rpt["missing"] = missing
-    rpt["n_missing"] = len(missing)
-    rpt["extras_count"] = len(extras)
-    rpt["is_complete"] = (len(missing) == 0)
-    return df2, rpt
-
-def check_pv_rwt(df, PV_READ, RWT):
-    miss_pv  = [pv for pv in PV_READ if pv not in df.columns]
-    miss_rwt = [rw for rw in RWT if rw not in df.columns]
-    return {
-        "PV_missing": miss_pv,
-        "RWT_missing": miss_rwt,
-        "PV_ok": (len(miss_pv) == 0),
-        "RWT_ok": (len(miss_rwt) == 0),
-    }
-
-def check_ids_weights(df):
-    rpt = {}
-    n = len(df)
-
-    # IDs
-    has_stuid = "CNTSTUID.STU" in df.columns
-    has_schid = "CNTSCHID" in df.columns
-    rpt["has_STUID"] = has_stuid
-    rpt["has_SCHID"] = has_schid
-
-    if has_stuid:
-        dup = df["CNTSTUID.STU"].duplicated(keep=False).sum()
-        rpt["STUID_duplicados"] = int(dup)
-        rpt["STUID_duplicados_%"] = _pct(dup, n)
-
-    if has_schid:
-        null_sch = df["CNTSCHID"].isna().sum()
-        rpt["SCHID_nulos"] = int(null_sch)
-        rpt["SCHID_nulos_%"] = _pct(null_sch, n)
-        rpt["n_escolas_distintas"] = int(df["CNTSCHID"].nunique(dropna=True))
-
-    # Pesos
-    if "W_FSTUWT" in df.columns:
-        w = pd.to_numeric(df["W_FSTUWT"], errors="coerce")
-        rpt["peso_nulos_%"] = _pct(w.isna().sum(), n)
-        rpt["peso_nao_positivos_%"] = _pct((w <= 0).fillna(False).sum(), n)
-        rpt["peso_sum"] = float(np.nansum(w))
-    else:
-        rpt["peso_nulos_%"] = None
-        rpt["peso_nao_positivos_%"] = None
-        rpt["peso_sum"] = None
-
-    return rpt
-
-def check_sentinels_and_ranges(df, PV_READ):
-    rpt = {}
-    # Checa sentinelas negativos em variáveis-chave (se existirem)
-    keys = [c for c in ["ESCS.STU","DISCLIMA.STU","TEACHSUP.STU","REPEAT.STU","LANGN.STU","IMMIG.STU"] if c in df.columns]
-    for c in keys:
-        s = pd.to_numeric(df[c], errors="coerce")
-        sent = s.isin([-9,-8,-7,-6,-5]).sum()
-        rpt[f"{c}_sentinelas_%"] = _pct(sent, len(s))
-        if c == "ESCS.STU":
-            out = s[(~s.isna()) & ((s < -6) | (s > 6))].size
-            rpt["ESCS_out_of_range_%"] = _pct(out, len(s))
-    # PVs: coerção numérica / missing global
-    pv_bad = 0
-    pv_present = [p for p in PV_READ if p in df.columns]
-    for pv in pv_present:
-        s = pd.to_numeric(df[pv], errors="coerce")
-        pv_bad += s.isna().sum()
-    if pv_present:
-        rpt["PV_missing_values_%"] = _pct(pv_bad, len(df)*len(pv_present))
-    return rpt
+# ---------- auditorias (motor de regras de pisa_audit) ----------
+def _fmt(v):
+    return f"{v:.2f}" if isinstance(v, float) else v
+
+def _report_sections(rpt):
+    """Relatório de `pisa_audit` como seções chave: valor para `format_report`."""
+    head = {"fonte": rpt["source"], "linhas": rpt["rows"], "n_cols": len(rpt["columns"]),
+            "aprovado": rpt["passed"]}
+    checks = {}
+    for c in rpt["checks"]:
+        alvo = c.get("column") or f"{len(c.get('columns', []))} colunas"
+        det = {k: v for k, v in c.items() if k not in ("rule", "passed", "column", "columns")}
+        status = "" if c["passed"] is None else _ok(c["passed"]) + " "
+        checks[f"{c['rule']}[{alvo}]"] = status + ", ".join(f"{k}={_fmt(v)}" for k, v in det.items())
+    return head, checks
 
 def format_report(*sections, title="Relatório"):
     print(f"\n===== {title} =====")
@@ -174,60 +108,27 @@ def format_report(*sections, title="Relatório"):
         print("-"*40)
 
 def audit_sch_stu(path, sheet, STU_CANON, ALIASES, PV_READ, RWT):
-    # 0) cópia local para /tmp (rápido)
-    path_local = _local_copy_if_drive(path)
-
-    # 1) ler apenas colunas necessárias (duas passadas)
-    wanted = set(STU_CANON) | set(PV_READ) | set(RWT)
-    alias_keys = set(ALIASES.keys())
-    df_raw = _read_excel_selected(path_local, sheet, wanted, alias_keys, engine="openpyxl")
-
-    # 2) padroniza nomes por sinônimos e verifica presença
-    df1, rpt_cols = check_required_columns(df_raw, STU_CANON, ALIASES, label="SCH_STU_BRA.data")
-
-    # 3) PVs e RWT
-    rpt_pv = check_pv_rwt(df1, PV_READ, RWT)
-
-    # 4) Tipagem mínima
-    if "CNTSCHID" in df1.columns:
-        df1["CNTSCHID"] = pd.to_numeric(df1["CNTSCHID"], errors="coerce").astype("Int64")
-    if "W_FSTUWT" in df1.columns:
-        df1["W_FSTUWT"] = pd.to_numeric(df1["W_FSTUWT"], errors="coerce")
-    for pv in [p for p in PV_READ if p in df1.columns]:
-        df1[pv] = pd.to_numeric(df1[pv], errors="coerce")
-
-    # 5) IDs, pesos
-    rpt_idw = check_ids_weights(df1)
-
-    # 6) sentinelas e faixas
-    rpt_sen = check_sentinels_and_ranges(df1, PV_READ)
-
-    # 7) Relatório
-    format_report(rpt_cols, rpt_pv, rpt_idw, rpt_sen, title="SCH_STU_BRA.xlsx (aba data)")
-
-    # 8) retorna canônico
-    keep = [c for c in STU_CANON if c in df1.columns]
-    return df1[keep].copy()
+    """
+    Auditoria do SCH_STU pelas regras de `pisa_audit.stu_rules` (colunas, PVs/RWT,
+    IDs, pesos, sentinelas, faixa de ESCS): uma passada no arquivo, relatório
+    impresso e o DataFrame canônico como retorno.
+    """
+    df1, rpt = pisa_audit.audit_sch_stu(path, sheet, STU_CANON, ALIASES, PV_READ, RWT)
+    # tipagem mínima (CNTSCHID já vem como Int64)
+    for c in ["W_FSTUWT", *PV_READ]:
+        if c in df1.columns:
+            df1[c] = pd.to_numeric(df1[c], errors="coerce")
+    format_report(*_report_sections(rpt), title=f"{Path(path).name} (aba {sheet})")
+    return df1
 
 def audit_sch(path, sheet, SCH_CANON, ALIASES):
-    path_local = _local_copy_if_drive(path)
-    wanted = set(SCH_CANON)
-    alias_keys = set(ALIASES.keys())
-    df_raw = _read_excel_selected(path_local, sheet, wanted, alias_keys, engine="openpyxl")
-
-    df1, rpt_cols = check_required_columns(df_raw, SCH_CANON, ALIASES, label="SCH_BRA.data")
-
-    # Tipagem
-    if "CNTSCHID" in df1.columns:
-        df1["CNTSCHID"] = pd.to_numeric(df1["CNTSCHID"], errors="coerce").astype("Int64")
-    if "STRATIO" in df1.columns:
-        df1["STRATIO"] = pd.to_numeric(df1["STRATIO"], errors="coerce")
-    if "SCHSIZE" in df1.columns:
-        df1["SCHSIZE"] = pd.to_numeric(df1["SCHSIZE"], errors="coerce")
-
-    format_report(rpt_cols, title="SCH_BRA.xlsx (aba data)")
-    keep = [c for c in SCH_CANON if c in df1.columns]
-    return df1[keep].copy()
+    """Auditoria do SCH pelas regras de `pisa_audit.sch_rules`."""
+    df1, rpt = pisa_audit.audit_sch(path, sheet, SCH_CANON, ALIASES)
+    for c in ("STRATIO", "SCHSIZE"):
+        if c in df1.columns:
+            df1[c] = pd.to_numeric(df1[c], errors="coerce")
+    format_report(*_report_sections(rpt), title=f"{Path(path).name} (aba {sheet})")
+    return df1
 
 # ---------- uso típico ----------
 # df_stu = audit_sch_stu("sch_stu/SCH_STU_BRA.xlsx", "data")
@@ -235,16 +136,24 @@ def audit_sch(path, sheet, SCH_CANON, ALIASES):
 
 # ---------- checagem de merge (cobertura entre bases) ----------
 def check_merge_coverage(df_stu, df_sch):
-    if "CNTSCHID" not in df_stu.columns or "CNTSCHID" not in df_sch.columns:
+    # df_stu pode ser um iterável de blocos: conta alunos por escola fora da memória
+    streamed = not isinstance(df_stu, pd.DataFrame)
+    if (not streamed and "CNTSCHID" not in df_stu.columns) or "CNTSCHID" not in df_sch.columns:
         print("⚠️ CNTSCHID ausente em uma das bases.")
         return
-    left = df_stu[["CNTSCHID"]].dropna().copy()
-    right = df_sch[["CNTSCHID"]].dropna().copy()
-    n_left = left["CNTSCHID"].nunique()
-    n_right = right["CNTSCHID"].nunique()
-    merged = left.merge(right.drop_duplicates(), on="CNTSCHID", how="left")
-    hit = merged["CNTSCHID"].notna().sum()
+    right = df_sch["CNTSCHID"].dropna()
+    n_right = right.nunique()
+    index = IdIndex(right.drop_duplicates())
+    if streamed:
+        counts = group_counts(df_stu, "CNTSCHID")
+        n_left, total = len(counts), int(counts.sum())
+        hit = int(counts[index.contains(counts.index)].sum())
+    else:
+        left = df_stu["CNTSCHID"].dropna()
+        n_left, total = left.nunique(), len(left)
+        # índice hash sobre as escolas: conta casamentos sem materializar um merge
+        hit = int(index.contains(left).sum())
     print("\n===== Cobertura do merge por escola =====")
     print(f"Escolas em SCH_STU: {n_left}")
     print(f"Escolas em SCH:     {n_right}")
-    print(f"Match (por CNTSCHID): {_pct(hit, len(merged)):.1f}% ({hit}/{len(merged)})")
+    print(f"Match (por CNTSCHID): {_pct(hit, total):.1f}% ({hit}/{total})")
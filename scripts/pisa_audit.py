@@ -0,0 +1,552 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de auditoria de qualidade por regras (base de `micro_check.audit_sch_stu`/`audit_sch`).
+
+As checagens são declaradas uma vez (colunas obrigatórias, duplicatas, taxa de
+nulos, sentinelas, faixas, pesos positivos, cobertura referencial) e executadas
+numa única passada por bloco de colunas:
+
+- cada coluna numérica é convertida UMA vez por bloco (matriz float n × m);
+- nulos, sentinelas, faixas, não positivos e somas saem de operações vetoriais
+  sobre essa matriz;
+- o estado de cada regra é somável entre blocos, então arquivos de qualquer
+  tamanho podem ser lidos em pedaços (`iter_sheet_chunks`, 1 passada no arquivo).
+
+Memória: as contagens por coluna têm tamanho fixo; `Unique` conta chaves num
+`pisa_groupby.GroupAggregator`, que guarda no máximo ~2·`max_keys` chaves em
+memória e despeja o excedente em disco particionado por hash (`spill_dir`); no
+final as duplicatas são contadas partição a partição. Só `Coverage` guarda os
+ids distintos encontrados (limitados ao tamanho da referência).
+
+O resultado é um relatório estruturado (dict serializável em JSON), em vez de
+linhas impressas.
+
+Uso típico
+----------
+    from pisa_audit import audit_sch_stu, stu_rules, AuditEngine, iter_sheet_chunks
+
+    df_stu, rpt = audit_sch_stu("sch_stu/SCH_STU_BRA.xlsx", "data", STU_CANON, ALIASES, PV_READ, RWT,
+                                report_path="outputs/audit_stu.json")
+    print(rpt["passed"], rpt["summary"])
+
+    # regras próprias, arquivo grande em blocos
+    eng = AuditEngine([Required(["CNTSTUID"]), Unique("CNTSTUID"), Range("ESCS", -6, 6)])
+    rpt = eng.run(iter_sheet_chunks("STU_QQQ.xlsx", "data", chunksize=100_000))
+"""
+
+from __future__ import annotations
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from pisa_groupby import GroupAggregator
+from pisa_linkage import IdIndex
+from profiling import stage
+
+
+NEG_SENTINELS = (-9, -8, -7, -6, -5)
+
+
+# -------------------------------------- Regras --------------------------------------
+
+@dataclass
+class Rule:
+    """Base: `name` identifica a regra no relatório."""
+    name: str = field(init=False, default="")
+
+    def columns(self) -> List[str]:
+        return []
+
+    def numeric_columns(self) -> List[str]:
+        return []
+
+
+@dataclass
+class Required(Rule):
+    """Colunas que precisam existir (após sinônimos)."""
+    cols: Sequence[str] = ()
+
+    def __post_init__(self):
+        self.name = "required"
+
+
+@dataclass
+class Unique(Rule):
+    """Duplicatas de uma chave (linhas cuja chave aparece mais de uma vez)."""
+    column: str = ""
+    max_pct: float = 0.0
+
+    def __post_init__(self):
+        self.name = "unique"
+
+    def columns(self):
+        return [self.column]
+
+
+@dataclass
+class NullRate(Rule):
+    """Ausentes por coluna (numeric=True conta também valores não numéricos)."""
+    cols: Sequence[str] = ()
+    max_pct: Optional[float] = None
+    numeric: bool = True
+    pooled: Optional[str] = None  # nome para reportar a taxa agregada do grupo (ex.: "PV")
+
+    def __post_init__(self):
+        self.name = "null_rate"
+
+    def columns(self):
+        return list(self.cols)
+
+    def numeric_columns(self):
+        return list(self.cols) if self.numeric else []
+
+
+@dataclass
+class SentinelRate(Rule):
+    """Valores-sentinela (códigos de ausência negativos) por coluna."""
+    cols: Sequence[str] = ()
+    values: Sequence[float] = NEG_SENTINELS
+    max_pct: Optional[float] = None
+
+    def __post_init__(self):
+        self.name = "sentinel_rate"
+
+    def columns(self):
+        return list(self.cols)
+
+    def numeric_columns(self):
+        return list(self.cols)
+
+
+@dataclass
+class Range(Rule):
+    """Valores presentes fora de [lo, hi]."""
+    column: str = ""
+    lo: float = -np.inf
+    hi: float = np.inf
+    max_pct: Optional[float] = None
+
+    def __post_init__(self):
+        self.name = "range"
+
+    def columns(self):
+        return [self.column]
+
+    def numeric_columns(self):
+        return [self.column]
+
+
+@dataclass
+class Positive(Rule):
+    """Pesos: ausentes, não positivos e soma."""
+    column: str = ""
+    max_pct: float = 0.0
+
+    def __post_init__(self):
+        self.name = "positive"
+
+    def columns(self):
+        return [self.column]
+
+    def numeric_columns(self):
+        return [self.column]
+
+
+@dataclass
+class Coverage(Rule):
+    """Cobertura referencial: valores de `column` encontrados em `reference` (ex.: CNTSCHID em SCH)."""
+    column: str = ""
+    reference: Sequence = ()
+    label: str = "reference"
+    min_pct: Optional[float] = None
+
+    def __post_init__(self):
+        self.name = "coverage"
+
+    def columns(self):
+        return [self.column]
+
+
+# -------------------------------------- Motor ---------------------------------------
+
+def _pct(n, d) -> float:
+    return 0.0 if d == 0 else 100.0 * n / d
+
+
+def _to_float(s: pd.Series) -> np.ndarray:
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return s.to_numpy(dtype=float, na_value=np.nan)
+    return pd.to_numeric(s, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+
+class AuditEngine:
+    """
+    Executa um conjunto de regras sobre um DataFrame ou um iterável de blocos.
+
+    Estado acumulado por bloco (somável): contagens por coluna da matriz numérica,
+    contagens de chave (duplicatas; em disco acima de `max_keys` chaves, em
+    `spill_dir`) e casamentos de cobertura.
+    """
+
+    def __init__(self, rules: Sequence[Rule], aliases: Optional[Dict[str, str]] = None,
+                 max_keys: int = 1_000_000, spill_dir: Optional[str] = None) -> None:
+        self.rules = list(rules)
+        self.aliases = dict(aliases or {})
+        self.max_keys = max_keys
+        self.spill_dir = spill_dir
+        num: List[str] = []
+        for r in self.rules:
+            num += [c for c in r.numeric_columns() if c not in num]
+        self.numeric_cols = num
+        # vetores por coluna da matriz: limites de faixa e máscara de sentinela
+        self._lo = np.full(len(num), -np.inf)
+        self._hi = np.full(len(num), np.inf)
+        self._sentinel_vals: Dict[int, np.ndarray] = {}
+        ranged: List[int] = []
+        positive: List[int] = []
+        for r in self.rules:
+            if isinstance(r, Range):
+                j = num.index(r.column)
+                self._lo[j], self._hi[j] = r.lo, r.hi
+                ranged.append(j)
+            if isinstance(r, Positive):
+                positive.append(num.index(r.column))
+            if isinstance(r, SentinelRate):
+                for c in r.cols:
+                    self._sentinel_vals[num.index(c)] = np.asarray(r.values, dtype=float)
+        # faixa e não positivos/soma só nas colunas das regras Range/Positive
+        self._range_idx = np.array(sorted(set(ranged)), dtype=np.int64)
+        self._pos_idx = np.array(sorted(set(positive)), dtype=np.int64)
+        self._coverage_idx = {id(r): IdIndex(pd.Series(list(r.reference)), name=r.label)
+                              for r in self.rules if isinstance(r, Coverage)}
+
+    def columns(self) -> List[str]:
+        """Colunas lidas pelas regras (para projetar a leitura)."""
+        out: List[str] = []
+        for r in self.rules:
+            for c in (list(r.cols) if isinstance(r, Required) else r.columns()):
+                if c not in out:
+                    out.append(c)
+        return out
+
+    def _rename(self, df: pd.DataFrame) -> pd.DataFrame:
+        ren = {old: new for old, new in self.aliases.items() if old in df.columns and new not in df.columns}
+        return df.rename(columns=ren) if ren else df
+
+    # ---------------- acumulação ----------------
+
+    def _new_state(self) -> dict:
+        m = len(self.numeric_cols)
+        return {
+            "rows": 0, "header": None,
+            "present": np.zeros(m, dtype=bool),
+            "nulls": np.zeros(m, dtype=np.int64),
+            "sentinels": np.zeros(m, dtype=np.int64),
+            "out_of_range": np.zeros(m, dtype=np.int64),
+            "nonpositive": np.zeros(m, dtype=np.int64),
+            "sums": np.zeros(m, dtype=float),
+            "raw_nulls": {},
+            "key_counts": {},
+            "coverage": {},
+        }
+
+    def _update(self, st: dict, chunk: pd.DataFrame) -> None:
+        chunk = self._rename(chunk)
+        n = len(chunk)
+        if st["header"] is None:
+            st["header"] = [str(c) for c in chunk.columns]
+        st["rows"] += n
+        if n == 0:
+            return
+
+        # matriz numérica: uma conversão por coluna por bloco
+        m = len(self.numeric_cols)
+        present = np.array([c in chunk.columns for c in self.numeric_cols], dtype=bool)
+        st["present"] |= present
+        X = np.full((n, m), np.nan)
+        for j, c in enumerate(self.numeric_cols):
+            if present[j]:
+                X[:, j] = _to_float(chunk[c])
+        nan = np.isnan(X)
+        st["nulls"] += nan.sum(axis=0)
+        if len(self._range_idx):
+            R, rn = X[:, self._range_idx], nan[:, self._range_idx]
+            st["out_of_range"][self._range_idx] += (~rn & ((R < self._lo[self._range_idx])
+                                                           | (R > self._hi[self._range_idx]))).sum(axis=0)
+        if len(self._pos_idx):
+            P, pn = X[:, self._pos_idx], nan[:, self._pos_idx]
+            st["nonpositive"][self._pos_idx] += (~pn & (P <= 0)).sum(axis=0)
+            st["sums"][self._pos_idx] += np.where(pn, 0.0, P).sum(axis=0)
+        for j, vals in self._sentinel_vals.items():
+            st["sentinels"][j] += int(np.isin(X[:, j], vals).sum())
+
+        for r in self.rules:
+            if isinstance(r, NullRate) and not r.numeric:
+                for c in r.cols:
+                    if c in chunk.columns:
+                        st["raw_nulls"][c] = st["raw_nulls"].get(c, 0) + int(chunk[c].isna().sum())
+            elif isinstance(r, Unique) and r.column in chunk.columns:
+                agg = st["key_counts"].get(r.column)
+                if agg is None:
+                    agg = st["key_counts"][r.column] = GroupAggregator(
+                        r.column, weight=None, count_name="n", max_groups=self.max_keys,
+                        spill_dir=self.spill_dir)
+                agg.update(chunk[[r.column]].dropna())
+            elif isinstance(r, Coverage) and r.column in chunk.columns:
+                s = chunk[r.column].dropna()
+                cov = st["coverage"].setdefault(id(r), {"n": 0, "hit": 0, "distinct": set()})
+                cov["n"] += len(s)
+                cov["hit"] += int(self._coverage_idx[id(r)].contains(s).sum())
+                cov["distinct"].update(pd.unique(s).tolist())
+
+    # ---------------- relatório ----------------
+
+    def _finalize(self, st: dict, source: Optional[str]) -> dict:
+        n = st["rows"]
+        header = set(st["header"] or [])
+        col_j = {c: j for j, c in enumerate(self.numeric_cols)}
+        checks: List[dict] = []
+
+        def _add(rule: Rule, passed: Optional[bool], **kw) -> None:
+            checks.append({"rule": rule.name, "passed": passed, **kw})
+
+        def _thr(pct: float, max_pct: Optional[float]) -> Optional[bool]:
+            return None if max_pct is None else bool(pct <= max_pct)
+
+        for r in self.rules:
+            if isinstance(r, Required):
+                missing = [c for c in r.cols if c not in header]
+                _add(r, not missing, columns=list(r.cols), missing=missing)
+            elif isinstance(r, Unique):
+                agg = st["key_counts"].get(r.column)
+                if agg is None:
+                    _add(r, False, column=r.column, error="coluna ausente")
+                    continue
+                dup = distinct = 0
+                for part in agg.iter_partitions():   # uma partição de chaves por vez
+                    counts = part["n"].to_numpy()
+                    dup += int(counts[counts > 1].sum())
+                    distinct += len(counts)
+                pct = _pct(dup, n)
+                _add(r, bool(pct <= r.max_pct), column=r.column, duplicated=dup, pct=pct, distinct=distinct)
+            elif isinstance(r, NullRate):
+                total = 0
+                for c in r.cols:
+                    if r.numeric:
+                        if c not in col_j or not st["present"][col_j[c]]:
+                            continue
+                        k = int(st["nulls"][col_j[c]])
+                    elif c in header:
+                        k = st["raw_nulls"].get(c, 0)
+                    else:
+                        continue
+                    total += k
+                    pct = _pct(k, n)
+                    if not r.pooled:
+                        _add(r, _thr(pct, r.max_pct), column=c, count=k, pct=pct)
+                if r.pooled:
+                    present = [c for c in r.cols if c in header]
+                    pct = _pct(total, n * len(present))
+                    _add(r, _thr(pct, r.max_pct), column=r.pooled, columns=present, count=total, pct=pct)
+            elif isinstance(r, SentinelRate):
+                for c in r.cols:
+                    j = col_j[c]
+                    if not st["present"][j]:
+                        continue
+                    k = int(st["sentinels"][j])
+                    _add(r, _thr(_pct(k, n), r.max_pct), column=c, count=k, pct=_pct(k, n),
+                         values=list(r.values))
+            elif isinstance(r, Range):
+                j = col_j[r.column]
+                if not st["present"][j]:
+                    continue
+                k = int(st["out_of_range"][j])
+                _add(r, _thr(_pct(k, n), r.max_pct), column=r.column, lo=float(r.lo), hi=float(r.hi),
+                     count=k, pct=_pct(k, n))
+            elif isinstance(r, Positive):
+                j = col_j[r.column]
+                if not st["present"][j]:
+                    _add(r, False, column=r.column, error="coluna ausente")
+                    continue
+                nul, nonpos = int(st["nulls"][j]), int(st["nonpositive"][j])
+                _add(r, bool(_pct(nonpos, n) <= r.max_pct), column=r.column,
+                     null_pct=_pct(nul, n), nonpositive=nonpos, nonpositive_pct=_pct(nonpos, n),
+                     sum=float(st["sums"][j]))
+            elif isinstance(r, Coverage):
+                cov = st["coverage"].get(id(r))
+                if cov is None:
+                    _add(r, False, column=r.column, error="coluna ausente")
+                    continue
+                pct = _pct(cov["hit"], cov["n"])
+                _add(r, None if r.min_pct is None else bool(pct >= r.min_pct), column=r.column,
+                     reference=r.label, matched=cov["hit"], total=cov["n"], pct=pct,
+                     distinct=len(cov["distinct"]))
+
+        failed = [c for c in checks if c["passed"] is False]
+        return {
+            "source": source,
+            "rows": int(n),
+            "columns": st["header"] or [],
+            "passed": not failed,
+            "summary": {"checks": len(checks), "failed": len(failed)},
+            "checks": checks,
+        }
+
+    def run(self, data: Union[pd.DataFrame, Iterable[pd.DataFrame]], source: Optional[str] = None) -> dict:
+        """Executa as regras sobre um DataFrame ou sobre blocos (um único estado acumulado)."""
+        st = self._new_state()
+        chunks = [data] if isinstance(data, pd.DataFrame) else data
+        try:
+            with stage("pisa_audit.run", source=source) as sp:
+                for chunk in chunks:
+                    self._update(st, chunk)
+                sp.rows = st["rows"]
+            return self._finalize(st, source)
+        finally:
+            for agg in st["key_counts"].values():
+                agg.close()
+
+
+def save_report(report: dict, path: str) -> str:
+    """Grava o relatório em JSON (UTF-8, indentado)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2, default=float)
+    return path
+
+
+def report_frame(report: dict) -> pd.DataFrame:
+    """Relatório como DataFrame (uma linha por checagem)."""
+    return pd.DataFrame(report["checks"])
+
+
+# --------------------------------- Leitura em blocos --------------------------------
+
+def iter_sheet_chunks(path: str, sheet: Union[str, int] = "data",
+                      columns: Optional[Iterable[str]] = None,
+                      chunksize: int = 50_000) -> Iterator[pd.DataFrame]:
+    """
+    Lê um arquivo em blocos numa única passada (o cabeçalho vem da primeira linha).
+    .xlsx via openpyxl read_only; .csv via pandas; .parquet via pyarrow.
+    `columns` projeta a leitura (colunas ausentes são simplesmente ignoradas).
+    """
+    wanted = None if columns is None else set(columns)
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        usecols = (lambda c: c in wanted) if wanted is not None else None
+        yield from pd.read_csv(path, usecols=usecols, chunksize=chunksize)
+        return
+    if ext == ".parquet":
+        import pyarrow.parquet as pq
+        pf = pq.ParquetFile(path)
+        cols = None if wanted is None else [c for c in pf.schema_arrow.names if c in wanted]
+        for batch in pf.iter_batches(batch_size=chunksize, columns=cols):
+            yield batch.to_pandas()
+        return
+
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if isinstance(sheet, str) else wb.worksheets[sheet]
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(h) if h is not None else f"col_{i}" for i, h in enumerate(header, 1)]
+        idx = [i for i, h in enumerate(header) if wanted is None or h in wanted]
+        names = [header[i] for i in idx]
+        buf: List[tuple] = []
+        for r in rows:
+            buf.append(tuple(r[i] if i < len(r) else None for i in idx))
+            if len(buf) >= chunksize:
+                yield pd.DataFrame.from_records(buf, columns=names)
+                buf = []
+        if buf or not names:
+            yield pd.DataFrame.from_records(buf, columns=names)
+    finally:
+        wb.close()
+
+
+# ---------------------------------- Regras prontas ----------------------------------
+
+def stu_rules(stu_canon: Sequence[str], pv_read: Sequence[str], rwt: Sequence[str],
+              school_ids: Optional[Sequence] = None) -> List[Rule]:
+    """
+    Regras da auditoria do SCH_STU (colunas, PVs/RWT, IDs, pesos, sentinelas,
+    faixa de ESCS, PVs ausentes).
+    """
+    keys = ["ESCS.STU", "DISCLIMA.STU", "TEACHSUP.STU", "REPEAT.STU", "LANGN.STU", "IMMIG.STU"]
+    rules: List[Rule] = [
+        Required(list(stu_canon)),
+        Required(list(pv_read) + list(rwt)),
+        Unique("CNTSTUID.STU"),
+        NullRate(["CNTSCHID"], max_pct=0.0),
+        Positive("W_FSTUWT"),
+        SentinelRate(keys),
+        Range("ESCS.STU", -6, 6),
+        NullRate(list(pv_read), pooled="PV"),
+    ]
+    if school_ids is not None:
+        rules.append(Coverage("CNTSCHID", reference=school_ids, label="SCH.CNTSCHID", min_pct=100.0))
+    return rules
+
+
+def sch_rules(sch_canon: Sequence[str]) -> List[Rule]:
+    return [Required(list(sch_canon)), Unique("CNTSCHID"), NullRate(["STRATIO", "SCHSIZE"])]
+
+
+def _audit_file(path: str, sheet, rules: List[Rule], aliases: Dict[str, str], keep: Sequence[str],
+                chunksize: int, report_path: Optional[str], return_frame: bool):
+    from micro_check import _local_copy_if_drive
+
+    eng = AuditEngine(rules, aliases)
+    wanted = set(eng.columns()) | set(keep) | set(aliases)
+    kept: List[pd.DataFrame] = []
+
+    def _chunks():
+        for ch in iter_sheet_chunks(_local_copy_if_drive(path), sheet, wanted, chunksize):
+            if return_frame:
+                ch2 = eng._rename(ch)
+                kept.append(ch2[[c for c in keep if c in ch2.columns]])
+            yield ch
+
+    report = eng.run(_chunks(), source=f"{os.path.basename(path)}:{sheet}")
+    if report_path:
+        save_report(report, report_path)
+    df = pd.concat(kept, ignore_index=True) if kept else None
+    if df is not None and "CNTSCHID" in df.columns:
+        df["CNTSCHID"] = pd.to_numeric(df["CNTSCHID"], errors="coerce").astype("Int64")
+    return df, report
+
+
+def audit_sch_stu(path, sheet, STU_CANON, ALIASES, PV_READ, RWT,
+                  school_ids: Optional[Sequence] = None,
+                  chunksize: int = 50_000,
+                  report_path: Optional[str] = None,
+                  return_frame: bool = True) -> Tuple[Optional[pd.DataFrame], dict]:
+    """
+    Auditoria do SCH_STU por regras: uma passada no arquivo, relatório JSON.
+    Retorna (df canônico ou None, relatório); `micro_check.audit_sch_stu` imprime
+    o mesmo relatório.
+    """
+    return _audit_file(path, sheet, stu_rules(STU_CANON, PV_READ, RWT, school_ids), ALIASES,
+                       STU_CANON, chunksize, report_path, return_frame)
+
+
+def audit_sch(path, sheet, SCH_CANON, ALIASES, chunksize: int = 50_000,
+              report_path: Optional[str] = None,
+              return_frame: bool = True) -> Tuple[Optional[pd.DataFrame], dict]:
+    """Auditoria do SCH por regras (a de `micro_check.audit_sch` imprime o relatório)."""
+    return _audit_file(path, sheet, sch_rules(SCH_CANON), ALIASES, SCH_CANON,
+                       chunksize, report_path, return_frame)
+
+
+__all__ = [
+    "Rule", "Required", "Unique", "NullRate", "SentinelRate", "Range", "Positive", "Coverage",
+    "AuditEngine", "save_report", "report_frame", "iter_sheet_chunks",
+    "stu_rules", "sch_rules", "audit_sch_stu", "audit_sch",
+]
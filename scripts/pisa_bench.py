@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks reprodutíveis das etapas do pipeline sobre dados sintéticos (pisa_synth).
+
+Cada benchmark é uma função `(ctx) -> linhas processadas` cronometrada em
+`repeats` execuções, para cada tamanho de amostra (10k/100k/1M alunos por
+padrão). Os resultados vão para um JSON com metadados do ambiente, que pode
+ser comparado com uma execução de referência para detectar regressões.
+
+Etapas cobertas
+---------------
+- loader:     pisa_prep.load_students_df / load_schools_df, pisa_ingest_mssql._load_students_filtered
+- converter:  pisa_prep.to_mongo_documents_students, DataFrame -> records (NaN -> None)
+- inserter:   insert_many no MongoDB (somente com --mongo-uri, banco `pisa_bench`)
+- aggregator: school_profile (groupby + wavg, como no notebook; versão vetorizada de
+              `estatisticas`; pipeline no MongoDB com --mongo-uri)
+- model:      WLS do gradiente completo (T2) e MixedLM nulo (T3)
+
+Por padrão todas as etapas rodam em todos os tamanhos, inclusive os loaders
+(gravar e ler .xlsx de 1M linhas) e o MixedLM em 1M alunos, que levam dezenas
+de minutos. `--quick` (`run(quick=True)`) aplica `QUICK_CAPS` e pula essas
+etapas acima de 100k alunos, para uma rodada rápida; os resultados pulados
+aparecem como `skipped (cap=...)` e o JSON registra `quick` nos parâmetros.
+
+Uso
+---
+    python scripts/pisa_bench.py --out outputs/bench                  # 10k/100k/1M, tudo
+    python scripts/pisa_bench.py --quick --out outputs/bench          # sem loader/MixedLM em 1M
+    python scripts/pisa_bench.py --sizes 10000 --compare outputs/bench/bench_<...>.json
+"""
+
+from __future__ import annotations
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import warnings
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import estatisticas as estat
+from pisa_synth import FLT_ID_OFFSET, SynthConfig, generate, write_workbooks
+
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+# limites de tamanho por etapa (acima do limite a etapa é pulada): nenhum por
+# padrão, para que o loader e o MixedLM sejam medidos também em 1M alunos
+DEFAULT_CAPS: Dict[str, int] = {}
+
+# rodada rápida (`quick=True` / --quick): gravar/ler .xlsx de 1M linhas ou ajustar
+# MixedLM nessa escala leva dezenas de minutos
+QUICK_CAPS: Dict[str, int] = {
+    "loader": 100_000,
+    "model.mixedlm_null": 100_000,
+}
+
+
+@dataclass
+class BenchContext:
+    """Dados compartilhados pelos benchmarks de um mesmo tamanho."""
+    n_students: int
+    frames: Dict[str, pd.DataFrame]
+    work_dir: str
+    mongo_uri: Optional[str] = None
+    cache: Dict[str, object] = field(default_factory=dict)
+
+    @property
+    def workbook_dir(self) -> str:
+        """Grava os .xlsx sintéticos sob demanda (só quando algum loader roda)."""
+        if "workbooks" not in self.cache:
+            write_workbooks(self.frames, self.work_dir)
+            self.cache["workbooks"] = self.work_dir
+        return self.work_dir
+
+    @property
+    def students_final(self) -> pd.DataFrame:
+        if "students_final" not in self.cache:
+            self.cache["students_final"] = analytic_frame(self.frames)
+        return self.cache["students_final"]
+
+
+# ------------------------------- Preparação (notebook) -------------------------------
+
+def analytic_frame(frames: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Reproduz, sem imputação, o caminho do notebook até `students_final`:
+    correção do deslocamento do FLT, merge STU × FLT × SCH e reescalas.
+    """
+    stu = frames["STU"][["CNTSTUID", "CNTSCHID", "ESCS", "DISCLIMA", "BELONG",
+                         "ST004D01T", "REPEAT", "SCIE"]]
+    flt = frames["FLT"][["CNTSTUID", "CNTSCHID", "SENWT", "READ", "MATH"]].copy()
+    sch = frames["SCH"][["CNTSCHID", "EDUSHORT", "STAFFSHORT"]]
+    flt["CNTSTUID"] = flt["CNTSTUID"] - FLT_ID_OFFSET
+
+    df = stu.merge(flt, on=["CNTSTUID", "CNTSCHID"], how="inner", validate="one_to_one")
+    df = df.merge(sch, on="CNTSCHID", how="left", validate="many_to_one")
+    df["ESCS"] = df["ESCS"] / 1000 - 5
+    df["DISCLIMA"] = df["DISCLIMA"] / 100 - 5
+    df["BELONG"] = df["BELONG"] / 100
+    df["EDUSHORT"] = df["EDUSHORT"] / 10 - 5
+    df["STAFFSHORT"] = df["STAFFSHORT"] / 10 - 5
+    df["ST004D01T"] = (df["ST004D01T"] == "Male").astype("int8")
+    df["REPEAT"] = df["REPEAT"].map({"Did not repeat a  grade": 0, "Repeated a  grade": 1}).fillna(2).astype("int8")
+    df = df.rename(columns={"SCIE": "SCIENCE"})
+    return df.dropna(subset=["ESCS", "DISCLIMA", "BELONG", "EDUSHORT", "STAFFSHORT"]).reset_index(drop=True)
+
+
+def _school_profile_apply(df: pd.DataFrame) -> pd.DataFrame:
+    """Mesma agregação da célula `school_profile` do notebook (groupby.apply + wavg)."""
+    return (
+        df.groupby("CNTSCHID", as_index=False)
+        .apply(
+            lambda g: pd.Series({
+                "n_students": len(g),
+                "read_mean_w": estat.wavg(g["READ"], g["SENWT"]),
+                "math_mean_w": estat.wavg(g["MATH"], g["SENWT"]),
+                "science_mean_w": estat.wavg(g["SCIENCE"], g["SENWT"]),
+                "escs_mean_w": estat.wavg(g["ESCS"], g["SENWT"]),
+                "disclima_mean_w": estat.wavg(g["DISCLIMA"], g["SENWT"]),
+                "belong_mean_w": estat.wavg(g["BELONG"], g["SENWT"]),
+            }),
+            include_groups=False,
+        )
+    )
+
+
+# ------------------------------------ Benchmarks ------------------------------------
+
+def _bench_load_students_prep(ctx: BenchContext) -> int:
+    import pisa_prep
+    return len(pisa_prep.load_students_df(ctx.workbook_dir))
+
+
+def _bench_load_schools_prep(ctx: BenchContext) -> int:
+    import pisa_prep
+    return len(pisa_prep.load_schools_df(ctx.workbook_dir))
+
+
+def _bench_load_students_mssql(ctx: BenchContext) -> int:
+    import pisa_ingest_mssql
+    path = os.path.join(ctx.workbook_dir, "stu", "STU_BRA.xlsx")
+    return len(pisa_ingest_mssql._load_students_filtered(path))
+
+
+def _prep_students(ctx: BenchContext) -> pd.DataFrame:
+    if "prep_students" not in ctx.cache:
+        import pisa_prep
+        df = ctx.frames["STU"][[c for c in pisa_prep.STUDENT_COLS if c in ctx.frames["STU"].columns]]
+        ctx.cache["prep_students"] = df.reset_index(drop=True)
+    return ctx.cache["prep_students"]
+
+
+def _bench_to_documents(ctx: BenchContext) -> int:
+    import pisa_prep
+    return len(pisa_prep.to_mongo_documents_students(_prep_students(ctx)))
+
+
+def _bench_to_records(ctx: BenchContext) -> int:
+    df = ctx.frames["STU"]
+    return len(df.replace({np.nan: None}).to_dict(orient="records"))
+
+
+def _bench_mongo_insert(ctx: BenchContext) -> int:
+    from pymongo import MongoClient
+    import pisa_prep
+    docs = ctx.cache.get("docs")
+    if docs is None:
+        docs = ctx.cache["docs"] = pisa_prep.to_mongo_documents_students(_prep_students(ctx))
+    client = MongoClient(ctx.mongo_uri)
+    try:
+        col = client["pisa_bench"]["students"]
+        col.drop()
+        for batch in pisa_prep.chunked(docs, 50_000):
+            # cópia rasa: insert_many acrescenta `_id` aos dicts
+            col.insert_many([dict(d) for d in batch], ordered=False)
+        return len(docs)
+    finally:
+        client.close()
+
+
+def _bench_school_profile(ctx: BenchContext) -> int:
+    df = ctx.students_final
+    _school_profile_apply(df)
+    return len(df)
+
+
+def _bench_school_profile_vectorized(ctx: BenchContext) -> int:
+    df = ctx.students_final
+    estat.school_profile(df)
+    return len(df)
+
+
+def _bench_school_profile_mongo(ctx: BenchContext) -> int:
+    from pymongo import MongoClient
+    import pisa_prep
+    import pisa_mongo_agg
+    client = MongoClient(ctx.mongo_uri)
+    try:
+        col = client["pisa_bench"]["students_agg"]
+        if "agg_loaded" not in ctx.cache:  # carga + índices fora da medição repetida
+            pisa_mongo_agg.load_students(col, pisa_prep.to_mongo_documents_students(_prep_students(ctx)))
+            ctx.cache["agg_loaded"] = True
+        pisa_mongo_agg.school_profile(col)
+        return len(_prep_students(ctx))
+    finally:
+        client.close()
+
+
+def _bench_wls_full(ctx: BenchContext) -> int:
+    import statsmodels.formula.api as smf
+    base = ctx.students_final.copy()
+    base["ESCS_c"] = base["ESCS"] - base["ESCS"].mean()
+    clima = base.groupby("CNTSCHID")["DISCLIMA"].transform("mean")
+    base["clima_escola_c"] = clima - clima.mean()
+    base["EDUSHORT_c"] = base["EDUSHORT"] - base["EDUSHORT"].mean()
+    base["STAFFSHORT_c"] = base["STAFFSHORT"] - base["STAFFSHORT"].mean()
+    smf.wls(
+        "READ ~ ESCS_c + clima_escola_c + DISCLIMA + EDUSHORT_c + STAFFSHORT_c "
+        "+ ST004D01T + C(REPEAT) + ESCS_c:clima_escola_c",
+        data=base, weights=base["SENWT"],
+    ).fit()
+    return len(base)
+
+
+def _bench_mixedlm_null(ctx: BenchContext) -> int:
+    import statsmodels.formula.api as smf
+    base = ctx.students_final
+    smf.mixedlm("READ ~ 1", data=base, groups=base["CNTSCHID"]).fit(method="lbfgs", reml=False)
+    return len(base)
+
+
+BENCHMARKS: Dict[str, Callable[[BenchContext], int]] = {
+    "loader.pisa_prep.students": _bench_load_students_prep,
+    "loader.pisa_prep.schools": _bench_load_schools_prep,
+    "loader.mssql.students": _bench_load_students_mssql,
+    "converter.to_mongo_documents_students": _bench_to_documents,
+    "converter.to_records": _bench_to_records,
+    "inserter.mongo.insert_many": _bench_mongo_insert,
+    "aggregator.school_profile": _bench_school_profile,
+    "aggregator.school_profile_vectorized": _bench_school_profile_vectorized,
+    "aggregator.mongo.school_profile": _bench_school_profile_mongo,
+    "model.wls_full": _bench_wls_full,
+    "model.mixedlm_null": _bench_mixedlm_null,
+}
+
+
+def _cap_for(name: str, caps: Dict[str, int]) -> Optional[int]:
+    """Limite mais específico que casa com o nome (ex.: 'loader' cobre 'loader.*')."""
+    best = None
+    for key, cap in caps.items():
+        if name == key or name.startswith(key + "."):
+            if best is None or len(key) > len(best[0]):
+                best = (key, cap)
+    return best[1] if best else None
+
+
+# ------------------------------------- Execução -------------------------------------
+
+def _environment() -> dict:
+    import importlib
+    env = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+    for mod in ("numpy", "pandas", "statsmodels", "openpyxl"):
+        try:
+            env[mod] = importlib.import_module(mod).__version__
+        except Exception:
+            env[mod] = None
+    try:
+        env["git_rev"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5,
+        ).stdout.strip() or None
+    except Exception:
+        env["git_rev"] = None
+    return env
+
+
+def run(sizes: Sequence[int] = DEFAULT_SIZES,
+        only: Optional[Sequence[str]] = None,
+        repeats: int = 3,
+        seed: int = 2018,
+        students_per_school: int = 18,
+        caps: Optional[Dict[str, int]] = None,
+        mongo_uri: Optional[str] = None,
+        out_dir: Optional[str] = None,
+        verbose: bool = True,
+        quick: bool = False) -> pd.DataFrame:
+    """
+    Executa os benchmarks e (opcionalmente) grava `bench_<timestamp>.json` em out_dir.
+
+    Parâmetros
+    ----------
+    sizes : tamanhos (número de alunos); n_escolas = n_alunos / students_per_school.
+    only : prefixos de benchmarks a executar (ex.: ["loader", "model.wls_full"]).
+    repeats : execuções por benchmark; reporta mínimo e mediana.
+    caps : limites de tamanho por etapa (sobrepõe DEFAULT_CAPS / QUICK_CAPS).
+    mongo_uri : se ausente, os benchmarks `*.mongo.*` são pulados.
+    quick : parte de QUICK_CAPS (loader e MixedLM só até 100k) em vez de DEFAULT_CAPS.
+
+    Retorna
+    -------
+    pd.DataFrame com uma linha por (benchmark, tamanho).
+    """
+    caps = {**(QUICK_CAPS if quick else DEFAULT_CAPS), **(caps or {})}
+    names = [n for n in BENCHMARKS if not only or any(n == p or n.startswith(p) for p in only)]
+    rows: List[dict] = []
+
+    for n in sizes:
+        frames = generate(SynthConfig(n_students=n, n_schools=max(1, n // students_per_school), seed=seed))
+        work_dir = tempfile.mkdtemp(prefix=f"pisa_bench_{n}_")
+        ctx = BenchContext(n_students=n, frames=frames, work_dir=work_dir, mongo_uri=mongo_uri)
+        try:
+            for name in names:
+                cap = _cap_for(name, caps)
+                if cap is not None and n > cap:
+                    rows.append({"bench": name, "n_students": n, "status": f"skipped (cap={cap})"})
+                    continue
+                if ".mongo." in f".{name}." and not mongo_uri:
+                    rows.append({"bench": name, "n_students": n, "status": "skipped (sem mongo_uri)"})
+                    continue
+                walls, cpus, n_rows = [], [], None
+                try:
+                    if name.startswith("loader"):
+                        ctx.workbook_dir  # grava os .xlsx fora da medição
+                    with warnings.catch_warnings():
+                        warnings.simplefilter("ignore")
+                        for _ in range(repeats):
+                            c0, t0 = time.process_time(), time.perf_counter()
+                            n_rows = BENCHMARKS[name](ctx)
+                            walls.append(time.perf_counter() - t0)
+                            cpus.append(time.process_time() - c0)
+                except Exception as e:
+                    rows.append({"bench": name, "n_students": n, "status": f"error: {type(e).__name__}: {e}"})
+                    continue
+                row = {
+                    "bench": name, "n_students": n, "status": "ok", "rows": n_rows,
+                    "repeats": repeats,
+                    "wall_min_s": min(walls), "wall_median_s": float(np.median(walls)),
+                    "cpu_min_s": min(cpus),
+                    "rows_per_s": (n_rows / min(walls)) if n_rows and min(walls) > 0 else None,
+                }
+                rows.append(row)
+                if verbose:
+                    print(f"[{n:>9,}] {name:<40} {row['wall_min_s']:9.3f}s  ({row['rows_per_s'] or 0:,.0f} linhas/s)")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = pd.DataFrame(rows)
+    if out_dir:
+        save(results, out_dir, params={"sizes": list(sizes), "repeats": repeats, "seed": seed,
+                                       "students_per_school": students_per_school, "caps": caps,
+                                       "quick": quick})
+    return results
+
+
+def save(results: pd.DataFrame, out_dir: str, params: Optional[dict] = None) -> str:
+    """Grava resultados + ambiente em <out_dir>/bench_<timestamp>.json e retorna o caminho."""
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(out_dir, f"bench_{stamp}.json")
+    payload = {
+        "created": stamp,
+        "environment": _environment(),
+        "params": params or {},
+        "results": json.loads(results.to_json(orient="records")),
+    }
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(payload, fh, ensure_ascii=False, indent=2)
+    return path
+
+
+def load(path: str) -> pd.DataFrame:
+    with open(path, encoding="utf-8") as fh:
+        return pd.DataFrame(json.load(fh)["results"])
+
+
+def compare(baseline: pd.DataFrame | str, current: pd.DataFrame | str,
+            tolerance: float = 0.10) -> pd.DataFrame:
+    """
+    Compara duas execuções por (bench, n_students) usando o tempo mínimo.
+    `ratio` = atual / referência; `regressao` = ratio > 1 + tolerance.
+    """
+    base = load(baseline) if isinstance(baseline, str) else baseline
+    cur = load(current) if isinstance(current, str) else current
+    keys = ["bench", "n_students"]
+    base = base[base["status"] == "ok"][keys + ["wall_min_s"]]
+    cur = cur[cur["status"] == "ok"][keys + ["wall_min_s"]]
+    out = base.merge(cur, on=keys, how="inner", suffixes=("_ref", "_atual"))
+    out["ratio"] = out["wall_min_s_atual"] / out["wall_min_s_ref"]
+    out["regressao"] = out["ratio"] > 1.0 + tolerance
+    return out.sort_values(["regressao", "ratio"], ascending=[False, False]).reset_index(drop=True)
+
+
+__all__ = ["BENCHMARKS", "DEFAULT_SIZES", "DEFAULT_CAPS", "QUICK_CAPS", "run", "save", "load", "compare", "analytic_frame"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Benchmarks do pipeline PISA sobre dados sintéticos.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    ap.add_argument("--only", nargs="*", default=None, help="prefixos de benchmarks (ex.: loader model)")
+    ap.add_argument("--repeats", type=int, default=3)
+    ap.add_argument("--quick", action="store_true",
+                    help="pula loader e MixedLM acima de 100k alunos (QUICK_CAPS)")
+    ap.add_argument("--seed", type=int, default=2018)
+    ap.add_argument("--mongo-uri", default=os.environ.get("PISA_BENCH_MONGO_URI"))
+    ap.add_argument("--out", default="outputs/bench")
+    ap.add_argument("--compare", default=None, help="JSON de referência para detectar regressões")
+    ap.add_argument("--tolerance", type=float, default=0.10)
+    args = ap.parse_args()
+
+    res = run(args.sizes, only=args.only, repeats=args.repeats, seed=args.seed,
+              mongo_uri=args.mongo_uri, out_dir=args.out, quick=args.quick)
+    if args.compare:
+        cmp = compare(args.compare, res, tolerance=args.tolerance)
+        print(cmp.to_string(index=False))
+        if cmp["regressao"].any():
+            raise SystemExit(1)
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Quartis (ou qualquer faixa de quantis) ponderados pelo peso amostral, com os
+pontos de corte calculados uma vez por variável e população e reaproveitados.
+
+O notebook usava `pd.qcut(base["ESCS"], q=4)`: quantis não ponderados e
+refeitos em cada `quartil_summary_for_domain` depois do próprio `dropna`. Aqui:
+
+- `BinCache.cuts` ordena a variável uma vez (O(n log n)) e escolhe, para cada
+  probabilidade p, o menor valor cuja soma acumulada de pesos alcança p·Σw
+  (quantil ponderado pela CDF invertida). O resultado fica em cache pela
+  impressão digital dos valores e pesos da população (blake2b): o mesmo
+  filtro sobre os mesmos dados não reordena nada;
+- `assign_bins` atribui as faixas por `np.searchsorted` nos cortes (intervalos
+  fechados à direita, como `pd.qcut`); ausentes ficam sem faixa;
+- `binned_summary` monta o resumo de todos os domínios de uma vez: cada domínio
+  tem sua população (linhas com a nota presente) e seus cortes, e as somas
+  (n, Σw, Σw·x) de todos os pares domínio × faixa saem de um único `np.bincount`
+  sobre a chave domínio·k + faixa.
+
+Com `weighted=False` os cortes são os de `pd.qcut` (np.quantile linear) e a
+atribuição coincide com o notebook antigo.
+
+Uso típico
+----------
+    import pisa_bins as bins
+
+    task1_base["escs_quartil"] = bins.assign_bins(task1_base, "ESCS", weight="SENWT")
+    multi_quartil_summary = bins.binned_summary(
+        students_final, "ESCS",
+        domains={"Leitura": "READ", "Matemática": "MATH", "Ciências": "SCIENCE"},
+        measures={"clima_escola_medio": "disclima_mean_w"},
+        population=["ESCS", "SENWT", "disclima_mean_w"],
+    )
+    # colunas: dominio, escs_quartil, n_alunos, peso_expandido, score_medio, clima_escola_medio
+"""
+
+from __future__ import annotations
+import hashlib
+import threading
+from typing import Dict, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from estatisticas import QUARTIL_LABELS
+from profiling import stage
+
+
+def _probs(k: int) -> np.ndarray:
+    """Probabilidades dos k − 1 cortes internos (quartis: 0,25; 0,5; 0,75)."""
+    return np.arange(1, k) / k
+
+
+def weighted_quantiles(x: np.ndarray, w: Optional[np.ndarray], probs: Sequence[float]) -> np.ndarray:
+    """
+    Quantis de `x` (sem ausentes). Com pesos: menor valor cuja soma acumulada
+    alcança p·Σw; sem pesos: `np.quantile` linear (mesmos cortes de `pd.qcut`).
+    """
+    probs = np.asarray(probs, dtype=float)
+    if len(x) == 0:
+        return np.full(len(probs), np.nan)
+    if w is None:
+        return np.quantile(x, probs)
+    order = np.argsort(x, kind="stable")
+    xs = x[order]
+    cw = np.cumsum(w[order])
+    idx = np.searchsorted(cw, probs * cw[-1], side="left")
+    return xs[np.minimum(idx, len(xs) - 1)]
+
+
+def _fingerprint(x: np.ndarray, w: Optional[np.ndarray], k: int) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(x, dtype="float64").tobytes())
+    h.update(b"|" if w is None else np.ascontiguousarray(w, dtype="float64").tobytes())
+    h.update(str(k).encode())
+    return h.hexdigest()
+
+
+class BinCache:
+    """Cortes de quantis memorizados por (valores, pesos, k) da população."""
+
+    def __init__(self, max_cached: int = 64) -> None:
+        self.max_cached = max_cached
+        self._cache: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def cuts(self, x, w=None, k: int = 4) -> np.ndarray:
+        """k − 1 cortes internos de `x` (linhas com x ou w ausente são ignoradas)."""
+        x = np.asarray(x, dtype="float64")
+        ok = ~np.isnan(x)
+        if w is not None:
+            w = np.asarray(w, dtype="float64")
+            ok &= ~np.isnan(w)
+            w = w[ok]
+        x = x[ok]
+        key = _fingerprint(x, w, k)
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                self.hits += 1
+                return hit
+            self.misses += 1
+        with stage("pisa_bins.cuts", rows=len(x), k=k, weighted=w is not None):
+            out = weighted_quantiles(x, w, _probs(k))
+        with self._lock:
+            if len(self._cache) >= self.max_cached:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = out
+        return out
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+_DEFAULT_CACHE = BinCache()
+
+
+def codes_for(x, cuts: np.ndarray) -> np.ndarray:
+    """Faixa 0..k−1 de cada valor (fechada à direita); −1 para ausentes."""
+    x = np.asarray(x, dtype="float64")
+    codes = np.searchsorted(cuts, x, side="left")
+    return np.where(np.isnan(x), -1, codes)
+
+
+def assign_bins(df: pd.DataFrame, var: str, weight: Optional[str] = "SENWT",
+                labels: Sequence[str] = QUARTIL_LABELS, weighted: bool = True,
+                label_name: str = "escs_quartil", cache: Optional[BinCache] = None) -> pd.Series:
+    """
+    Faixas de quantis de `var` sobre a população de `df` (já filtrada), como
+    Categorical ordenado com `labels`. `weighted=False` reproduz `pd.qcut`.
+    """
+    cache = cache or _DEFAULT_CACHE
+    w = df[weight] if weighted and weight else None
+    cuts = cache.cuts(df[var], w, len(labels))
+    codes = codes_for(df[var], cuts)
+    if w is not None:
+        codes = np.where(np.isnan(np.asarray(w, dtype="float64")), -1, codes)
+    cat = pd.Categorical.from_codes(codes, categories=list(labels), ordered=True)
+    return pd.Series(cat, index=df.index, name=label_name)
+
+
+def binned_summary(df: pd.DataFrame,
+                   var: str = "ESCS",
+                   domains: Optional[Mapping[str, str]] = None,
+                   weight: str = "SENWT",
+                   measures: Optional[Mapping[str, str]] = None,
+                   population: Sequence[str] = (),
+                   labels: Sequence[str] = QUARTIL_LABELS,
+                   weighted: bool = True,
+                   label_name: str = "escs_quartil",
+                   score_name: str = "score_medio",
+                   domain_name: str = "dominio",
+                   cache: Optional[BinCache] = None) -> pd.DataFrame:
+    """
+    Resumo por domínio × faixa de `var`: n_alunos, peso_expandido, média
+    ponderada da nota do domínio (`score_name`) e de cada coluna de `measures`.
+
+    A população de cada domínio são as linhas com `var`, `weight`, as colunas de
+    `population` e a nota do domínio presentes (o `dropna` de
+    `quartil_summary_for_domain`); os cortes saem do cache por população.
+    """
+    cache = cache or _DEFAULT_CACHE
+    domains = dict(domains or {"Leitura": "READ", "Matemática": "MATH", "Ciências": "SCIENCE"})
+    measures = dict(measures or {})
+    k = len(labels)
+    x = df[var].to_numpy(dtype="float64")
+    w = df[weight].to_numpy(dtype="float64")
+    base_ok = ~np.isnan(x) & ~np.isnan(w)
+    for c in population:
+        base_ok &= df[c].notna().to_numpy()
+    meas = {name: df[col].to_numpy(dtype="float64") for name, col in measures.items()}
+
+    rows, keys = [], []
+    with stage("pisa_bins.binned_summary", rows=len(df), domains=len(domains), k=k):
+        for d, col in enumerate(domains.values()):
+            score = df[col].to_numpy(dtype="float64")
+            idx = np.flatnonzero(base_ok & ~np.isnan(score))
+            cuts = cache.cuts(x[idx], w[idx] if weighted else None, k)
+            rows.append(idx)
+            keys.append(d * k + np.searchsorted(cuts, x[idx], side="left"))
+        row = np.concatenate(rows) if rows else np.empty(0, dtype=int)
+        key = np.concatenate(keys) if keys else np.empty(0, dtype=int)
+        score_all = np.concatenate([df[col].to_numpy(dtype="float64")[r]
+                                    for col, r in zip(domains.values(), rows)]) if rows else np.empty(0)
+        size = len(domains) * k
+        ww = w[row]
+        n = np.bincount(key, minlength=size)
+        sw = np.bincount(key, weights=ww, minlength=size)
+        out = {
+            domain_name: np.repeat(list(domains.keys()), k),
+            label_name: pd.Categorical(np.tile(list(labels), len(domains)),
+                                       categories=list(labels), ordered=True),
+            "n_alunos": n,
+            "peso_expandido": sw,
+        }
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[score_name] = np.bincount(key, weights=ww * score_all, minlength=size) / sw
+            for name, v in meas.items():
+                vv = v[row]
+                ok = ~np.isnan(vv)
+                swm = np.bincount(key[ok], weights=ww[ok], minlength=size)
+                out[name] = np.where(swm > 0, np.bincount(key[ok], weights=ww[ok] * vv[ok],
+                                                          minlength=size) / swm, np.nan)
+    res = pd.DataFrame(out)
+    return res[res["n_alunos"] > 0].reset_index(drop=True)
+
+
+__all__ = ["weighted_quantiles", "BinCache", "codes_for", "assign_bins",
+           "binned_summary"]
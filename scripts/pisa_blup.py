@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Efeitos aleatórios por escola (BLUPs) e ranking de escolas "eficazes e
+equitativas" a partir de um MixedLM de intercepto e inclinação aleatórios.
+
+`MixedLMResults.random_effects` devolve um dict {escola: Series}, que o notebook
+convertia com `pd.DataFrame.from_dict` e cujos nomes de coluna precisavam ser
+adivinhados ("Group"/"Intercept"/0, "ESCS_c"/1). Com dezenas de milhares de
+escolas esse caminho é lento e frágil. Aqui tudo sai de uma vez, em arrays
+contíguos, direto dos componentes de variância ajustados:
+
+    r   = y − Xβ                                (resíduo marginal)
+    M_j = σ² I + Z_jᵀZ_j Ψ                      (q × q, por escola)
+    b_j = Ψ M_j⁻¹ Z_jᵀ r_j                      (BLUP)
+    V_j = σ² Ψ M_j⁻¹                            (variância condicional de b_j − u_j)
+
+com Z_jᵀZ_j e Z_jᵀr_j acumulados por `np.bincount` e os sistemas q × q
+resolvidos em lote (`np.linalg.solve` sobre a pilha G × q × q). A forma acima
+não inverte Ψ, então vale também na fronteira (variância de inclinação ≈ 0).
+Os valores coincidem com `random_effects`/`random_effects_cov` do statsmodels.
+
+As bandas usam a variância condicional, ou seja, já refletem o encolhimento:
+escolas pequenas têm BLUP puxado para 0 e intervalo largo. A confiabilidade
+1 − V_jj/Ψ_jj (0 = só encolhimento, 1 = só dados da escola) acompanha cada efeito.
+
+Uso típico
+----------
+    import pisa_blup as blup
+
+    school_re = blup.random_effects(rs_mixed, task3_base, cache=design_cache)
+    school_re.blup, school_re.cond_cov      # (G, q) e (G, q, q), contíguos
+    school_ranking = blup.rank_schools(school_re, slope="ESCS_c")   # intercepto = 1º efeito
+    # colunas: CNTSCHID, n_alunos, intercepto_re/_se/_lo/_hi, slope_escs_re/_se/_lo/_hi,
+    #          confiabilidade_*, perfil, rank_eficacia, rank_equidade
+    school_ranking[school_ranking["perfil"] == "Eficaz e equitativa"]
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import pisa_design as design
+from profiling import stage
+
+try:
+    from scipy import stats as _stats
+except ImportError:  # pragma: no cover
+    _stats = None
+
+
+PERFIS = ["Eficaz e equitativa", "Eficaz", "Equitativa", "Sem destaque"]
+
+
+def _require_scipy() -> None:
+    if _stats is None:
+        raise RuntimeError("scipy não está instalado. Instale com: pip install scipy")
+
+
+@dataclass
+class SchoolEffects:
+    """BLUPs e variâncias condicionais de todas as escolas (uma linha por grupo)."""
+    groups: pd.Index          # rótulos dos grupos, ordenados
+    names: list               # nomes dos efeitos aleatórios (intercepto primeiro, "ESCS_c", ...)
+    blup: np.ndarray          # (G, q)
+    cond_cov: np.ndarray      # (G, q, q)
+    n: np.ndarray             # alunos por grupo
+    cov_re: np.ndarray        # Ψ (q, q)
+    scale: float              # σ²
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def _col(self, name) -> int:
+        return self.names.index(name)
+
+    def se(self) -> np.ndarray:
+        """Erros padrão condicionais, (G, q)."""
+        return np.sqrt(np.maximum(np.diagonal(self.cond_cov, axis1=1, axis2=2), 0.0))
+
+    def reliability(self) -> np.ndarray:
+        """1 − V_jj/Ψ_jj por efeito, (G, q); NaN onde Ψ_jj = 0."""
+        psi = np.diag(self.cov_re)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rel = 1.0 - np.diagonal(self.cond_cov, axis1=1, axis2=2) / psi
+        return np.where(psi > 0, rel, np.nan)
+
+    def frame(self, rename: Optional[Mapping[Any, str]] = None,
+              group_name: str = "CNTSCHID") -> pd.DataFrame:
+        """BLUPs num DataFrame (grupo + uma coluna por efeito, opcionalmente renomeada)."""
+        cols = [(rename or {}).get(c, c) for c in self.names]
+        out = pd.DataFrame(self.blup, columns=cols)
+        out.insert(0, group_name, self.groups.to_numpy())
+        return out
+
+    def to_dict(self):
+        """Mesmo formato de `MixedLMResults.random_effects` (dict grupo -> Series)."""
+        return {g: pd.Series(row, index=self.names) for g, row in zip(self.groups, self.blup)}
+
+
+def _arrays(result, data: Optional[pd.DataFrame], groups, cache, mask):
+    """(y, X, Z, grupos, nomes de Z) do ajuste: do modelo vivo ou reconstruídos dos dados."""
+    live = getattr(result, "_result", None)
+    model = getattr(result if live is None else live, "model", None)
+    if getattr(model, "exog_re", None) is not None:
+        names = list(getattr(model.data, "exog_re_names", None) or
+                     [f"Z{i}" for i in range(model.exog_re.shape[1])])
+        return (np.asarray(model.endog, dtype=float), np.asarray(model.exog, dtype=float),
+                np.asarray(model.groups), np.asarray(model.exog_re, dtype=float), names)
+    if data is None:
+        raise ValueError("Ajuste sem dados na sessão: passe `data` (e `groups`).")
+    groups = groups if groups is not None else getattr(result, "groups", None)
+    if groups is None:
+        raise ValueError("Informe `groups` (coluna de escola) para reconstruir o delineamento.")
+    _, endog, exog, g, exog_re = design.mixedlm_arrays(
+        result.formula, data, groups, result.re_formula, cache, mask)
+    return (endog.to_numpy(dtype=float), exog.to_numpy(dtype=float), g,
+            exog_re.to_numpy(dtype=float), list(exog_re.columns))
+
+
+def random_effects(result, data: Optional[pd.DataFrame] = None, groups=None,
+                   cache: Optional[design.DesignCache] = None, mask=None) -> SchoolEffects:
+    """
+    BLUPs e variâncias condicionais de um MixedLM (statsmodels ou `StoredFit`).
+    Usa as matrizes do modelo quando o ajuste está vivo na sessão; senão
+    (ajuste vindo do disco) reconstrói y/X/Z de `data` pelo cache de delineamento.
+    """
+    y, X, g, Z, names = _arrays(result, data, groups, cache, mask)
+    beta = np.asarray(result.fe_params, dtype=float)
+    psi = np.asarray(result.cov_re, dtype=float)
+    scale = float(result.scale)
+    if Z.shape[1] != psi.shape[0]:
+        raise ValueError(f"Z tem {Z.shape[1]} colunas e cov_re é {psi.shape}.")
+
+    with stage("pisa_blup.random_effects", rows=len(y), q=Z.shape[1]):
+        codes, labels = pd.factorize(pd.Series(g), sort=True)
+        G, q = len(labels), Z.shape[1]
+        r = y - X @ beta
+        ztz = np.empty((G, q, q))
+        ztr = np.empty((G, q))
+        for a in range(q):
+            ztr[:, a] = np.bincount(codes, weights=Z[:, a] * r, minlength=G)
+            for b in range(a, q):
+                ztz[:, a, b] = np.bincount(codes, weights=Z[:, a] * Z[:, b], minlength=G)
+                ztz[:, b, a] = ztz[:, a, b]
+        M = scale * np.eye(q) + ztz @ psi                           # (G, q, q)
+        Minv = np.linalg.solve(M, np.broadcast_to(np.eye(q), M.shape))
+        blup = np.ascontiguousarray(np.einsum("ab,gbc,gc->ga", psi, Minv, ztr))
+        cond = scale * (psi @ Minv)
+        cond = np.ascontiguousarray(0.5 * (cond + np.swapaxes(cond, 1, 2)))
+    return SchoolEffects(pd.Index(labels, name="group"), list(names), blup, cond,
+                         np.bincount(codes, minlength=G), psi, scale)
+
+
+def rank_schools(effects: SchoolEffects, intercept: Any = None, slope: Any = None,
+                 alpha: float = 0.05, min_n: int = 1, group_name: str = "CNTSCHID") -> pd.DataFrame:
+    """
+    Tabela ranqueada de escolas (vetorizada). Eficaz: intervalo do intercepto
+    aleatório acima de 0 (desempenho acima do esperado pelo perfil). Equitativa:
+    intervalo do desvio de inclinação de ESCS abaixo de 0 (gradiente mais plano).
+    Ordena por perfil e, dentro dele, pelo limite inferior do intercepto
+    (ranking conservador: escolas pequenas não sobem só por ruído).
+    """
+    _require_scipy()
+    intercept = effects.names[0] if intercept is None else intercept
+    z = _stats.norm.ppf(1 - alpha / 2)
+    se = effects.se()
+    rel = effects.reliability()
+    keep = effects.n >= min_n
+
+    def block(name, prefix):
+        if name is None:
+            nan = np.full(keep.sum(), np.nan)
+            return {f"{prefix}_re": nan, f"{prefix}_se": nan, f"{prefix}_lo": nan,
+                    f"{prefix}_hi": nan, f"confiabilidade_{prefix}": nan}
+        j = effects._col(name)
+        b, s = effects.blup[keep, j], se[keep, j]
+        return {f"{prefix}_re": b, f"{prefix}_se": s, f"{prefix}_lo": b - z * s,
+                f"{prefix}_hi": b + z * s, f"confiabilidade_{prefix}": rel[keep, j]}
+
+    out = pd.DataFrame({group_name: effects.groups.to_numpy()[keep], "n_alunos": effects.n[keep],
+                        **block(intercept, "intercepto"), **block(slope, "slope_escs")})
+    eficaz = (out["intercepto_lo"] > 0).to_numpy()
+    equitativa = (out["slope_escs_hi"] < 0).to_numpy()
+    out["perfil"] = pd.Categorical(
+        np.select([eficaz & equitativa, eficaz, equitativa], PERFIS[:3], PERFIS[3]),
+        categories=PERFIS, ordered=True)
+    out["rank_eficacia"] = out["intercepto_re"].rank(ascending=False, method="min")
+    out["rank_equidade"] = out["slope_escs_re"].rank(ascending=True, method="min")
+    out = out.sort_values(["perfil", "intercepto_lo"], ascending=[True, False], kind="stable")
+    return out.reset_index(drop=True)
+
+
+def rank_schools_many(effects: Mapping[str, SchoolEffects], key_name: str = "dominio",
+                      **kwargs) -> pd.DataFrame:
+    """`rank_schools` para vários modelos (ex.: um por domínio), empilhado com `key_name`."""
+    frames = [rank_schools(e, **kwargs).assign(**{key_name: k}) for k, e in effects.items()]
+    return pd.concat(frames, ignore_index=True)
+
+
+__all__ = ["PERFIS", "SchoolEffects", "random_effects", "rank_schools", "rank_schools_many"]
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Codificação compacta (opcional) dos documentos de alunos para o MongoDB.
+
+O formato de `pisa_prep.to_mongo_documents_students` repete em todo aluno nomes
+longos (`STIDSTD`, `controls.lang_home`...), o subdocumento `meta` constante,
+rótulos de texto dos controles e 10 PVs como lista de doubles. O formato
+compacto (`compact/v1`):
+
+- usa aliases curtos de campo (`STIDSTD` -> `i`, `controls.sex` -> `g`, ...);
+- omite campos ausentes (None) em vez de gravá-los;
+- troca os rótulos dos controles por códigos inteiros (tabela no esquema);
+- empacota os PVs num binário float32 (little-endian, NaN = ausente);
+- move `meta`, aliases e tabelas de códigos para UM documento de esquema por
+  coleção, na coleção META_COLLECTION (`_id` = nome da coleção).
+
+`decode_students` restaura exatamente o formato atual (PVs com precisão float32;
+use pv_dtype="float64" para ida e volta sem perda).
+
+Uso típico
+----------
+    from pisa_compact import encode_students, decode_students, write_compact, read_compact
+
+    docs, schema = encode_students(df_stu)          # df de pisa_prep.load_students_df
+    write_compact(db, "students_c", df_stu)         # grava dados + esquema
+    alunos = read_compact(db, "students_c", {"SCHOOLID": "7600001"})  # formato original
+
+    from pisa_compact import compare_encodings
+    compare_encodings(df_stu)                        # bytes BSON e throughput, normal vs compacto
+"""
+
+from __future__ import annotations
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from pisa_prep import PV_READ_COLS, chunked, to_mongo_documents_students
+from profiling import stage
+
+
+ENCODING = "compact/v1"
+META_COLLECTION = "_pisa_schema"
+DEFAULT_META = {"source": "PISA2018", "country": "BRA", "level": "student"}
+
+# caminho no formato atual -> alias curto
+FIELD_ALIASES: Dict[str, str] = {
+    "STIDSTD": "i",
+    "SCHOOLID": "s",
+    "W_FSTUWT": "w",
+    "ESCS": "e",
+    "DISCLIMA": "d",
+    "controls.sex": "g",
+    "controls.repeat": "r",
+    "controls.lang_home": "l",
+    "controls.immig": "m",
+    "pv_read": "p",
+}
+
+# caminho no formato atual -> coluna do DataFrame de pisa_prep
+_SOURCE_COLS: Dict[str, str] = {
+    "STIDSTD": "STIDSTD", "SCHOOLID": "SCHOOLID", "W_FSTUWT": "W_FSTUWT",
+    "ESCS": "ESCS", "DISCLIMA": "DISCLIMA",
+    "controls.sex": "ST004D01T", "controls.repeat": "REPEAT",
+    "controls.lang_home": "LANGN", "controls.immig": "IMMIG",
+}
+_ID_FIELDS = ("STIDSTD", "SCHOOLID")
+_NUMERIC_FIELDS = ("W_FSTUWT", "ESCS", "DISCLIMA")
+_CONTROL_FIELDS = ("controls.sex", "controls.repeat", "controls.lang_home", "controls.immig")
+
+
+# ------------------------------------ Codificação -----------------------------------
+
+def _as_str_array(s: pd.Series) -> np.ndarray:
+    """Mesma regra de `pisa_prep._as_str`: str(x), ausente -> None."""
+    out = s.astype(object).to_numpy()
+    miss = pd.isna(out)
+    return np.array([None if m else str(v) for v, m in zip(out, miss)], dtype=object)
+
+
+def _numeric_array(s: pd.Series) -> np.ndarray:
+    v = pd.to_numeric(s, errors="coerce").astype(float).to_numpy()
+    return np.array([None if np.isnan(x) else float(x) for x in v], dtype=object)
+
+
+def encode_students(df_students: pd.DataFrame,
+                    meta: Optional[dict] = None,
+                    pv_dtype: str = "float32",
+                    student_as_id: bool = False) -> Tuple[List[dict], dict]:
+    """
+    Converte o DF de alunos (colunas de pisa_prep.STUDENT_COLS) em documentos compactos.
+
+    Parâmetros
+    ----------
+    meta : metadado constante da coleção (padrão: DEFAULT_META), guardado só no esquema.
+    pv_dtype : "float32" (4 bytes/PV) ou "float64" (sem perda).
+    student_as_id : usa o id do aluno como `_id` (dispensa o ObjectId e um índice extra).
+
+    Retorna
+    -------
+    (docs, schema) — `schema` deve ser gravado com `write_schema` (ou use `write_compact`).
+    """
+    if pv_dtype not in ("float32", "float64"):
+        raise ValueError("pv_dtype deve ser 'float32' ou 'float64'")
+    n = len(df_students)
+    cols: Dict[str, np.ndarray] = {}
+    categories: Dict[str, List] = {}
+
+    for path in _ID_FIELDS:
+        src = _SOURCE_COLS[path]
+        cols[path] = _as_str_array(df_students[src]) if src in df_students else np.full(n, None, dtype=object)
+    for path in _NUMERIC_FIELDS:
+        src = _SOURCE_COLS[path]
+        cols[path] = _numeric_array(df_students[src]) if src in df_students else np.full(n, None, dtype=object)
+    for path in _CONTROL_FIELDS:
+        src = _SOURCE_COLS[path]
+        if src not in df_students:
+            cols[path] = np.full(n, None, dtype=object)
+            continue
+        codes, uniques = pd.factorize(df_students[src], use_na_sentinel=True)
+        categories[FIELD_ALIASES[path]] = [u.item() if hasattr(u, "item") else u for u in uniques]
+        cols[path] = np.array([None if c < 0 else int(c) for c in codes], dtype=object)
+
+    present_pv = [c for c in PV_READ_COLS if c in df_students.columns]
+    pv = df_students[present_pv].apply(pd.to_numeric, errors="coerce").to_numpy(dtype="<f8")
+    pv = pv.astype("<f4" if pv_dtype == "float32" else "<f8")
+
+    aliases = [(FIELD_ALIASES[p], cols[p]) for p in (*_ID_FIELDS, *_NUMERIC_FIELDS, *_CONTROL_FIELDS)]
+    docs: List[dict] = []
+    for k in range(n):
+        doc = {a: v[k] for a, v in aliases if v[k] is not None}
+        if present_pv:
+            doc["p"] = pv[k].tobytes()
+        if student_as_id and "i" in doc:
+            doc["_id"] = doc.pop("i")
+        docs.append(doc)
+
+    schema = {
+        "encoding": ENCODING,
+        "aliases": dict(FIELD_ALIASES),
+        "categories": categories,
+        "pv_cols": present_pv,
+        "pv_dtype": "<f4" if pv_dtype == "float32" else "<f8",
+        "student_as_id": bool(student_as_id),
+        "meta": dict(meta or DEFAULT_META),
+    }
+    return docs, schema
+
+
+# ----------------------------------- Decodificação ----------------------------------
+
+def decode_students(docs: Iterable[dict], schema: dict, keep_id: bool = False) -> List[dict]:
+    """
+    Restaura o formato de `to_mongo_documents_students` a partir de documentos compactos.
+    `keep_id` preserva o `_id` do Mongo (quando não é o id do aluno).
+    """
+    if schema.get("encoding") != ENCODING:
+        raise ValueError(f"Esquema desconhecido: {schema.get('encoding')!r} (esperado {ENCODING!r})")
+    a = schema["aliases"]
+    cats = {k: list(v) for k, v in schema.get("categories", {}).items()}
+    dt = np.dtype(schema["pv_dtype"])
+    has_pv = bool(schema.get("pv_cols"))
+    as_id = schema.get("student_as_id", False)
+    meta = schema["meta"]
+
+    def _cat(alias: str, doc: dict):
+        c = doc.get(alias)
+        return None if c is None else cats[alias][c]
+
+    out: List[dict] = []
+    for doc in docs:
+        if has_pv and "p" in doc:
+            pv = [None if np.isnan(x) else float(x) for x in np.frombuffer(doc["p"], dtype=dt)]
+        else:
+            pv = []
+        rec = {
+            "STIDSTD": doc.get("_id") if as_id else doc.get(a["STIDSTD"]),
+            "SCHOOLID": doc.get(a["SCHOOLID"]),
+            "W_FSTUWT": doc.get(a["W_FSTUWT"]),
+            "ESCS": doc.get(a["ESCS"]),
+            "DISCLIMA": doc.get(a["DISCLIMA"]),
+            "controls": {
+                "sex": _cat(a["controls.sex"], doc),
+                "repeat": _cat(a["controls.repeat"], doc),
+                "lang_home": _cat(a["controls.lang_home"], doc),
+                "immig": _cat(a["controls.immig"], doc),
+            },
+            "pv_read": pv,
+            "meta": dict(meta),
+        }
+        if keep_id and not as_id and "_id" in doc:
+            rec = {"_id": doc["_id"], **rec}
+        out.append(rec)
+    return out
+
+
+def alias_query(query: dict, schema: dict) -> dict:
+    """
+    Traduz um filtro escrito no formato atual para os aliases (ex.: {"SCHOOLID": x} -> {"s": x}).
+    Igualdade em controles com rótulo vira igualdade no código.
+    """
+    a = schema["aliases"]
+    cats = schema.get("categories", {})
+    out = {}
+    for k, v in query.items():
+        if k.startswith("$") and isinstance(v, list):
+            out[k] = [alias_query(q, schema) for q in v]
+            continue
+        if k == "STIDSTD" and schema.get("student_as_id"):
+            out["_id"] = v
+            continue
+        alias = a.get(k, k)
+        if alias in cats and not isinstance(v, dict):
+            v = cats[alias].index(v) if v in cats[alias] else -1
+        out[alias] = v
+    return out
+
+
+# --------------------------------------- MongoDB ------------------------------------
+
+def write_schema(db, collection: str, schema: dict) -> None:
+    db[META_COLLECTION].replace_one({"_id": collection}, {"_id": collection, **schema}, upsert=True)
+
+
+def read_schema(db, collection: str) -> dict:
+    schema = db[META_COLLECTION].find_one({"_id": collection})
+    if schema is None:
+        raise KeyError(f"Coleção '{collection}' não tem esquema em {META_COLLECTION}.")
+    schema.pop("_id", None)
+    return schema
+
+
+def write_compact(db, collection: str, df_students: pd.DataFrame,
+                  batch_size: int = 50_000, drop_existing: bool = True, **encode_kwargs) -> int:
+    """Codifica, grava os documentos e o esquema da coleção. Retorna o número de alunos."""
+    with stage("pisa_compact.encode", rows=len(df_students)):
+        docs, schema = encode_students(df_students, **encode_kwargs)
+    if drop_existing:
+        db[collection].drop()
+    with stage("pisa_compact.insert_many", rows=len(docs), collection=collection):
+        for batch in chunked(docs, batch_size):
+            db[collection].insert_many(batch, ordered=False)
+    write_schema(db, collection, schema)
+    return len(docs)
+
+
+def read_compact(db, collection: str, query: Optional[dict] = None, keep_id: bool = False) -> List[dict]:
+    """Lê (filtro no formato atual) e devolve documentos no formato atual."""
+    schema = read_schema(db, collection)
+    cur = db[collection].find(alias_query(query or {}, schema))
+    with stage("pisa_compact.decode", collection=collection) as st:
+        out = decode_students(cur, schema, keep_id=keep_id)
+        st.rows = len(out)
+    return out
+
+
+# ------------------------------------- Comparação -----------------------------------
+
+def compare_encodings(df_students: pd.DataFrame, repeats: int = 3, pv_dtype: str = "float32") -> pd.DataFrame:
+    """
+    Compara formato atual x compacto: bytes BSON (total e por aluno) e throughput
+    de codificar (DF -> docs -> BSON) e decodificar (BSON -> docs no formato atual).
+    Não precisa de servidor; usa o `bson` do pymongo.
+    """
+    try:
+        import bson
+    except Exception as e:
+        raise RuntimeError("pymongo não está instalado. Rode: pip install pymongo") from e
+
+    def _best(fn):
+        best, res = float("inf"), None
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            res = fn()
+            best = min(best, time.perf_counter() - t0)
+        return best, res
+
+    n = len(df_students)
+    t_enc_plain, raw_plain = _best(lambda: [bson.encode(d) for d in to_mongo_documents_students(df_students)])
+    t_enc_comp, (raw_comp, schema) = _best(
+        lambda: (lambda ds: ([bson.encode(d) for d in ds[0]], ds[1]))(encode_students(df_students, pv_dtype=pv_dtype))
+    )
+    t_dec_plain, _ = _best(lambda: [bson.decode(b) for b in raw_plain])
+    t_dec_comp, _ = _best(lambda: decode_students((bson.decode(b) for b in raw_comp), schema))
+
+    rows = []
+    for name, raw, te, td, extra in (
+        ("atual", raw_plain, t_enc_plain, t_dec_plain, 0),
+        (ENCODING, raw_comp, t_enc_comp, t_dec_comp, len(bson.encode(schema))),
+    ):
+        total = sum(len(b) for b in raw) + extra
+        rows.append({
+            "encoding": name, "docs": n, "bson_bytes": total,
+            "bytes_per_doc": total / n if n else None,
+            "encode_docs_per_s": n / te if te > 0 else None,
+            "decode_docs_per_s": n / td if td > 0 else None,
+        })
+    out = pd.DataFrame(rows)
+    out["size_ratio"] = out["bson_bytes"] / out["bson_bytes"].iloc[0]
+    return out
+
+
+__all__ = [
+    "ENCODING", "META_COLLECTION", "FIELD_ALIASES",
+    "encode_students", "decode_students", "alias_query",
+    "write_schema", "read_schema", "write_compact", "read_compact", "compare_encodings",
+]
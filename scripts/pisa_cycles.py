@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+"""
+Carga longitudinal de vários ciclos do PISA (2009–2022) num esquema harmonizado,
+para análises de tendência do gradiente ESCS.
+
+Cada ciclo fica numa pasta com a mesma organização de `pisa2018/`:
+
+    <base>/pisa2009/stu/STU_BRA.xlsx, <base>/pisa2009/sch/SCH_BRA.xlsx, PISA2009_CODEBOOK.xlsx
+    <base>/pisa2012/...
+    <base>/pisa2018/...
+
+Os nomes das variáveis mudam entre ciclos (SCHOOLID → CNTSCHID, StIDStd → CNTSTUID,
+ST04Q01 → ST004D01T, DISCLISCIE em 2015...). `SCHEMA` lista, para cada nome
+harmonizado, os nomes candidatos; a tabela de renomeação de cada ciclo é derivada
+das variáveis que existem no codebook do ciclo (e no cabeçalho dos arquivos),
+escolhendo o primeiro candidato presente. As tabelas vão para o manifesto. Na
+leitura, cada arquivo é renomeado pelo próprio cabeçalho (o codebook pode listar
+uma variável que o arquivo não traz); ids e chaves (`REQUIRED_COLUMNS`) ausentes
+são erro, nunca colunas NA.
+
+Só entram como candidatos nomes com o mesmo construto e o mesmo sentido: SCMATEDU
+(qualidade dos recursos, ≤2012) não é EDUSHORT (falta de recursos, outra escala),
+então EDUSHORT fica ausente nesses ciclos.
+
+Os pares (ciclo, país) são lidos em paralelo (um processo por par, como em
+`pisa_multicountry`) e gravados num único conjunto parquet particionado no estilo
+hive:
+
+    <out>/stu/cycle=2018/CNT=BRA/part-0.parquet
+    <out>/sch/cycle=2018/CNT=BRA/part-0.parquet
+    <out>/_manifest.json
+
+`CrossCycleDataset` lê com `pyarrow.dataset`: filtros por ciclo/país descartam
+partições pelo caminho (predicate pushdown), então consultar 2018 não abre os
+arquivos dos outros ciclos.
+
+Uso típico
+----------
+    from pisa_cycles import load_cycles, CrossCycleDataset
+
+    manifest = load_cycles("dados_pisa", "outputs/cycles", cycles=[2009, 2012, 2015, 2018, 2022])
+    ds = CrossCycleDataset("outputs/cycles")
+    stu_2018 = ds.load("stu", columns=["CNTSCHID", "ESCS", "PV1READ", "SENWT"], cycles=[2018])
+    trend = ds.load("stu", columns=["ESCS", "PV1READ", "SENWT"], countries=["BRA"])  # todos os ciclos
+"""
+
+from __future__ import annotations
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from pisa_inventory import XlsxReader, default_catalog
+from pisa_multicountry import discover_countries
+from pisa_prep import discover_paths
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pads
+except ImportError:  # pragma: no cover
+    pa = None
+    pads = None
+
+
+CYCLES = (2009, 2012, 2015, 2018, 2022)
+
+_PV = {f"PV{i}{d}": (f"PV{i}{d}",) for d in ("READ", "MATH", "SCIE") for i in range(1, 11)}
+
+# nome harmonizado -> candidatos (o primeiro presente no ciclo vence)
+SCHEMA: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "STU": {
+        "CNTSCHID": ("CNTSCHID", "SCHOOLID"),
+        "CNTSTUID": ("CNTSTUID", "STIDSTD", "StIDStd"),
+        "ESCS": ("ESCS",),
+        "ST004D01T": ("ST004D01T", "ST04Q01"),
+        "REPEAT": ("REPEAT",),
+        "DISCLIMA": ("DISCLIMA", "DISCLISCIE"),
+        "BELONG": ("BELONG",),
+        "W_FSTUWT": ("W_FSTUWT",),
+        "SENWT": ("SENWT",),
+        **_PV,                                    # 2009/2012: só PV1–PV5
+    },
+    "SCH": {
+        "CNTSCHID": ("CNTSCHID", "SCHOOLID"),
+        "EDUSHORT": ("EDUSHORT",),
+        "STAFFSHORT": ("STAFFSHORT", "TCSHORT"),
+        "SCHSIZE": ("SCHSIZE",),
+        "STRATIO": ("STRATIO",),
+    },
+}
+
+# ids e chaves de junção: sem eles a partição não serve para nada
+REQUIRED_COLUMNS: Dict[str, Tuple[str, ...]] = {"STU": ("CNTSCHID", "CNTSTUID"), "SCH": ("CNTSCHID",)}
+
+ID_COLUMNS = {"CNTSCHID", "CNTSTUID"}
+LABEL_COLUMNS = {"ST004D01T", "REPEAT"}
+
+_CYCLE_DIR_RE = re.compile(r"^pisa[_-]?(\d{4})$", re.IGNORECASE)
+_CODE_HEADERS = ("NAME", "VARNAME", "VARIABLE", "CODE")
+
+
+def _require_pyarrow() -> None:
+    if pads is None:
+        raise RuntimeError("pyarrow não está instalado. Instale com: pip install pyarrow")
+
+
+# ----------------------------------- Descoberta ------------------------------------
+
+def discover_cycles(base_dir: str) -> Dict[int, str]:
+    """{ano: pasta} para as subpastas `pisaAAAA` de `base_dir`."""
+    out = {}
+    for d in sorted(os.listdir(base_dir)):
+        m = _CYCLE_DIR_RE.match(d)
+        if m and os.path.isdir(os.path.join(base_dir, d)):
+            out[int(m.group(1))] = os.path.join(base_dir, d)
+    return out
+
+
+def find_codebook(cycle_dir: str, cycle: int) -> Optional[str]:
+    """PISA<ano>_CODEBOOK.xlsx (qualquer caixa) ou PISA.xlsx na pasta do ciclo."""
+    names = {f.lower(): f for f in os.listdir(cycle_dir)}
+    for cand in (f"pisa{cycle}_codebook.xlsx", "pisa.xlsx"):
+        if cand in names:
+            return os.path.join(cycle_dir, names[cand])
+    return None
+
+
+def codebook_variables(path: str) -> Set[str]:
+    """
+    Nomes de variáveis listados no codebook (todas as abas): a coluna cujo
+    cabeçalho é NAME/VARNAME/VARIABLE/Code, procurado nas primeiras linhas.
+    """
+    names: Set[str] = set()
+    with XlsxReader(path) as rd:
+        for sheet in rd.sheet_names:
+            df = rd.read(sheet)
+            if df.empty:
+                continue
+            # cabeçalho da aba como 1ª linha da grade (NAME pode estar já na linha 1)
+            grid = pd.DataFrame([list(df.columns), *df.astype(object).to_numpy().tolist()])
+            for i in range(min(10, len(grid))):
+                row = grid.iloc[i].astype(str).str.strip().str.upper()
+                hits = [j for j, v in row.items() if v in _CODE_HEADERS]
+                if hits:
+                    col = grid.iloc[i + 1:, hits[0]].dropna().astype(str).str.strip()
+                    names.update(v for v in col if re.fullmatch(r"[A-Za-z][\w.]*", v))
+                    break
+    return names
+
+
+def rename_table(level: str, available: Iterable[str],
+                 schema: Optional[Mapping[str, Mapping[str, Sequence[str]]]] = None,
+                 source: Optional[str] = None) -> Dict[str, str]:
+    """
+    {nome_no_ciclo: nome_harmonizado} escolhendo, para cada variável do esquema,
+    o primeiro candidato disponível (comparação sem caixa: StIDStd = STIDSTD).
+    Levanta KeyError se uma coluna de `REQUIRED_COLUMNS` não tiver candidato
+    (`source` identifica a origem na mensagem).
+    """
+    by_upper = {str(a).upper(): str(a) for a in available if a is not None}
+    out: Dict[str, str] = {}
+    for harm, cands in (schema or SCHEMA)[level.upper()].items():
+        for c in cands:
+            real = by_upper.get(c.upper())
+            if real is not None:
+                out[real] = harm
+                break
+    missing = [c for c in REQUIRED_COLUMNS.get(level.upper(), ()) if c not in out.values()]
+    if missing:
+        raise KeyError(f"Colunas obrigatórias sem candidato em {source or level.upper()}: {missing}")
+    return out
+
+
+def cycle_rename_tables(cycle_dir: str, cycle: int, countries: Sequence[str]) -> Dict[str, Dict[str, str]]:
+    """Tabelas {nível: {origem: harmonizado}} do ciclo: codebook ∪ cabeçalhos dos arquivos."""
+    codebook = find_codebook(cycle_dir, cycle)
+    from_codebook = codebook_variables(codebook) if codebook else set()
+    cat = default_catalog()
+    tables = {}
+    for level in SCHEMA:
+        available = set(from_codebook)
+        for cnt in countries:
+            path = dict(zip(("STU", "SCH"), discover_paths(cycle_dir, cnt)))[level]
+            if os.path.exists(path):
+                available.update(h for h in cat.header(path, cat.pick_sheet(path)) if h)
+        tables[level] = rename_table(level, available, source=f"{cycle}/{level}")
+    return tables
+
+
+# --------------------------------- Worker (processo) --------------------------------
+
+def _as_label(s: pd.Series) -> pd.Series:
+    num = pd.to_numeric(s, errors="coerce")
+    if num.notna().sum() == s.notna().sum():
+        return num.round().astype("Int64").astype("string")
+    return s.astype("string")
+
+
+def harmonise(df: pd.DataFrame, level: str, rename: Mapping[str, str]) -> pd.DataFrame:
+    """
+    Frame já renomeado -> esquema harmonizado completo: todas as colunas do esquema
+    (ausentes = NA), tipos fixos (ids Int64, rótulos string, medidas float64) e
+    SENWT derivado de W_FSTUWT quando o ciclo não o traz (soma 5000 por país,
+    definição do senate weight).
+    """
+    level = level.upper()
+    source = {harm: src for src, harm in rename.items()}
+    out = {}
+    for harm in SCHEMA[level]:
+        s = df[harm] if harm in df.columns else pd.Series(np.nan, index=df.index)
+        if isinstance(s, pd.DataFrame):  # cabeçalho repetido no arquivo: vale a 1ª coluna
+            s = s.iloc[:, 0]
+        if harm in ID_COLUMNS:
+            out[harm] = pd.to_numeric(s, errors="coerce").round().astype("Int64")
+        elif harm in LABEL_COLUMNS:
+            out[harm] = _as_label(s)
+        else:
+            out[harm] = pd.to_numeric(s, errors="coerce").astype("float64")
+    out = pd.DataFrame(out, index=df.index)
+    if level == "STU" and "SENWT" not in source and out["W_FSTUWT"].notna().any():
+        w = out["W_FSTUWT"]
+        out["SENWT"] = w * 5000.0 / w.sum()
+    return out.reset_index(drop=True)
+
+
+def _partition_path(out_dir: str, level: str, cycle: int, country: str) -> str:
+    return os.path.join(out_dir, level.lower(), f"cycle={cycle}", f"CNT={country}", "part-0.parquet")
+
+
+def _load_pair(cycle: int, country: str, cycle_dir: str, tables: Dict[str, Dict[str, str]],
+               out_dir: str) -> dict:
+    """Lê STU/SCH de um (ciclo, país), harmoniza e grava as partições. Roda no processo filho."""
+    t0 = time.perf_counter()
+    info = {"cycle": cycle, "country": country, "files": {}, "rows": {}, "missing": {}, "rename": {},
+            "error": None}
+    try:
+        paths = dict(zip(("STU", "SCH"), discover_paths(cycle_dir, country)))
+        for level, path in paths.items():
+            if not os.path.exists(path):
+                continue
+            with XlsxReader(path) as rd:
+                sheet = rd.pick_sheet()
+                # o cabeçalho do arquivo decide: a tabela do ciclo vem também do codebook
+                rename = rename_table(level, rd.header(sheet), source=os.path.basename(path))
+                df = rd.read(sheet, columns=list(SCHEMA[level]), aliases=rename,
+                             required=REQUIRED_COLUMNS[level])
+            if rename != tables[level]:
+                info["rename"][level] = rename
+            info["missing"][level] = [c for c in SCHEMA[level] if c not in df.columns]
+            df = harmonise(df, level, rename)
+            out = _partition_path(out_dir, level, cycle, country)
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            tmp = out + ".tmp"
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, out)  # partição parcial nunca fica visível
+            info["files"][level] = os.path.relpath(out, out_dir)
+            info["rows"][level] = int(len(df))
+    except Exception as e:
+        info["error"] = f"{type(e).__name__}: {e}"
+    info["seconds"] = time.perf_counter() - t0
+    return info
+
+
+# ------------------------------------ Carga em lote ---------------------------------
+
+def load_cycles(base_dir: str,
+                out_dir: str,
+                cycles: Optional[Sequence[int]] = None,
+                countries: Optional[Sequence[str]] = None,
+                cycle_dirs: Optional[Mapping[int, str]] = None,
+                max_workers: Optional[int] = None,
+                verbose: bool = True) -> dict:
+    """
+    Lê todos os (ciclo, país) em paralelo e grava o conjunto particionado.
+
+    Parâmetros
+    ----------
+    cycles : anos a processar; padrão = todas as pastas `pisaAAAA` de `base_dir`.
+    countries : códigos de país; padrão = os que têm STU e SCH em cada ciclo.
+    cycle_dirs : {ano: pasta} explícito (sobrepõe a descoberta).
+
+    Retorna
+    -------
+    dict
+        Manifesto {"schema", "cycles": {ano: {"rename": {...}, "countries": {...}}}},
+        também gravado em <out_dir>/_manifest.json.
+    """
+    _require_pyarrow()
+    dirs = dict(cycle_dirs or discover_cycles(base_dir))
+    if cycles:
+        missing = [c for c in cycles if c not in dirs]
+        if missing:
+            raise FileNotFoundError(f"Ciclos sem pasta em {base_dir}: {missing}")
+        dirs = {c: dirs[c] for c in cycles}
+    os.makedirs(out_dir, exist_ok=True)
+
+    plan: Dict[int, dict] = {}
+    for cycle, d in sorted(dirs.items()):
+        cnts = list(countries) if countries else discover_countries(d)
+        plan[cycle] = {"dir": d, "countries": cnts, "rename": cycle_rename_tables(d, cycle, cnts)}
+
+    results: Dict[int, Dict[str, dict]] = {c: {} for c in plan}
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        futs = [ex.submit(_load_pair, cycle, cnt, p["dir"], p["rename"], out_dir)
+                for cycle, p in plan.items() for cnt in p["countries"]]
+        for fut in as_completed(futs):
+            info = fut.result()
+            results[info["cycle"]][info["country"]] = info
+            if verbose:
+                status = f"ERRO {info['error']}" if info["error"] else \
+                    ", ".join(f"{k}={v}" for k, v in info["rows"].items())
+                print(f"[{info['cycle']} {info['country']}] {info['seconds']:.1f}s | {status}")
+
+    manifest = {
+        "schema": {lvl: list(cols) for lvl, cols in SCHEMA.items()},
+        "cycles": {str(c): {"rename": plan[c]["rename"], "countries": dict(sorted(results[c].items()))}
+                   for c in plan},
+    }
+    with open(os.path.join(out_dir, "_manifest.json"), "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, ensure_ascii=False, indent=2)
+    return manifest
+
+
+# ------------------------------- Conjunto combinado ----------------------------------
+
+class CrossCycleDataset:
+    """
+    Visão do conjunto gravado por `load_cycles` (partições hive cycle=/CNT=).
+    Filtros por ciclo e país podam partições antes de abrir qualquer arquivo.
+    """
+
+    def __init__(self, out_dir: str) -> None:
+        _require_pyarrow()
+        self.out_dir = out_dir
+        path = os.path.join(out_dir, "_manifest.json")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Manifesto não encontrado em {out_dir} (rode load_cycles).")
+        with open(path, encoding="utf-8") as fh:
+            self.manifest = json.load(fh)
+        self._datasets: Dict[str, "pads.Dataset"] = {}
+
+    @property
+    def cycles(self) -> List[int]:
+        return sorted(int(c) for c in self.manifest["cycles"])
+
+    def countries(self, cycle: Optional[int] = None) -> List[str]:
+        cyc = [str(cycle)] if cycle is not None else list(self.manifest["cycles"])
+        return sorted({cnt for c in cyc for cnt, info in self.manifest["cycles"][c]["countries"].items()
+                       if not info.get("error")})
+
+    def rename_table(self, cycle: int, level: str = "stu") -> Dict[str, str]:
+        return dict(self.manifest["cycles"][str(cycle)]["rename"][level.upper()])
+
+    def dataset(self, level: str = "stu") -> "pads.Dataset":
+        level = level.lower()
+        if level not in self._datasets:
+            part = pads.partitioning(pa.schema([("cycle", pa.int16()), ("CNT", pa.string())]), flavor="hive")
+            self._datasets[level] = pads.dataset(os.path.join(self.out_dir, level), format="parquet",
+                                                 partitioning=part)
+        return self._datasets[level]
+
+    @staticmethod
+    def _filter(cycles, countries, extra):
+        expr = None
+        for name, values, cast in (("cycle", cycles, int), ("CNT", countries, str)):
+            if values:
+                e = pads.field(name).isin([cast(v) for v in values])
+                expr = e if expr is None else expr & e
+        if extra is not None:
+            expr = extra if expr is None else expr & extra
+        return expr
+
+    def scanner(self, level: str = "stu", columns: Optional[List[str]] = None,
+                cycles: Optional[Sequence[int]] = None, countries: Optional[Sequence[str]] = None,
+                filter=None, batch_size: int = 200_000):
+        """Scanner pyarrow (para ler em lotes); mesmos filtros de `load`."""
+        return self.dataset(level).scanner(columns=columns, filter=self._filter(cycles, countries, filter),
+                                           batch_size=batch_size)
+
+    def load(self, level: str = "stu", columns: Optional[List[str]] = None,
+             cycles: Optional[Sequence[int]] = None, countries: Optional[Sequence[str]] = None,
+             filter=None) -> pd.DataFrame:
+        """
+        Lê as colunas pedidas dos ciclos/países pedidos; `cycle` e `CNT` vêm das
+        partições. `filter` aceita uma expressão pyarrow extra (ex.:
+        `pads.field("ESCS") > 0`), empurrada para a leitura dos row groups.
+        """
+        cols = None if columns is None else list(dict.fromkeys(["cycle", "CNT", *columns]))
+        table = self.scanner(level, cols, cycles, countries, filter).to_table()
+        df = table.to_pandas()
+        if "CNT" in df.columns:
+            df["CNT"] = df["CNT"].astype("category")
+        return df
+
+    def iter_batches(self, level: str = "stu", columns: Optional[List[str]] = None,
+                     cycles: Optional[Sequence[int]] = None, countries: Optional[Sequence[str]] = None,
+                     filter=None, batch_size: int = 200_000):
+        """Blocos pandas (ex.: para `pisa_groupby.aggregate` fora da memória)."""
+        cols = None if columns is None else list(dict.fromkeys(["cycle", "CNT", *columns]))
+        for batch in self.scanner(level, cols, cycles, countries, filter, batch_size).to_batches():
+            if batch.num_rows:
+                yield batch.to_pandas()
+
+    def __repr__(self) -> str:
+        return f"CrossCycleDataset({self.out_dir!r}, ciclos={self.cycles})"
+
+
+__all__ = [
+    "CYCLES", "SCHEMA", "REQUIRED_COLUMNS", "discover_cycles", "find_codebook", "codebook_variables",
+    "rename_table", "cycle_rename_tables", "harmonise", "load_cycles", "CrossCycleDataset",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Carga multi-ciclo do PISA em parquet particionado.")
+    ap.add_argument("base_dir")
+    ap.add_argument("out_dir")
+    ap.add_argument("--cycles", nargs="*", type=int, default=None)
+    ap.add_argument("--countries", nargs="*", default=None)
+    ap.add_argument("--workers", type=int, default=None)
+    args = ap.parse_args()
+
+    load_cycles(args.base_dir, args.out_dir, cycles=args.cycles, countries=args.countries,
+                max_workers=args.workers)
@@ -3,6 +3,8 @@ import pandas as pd
 import numpy as np
 from IPython.display import display
 
+from pisa_inventory import XlsxReader, default_catalog
+
 # ---------- util ----------
 def peek_df(name, df, n=3, max_cols=12):
     print(f"{name} => {list(df.columns)[:max_cols]}  (shape={df.shape})")
@@ -10,11 +12,7 @@ def peek_df(name, df, n=3, max_cols=12):
     
     
 def _pick_sheet(xlsx_path, pref=("data","data.with.lbl")):
-    xls = pd.ExcelFile(xlsx_path, engine="openpyxl")
-    for s in pref:
-        if s in xls.sheet_names: 
-            return s
-    return xls.sheet_names[0]
+    return default_catalog().pick_sheet(xlsx_path, pref, contains=None)
 
 def _to_float(df, cols):
     for c in cols:
@@ -28,35 +26,19 @@ def _to_str_strip(df, cols):
             df[c] = df[c].astype(str).str.strip()
     return df
 
-def load_students(stu_path):
-    sheet = _pick_sheet(stu_path)
-    # 1) ler só o header para descobrir quais colunas existem
-    header = pd.read_excel(stu_path, sheet_name=sheet, nrows=0, engine="openpyxl")
-    cols = list(map(str, header.columns))
+_ID_ALIASES = {"CNTSTUID": "STIDSTD", "CNTSCHID": "SCHOOLID"}
 
-    # 2) resolver sinônimos -> decidir as colunas reais a ler
-    pick = {
-        "STIDSTD":  next((c for c in ["STIDSTD","CNTSTUID"] if c in cols), None),
-        "SCHOOLID": next((c for c in ["SCHOOLID","CNTSCHID"] if c in cols), None),
-        "W_FSTUWT": "W_FSTUWT" if "W_FSTUWT" in cols else None,
-        "ESCS":     "ESCS"     if "ESCS"     in cols else None,
-        "DISCLIMA": "DISCLIMA" if "DISCLIMA" in cols else None,
-        "ST004D01T":"ST004D01T" if "ST004D01T" in cols else None,
-        "REPEAT":   "REPEAT"   if "REPEAT"   in cols else None,
-        "LANGN":    "LANGN"    if "LANGN"    in cols else None,
-        "IMMIG":    "IMMIG"    if "IMMIG"    in cols else None,
-    }
-    pv_real = [c for c in PV_READ if c in cols]
-    read_cols = [c for c in pick.values() if c is not None] + pv_real
-    if not read_cols:
+def load_students(stu_path):
+    # 1-4) uma abertura: aba, cabeçalho e sinônimos resolvidos em memória;
+    #      só as colunas canônicas presentes são lidas, já com nome canônico
+    with XlsxReader(stu_path) as rd:
+        sheet = rd.pick_sheet(("data","data.with.lbl"), contains=None)
+        df = rd.read(sheet, columns=["STIDSTD","SCHOOLID","W_FSTUWT","ESCS","DISCLIMA",
+                                     "ST004D01T","REPEAT","LANGN","IMMIG",*PV_READ],
+                     aliases=_ID_ALIASES)
+    if df.shape[1] == 0:
         raise RuntimeError("Nenhuma coluna esperada encontrada em STU_BRA.xlsx.")
-
-    # 3) carregar somente as colunas necessárias
-    df = pd.read_excel(stu_path, sheet_name=sheet, engine="openpyxl", usecols=read_cols)
-
-    # 4) renomear para canônico
-    rename = {v:k for k,v in pick.items() if v is not None}
-    df = df.rename(columns=rename)
+    pv_real = [c for c in PV_READ if c in df.columns]
 
     # 5) coerções
     df = _to_float(df, ["W_FSTUWT","ESCS","DISCLIMA","REPEAT","LANGN","IMMIG",*pv_real])
@@ -69,17 +51,13 @@ def load_students(stu_path):
     return df[keep].copy()
 
 def load_schools(sch_path):
-    sheet = _pick_sheet(sch_path)
-    header = pd.read_excel(sch_path, sheet_name=sheet, nrows=0, engine="openpyxl")
-    cols = list(map(str, header.columns))
-
-    pick_id = next((c for c in ["SCHOOLID","CNTSCHID"] if c in cols), None)
-    read_cols = [pick_id] + [c for c in ["SCMATEDU","TCSHORT"] if c in cols if pick_id]
-    if not pick_id:
-        raise RuntimeError("SCH: não encontrei coluna de ID da escola (SCHOOLID/CNTSCHID).")
-
-    df = pd.read_excel(sch_path, sheet_name=sheet, engine="openpyxl", usecols=read_cols)
-    df = df.rename(columns={pick_id: "SCHOOLID"})
+    with XlsxReader(sch_path) as rd:
+        sheet = rd.pick_sheet(("data","data.with.lbl"), contains=None)
+        try:
+            df = rd.read(sheet, columns=["SCHOOLID","SCMATEDU","TCSHORT"], aliases=_ID_ALIASES,
+                         required=["SCHOOLID"])
+        except KeyError:
+            raise RuntimeError("SCH: não encontrei coluna de ID da escola (SCHOOLID/CNTSCHID).")
     df = _to_str_strip(df, ["SCHOOLID"])
     df = _to_float(df, [c for c in ["SCMATEDU","TCSHORT"] if c in df.columns])
     df = df[df["SCHOOLID"].notna() & (df["SCHOOLID"]!="")].drop_duplicates(subset=["SCHOOLID"])
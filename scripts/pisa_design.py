@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+Cache de matrizes de delineamento (lado direito das fórmulas) para os ajustes
+WLS/MixedLM das tarefas T2–T4 e do laço por domínio.
+
+`smf.wls`/`smf.mixedlm` reavaliam a fórmula inteira a cada chamada (inclusive a
+expansão de `C(REPEAT)` e as interações), mesmo quando só o desfecho muda. Aqui
+a matriz do lado direito é construída uma vez e guardada sob a chave
+
+    (RHS, impressão digital das colunas usadas pelo RHS, máscara de linhas)
+
+com descarte LRU por bytes. Trocar o desfecho (READ → MATH) ou imputações que não
+alteram as colunas do RHS reaproveitam a mesma matriz, sem reavaliar a fórmula;
+cada subconjunto (tercis via `mask`) é avaliado uma vez e também fica em cache.
+
+Observações
+-----------
+- Com máscara, a fórmula é avaliada só nas linhas selecionadas, como
+  `smf.wls(formula, data[mask])`: níveis de `C(...)` ausentes no subconjunto não
+  viram colunas nulas, e transformações com estado (`center`, `standardize`)
+  usam o subconjunto.
+- Matrizes com muitas dummies podem ser guardadas esparsas (`sparse="auto"`);
+  são densificadas só no momento do ajuste.
+- `dtype="float32"` guarda as matrizes em 4 bytes quando `pisa_precision.float32_safe`
+  permite (senão ficam em float64); o ajuste sempre recebe float64.
+- Os resultados são objetos statsmodels comuns: `params`, `bse`, `predict(frame)`
+  (a especificação da fórmula é anexada ao modelo) funcionam como em `smf`.
+
+Uso típico
+----------
+    from pisa_design import DesignCache, fit_wls, fit_mixedlm
+
+    cache = DesignCache(max_bytes=512 * 2**20)
+    rhs = "ESCS_c + clima_escola_c + DISCLIMA + EDUSHORT_c + STAFFSHORT_c + ST004D01T + C(REPEAT) + ESCS_c:clima_escola_c"
+    for dep in ["READ", "MATH", "SCIE"]:
+        res = fit_wls(f"{dep} ~ {rhs}", base, weights="SENWT", cache=cache)   # RHS construído 1x
+    res_t1 = fit_wls("READ ~ ESCS", base, weights="SENWT", cache=cache, mask=base["clima_tercil"].eq("Baixo clima disciplinar"))
+    cache.stats()
+"""
+
+from __future__ import annotations
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from profiling import stage
+
+try:
+    import statsmodels.api as sm
+except ImportError:  # pragma: no cover
+    sm = None
+
+try:
+    import patsy
+except ImportError:  # pragma: no cover
+    patsy = None
+
+try:
+    from scipy import sparse as _sparse
+except ImportError:  # pragma: no cover
+    _sparse = None
+
+
+def _require_statsmodels() -> None:
+    if sm is None:
+        raise RuntimeError("statsmodels não está instalado. Instale com: pip install statsmodels")
+    _require_patsy()
+
+
+def _require_patsy() -> None:
+    if patsy is None:
+        raise RuntimeError("patsy não está instalado. Instale com: pip install patsy")
+
+
+def build_design(rhs: str, frame: pd.DataFrame) -> Tuple[pd.DataFrame, Any]:
+    """
+    (X, DesignInfo) do RHS via `patsy.dmatrix` (API pública; linhas com NA nas
+    variáveis do RHS são descartadas, como em `smf`). O índice de X é o de `frame`.
+    """
+    _require_patsy()
+    X = patsy.dmatrix(rhs, frame, NA_action="drop", return_type="dataframe")
+    return X, X.design_info
+
+
+def design_for(spec: Any, frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    X de novos dados com uma especificação já ajustada: `DesignInfo` do patsy
+    (pisa_design, smf) ou `ModelSpec` do formulaic (smf com esse motor).
+    """
+    if hasattr(spec, "get_model_matrix"):
+        return pd.DataFrame(spec.get_model_matrix(frame))
+    _require_patsy()
+    return patsy.build_design_matrices([spec], frame, NA_action="drop", return_type="dataframe")[0]
+
+
+def model_spec(model) -> Any:
+    """Especificação da fórmula de um modelo statsmodels (0.14: `design_info`; 0.15: `model_spec`)."""
+    data = getattr(model, "data", None)
+    for holder, attr in ((model, "model_spec"), (data, "model_spec"), (data, "design_info")):
+        spec = getattr(holder, attr, None) if holder is not None else None
+        if spec is not None:
+            return spec
+    return None
+
+
+_IDENT = re.compile(r"[A-Za-z_][A-Za-z0-9_.]*")
+
+
+def referenced_columns(formula: str, data: pd.DataFrame) -> List[str]:
+    """Colunas de `data` citadas na fórmula (na ordem do frame)."""
+    names = set(_IDENT.findall(formula))
+    return [c for c in data.columns if isinstance(c, str) and c in names]
+
+
+def split_formula(formula: str) -> Tuple[str, str]:
+    """'y ~ a + b' -> ('y', 'a + b')."""
+    if "~" not in formula:
+        raise ValueError(f"Fórmula sem '~': {formula!r}")
+    lhs, rhs = formula.split("~", 1)
+    return lhs.strip(), rhs.strip()
+
+
+def fingerprint(data: pd.DataFrame, columns: Optional[Sequence[str]] = None) -> str:
+    """
+    Impressão digital (blake2b) do conteúdo de `columns` (todas por padrão):
+    nomes, dtypes, índice e valores. Custo O(n) vetorial, bem menor que reavaliar a fórmula.
+    """
+    cols = list(data.columns if columns is None else columns)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((len(data), cols)).encode())
+    h.update(pd.util.hash_pandas_object(data.index, index=False).to_numpy().tobytes())
+    for c in cols:
+        s = data[c]
+        h.update(f"{c}|{s.dtype}".encode())
+        h.update(pd.util.hash_pandas_object(s, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _mask_key(mask, n: int) -> Optional[str]:
+    if mask is None:
+        return None
+    m = np.asarray(mask, dtype=bool)
+    if m.shape != (n,):
+        raise ValueError(f"mask deve ter {n} posições (tem {m.shape}).")
+    return hashlib.blake2b(np.packbits(m).tobytes(), digest_size=16).hexdigest()
+
+
+@dataclass
+class DesignMatrix:
+    """Matriz do RHS já avaliada: `rows` são posições no frame original."""
+    rhs: str
+    columns: List[str]
+    rows: np.ndarray
+    matrix: Any            # np.ndarray (float64) ou scipy.sparse.csr_matrix
+    spec: Any              # DesignInfo (patsy), usado no predict
+
+    @property
+    def is_sparse(self) -> bool:
+        return _sparse is not None and _sparse.issparse(self.matrix)
+
+    @property
+    def nbytes(self) -> int:
+        m = self.matrix
+        if self.is_sparse:
+            return int(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes) + int(self.rows.nbytes)
+        return int(m.nbytes) + int(self.rows.nbytes)
+
+    def dense(self) -> np.ndarray:
+        m = self.matrix.toarray() if self.is_sparse else self.matrix
+        return m if m.dtype == np.float64 else m.astype(np.float64)
+
+    def subset(self, keep: np.ndarray) -> "DesignMatrix":
+        """Linhas `keep` (máscara sobre `rows`)."""
+        return DesignMatrix(self.rhs, self.columns, self.rows[keep], self.matrix[keep], self.spec)
+
+
+class DesignCache:
+    """
+    Cache LRU de `DesignMatrix` limitado por bytes.
+
+    sparse : "auto" | True | False
+        "auto" guarda em CSR quando a fração de não zeros é menor que `density`.
+    dtype : "float64" | "float32"
+        "float32" guarda em 4 bytes as matrizes que passam em `float32_safe`.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 2**20, sparse: Union[str, bool] = "auto",
+                 density: float = 0.35, dtype: str = "float64") -> None:
+        if dtype not in ("float64", "float32"):
+            raise ValueError("dtype deve ser 'float64' ou 'float32'")
+        self.max_bytes = int(max_bytes)
+        self.sparse = sparse
+        self.density = density
+        self.dtype = dtype
+        self._items: "OrderedDict[tuple, DesignMatrix]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    # ---------------- interno ----------------
+
+    def _put(self, key: tuple, dm: DesignMatrix) -> None:
+        with self._lock:
+            if key in self._items:
+                return
+            if dm.nbytes > self.max_bytes:
+                return  # maior que o cache inteiro: não guarda
+            self._items[key] = dm
+            self._bytes += dm.nbytes
+            while self._bytes > self.max_bytes and self._items:
+                _, old = self._items.popitem(last=False)
+                self._bytes -= old.nbytes
+                self.evictions += 1
+
+    def _lookup(self, key: tuple) -> Optional[DesignMatrix]:
+        with self._lock:
+            dm = self._items.get(key)
+            if dm is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+            return dm
+
+    def _store_form(self, X: np.ndarray):
+        if self.dtype == "float32":
+            from pisa_precision import float32_safe
+            if float32_safe(X):
+                X = X.astype(np.float32)
+        want = self.sparse
+        if want == "auto":
+            want = X.size > 0 and np.count_nonzero(X) / X.size < self.density
+        if want and _sparse is not None:
+            return _sparse.csr_matrix(X)
+        return X
+
+    def _build(self, rhs: str, data: pd.DataFrame, cols: List[str],
+               mask: Optional[np.ndarray] = None) -> DesignMatrix:
+        _require_statsmodels()
+        pos = np.arange(len(data)) if mask is None else np.flatnonzero(mask)
+        frame = data[cols].iloc[pos].reset_index(drop=True)
+        with stage("pisa_design.build", rows=len(frame), rhs=rhs):
+            X, spec = build_design(rhs, frame)
+        return DesignMatrix(
+            rhs=rhs,
+            columns=[str(c) for c in X.columns],
+            rows=pos[np.asarray(X.index, dtype=np.int64)],
+            matrix=self._store_form(np.ascontiguousarray(X.to_numpy(dtype=np.float64))),
+            spec=spec,
+        )
+
+    # ---------------- API ----------------
+
+    def get(self, rhs: str, data: pd.DataFrame, mask=None) -> DesignMatrix:
+        """
+        Matriz do RHS para `data` (linhas com NA nas variáveis do RHS são descartadas,
+        como em `smf`). Com `mask`, a fórmula é avaliada só nas linhas selecionadas
+        (mesmas colunas de `smf` sobre `data[mask]`).
+        """
+        rhs = rhs.strip()
+        cols = referenced_columns(rhs, data)
+        fp = fingerprint(data, cols)
+        key = (rhs, fp, _mask_key(mask, len(data)))
+        dm = self._lookup(key)
+        if dm is not None:
+            return dm
+        self.misses += 1
+        dm = self._build(rhs, data, cols, None if mask is None else np.asarray(mask, dtype=bool))
+        self._put(key, dm)
+        return dm
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+
+_DEFAULT: Optional[DesignCache] = None
+
+
+def default_cache() -> DesignCache:
+    """Cache do processo (compartilhado pelos ajustes que não recebem `cache`)."""
+    global _DEFAULT
+    if _DEFAULT is None:
+        _DEFAULT = DesignCache()
+    return _DEFAULT
+
+
+# ------------------------------------ Ajustes ------------------------------------
+
+def _as_array(v, data: pd.DataFrame) -> np.ndarray:
+    if isinstance(v, str):
+        v = data[v]
+    return pd.to_numeric(pd.Series(np.asarray(v)), errors="coerce").to_numpy(dtype=float)
+
+
+def _prepare(formula: str, data: pd.DataFrame, cache: Optional[DesignCache], mask,
+             extra: Sequence[np.ndarray] = ()):
+    lhs, rhs = split_formula(formula)
+    dm = (cache or default_cache()).get(rhs, data, mask)
+    y = _as_array(lhs, data)[dm.rows]
+    ok = np.isfinite(y)
+    ex = [e[dm.rows] for e in extra]
+    for e in ex:
+        ok &= pd.notna(e)
+    if not ok.all():
+        dm = dm.subset(ok)
+        y = y[ok]
+        ex = [e[ok] for e in ex]
+    index = data.index[dm.rows]
+    exog = pd.DataFrame(dm.dense(), columns=dm.columns, index=index)
+    endog = pd.Series(y, index=index, name=lhs)
+    return dm, endog, exog, ex
+
+
+def _attach_formula(model, formula: str, dm: DesignMatrix):
+    model.formula = formula
+    # permite results.predict(DataFrame), como em smf (0.15 lê model_spec; 0.14, design_info)
+    model.data.model_spec = dm.spec
+    model.data.design_info = dm.spec
+    return model
+
+
+def fit_wls(formula: str, data: pd.DataFrame, weights, cache: Optional[DesignCache] = None,
+            mask=None, **fit_kwargs):
+    """Equivalente a `smf.wls(formula, data, weights=...).fit()` usando o cache de RHS."""
+    _require_statsmodels()
+    w = _as_array(weights, data)
+    dm, endog, exog, (w,) = _prepare(formula, data, cache, mask, extra=[w])
+    model = _attach_formula(sm.WLS(endog, exog, weights=w), formula, dm)
+    with stage("fit.wls.cached", rows=len(endog), formula=formula):
+        return model.fit(**fit_kwargs)
+
+
+def mixedlm_arrays(formula: str, data: pd.DataFrame, groups, re_formula: Optional[str] = None,
+                   cache: Optional[DesignCache] = None, mask=None):
+    """
+    (endog, exog, grupos, exog_re) exatamente como `fit_mixedlm` os entrega ao
+    MixedLM; o intercepto aleatório chama-se "Group", como em `MixedLM.from_formula`.
+    """
+    g = np.asarray(data[groups] if isinstance(groups, str) else groups)
+    dm, endog, exog, (g,) = _prepare(formula, data, cache, mask, extra=[g])
+    if re_formula is None or re_formula.strip() in ("1", "~1", "~ 1"):
+        exog_re = pd.DataFrame({"Group": np.ones(len(endog))}, index=endog.index)
+    else:
+        rdm = (cache or default_cache()).get(re_formula.strip().lstrip("~"), data, mask)
+        pos = pd.Index(rdm.rows).get_indexer(dm.rows)
+        if (pos < 0).any():
+            raise ValueError("re_formula tem ausentes em linhas usadas pela parte fixa; "
+                             "remova-os antes (dropna) ou use smf.mixedlm.")
+        names = [c.replace("Intercept", "Group") for c in rdm.columns]
+        exog_re = pd.DataFrame(rdm.dense()[pos], columns=names, index=endog.index)
+    return dm, endog, exog, g, exog_re
+
+
+def fit_mixedlm(formula: str, data: pd.DataFrame, groups, re_formula: Optional[str] = None,
+                cache: Optional[DesignCache] = None, mask=None, **fit_kwargs):
+    """
+    Equivalente a `smf.mixedlm(formula, data, groups=..., re_formula=...).fit(**fit_kwargs)`:
+    as matrizes fixas e aleatórias vêm do cache (o intercepto aleatório chama-se
+    "Group", como em `MixedLM.from_formula`).
+    """
+    _require_statsmodels()
+    dm, endog, exog, g, exog_re = mixedlm_arrays(formula, data, groups, re_formula, cache, mask)
+    model = _attach_formula(sm.MixedLM(endog, exog, groups=g, exog_re=exog_re), formula, dm)
+    with stage("fit.mixedlm.cached", rows=len(endog), formula=formula, re_formula=re_formula):
+        return model.fit(**fit_kwargs)
+
+
+__all__ = [
+    "DesignMatrix", "DesignCache", "default_cache", "fingerprint", "build_design", "design_for",
+    "model_spec",
+    "referenced_columns", "split_formula", "fit_wls", "fit_mixedlm", "mixedlm_arrays",
+]
@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""
+Exportação Arrow das tabelas analíticas (`students_final`, `school_profile`,
+resumos) para consumidores externos (BI, R), sem passar por CSV nem pelo Excel.
+
+Cada tabela é gravada em dois formatos colunares:
+
+    <out_dir>/<nome>.arrow      IPC/Feather v2 sem compressão: o leitor faz
+                                memory-map e usa os buffers direto (zero-copy;
+                                `arrow::read_feather(..., mmap = TRUE)` no R)
+    <out_dir>/<nome>.parquet    zstd, row groups com estatísticas min/max por
+                                coluna (filtros pulam row groups inteiros)
+    <out_dir>/_manifest.json    linhas, colunas e schema de cada tabela
+
+Textos repetitivos (rótulos de quartil, perfil, país) e colunas `category` viram
+colunas dicionarizadas do Arrow (índices int8/int16 + dicionário único), tanto no
+IPC quanto no parquet.
+
+`ArrowServer` serve as tabelas por socket TCP local em streams IPC de record
+batches. Protocolo (uma linha JSON de pedido, uma linha JSON de resposta e,
+em `get`, o stream Arrow logo em seguida):
+
+    -> {"op": "list"}
+    <- {"ok": true, "tables": {"school_profile": {"rows": ..., "columns": [...]}}}
+    -> {"op": "get", "name": "students_final", "columns": ["CNTSCHID", "ESCS"], "batch_rows": 65536}
+    <- {"ok": true, "rows": ...}  +  stream IPC (schema, batches...)
+
+Uso típico
+----------
+    import pisa_export as export
+
+    manifest = export.export_frames(
+        {"students_final": students_final, "school_profile": school_profile,
+         "quartil_summary": quartil_summary},
+        "outputs/arrow", sort_by={"students_final": ["CNTSCHID"]})
+    table = export.read_table("outputs/arrow/students_final.arrow")   # memory-map
+
+    with export.ArrowServer(root="outputs/arrow", port=8815) as srv:
+        df = export.fetch("students_final", port=srv.port, columns=["CNTSCHID", "ESCS"]).to_pandas()
+
+    # linha de comando
+    python scripts/pisa_export.py serve outputs/arrow --port 8815
+"""
+
+from __future__ import annotations
+import json
+import os
+import socket
+import socketserver
+import threading
+from typing import Any, Dict, Iterator, Mapping, Optional, Sequence, Union
+
+import pandas as pd
+
+from pisa_sparse import densify
+from profiling import stage
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise RuntimeError("pyarrow não está instalado. Instale com: pip install pyarrow")
+
+
+TableLike = Union[pd.DataFrame, "pa.Table"]
+
+
+# ------------------------------------ Conversão -------------------------------------
+
+def to_arrow(df: TableLike, max_levels: int = 256) -> "pa.Table":
+    """
+    DataFrame -> pa.Table. Colunas numéricas são repassadas sem cópia quando
+    o layout permite; textos com até `max_levels` valores distintos e colunas
+    `category` viram dicionário; colunas esparsas são densificadas.
+    """
+    _require_pyarrow()
+    if isinstance(df, pa.Table):
+        return df
+    cols: Dict[str, Any] = {}
+    for c in df.columns:
+        s = df[c]
+        if isinstance(s.dtype, pd.SparseDtype):
+            s = densify(s)
+        elif (s.dtype == object or pd.api.types.is_string_dtype(s)) and \
+                s.nunique(dropna=True) <= max_levels:
+            s = s.astype("category")
+        cols[str(c)] = s
+    return pa.Table.from_pandas(pd.DataFrame(cols, index=df.index), preserve_index=False)
+
+
+# ------------------------------------- Escrita --------------------------------------
+
+def write_ipc(df: TableLike, path: str, compression: Optional[str] = None,
+              max_levels: int = 256) -> str:
+    """
+    Arquivo IPC/Feather v2. Sem compressão (padrão) o arquivo pode ser lido por
+    memory-map sem cópia; `compression="zstd"`/`"lz4"` troca isso por tamanho.
+    """
+    table = to_arrow(df, max_levels)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    opts = pa_ipc.IpcWriteOptions(compression=compression)
+    with stage("pisa_export.write_ipc", rows=table.num_rows, cols=table.num_columns):
+        with pa.OSFile(tmp, "wb") as sink, pa_ipc.new_file(sink, table.schema, options=opts) as w:
+            w.write_table(table)
+    os.replace(tmp, path)
+    return path
+
+
+def write_parquet(df: TableLike, path: str, compression: str = "zstd",
+                  row_group_size: int = 65_536, sort_by: Optional[Sequence[str]] = None,
+                  max_levels: int = 256) -> str:
+    """
+    Parquet com dicionário e estatísticas por row group. `sort_by` ordena antes
+    de gravar, o que deixa os intervalos min/max estreitos (ex.: por CNTSCHID).
+    """
+    table = to_arrow(df, max_levels)
+    if sort_by:
+        table = table.sort_by([(c, "ascending") for c in sort_by])
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with stage("pisa_export.write_parquet", rows=table.num_rows, cols=table.num_columns):
+        pq.write_table(table, tmp, compression=compression, row_group_size=row_group_size,
+                       use_dictionary=True, write_statistics=True)
+    os.replace(tmp, path)
+    return path
+
+
+def export_frames(frames: Mapping[str, TableLike], out_dir: str,
+                  formats: Sequence[str] = ("arrow", "parquet"),
+                  sort_by: Optional[Mapping[str, Sequence[str]]] = None,
+                  row_group_size: int = 65_536, max_levels: int = 256) -> Dict[str, Any]:
+    """
+    Grava cada tabela de `frames` nos formatos pedidos e atualiza
+    <out_dir>/_manifest.json (tabelas já exportadas por outras chamadas são mantidas).
+    """
+    _require_pyarrow()
+    bad = set(formats) - {"arrow", "parquet"}
+    if bad:
+        raise ValueError(f"formatos desconhecidos: {sorted(bad)} (use 'arrow' e/ou 'parquet')")
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = _read_manifest(out_dir)
+    tables = manifest.setdefault("tables", {})
+    for name, df in frames.items():
+        table = to_arrow(df, max_levels)
+        files = {}
+        if "arrow" in formats:
+            files["arrow"] = os.path.basename(write_ipc(table, os.path.join(out_dir, f"{name}.arrow")))
+        if "parquet" in formats:
+            files["parquet"] = os.path.basename(write_parquet(
+                table, os.path.join(out_dir, f"{name}.parquet"), row_group_size=row_group_size,
+                sort_by=(sort_by or {}).get(name)))
+        tables[name] = {"rows": table.num_rows, "columns": table.column_names,
+                        "schema": {f.name: str(f.type) for f in table.schema}, "files": files}
+    manifest["tables"] = dict(sorted(tables.items()))
+    tmp = os.path.join(out_dir, "_manifest.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(out_dir, "_manifest.json"))
+    return manifest
+
+
+def _read_manifest(out_dir: str) -> Dict[str, Any]:
+    path = os.path.join(out_dir, "_manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+# -------------------------------------- Leitura -------------------------------------
+
+def read_table(path: str, columns: Optional[Sequence[str]] = None) -> "pa.Table":
+    """Lê .arrow por memory-map (zero-copy se sem compressão) ou .parquet."""
+    _require_pyarrow()
+    if path.endswith(".parquet"):
+        return pq.read_table(path, columns=list(columns) if columns else None)
+    table = pa_ipc.open_file(pa.memory_map(path, "r")).read_all()
+    return table.select(list(columns)) if columns else table
+
+
+def row_group_stats(path: str, column: str) -> pd.DataFrame:
+    """min/max/nulos de `column` em cada row group de um parquet."""
+    _require_pyarrow()
+    meta = pq.ParquetFile(path).metadata
+    j = meta.schema.names.index(column)
+    rows = []
+    for i in range(meta.num_row_groups):
+        rg = meta.row_group(i)
+        st = rg.column(j).statistics
+        rows.append({"row_group": i, "rows": rg.num_rows,
+                     "min": st.min if st is not None and st.has_min_max else None,
+                     "max": st.max if st is not None and st.has_min_max else None,
+                     "nulls": st.null_count if st is not None else None})
+    return pd.DataFrame(rows)
+
+
+# -------------------------------------- Servidor ------------------------------------
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _reply(self, payload: Dict[str, Any]) -> None:
+        self.wfile.write((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def handle(self) -> None:
+        server: "ArrowServer" = self.server.owner  # type: ignore[attr-defined]
+        try:
+            req = json.loads(self.rfile.readline().decode("utf-8") or "{}")
+            op = req.get("op")
+            if op == "list":
+                self._reply({"ok": True, "tables": server.catalog()})
+                return
+            if op != "get":
+                raise ValueError(f"operação desconhecida: {op!r}")
+            table = server.table(req["name"])
+            cols = req.get("columns")
+            if cols:
+                missing = [c for c in cols if c not in table.column_names]
+                if missing:
+                    raise KeyError(f"colunas ausentes em {req['name']!r}: {missing}")
+                table = table.select(cols)
+        except Exception as e:
+            self._reply({"ok": False, "error": f"{type(e).__name__}: {e}"})
+            return
+        self._reply({"ok": True, "rows": table.num_rows})
+        batch_rows = int(req.get("batch_rows") or server.batch_rows)
+        with stage("pisa_export.serve", table=req["name"], rows=table.num_rows):
+            with pa_ipc.new_stream(self.wfile, table.schema) as w:
+                for batch in table.to_batches(max_chunksize=batch_rows):
+                    w.write_batch(batch)
+        self.wfile.flush()
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ArrowServer:
+    """
+    Servidor TCP local de record batches Arrow. As tabelas vêm de `tables`
+    (DataFrames ou pa.Table) e/ou de um diretório de `export_frames` (`root`),
+    cujos .arrow são abertos por memory-map. `port=0` escolhe uma porta livre.
+    """
+
+    def __init__(self, tables: Optional[Mapping[str, TableLike]] = None, root: Optional[str] = None,
+                 host: str = "127.0.0.1", port: int = 0, batch_rows: int = 65_536) -> None:
+        _require_pyarrow()
+        self.host = host
+        self.batch_rows = batch_rows
+        self._tables: Dict[str, "pa.Table"] = {}
+        self._lock = threading.Lock()
+        if root is not None:
+            for name, info in _read_manifest(root).get("tables", {}).items():
+                f = info["files"].get("arrow") or info["files"].get("parquet")
+                self._tables[name] = read_table(os.path.join(root, f))
+        for name, df in (tables or {}).items():
+            self.register(name, df)
+        self._server = _TCPServer((host, port), _Handler, bind_and_activate=True)
+        self._server.owner = self  # type: ignore[attr-defined]
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def register(self, name: str, df: TableLike) -> None:
+        table = to_arrow(df)
+        with self._lock:
+            self._tables[name] = table
+
+    def table(self, name: str) -> "pa.Table":
+        with self._lock:
+            if name not in self._tables:
+                raise KeyError(f"tabela desconhecida: {name!r}")
+            return self._tables[name]
+
+    def catalog(self) -> Dict[str, Any]:
+        with self._lock:
+            return {n: {"rows": t.num_rows, "columns": t.column_names}
+                    for n, t in sorted(self._tables.items())}
+
+    def start(self) -> "ArrowServer":
+        """Atende em uma thread de fundo."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, daemon=True,
+                                            name=f"ArrowServer:{self.port}")
+            self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self) -> "ArrowServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def __repr__(self) -> str:
+        return f"ArrowServer({self.host}:{self.port}, tabelas={len(self._tables)})"
+
+
+# -------------------------------------- Cliente -------------------------------------
+
+def _request(host: str, port: int, payload: Dict[str, Any], timeout: Optional[float]):
+    sock = socket.create_connection((host, port), timeout=timeout)
+    rfile = sock.makefile("rb")
+    sock.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+    head = json.loads(rfile.readline().decode("utf-8") or "{}")
+    if not head.get("ok"):
+        rfile.close()
+        sock.close()
+        raise RuntimeError(f"servidor Arrow recusou o pedido: {head.get('error', 'sem resposta')}")
+    return sock, rfile, head
+
+
+def list_tables(host: str = "127.0.0.1", port: int = 8815,
+                timeout: Optional[float] = 30.0) -> Dict[str, Any]:
+    """Catálogo do servidor: {nome: {"rows": ..., "columns": [...]}}."""
+    sock, rfile, head = _request(host, port, {"op": "list"}, timeout)
+    rfile.close()
+    sock.close()
+    return head["tables"]
+
+
+def iter_batches(name: str, host: str = "127.0.0.1", port: int = 8815,
+                 columns: Optional[Sequence[str]] = None, batch_rows: Optional[int] = None,
+                 timeout: Optional[float] = 30.0) -> Iterator["pa.RecordBatch"]:
+    """Record batches de uma tabela do servidor, à medida que chegam."""
+    _require_pyarrow()
+    payload = {"op": "get", "name": name, "columns": list(columns) if columns else None,
+               "batch_rows": batch_rows}
+    sock, rfile, _ = _request(host, port, payload, timeout)
+    try:
+        reader = pa_ipc.open_stream(rfile)
+        for batch in reader:
+            yield batch
+    finally:
+        rfile.close()
+        sock.close()
+
+
+def fetch(name: str, host: str = "127.0.0.1", port: int = 8815,
+          columns: Optional[Sequence[str]] = None, batch_rows: Optional[int] = None,
+          timeout: Optional[float] = 30.0) -> "pa.Table":
+    """Tabela inteira do servidor (`.to_pandas()` para DataFrame)."""
+    _require_pyarrow()
+    payload = {"op": "get", "name": name, "columns": list(columns) if columns else None,
+               "batch_rows": batch_rows}
+    sock, rfile, _ = _request(host, port, payload, timeout)
+    try:
+        return pa_ipc.open_stream(rfile).read_all()
+    finally:
+        rfile.close()
+        sock.close()
+
+
+__all__ = [
+    "to_arrow", "write_ipc", "write_parquet", "export_frames", "read_table", "row_group_stats",
+    "ArrowServer", "list_tables", "iter_batches", "fetch",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Servidor local de tabelas Arrow exportadas.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sp = sub.add_parser("serve", help="serve um diretório de export_frames")
+    sp.add_argument("root")
+    sp.add_argument("--host", default="127.0.0.1")
+    sp.add_argument("--port", type=int, default=8815)
+    sp.add_argument("--batch-rows", type=int, default=65_536)
+    lp = sub.add_parser("list", help="lista as tabelas de um servidor")
+    lp.add_argument("--host", default="127.0.0.1")
+    lp.add_argument("--port", type=int, default=8815)
+    args = ap.parse_args()
+
+    if args.cmd == "serve":
+        srv = ArrowServer(root=args.root, host=args.host, port=args.port, batch_rows=args.batch_rows)
+        print(f"{srv!r} — Ctrl+C para encerrar")
+        try:
+            srv.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            srv.stop()
+    else:
+        print(json.dumps(list_tables(args.host, args.port), ensure_ascii=False, indent=2))
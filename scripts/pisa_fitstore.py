@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""
+Armazém de ajustes (WLS/MixedLM) com memoização em disco e reajuste preguiçoso.
+
+Cada ajuste é identificado por
+
+    (tipo, fórmula, re_formula, pesos, impressão digital dos dados, opções do otimizador)
+
+e persistido em `root/<chave>.pkl` como um `StoredFit` leve: parâmetros, erros
+padrão, covariância, componentes de variância, efeitos aleatórios (DataFrame
+contíguo, uma linha por grupo), métricas (AIC, R², llf...) e a fórmula. Ao reexecutar
+o notebook com dados e fórmula inalterados o resultado volta do disco na hora.
+
+`StoredFit` imita os atributos usados pelo notebook (`params`, `bse`, `tvalues`,
+`pvalues`, `rsquared`, `aic`, `scale`, `cov_re`, `random_effects`, `cov_params()`,
+`predict(frame)`), então `summarize_mixed`, `pisa_predict.predict_grid` etc.
+funcionam sem mudança. O objeto statsmodels completo (`.result`) só é refeito
+quando pedido e se os dados ainda estiverem na sessão.
+
+Uso típico
+----------
+    from pisa_fitstore import FitStore
+
+    store = FitStore("outputs/fit_store")
+    grad_full = store.fit_wls("READ ~ ESCS_c + ...", task2_base, weights="SENWT")
+    rs_mixed  = store.fit_mixedlm("READ ~ ESCS_c + ...", task3_base, groups="CNTSCHID",
+                                  re_formula="~ESCS_c",
+                                  fit_options=[{"method": "lbfgs", "reml": False},
+                                               {"method": "powell", "reml": False, "maxiter": 200}])
+    mixed_table = store.mixed_table({"Null": null_mixed, "Intercepto aleatório": ri_mixed,
+                                     "Inclinação aleatória": rs_mixed})
+    store.stats()
+"""
+
+from __future__ import annotations
+import hashlib
+import os
+import pickle
+import re
+import threading
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import pisa_design as design
+from profiling import stage
+
+try:
+    import statsmodels
+except ImportError:  # pragma: no cover
+    statsmodels = None
+
+
+STORE_VERSION = 1
+
+GRAD_TERMS = ["Intercept", "ESCS_c", "clima_escola_c", "ESCS_c:clima_escola_c"]
+
+# transformações com estado: o protótipo de níveis não reproduz a especificação
+_STATEFUL = re.compile(r"\b(center|standardize|scale|bs|cr|cc|te)\s*\(")
+
+
+# ------------------------------------ StoredFit ------------------------------------
+
+class StoredFit:
+    """Resultado persistido (sem dados) com a interface usada pelo notebook."""
+
+    def __init__(self, kind: str, formula: str, re_formula: Optional[str], key: str,
+                 fit_options: Dict[str, Any], values: Dict[str, Any],
+                 prototype: Optional[pd.DataFrame], groups: Optional[str] = None) -> None:
+        self.kind = kind
+        self.formula = formula
+        self.re_formula = re_formula
+        self.groups = groups
+        self.key = key
+        self.fit_options = fit_options
+        self.prototype = prototype
+        self.__dict__.update(values)
+        self._result = None
+        self._refit: Optional[Callable[[], Any]] = None
+        self._spec = None
+        self._spec_built = False
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        d["_result"] = None
+        d["_refit"] = None
+        d["_spec"] = None
+        d["_spec_built"] = False
+        return d
+
+    # ---- interface tipo statsmodels ----
+
+    def cov_params(self) -> pd.DataFrame:
+        return self.cov_params_
+
+    @property
+    def random_effects(self) -> Dict[Any, pd.Series]:
+        """Mesmo formato de `MixedLMResults.random_effects` (dict grupo -> Series)."""
+        re_ = self.random_effects_frame
+        if re_ is None:
+            return {}
+        cols = list(re_.columns)
+        return {g: pd.Series(row, index=cols) for g, row in zip(re_.index, re_.to_numpy())}
+
+    @property
+    def model(self):
+        """Só o necessário para prever: a especificação da fórmula (reconstruída sob demanda)."""
+        spec = self._model_spec()
+        return SimpleNamespace(formula=self.formula, model_spec=spec,
+                               data=SimpleNamespace(model_spec=spec))
+
+    def _model_spec(self):
+        if not self._spec_built:
+            self._spec_built = True
+            if self._result is not None:
+                self._spec = design.model_spec(self._result.model)
+            elif self.prototype is not None and design.patsy is not None:
+                _, rhs = design.split_formula(self.formula)
+                X, spec = design.build_design(rhs, self.prototype)
+                names = list(self.fe_params.index) if self.fe_params is not None else list(self.params.index)
+                self._spec = spec if [str(c) for c in X.columns] == names else None
+        if self._spec is None and self._refit is not None:
+            return design.model_spec(self.result.model)
+        if self._spec is None:
+            raise RuntimeError("Especificação da fórmula indisponível; reajuste com os dados na sessão.")
+        return self._spec
+
+    def predict(self, exog: pd.DataFrame) -> pd.Series:
+        X = design.design_for(self._model_spec(), exog)
+        b = self.fe_params if self.fe_params is not None else self.params
+        return pd.Series(np.asarray(X, dtype=float) @ np.asarray(b, dtype=float), index=X.index)
+
+    @property
+    def result(self):
+        """Objeto statsmodels completo; reajusta (uma vez) se necessário."""
+        if self._result is None:
+            if self._refit is None:
+                raise RuntimeError("Resultado completo indisponível: dados não estão nesta sessão.")
+            with stage("fitstore.refit", formula=self.formula):
+                self._result = self._refit()
+        return self._result
+
+    def __repr__(self) -> str:
+        return f"StoredFit({self.kind}, {self.formula!r}, re={self.re_formula!r}, key={self.key[:10]})"
+
+
+def _prototype(formula: str, data: pd.DataFrame, max_levels: int = 50) -> Optional[pd.DataFrame]:
+    """Frame mínimo com os níveis das colunas do RHS (para reconstruir a especificação)."""
+    _, rhs = design.split_formula(formula)
+    if _STATEFUL.search(rhs):
+        return None
+    cols = design.referenced_columns(rhs, data)
+    levels = {}
+    for c in cols:
+        s = data[c].dropna()
+        u = pd.unique(s)
+        if len(u) > max_levels:
+            if not pd.api.types.is_numeric_dtype(s):
+                return None
+            u = np.array([s.min(), s.max()])
+        else:
+            try:
+                u = np.sort(u)
+            except TypeError:
+                pass
+        levels[c] = u
+    if not levels:
+        return pd.DataFrame(index=range(1))
+    n = max(len(u) for u in levels.values())
+    return pd.DataFrame({c: np.resize(u, n) for c, u in levels.items()})
+
+
+def _values_from_result(kind: str, res) -> Dict[str, Any]:
+    g = lambda name: getattr(res, name, None)
+    v: Dict[str, Any] = {
+        "params": res.params.copy(),
+        "bse": g("bse"),
+        "tvalues": g("tvalues"),
+        "pvalues": g("pvalues"),
+        "cov_params_": res.cov_params(),
+        "nobs": float(res.nobs),
+        "llf": float(res.llf) if g("llf") is not None else np.nan,
+        "aic": float(res.aic) if g("aic") is not None else np.nan,
+        "bic": float(res.bic) if g("bic") is not None else np.nan,
+        "scale": float(res.scale),
+        "use_t": bool(g("use_t")),
+        "df_resid": float(g("df_resid")) if g("df_resid") is not None else np.inf,
+        "rsquared": float(res.rsquared) if g("rsquared") is not None else np.nan,
+        "rsquared_adj": float(res.rsquared_adj) if g("rsquared_adj") is not None else np.nan,
+        "fe_params": None, "cov_re": None, "random_effects_frame": None, "converged": True,
+    }
+    if kind == "mixedlm":
+        v["fe_params"] = res.fe_params.copy()
+        v["cov_re"] = res.cov_re.copy()
+        v["converged"] = bool(g("converged"))
+        re_ = res.random_effects
+        if re_:
+            keys = list(re_.keys())
+            first = re_[keys[0]]
+            v["random_effects_frame"] = pd.DataFrame(
+                np.vstack([np.asarray(re_[k], dtype=float) for k in keys]),
+                index=pd.Index(keys, name="group"), columns=list(first.index))
+    return v
+
+
+# ------------------------------------ FitStore ------------------------------------
+
+class FitStore:
+    """
+    Memoização de ajustes: memória da sessão + arquivos pickle em `root`
+    (root=None mantém só em memória).
+    """
+
+    def __init__(self, root: Optional[str] = "outputs/fit_store",
+                 cache: Optional[design.DesignCache] = None) -> None:
+        self.root = root
+        self.cache = cache
+        self._mem: Dict[str, StoredFit] = {}
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.fits = 0
+        if root:
+            os.makedirs(root, exist_ok=True)
+
+    # ---------------- chaves ----------------
+
+    @staticmethod
+    def make_key(kind: str, formula: str, data: pd.DataFrame, weights=None, groups=None,
+                 re_formula: Optional[str] = None, fit_options: Any = None) -> str:
+        cols = design.referenced_columns(f"{formula} {re_formula or ''}", data)
+        extra = []
+        for v in (weights, groups):
+            if isinstance(v, str):
+                cols.append(v)
+                extra.append(("col", v))
+            elif v is not None:
+                # bytes na ordem das linhas: um vetor permutado é outra chave
+                h = pd.util.hash_pandas_object(pd.Series(np.asarray(v)), index=False).to_numpy()
+                extra.append(("arr", len(h), hashlib.blake2b(h.tobytes(), digest_size=16).hexdigest()))
+            else:
+                extra.append(None)
+        payload = (
+            STORE_VERSION, kind, " ".join(formula.split()), " ".join((re_formula or "").split()),
+            design.fingerprint(data, list(dict.fromkeys(cols))), repr(extra), repr(fit_options),
+            getattr(statsmodels, "__version__", None),
+        )
+        return hashlib.blake2b(repr(payload).encode(), digest_size=20).hexdigest()
+
+    def _path(self, key: str) -> Optional[str]:
+        return os.path.join(self.root, f"{key}.pkl") if self.root else None
+
+    def get(self, key: str) -> Optional[StoredFit]:
+        with self._lock:
+            fit = self._mem.get(key)
+        if fit is not None:
+            self.hits += 1
+            return fit
+        p = self._path(key)
+        if p and os.path.exists(p):
+            with open(p, "rb") as fh:
+                fit = pickle.load(fh)
+            with self._lock:
+                self._mem[key] = fit
+            self.disk_hits += 1
+            return fit
+        return None
+
+    def _put(self, fit: StoredFit) -> None:
+        with self._lock:
+            self._mem[fit.key] = fit
+        p = self._path(fit.key)
+        if p:
+            tmp = p + ".tmp"
+            with open(tmp, "wb") as fh:
+                pickle.dump(fit, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, p)
+
+    def _memo(self, kind: str, formula: str, data: pd.DataFrame, re_formula, key: str,
+              fit_options, run: Callable[[], Any], groups: Optional[str] = None) -> StoredFit:
+        fit = self.get(key)
+        if fit is not None:
+            fit._refit = fit._refit or run  # reajuste preguiçoso disponível nesta sessão
+            return fit
+        with stage(f"fitstore.fit.{kind}", rows=len(data), formula=formula):
+            res = run()
+        self.fits += 1
+        fit = StoredFit(kind, formula, re_formula, key, fit_options,
+                        _values_from_result(kind, res), _prototype(formula, data), groups)
+        fit._result = res
+        fit._refit = run
+        self._put(fit)
+        return fit
+
+    # ---------------- ajustes ----------------
+
+    def fit_wls(self, formula: str, data: pd.DataFrame, weights, mask=None, **fit_kwargs) -> StoredFit:
+        """
+        `smf.wls(formula, data, weights).fit(**fit_kwargs)` memorizado. Com `mask`, a
+        chave e o ajuste usam o mesmo recorte `data[mask]` (a fórmula é avaliada no
+        subconjunto): equivale a chamar com o frame já recortado.
+        """
+        sub = data
+        if mask is not None:
+            m = np.asarray(mask, dtype=bool)
+            sub = data[m]
+            if not isinstance(weights, str):
+                weights = np.asarray(weights)[m]
+        key = self.make_key("wls", formula, sub, weights=weights, fit_options=fit_kwargs)
+        run = lambda: design.fit_wls(formula, sub, weights, cache=self.cache, **fit_kwargs)
+        return self._memo("wls", formula, sub, None, key, fit_kwargs, run)
+
+    def fit_mixedlm(self, formula: str, data: pd.DataFrame, groups, re_formula: Optional[str] = None,
+                    fit_options: Sequence[Dict[str, Any]] = ({"reml": False},),
+                    retry_on=(np.linalg.LinAlgError,)) -> StoredFit:
+        """
+        `smf.mixedlm(...).fit(**opts)` memorizado. `fit_options` é tentado em ordem
+        (ex.: lbfgs e, se a Hessiana for singular, powell); a chave cobre a lista toda.
+        """
+        fit_options = [dict(o) for o in fit_options]
+        key = self.make_key("mixedlm", formula, data, groups=groups, re_formula=re_formula,
+                            fit_options=fit_options)
+
+        def run():
+            for i, opts in enumerate(fit_options):
+                try:
+                    return design.fit_mixedlm(formula, data, groups, re_formula=re_formula,
+                                              cache=self.cache, **opts)
+                except retry_on:
+                    if i == len(fit_options) - 1:
+                        raise
+                    print(f"Aviso: ajuste falhou com {opts}; tentando {fit_options[i + 1]}.")
+
+        return self._memo("mixedlm", formula, data, re_formula, key, fit_options, run,
+                          groups=groups if isinstance(groups, str) else None)
+
+    # ---------------- resumos ----------------
+
+    @staticmethod
+    def mixed_table(fits: Mapping[str, StoredFit], **extra) -> pd.DataFrame:
+        """Tabela no formato de `mixed_table` do notebook (AIC, ICC, variâncias, coef. ESCS)."""
+        rows = []
+        for label, r in fits.items():
+            var_between = float(r.cov_re.iloc[0, 0]) if r.cov_re is not None and r.cov_re.size else 0.0
+            var_within = r.scale
+            tot = var_between + var_within
+            rows.append({**extra, "modelo": label, "AIC": r.aic,
+                         "ICC": var_between / tot if tot else np.nan,
+                         "Var_between": var_between, "Var_within": var_within,
+                         "coef_ESCS": r.params.get("ESCS_c", np.nan)})
+        return pd.DataFrame(rows)
+
+    @staticmethod
+    def grad_results(fits: Mapping[str, StoredFit], terms: Sequence[str] = GRAD_TERMS, **extra) -> pd.DataFrame:
+        """Tabela no formato de `grad_results` do notebook (estimativa, EP, t, p, R²)."""
+        rows = []
+        for label, m in fits.items():
+            for term in terms:
+                if term in m.params:
+                    rows.append({**extra, "modelo": label, "parâmetro": term,
+                                 "estimativa": m.params[term], "erro_padrao": m.bse[term],
+                                 "t": m.tvalues[term], "p": m.pvalues[term], "R2": m.rsquared})
+        return pd.DataFrame(rows)
+
+    def stats(self) -> Dict[str, int]:
+        n_disk = len([f for f in os.listdir(self.root) if f.endswith(".pkl")]) if self.root else 0
+        return {"memory": len(self._mem), "on_disk": n_disk, "hits": self.hits,
+                "disk_hits": self.disk_hits, "fits": self.fits}
+
+    def clear(self, disk: bool = False) -> None:
+        with self._lock:
+            self._mem.clear()
+        if disk and self.root:
+            for f in os.listdir(self.root):
+                if f.endswith(".pkl"):
+                    os.remove(os.path.join(self.root, f))
+
+
+__all__ = ["StoredFit", "FitStore", "GRAD_TERMS"]
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Agregação por grupo fora da memória (out-of-core) para perfis de escola,
+cobertura de merge e resumos por quartil quando `students_final` não cabe na RAM
+(vários ciclos × países, milhões de alunos × centenas de colunas).
+
+Os dados chegam em blocos (iterável de DataFrames: `pisa_audit.iter_sheet_chunks`,
+`iter_chunks` sobre vários parquet/csv, `MultiCountryDataset.iter_countries`...).
+Por bloco calcula-se, por grupo (ex.: `CNTSCHID`), só somas combináveis:
+
+    n (linhas), Σw, e por medida: Σw (linhas válidas), Σw·x, Σw·x²
+
+Chaves numéricas são normalizadas para float64 antes de agrupar e de
+calcular a partição (um bloco com id ausente chega como float64). Somas de
+blocos diferentes se combinam por adição, então a ordem dos blocos não
+importa e agregadores de workers distintos podem ser unidos com `merge`. Quando a
+tabela de grupos passa de `max_groups`, ela é despejada em disco particionada por
+hash da chave; no final cada partição (grupos disjuntos) é reduzida sozinha.
+As médias finais seguem a regra de `estatisticas.wmeans_by` (cada medida usa as
+linhas com medida e peso presentes) e coincidem com o cálculo em memória; o DP
+ponderado é o populacional, sqrt(Σw·x²/Σw − média²).
+
+Uso típico
+----------
+    import pisa_groupby as gb
+
+    agg = gb.GroupAggregator("CNTSCHID", "SENWT", estat.SCHOOL_PROFILE_MEASURES,
+                             count_name="n_students", max_groups=500_000,
+                             spill_dir="outputs/spill")
+    for chunk in gb.iter_chunks(["outputs/multicountry/stu/STU_BRA.parquet", ...],
+                                columns=agg.columns):
+        agg.update(chunk)
+    school_profile = agg.result()           # = estat.school_profile(students_final)
+
+    # ou, direto pelas funções de estatisticas (aceitam blocos):
+    school_profile = estat.school_profile(gb.iter_chunks(paths, columns=[...]))
+    quartis = gb.quartil_summary(lambda: gb.iter_chunks(paths, columns=[...]))
+"""
+
+from __future__ import annotations
+import os
+import shutil
+import tempfile
+import threading
+from itertools import chain
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from profiling import stage
+
+
+def iter_chunks(paths: Union[str, Sequence[str]], columns: Optional[Iterable[str]] = None,
+                chunksize: int = 200_000, sheet: Union[str, int] = "data") -> Iterator[pd.DataFrame]:
+    """Blocos de vários arquivos (.xlsx/.csv/.parquet) em sequência, projetando `columns`."""
+    from pisa_audit import iter_sheet_chunks
+
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    cols = None if columns is None else list(columns)
+    return chain.from_iterable(iter_sheet_chunks(p, sheet, cols, chunksize) for p in paths)
+
+
+def _canonical_key(s: pd.Series) -> pd.Series:
+    """
+    Chave numérica em float64: um bloco com CNTSCHID ausente vira float64 e o
+    mesmo id (1 e 1.0) precisa cair no mesmo grupo e na mesma partição.
+    """
+    if (pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s)
+            and not isinstance(s.dtype, pd.CategoricalDtype)):
+        return s.astype("float64")
+    return s
+
+
+def _partition_id(path: str) -> int:
+    # arquivos despejados: [m<k>-]p<partição>-<seq>.pkl
+    return int(os.path.basename(path).split("-")[-2][1:])
+
+
+class GroupAggregator:
+    """
+    Médias/DPs ponderados por grupo acumulados bloco a bloco, com despejo em disco.
+
+    `measures` mapeia nome de saída -> coluna (como em `estatisticas.wmeans_by`).
+    `sd=True` acrescenta `<saída>_sd`; `weight_sum_name` acrescenta Σw do grupo.
+    """
+
+    def __init__(self, by: Union[str, Sequence[str]] = "CNTSCHID", weight: Optional[str] = "SENWT",
+                 measures: Optional[Dict[str, str]] = None, count_name: Optional[str] = "n",
+                 sd: bool = False, weight_sum_name: Optional[str] = None,
+                 max_groups: int = 1_000_000, spill_dir: Optional[str] = None,
+                 partitions: int = 16) -> None:
+        self.by = [by] if isinstance(by, str) else list(by)
+        self.weight = weight
+        self.measures = dict(measures or {})
+        if self.measures and weight is None:
+            raise ValueError("Medidas ponderadas exigem `weight`.")
+        self.count_name = count_name
+        self.sd = sd
+        self.weight_sum_name = weight_sum_name
+        self.max_groups = max_groups
+        self.partitions = partitions
+        self.spill_root = spill_dir
+        self._spill_dir: Optional[str] = None
+        self._spills = 0
+        self._table: Optional[pd.DataFrame] = None
+        self._pending: List[pd.DataFrame] = []
+        self._pending_rows = 0
+        self._lock = threading.Lock()
+        self.rows = 0
+
+    @property
+    def columns(self) -> List[str]:
+        """Colunas que o agregador lê (para projetar a leitura dos blocos)."""
+        cols = [*self.by, *([self.weight] if self.weight else []), *self.measures.values()]
+        return list(dict.fromkeys(cols))
+
+    # ---------------- somas por bloco ----------------
+
+    def partial(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """Somas combináveis do bloco, indexadas pela chave do grupo."""
+        parts = {"__n": pd.Series(1.0, index=chunk.index)}
+        if self.weight:
+            w = pd.to_numeric(chunk[self.weight], errors="coerce").astype(float)
+            parts["__w"] = w.fillna(0.0)
+        for out, col in self.measures.items():
+            x = pd.to_numeric(chunk[col], errors="coerce").astype(float)
+            ok = x.notna() & w.notna()
+            wx = (w * x).where(ok, 0.0)
+            parts[f"{out}__sw"] = w.where(ok, 0.0)
+            parts[f"{out}__swx"] = wx
+            if self.sd:
+                parts[f"{out}__swxx"] = (wx * x).where(ok, 0.0)
+        keys = [_canonical_key(chunk[k]) for k in self.by]
+        return pd.DataFrame(parts, index=chunk.index).groupby(keys, observed=True, sort=False).sum()
+
+    def update(self, chunk: pd.DataFrame) -> "GroupAggregator":
+        part = self.partial(chunk)
+        with self._lock:
+            self.rows += len(chunk)
+            self._pending.append(part)
+            self._pending_rows += len(part)
+            if self._pending_rows >= self.max_groups:
+                self._compact()
+        return self
+
+    def merge(self, other: "GroupAggregator") -> "GroupAggregator":
+        """Soma o estado de outro agregador (ex.: de outro worker) a este."""
+        if other.partitions != self.partitions:
+            raise ValueError("Agregadores com números de partições diferentes.")
+        with other._lock:
+            other._compact()
+            spilled = other._spill_files()
+            table = other._table
+            rows = other.rows
+        with self._lock:
+            self.rows += rows
+            if table is not None:
+                self._pending.append(table)
+                self._pending_rows += len(table)
+            for path in spilled:
+                dst = os.path.join(self._dir(), f"m{self._spills:05d}-{os.path.basename(path)}")
+                shutil.copyfile(path, dst)
+                self._spills += 1
+            self._compact()
+        return self
+
+    # ---------------- memória e disco ----------------
+
+    @staticmethod
+    def _reduce(frames: List[pd.DataFrame]) -> pd.DataFrame:
+        if len(frames) == 1:
+            return frames[0]
+        t = pd.concat(frames)
+        return t.groupby(level=list(range(t.index.nlevels)), observed=True, sort=False).sum()
+
+    def _compact(self) -> None:
+        if not self._pending:
+            return
+        frames = ([self._table] if self._table is not None else []) + self._pending
+        self._table = self._reduce(frames)
+        self._pending, self._pending_rows = [], 0
+        if len(self._table) > self.max_groups:
+            self._spill()
+
+    def _dir(self) -> str:
+        # um subdiretório por agregador: despejos de execuções diferentes não se misturam
+        if self._spill_dir is None:
+            if self.spill_root:
+                os.makedirs(self.spill_root, exist_ok=True)
+            self._spill_dir = tempfile.mkdtemp(prefix="pisa_groupby_", dir=self.spill_root)
+        return self._spill_dir
+
+    def _partition_of(self, table: pd.DataFrame) -> np.ndarray:
+        h = pd.util.hash_pandas_object(table.index.to_frame(index=False), index=False).to_numpy()
+        return (h % np.uint64(self.partitions)).astype(np.int64)
+
+    def _spill(self) -> None:
+        table, self._table = self._table, None
+        d = self._dir()
+        with stage("pisa_groupby.spill", groups=len(table)):
+            part = self._partition_of(table)
+            for p in np.unique(part):
+                table[part == p].to_pickle(os.path.join(d, f"p{p:03d}-{self._spills:05d}.pkl"))
+        self._spills += 1
+
+    def _spill_files(self) -> List[str]:
+        if self._spill_dir is None or not os.path.isdir(self._spill_dir):
+            return []
+        return sorted(os.path.join(self._spill_dir, f) for f in os.listdir(self._spill_dir)
+                      if f.endswith(".pkl"))
+
+    # ---------------- resultado ----------------
+
+    def _finalise(self, sums: pd.DataFrame) -> pd.DataFrame:
+        out = pd.DataFrame(index=sums.index)
+        if self.count_name:
+            out[self.count_name] = sums["__n"].round().astype("int64")
+        if self.weight_sum_name:
+            out[self.weight_sum_name] = sums["__w"]
+        for name in self.measures:
+            sw = sums[f"{name}__sw"]
+            mean = (sums[f"{name}__swx"] / sw).where(sw > 0)
+            out[name] = mean
+            if self.sd:
+                var = (sums[f"{name}__swxx"] / sw - mean ** 2).clip(lower=0.0)
+                out[f"{name}_sd"] = np.sqrt(var).where(sw > 0)
+        return out
+
+    def iter_partitions(self) -> Iterator[pd.DataFrame]:
+        """
+        Tabela final por partição de hash (grupos disjuntos, sem ordem), sem juntar
+        tudo em memória: o pico é uma partição, não a tabela inteira.
+        """
+        with self._lock:
+            self._compact()
+            files = self._spill_files()
+            if not files:
+                table = self._table if self._table is not None else self.partial(
+                    pd.DataFrame(columns=self.columns))
+                yield self._finalise(table)
+                return
+            mem = self._table
+            mem_part = self._partition_of(mem) if mem is not None else None
+            by_part: Dict[int, List[str]] = {}
+            for f in files:
+                by_part.setdefault(_partition_id(f), []).append(f)
+            with stage("pisa_groupby.reduce_partitions", partitions=self.partitions):
+                for p in range(self.partitions):
+                    frames = [pd.read_pickle(f) for f in by_part.get(p, [])]
+                    if mem is not None:
+                        frames.append(mem[mem_part == p])
+                    frames = [f for f in frames if len(f)]
+                    if frames:
+                        yield self._finalise(self._reduce(frames))
+
+    def result(self) -> pd.DataFrame:
+        """Tabela final (uma linha por grupo, ordenada pela chave), como `wmeans_by`."""
+        pieces = list(self.iter_partitions())
+        out = pieces[0] if len(pieces) == 1 else pd.concat(pieces)
+        return out.sort_index().reset_index()
+
+    def close(self) -> None:
+        """Remove os arquivos despejados por este agregador."""
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+
+    def __enter__(self) -> "GroupAggregator":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def aggregate(chunks: Iterable[pd.DataFrame], by: Union[str, Sequence[str]] = "CNTSCHID",
+              weight: Optional[str] = "SENWT", measures: Optional[Dict[str, str]] = None,
+              **kwargs) -> pd.DataFrame:
+    """Atalho: consome os blocos num `GroupAggregator` e devolve a tabela final."""
+    with GroupAggregator(by, weight, measures, **kwargs) as agg:
+        with stage("pisa_groupby.aggregate", by=str(by)):
+            for chunk in chunks:
+                agg.update(chunk)
+        return agg.result()
+
+
+def quartil_summary(chunks: Callable[[], Iterable[pd.DataFrame]], var: str = "ESCS",
+                    weight: str = "SENWT", measures: Optional[Dict[str, str]] = None,
+                    labels: Optional[Sequence[str]] = None, label_name: str = "escs_quartil",
+                    weighted: bool = True, **kwargs) -> pd.DataFrame:
+    """
+    `estatisticas.quartil_summary` em duas passadas sobre os blocos (`chunks` é uma
+    função que devolve um iterável novo a cada chamada). A 1ª passada guarda só
+    `var` e o peso das linhas válidas para obter os mesmos cortes de
+    `pisa_bins.assign_bins` (ponderados ou, com `weighted=False`, os de `pd.qcut`);
+    a 2ª classifica cada bloco com esses cortes e acumula as somas por quartil.
+    """
+    import estatisticas as estat
+    import pisa_bins
+
+    measures = measures or estat.QUARTIL_MEASURES
+    labels = list(labels or estat.QUARTIL_LABELS)
+    need = [var, weight, *measures.values()]
+    with stage("pisa_groupby.quartil.pass1"):
+        parts = [c.dropna(subset=need)[[var, weight]].to_numpy(dtype=float) for c in chunks()]
+        values = np.concatenate(parts) if parts else np.empty((0, 2))
+    probs = np.arange(1, len(labels)) / len(labels)
+    cuts = pisa_bins.weighted_quantiles(values[:, 0], values[:, 1] if weighted else None, probs)
+    with GroupAggregator(label_name, weight, measures, count_name="n_alunos",
+                         weight_sum_name="peso_expandido", **kwargs) as agg:
+        with stage("pisa_groupby.quartil.pass2", rows=len(values)):
+            for c in chunks():
+                c = c.dropna(subset=need)
+                codes = pisa_bins.codes_for(c[var], cuts)
+                q = pd.Categorical.from_codes(codes, categories=labels, ordered=True)
+                agg.update(c.assign(**{label_name: q}))
+        out = agg.result()
+    out[label_name] = pd.Categorical(out[label_name], categories=labels, ordered=True)
+    return out.sort_values(label_name, kind="stable").reset_index(drop=True)
+
+
+def group_counts(chunks: Iterable[pd.DataFrame], by: str = "CNTSCHID", **kwargs) -> pd.Series:
+    """Linhas por grupo (sem pesos), em blocos — base da cobertura de merge fora da memória."""
+    out = aggregate(chunks, by, weight=None, measures=None, count_name="n", **kwargs)
+    return out.set_index(by)["n"]
+
+
+__all__ = ["iter_chunks", "GroupAggregator", "aggregate", "quartil_summary", "group_counts"]
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+ICC e decomposição da variância entre/intra escolas por ANOVA de um fator,
+para muitas variáveis e subgrupos de uma vez.
+
+O ICC do notebook vem de um MixedLM nulo (`null_mixed`) por variável — caro
+para READ/MATH/SCIENCE × sexo/tercil de clima × dezenas de índices de
+questionário. Aqui tudo sai de somas por (subgrupo, escola) obtidas num único
+`groupby().sum()` sobre a tabela larga [w, w², w·y, w·y²] de todas as variáveis:
+
+    W_j = Σ w,  R_j = Σ w²,  S_j = Σ w·y,  Q_j = Σ w·y²     (por escola j, por variável)
+    SQ_intra = Σ_j (Q_j − S_j²/W_j)
+    SQ_entre = Σ_j S_j²/W_j − (Σ S_j)² / W,         W = Σ W_j = N
+    σ²_intra = SQ_intra / Σ_j (W_j − R_j/W_j)
+    σ²_entre = max(0, (SQ_entre − σ²_intra · Σ_j R_j/W_j · (1 − W_j/W)) / (W − Σ W_j²/W))
+    ICC = σ²_entre / (σ²_entre + σ²_intra)
+
+Os denominadores são as esperanças de SQ_intra e SQ_entre sob o modelo de um
+fator com pesos: pesos desiguais aumentam a variância da média ponderada de
+cada escola (R_j/W_j² em vez de 1/n_j), o que sem a correção vira variância
+"entre" espúria. Com pesos (ex.: SENWT), eles são normalizados para somar N
+(número de alunos com a variável presente) em cada subgrupo × variável; sem
+pesos, R_j = W_j = n_j e as fórmulas são as do estimador ANOVA clássico para
+grupos desbalanceados (N − J, J − 1 e n0 = (N − Σ n_j²/N)/(J − 1)). Escolas
+sem nenhum valor da variável não contam em J.
+
+`refine` reajusta casos escolhidos com o MixedLM nulo completo (via `FitStore`,
+se dado) e acrescenta as colunas `*_mlm` para comparação. O MixedLM do
+statsmodels não usa pesos amostrais: compare com a versão não ponderada.
+
+Uso típico
+----------
+    import pisa_icc as icc
+
+    icc_table = icc.variance_components(
+        students_final, ["READ", "MATH", "SCIENCE", "DISCLIMA", "BELONG"],
+        group="CNTSCHID", by="ST004D01T", weight="SENWT")
+    # colunas: ST004D01T, variavel, n_alunos, n_escolas, n0, media,
+    #          var_entre, var_intra, ICC, F
+
+    icc.refine(task3_base, icc.variance_components(task3_base, ["READ"]),
+               fit_store=fit_store, fit_options=MIXED_FIT_OPTIONS)
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+import pisa_design as design
+from profiling import stage
+
+
+STAT_COLUMNS = ["n_alunos", "n_escolas", "n0", "media", "var_entre", "var_intra", "ICC", "F"]
+
+
+def _as_list(v) -> list:
+    if v is None:
+        return []
+    return [v] if isinstance(v, str) else list(v)
+
+
+def variance_components(df: pd.DataFrame,
+                        outcomes: Sequence[str],
+                        group: str = "CNTSCHID",
+                        by: Union[str, Sequence[str], None] = None,
+                        weight: Optional[str] = None,
+                        outcome_name: str = "variavel") -> pd.DataFrame:
+    """
+    Variância entre/intra `group` e ICC de cada coluna de `outcomes`, por
+    subgrupo de `by` (opcional). Cada variável usa só as linhas em que ela, o
+    grupo, o peso e as colunas de `by` estão presentes.
+    """
+    by = _as_list(by)
+    outcomes = list(outcomes)
+    keys = [*by, group]
+    ok = df[keys].notna().all(axis=1).to_numpy()
+    if weight:
+        w = df[weight].to_numpy(dtype="float64")
+        ok = ok & ~np.isnan(w)
+    else:
+        w = np.ones(len(df))
+
+    parts: Dict[str, np.ndarray] = {}
+    for k, col in enumerate(outcomes):
+        y = df[col].to_numpy(dtype="float64")
+        m = ok & ~np.isnan(y)
+        wy = np.where(m, w, 0.0)
+        yy = np.where(m, y, 0.0)
+        parts[f"n{k}"] = m.astype("float64")
+        parts[f"w{k}"] = wy
+        parts[f"r{k}"] = wy * wy
+        parts[f"s{k}"] = wy * yy
+        parts[f"q{k}"] = wy * yy * yy
+
+    with stage("pisa_icc.variance_components", rows=len(df), outcomes=len(outcomes), by=len(by)):
+        cells = (pd.DataFrame(parts, index=df.index)[ok]
+                 .groupby([df.loc[ok, c] for c in keys], observed=True, sort=True).sum())
+        levels = (cells.index.droplevel(group).unique() if by else [None])
+        rows = []
+        for level in levels:
+            block = cells.xs(level, level=by if len(by) > 1 else by[0]) if by else cells
+            key = dict(zip(by, level if isinstance(level, tuple) else (level,))) if by else {}
+            for k, col in enumerate(outcomes):
+                rows.append({**key, outcome_name: col, **_anova(
+                    block[f"n{k}"].to_numpy(), block[f"w{k}"].to_numpy(), block[f"r{k}"].to_numpy(),
+                    block[f"s{k}"].to_numpy(), block[f"q{k}"].to_numpy())})
+    return pd.DataFrame(rows)
+
+
+def _anova(n: np.ndarray, W: np.ndarray, R: np.ndarray, S: np.ndarray,
+           Q: np.ndarray) -> Dict[str, float]:
+    """Componentes de variância a partir das somas por escola de uma variável."""
+    keep = (n > 0) & (W > 0)
+    n, W, R, S, Q = n[keep], W[keep], R[keep], S[keep], Q[keep]
+    N, J = float(n.sum()), int(keep.sum())
+    out = {c: np.nan for c in STAT_COLUMNS}
+    out.update(n_alunos=int(N), n_escolas=J)
+    if J == 0:
+        return out
+    c = N / W.sum()                       # normaliza os pesos para somarem N
+    W, R, S, Q = c * W, c * c * R, c * S, c * Q
+    out["media"] = S.sum() / W.sum()
+    df_intra = float(np.sum(W - R / W))       # N − J sem pesos
+    if J < 2 or df_intra <= 0:
+        return out
+    ss_intra = float(np.sum(Q - S * S / W))
+    ss_entre = float(np.sum(S * S / W) - S.sum() ** 2 / N)
+    ms_intra = max(ss_intra, 0.0) / df_intra
+    ms_entre = max(ss_entre, 0.0) / (J - 1)
+    n0 = (N - np.sum(W * W) / N) / (J - 1)
+    e_intra = float(np.sum(R / W * (1.0 - W / N)))   # J − 1 sem pesos
+    var_entre = (max((max(ss_entre, 0.0) - ms_intra * e_intra) / (n0 * (J - 1)), 0.0)
+                 if n0 > 0 else np.nan)
+    tot = var_entre + ms_intra
+    out.update(n0=n0, var_entre=var_entre, var_intra=ms_intra,
+               ICC=var_entre / tot if tot > 0 else np.nan,
+               F=ms_entre / ms_intra if ms_intra > 0 else np.nan)
+    return out
+
+
+def refine(df: pd.DataFrame,
+           table: pd.DataFrame,
+           group: str = "CNTSCHID",
+           by: Union[str, Sequence[str], None] = None,
+           fit_store=None,
+           fit_options: Sequence[Dict[str, Any]] = ({"reml": True},),
+           outcome_name: str = "variavel") -> pd.DataFrame:
+    """
+    Reajusta as linhas de `table` (saída de `variance_components`, já filtrada
+    para os casos de interesse) com o MixedLM nulo `y ~ 1 | group` e acrescenta
+    var_entre_mlm, var_intra_mlm e ICC_mlm. `by` padrão: as colunas de `table`
+    que existem em `df` (além da variável e das estatísticas).
+    """
+    if by is None:
+        by = [c for c in table.columns
+              if c in df.columns and c != outcome_name and c not in STAT_COLUMNS]
+    by = _as_list(by)
+    out = table.copy()
+    extra = {"var_entre_mlm": [], "var_intra_mlm": [], "ICC_mlm": []}
+    for _, row in table.iterrows():
+        sub = df
+        for c in by:
+            sub = sub[sub[c] == row[c]]
+        col = row[outcome_name]
+        sub = sub.dropna(subset=[col, group])
+        formula = f"{col} ~ 1"
+        with stage("pisa_icc.refine", rows=len(sub), formula=formula):
+            if fit_store is not None:
+                res = fit_store.fit_mixedlm(formula, sub, groups=group, fit_options=fit_options)
+            else:
+                res = design.fit_mixedlm(formula, sub, group, **dict(fit_options[0]))
+        vb = float(np.asarray(res.cov_re)[0, 0])
+        vw = float(res.scale)
+        extra["var_entre_mlm"].append(vb)
+        extra["var_intra_mlm"].append(vw)
+        extra["ICC_mlm"].append(vb / (vb + vw) if vb + vw > 0 else np.nan)
+    for k, v in extra.items():
+        out[k] = v
+    return out
+
+
+__all__ = ["STAT_COLUMNS", "variance_components", "refine"]
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+Planejador de índices para as coleções/tabelas do PISA já carregadas.
+
+Parte dos padrões de consulta documentados (busca por aluno, junção por escola,
+faixa de ESCS, filtros por sexo/repetência) e gera índices compostos na ordem
+igualdade -> faixa, com os campos lidos pela consulta no fim da chave (MongoDB)
+ou em INCLUDE (SQL Server), para que a consulta seja coberta pelo índice.
+
+Os índices devem ser criados DEPOIS da carga em lote: inserir numa coleção/tabela
+sem índices secundários é bem mais rápido, e o build único é mais compacto.
+Cada `apply_*` devolve um relatório com tempo de build e tamanho por índice.
+
+Layouts de campos
+-----------------
+- PREP_FIELDS:  documentos de `pisa_prep.to_mongo_documents_students`
+- RAW_FIELDS:   abas brutas de `ingest_xlsx_to_mongo` (nomes do PISA 2018)
+- MSSQL_FIELDS: tabela STU_BRA de `pisa_ingest_mssql`
+
+Uso típico
+----------
+    from pisa_indexes import plan_indexes, apply_mongo_indexes, PREP_FIELDS
+
+    plan = plan_indexes(PREP_FIELDS)
+    report = apply_mongo_indexes(db.students, plan)     # após insert_many
+    print(report)
+
+    # SQL Server (após os INSERTs), com columnstore para varreduras analíticas
+    from pisa_indexes import MSSQL_FIELDS, apply_mssql_indexes
+    apply_mssql_indexes(conn, "dbo", "STU_BRA", plan_indexes(MSSQL_FIELDS, target="mssql"),
+                        columnstore=True)
+"""
+
+from __future__ import annotations
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+from profiling import stage
+
+
+# ------------------------------- Padrões de consulta --------------------------------
+
+@dataclass(frozen=True)
+class QueryPattern:
+    """Consulta típica em campos lógicos (ver *_FIELDS): igualdade, faixa e campos lidos."""
+    name: str
+    equality: Tuple[str, ...] = ()
+    range: Optional[str] = None
+    reads: Tuple[str, ...] = ()
+    unique: bool = False
+    description: str = ""
+
+
+QUERY_PATTERNS: List[QueryPattern] = [
+    QueryPattern("student", equality=("student",), unique=True,
+                 description="busca de um aluno pelo id"),
+    QueryPattern("school", equality=("school",), reads=("escs", "weight", "disclima", "pv"),
+                 description="junção/agrupamento por escola (school_profile)"),
+    QueryPattern("escs", range="escs", reads=("weight",),
+                 description="faixa de ESCS (quartis, pontos de corte)"),
+    QueryPattern("sex_repeat", equality=("sex", "repeat"), range="escs", reads=("weight",),
+                 description="filtros por sexo/repetência com faixa de ESCS"),
+]
+
+# campo lógico -> nome físico (lista = várias colunas, ex.: PVs no SQL)
+FieldMap = Dict[str, Union[str, List[str]]]
+
+PREP_FIELDS: FieldMap = {
+    "student": "STIDSTD", "school": "SCHOOLID", "escs": "ESCS", "weight": "W_FSTUWT",
+    "disclima": "DISCLIMA", "sex": "controls.sex", "repeat": "controls.repeat", "pv": "pv_read",
+}
+
+RAW_FIELDS: FieldMap = {
+    "student": "CNTSTUID", "school": "CNTSCHID", "escs": "ESCS", "weight": "W_FSTUWT",
+    "disclima": "DISCLIMA", "sex": "ST004D01T", "repeat": "REPEAT",
+    "pv": [f"PV{i}READ" for i in range(1, 11)],
+}
+
+MSSQL_FIELDS: FieldMap = {**RAW_FIELDS, "student": "STIDSTD", "school": "SCHOOLID"}
+
+# campos-lista no MongoDB: índice multikey não cobre consultas, então ficam fora da chave
+MONGO_ARRAY_FIELDS = {"pv_read"}
+
+
+@dataclass
+class IndexSpec:
+    """Índice planejado: chave (campo, direção) + colunas INCLUDE (só SQL Server)."""
+    name: str
+    keys: List[Tuple[str, int]]
+    include: List[str] = field(default_factory=list)
+    unique: bool = False
+    pattern: str = ""
+
+
+def _physical(fields: FieldMap, logical: Iterable[str]) -> List[str]:
+    out: List[str] = []
+    for name in logical:
+        v = fields.get(name)
+        if v is None:
+            continue
+        out.extend(v if isinstance(v, list) else [v])
+    return out
+
+
+def plan_indexes(fields: FieldMap,
+                 patterns: Sequence[QueryPattern] = QUERY_PATTERNS,
+                 available: Optional[Iterable[str]] = None,
+                 target: str = "mongo") -> List[IndexSpec]:
+    """
+    Traduz os padrões de consulta em índices para um layout de campos.
+
+    Parâmetros
+    ----------
+    available : campos existentes na coleção/tabela; padrões com chave ausente são
+        ignorados e campos lidos ausentes são descartados.
+    target : "mongo" (campos lidos escalares entram no fim da chave) ou
+        "mssql" (campos lidos vão para INCLUDE).
+
+    Índices cuja chave é prefixo de outra (e não são únicos) são removidos.
+    """
+    if target not in ("mongo", "mssql"):
+        raise ValueError("target deve ser 'mongo' ou 'mssql'")
+    avail = set(available) if available is not None else None
+    specs: List[IndexSpec] = []
+    for p in patterns:
+        key_fields = _physical(fields, p.equality) + _physical(fields, [p.range] if p.range else [])
+        if not key_fields or len(key_fields) < len(p.equality) + bool(p.range):
+            continue
+        if avail is not None and not set(key_fields) <= avail:
+            continue
+        keys = [(f, 1) for f in key_fields]
+        include: List[str] = []
+        if target == "mongo":
+            # só campos escalares: listas (multikey) e grupos de colunas (PVs) não entram na chave
+            scalar = [r for r in p.reads if isinstance(fields.get(r), str)]
+            reads = [f for f in _physical(fields, scalar) if f not in MONGO_ARRAY_FIELDS]
+            keys += [(f, 1) for f in reads if f not in key_fields and (avail is None or f in avail)]
+        else:
+            include = [f for f in _physical(fields, p.reads)
+                       if f not in key_fields and (avail is None or f in avail)]
+        specs.append(IndexSpec(name=f"ix_{p.name}", keys=keys, include=include, unique=p.unique, pattern=p.name))
+
+    def _redundant(a: IndexSpec) -> bool:
+        return not a.unique and any(
+            b is not a and len(b.keys) > len(a.keys) and b.keys[:len(a.keys)] == a.keys for b in specs
+        )
+    return [s for s in specs if not _redundant(s)]
+
+
+# ------------------------------------- MongoDB --------------------------------------
+
+def create_clustered_collection(db, name: str, drop_existing: bool = True):
+    """
+    Cria uma coleção clusterizada por `_id` (MongoDB >= 5.3). Os documentos ficam
+    ordenados pela chave: use `_id` = id do aluno para buscas/faixas sem índice extra.
+    """
+    if drop_existing:
+        db[name].drop()
+    return db.create_collection(name, clusteredIndex={"key": {"_id": 1}, "unique": True})
+
+
+def _mongo_index_sizes(collection) -> Dict[str, int]:
+    try:
+        stats = next(collection.aggregate([{"$collStats": {"storageStats": {}}}]))
+        return dict(stats["storageStats"].get("indexSizes", {}))
+    except Exception:
+        try:
+            return dict(collection.database.command("collStats", collection.name).get("indexSizes", {}))
+        except Exception:
+            return {}
+
+
+def apply_mongo_indexes(collection, plan: Sequence[IndexSpec], verbose: bool = True) -> pd.DataFrame:
+    """
+    Cria os índices planejados (um por vez, após a carga) e relata build e tamanho.
+    Falhas (ex.: duplicatas num índice único) entram no relatório sem interromper.
+    """
+    rows = []
+    for spec in plan:
+        row = {"index": spec.name, "pattern": spec.pattern,
+               "keys": ", ".join(f for f, _ in spec.keys), "unique": spec.unique}
+        t0 = time.perf_counter()
+        try:
+            with stage("pisa_indexes.create_index", collection=collection.name, index=spec.name):
+                collection.create_index(spec.keys, name=spec.name, unique=spec.unique)
+            row["status"] = "ok"
+        except Exception as e:
+            row["status"] = f"erro: {type(e).__name__}: {e}"
+        row["build_s"] = time.perf_counter() - t0
+        rows.append(row)
+    sizes = _mongo_index_sizes(collection)
+    report = pd.DataFrame(rows)
+    if not report.empty:
+        report["size_bytes"] = report["index"].map(sizes)
+        if verbose:
+            print(report.to_string(index=False))
+    return report
+
+
+def apply_mongo_indexes_auto(collection, fields: FieldMap = RAW_FIELDS, verbose: bool = True) -> pd.DataFrame:
+    """Planeja com os campos de um documento de amostra e aplica (para coleções de abas brutas)."""
+    sample = collection.find_one({}, {"_id": 0}) or {}
+    avail = set(_flatten_keys(sample))
+    return apply_mongo_indexes(collection, plan_indexes(fields, available=avail), verbose=verbose)
+
+
+def _flatten_keys(doc: dict, prefix: str = "") -> Iterable[str]:
+    for k, v in doc.items():
+        yield prefix + k
+        if isinstance(v, dict):
+            yield from _flatten_keys(v, prefix + k + ".")
+
+
+# ----------------------------------- SQL Server -------------------------------------
+
+def _q(name: str) -> str:
+    return "[" + str(name).replace("]", "]]") + "]"
+
+
+def _mssql_columns(cur, schema: str, table: str) -> Dict[str, int]:
+    """{coluna: max_length em bytes} (-1 = MAX)."""
+    cur.execute(
+        "SELECT c.name, c.max_length FROM sys.columns c "
+        f"WHERE c.object_id = OBJECT_ID(N'{schema}.{table}')"
+    )
+    return {str(n): int(m) for n, m in cur.fetchall()}
+
+
+def _mssql_index_sizes(cur, schema: str, table: str) -> Dict[str, int]:
+    cur.execute(
+        "SELECT i.name, SUM(ps.used_page_count) * 8192 "
+        "FROM sys.dm_db_partition_stats ps "
+        "JOIN sys.indexes i ON i.object_id = ps.object_id AND i.index_id = ps.index_id "
+        f"WHERE ps.object_id = OBJECT_ID(N'{schema}.{table}') AND i.name IS NOT NULL "
+        "GROUP BY i.name"
+    )
+    return {str(n): int(s) for n, s in cur.fetchall()}
+
+
+def _fit_key(keys: Sequence[Tuple[str, int]], include: Sequence[str], sizes: Dict[str, int],
+             max_key_bytes: int) -> Tuple[List[Tuple[str, int]], List[str], List[str]]:
+    """
+    Chave que cabe em `max_key_bytes`: colunas que estourariam o limite (ex.:
+    NVARCHAR(255) = 510 bytes) saem da chave e vão para INCLUDE, na ordem, e as
+    seguintes que ainda cabem continuam na chave. Devolve (chave, include, movidas).
+    """
+    kept: List[Tuple[str, int]] = []
+    moved: List[str] = []
+    total = 0
+    for c, d in keys:
+        if total + sizes[c] <= max_key_bytes:
+            kept.append((c, d))
+            total += sizes[c]
+        else:
+            moved.append(c)
+    return kept, [*moved, *(c for c in include if c not in moved)], moved
+
+
+def mssql_index_statements(schema: str, table: str, plan: Sequence[IndexSpec],
+                           columns: Optional[Dict[str, int]] = None,
+                           columnstore: bool = False,
+                           max_key_bytes: int = 900,
+                           notes: Optional[Dict[str, str]] = None) -> List[Tuple[str, Optional[str]]]:
+    """
+    Gera (nome, T-SQL) para o plano; T-SQL None quando o índice não é possível
+    (coluna ausente, chave NVARCHAR(MAX) ou nenhuma coluna da chave cabe).
+    Colunas que fariam a chave passar de `max_key_bytes` vão para INCLUDE.
+    Cada índice pulado ou ajustado é avisado e, com `notes`, o motivo fica em
+    `notes[nome]`. Com `columnstore`, acrescenta um CLUSTERED COLUMNSTORE
+    (varreduras analíticas).
+    """
+    out: List[Tuple[str, Optional[str]]] = []
+    t = f"{_q(schema)}.{_q(table)}"
+
+    def _note(name: str, msg: str) -> None:
+        print(f"[indexes] {table}.{name}: {msg}")
+        if notes is not None:
+            notes[name] = msg
+
+    for spec in plan:
+        name = f"IX_{table}_{spec.pattern}"
+        keys = list(spec.keys)
+        if columns is not None:
+            sizes = {c: columns.get(c) for c, _ in keys}
+            bad = [c for c, sz in sizes.items() if sz is None or sz < 0]
+            if bad:
+                _note(name, f"pulado: coluna ausente ou (N)VARCHAR(MAX) na chave: {', '.join(bad)}")
+                out.append((name, None))
+                continue
+            include = [c for c in spec.include if columns.get(c, -1) >= 0]
+            if sum(sizes.values()) > max_key_bytes:
+                keys, include, moved = _fit_key(keys, include, sizes, max_key_bytes)
+                if not keys:
+                    _note(name, f"pulado: nenhuma coluna da chave cabe em {max_key_bytes} bytes")
+                    out.append((name, None))
+                    continue
+                _note(name, f"chave acima de {max_key_bytes} bytes; {', '.join(moved)} em INCLUDE")
+        else:
+            include = list(spec.include)
+        sql = (f"CREATE {'UNIQUE ' if spec.unique else ''}NONCLUSTERED INDEX {_q(name)} ON {t} ("
+               + ", ".join(f"{_q(c)} {'ASC' if d > 0 else 'DESC'}" for c, d in keys) + ")")
+        if include:
+            sql += " INCLUDE (" + ", ".join(_q(c) for c in include) + ")"
+        out.append((name, sql + ";"))
+    if columnstore:
+        name = f"CCI_{table}"
+        out.insert(0, (name, f"CREATE CLUSTERED COLUMNSTORE INDEX {_q(name)} ON {t};"))
+    return out
+
+
+def apply_mssql_indexes(conn, schema: str, table: str, plan: Sequence[IndexSpec],
+                        columnstore: bool = False, drop_existing: bool = True,
+                        verbose: bool = True) -> pd.DataFrame:
+    """
+    Cria os índices planejados numa tabela já carregada e relata build e tamanho.
+    O columnstore (se pedido) é criado primeiro: os demais viram índices sobre ele.
+    """
+    rows = []
+    with conn.cursor() as cur:
+        cols = _mssql_columns(cur, schema, table)
+        notes: Dict[str, str] = {}
+        for name, sql in mssql_index_statements(schema, table, plan, cols, columnstore, notes=notes):
+            row = {"index": name, "sql": sql}
+            if sql is None:
+                row.update(status=notes.get(name, "pulado"), build_s=0.0)
+                rows.append(row)
+                continue
+            if drop_existing:
+                cur.execute(
+                    f"IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'{name}' "
+                    f"AND object_id = OBJECT_ID(N'{schema}.{table}')) DROP INDEX {_q(name)} ON {_q(schema)}.{_q(table)};"
+                )
+            t0 = time.perf_counter()
+            try:
+                with stage("pisa_indexes.create_index", table=table, index=name):
+                    cur.execute(sql)
+                row["status"] = f"ok ({notes[name]})" if name in notes else "ok"
+            except Exception as e:
+                row["status"] = f"erro: {type(e).__name__}: {e}"
+            row["build_s"] = time.perf_counter() - t0
+            rows.append(row)
+        sizes = _mssql_index_sizes(cur, schema, table)
+    report = pd.DataFrame(rows)
+    if not report.empty:
+        report["size_bytes"] = report["index"].map(sizes)
+        if verbose:
+            print(report.drop(columns="sql").to_string(index=False))
+    return report
+
+
+__all__ = [
+    "QueryPattern", "QUERY_PATTERNS", "IndexSpec",
+    "PREP_FIELDS", "RAW_FIELDS", "MSSQL_FIELDS",
+    "plan_indexes", "create_clustered_collection",
+    "apply_mongo_indexes", "apply_mongo_indexes_auto",
+    "mssql_index_statements", "apply_mssql_indexes",
+]
@@ -14,6 +14,9 @@ import numpy as np
 import pandas as pd
 from pymongo import MongoClient
 
+from pisa_sparse import default_keep, iter_documents, report_frame, sparsify
+from profiling import instrument, stage
+
 
 # -------------------------- utilitários para busca/paths ----------------------- #
 
@@ -154,6 +157,12 @@ def _find_one_in_many(base_dirs: List[str], rel_candidates: List[str]) -> str:
     raise FileNotFoundError(f"Nenhum caminho encontrado entre: {rel_candidates} em {base_dirs}")
 
 
+@instrument("pisa_ingest_min._read_all_sheets")
+def _read_all_sheets(xlsx_path: str) -> Dict[str, pd.DataFrame]:
+    """Lê todas as abas do .xlsx -> {sheet_name: DataFrame}."""
+    return pd.read_excel(xlsx_path, sheet_name=None)
+
+
 # -------------------------- API pública (funções) ------------------------------ #
 
 def connect_mongo(db_name: str,
@@ -185,31 +194,47 @@ def connect_mongo(db_name: str,
     return client, db
 
 
+def _sheet_records(df: pd.DataFrame, sheet: str, sparse: bool, sentinels, reports: list) -> Iterable[dict]:
+    """Registros de uma aba: densos (NaN -> None) ou esparsos (campos nulos omitidos)."""
+    if not sparse:
+        return df.replace({np.nan: None}).to_dict(orient="records")
+    sdf, rep = sparsify(df, sheet=sheet, sentinels=sentinels, keep=default_keep(df.columns))
+    reports.append(rep)
+    return iter_documents(sdf)
+
+
 def insert_excel_to_collections(xlsx_path: str,
                                 db,
                                 drop_existing: bool = True,
-                                batch_size: int = 50_000) -> List[str]:
+                                batch_size: int = 50_000,
+                                sparse: bool = False,
+                                sentinels: Iterable[float] | None = None) -> List[str]:
     """
     Lê um .xlsx e insere no Mongo:
       - 1 aba   -> coleção = <basename>
       - >1 abas -> <basename>__<sheet>
     Colunas preservadas; NaN -> None.
+    sparse=True: abas largas passam por `pisa_sparse.sparsify` (itens esparsos/
+    categóricos em memória), os documentos omitem os campos nulos (e os
+    `sentinels`, se informados) e a memória economizada por aba é impressa.
     Retorna a lista de coleções criadas/atualizadas.
     """
     base = os.path.splitext(os.path.basename(xlsx_path))[0]
     # engine padrão do pandas (openpyxl) para .xlsx
-    sheets: Dict[str, pd.DataFrame] = pd.read_excel(xlsx_path, sheet_name=None)
+    sheets: Dict[str, pd.DataFrame] = _read_all_sheets(xlsx_path)
     created: List[str] = []
+    reports: list = []
 
     if len(sheets) == 1:
         sheet_name, df = next(iter(sheets.items()))
         col = _sanitize_collection(base)
         if drop_existing and col in db.list_collection_names():
             db[col].drop()
-        records = df.replace({np.nan: None}).to_dict(orient="records")
-        if records:
-            for batch in _chunked(records, batch_size):
-                db[col].insert_many(batch)
+        records = _sheet_records(df, sheet_name, sparse, sentinels, reports)
+        if len(df):
+            with stage("pisa_ingest_min.insert_many", rows=len(df), collection=col):
+                for batch in _chunked(records, batch_size):
+                    db[col].insert_many(batch)
         created.append(col)
         print(f"[OK] {os.path.basename(xlsx_path)} ('{sheet_name}') -> {col} | linhas={len(df)}")
     else:
@@ -217,13 +242,17 @@ def insert_excel_to_collections(xlsx_path: str,
             col = _sanitize_collection(f"{base}__{sheet_name}")
             if drop_existing and col in db.list_collection_names():
                 db[col].drop()
-            records = df.replace({np.nan: None}).to_dict(orient="records")
-            if records:
-                for batch in _chunked(records, batch_size):
-                    db[col].insert_many(batch)
+            records = _sheet_records(df, sheet_name, sparse, sentinels, reports)
+            if len(df):
+                with stage("pisa_ingest_min.insert_many", rows=len(df), collection=col):
+                    for batch in _chunked(records, batch_size):
+                        db[col].insert_many(batch)
             created.append(col)
             print(f"[OK] {os.path.basename(xlsx_path)} ('{sheet_name}') -> {col} | linhas={len(df)}")
 
+    if reports:
+        print(report_frame(reports)[["sheet", "rows", "columns", "dense_mb", "sparse_mb", "saved_pct"]]
+              .to_string(index=False))
     return created
 
 
@@ -232,18 +261,23 @@ def ingest_by_paths(stu_path: str, sch_path: str, codebook_path: str,
                     uri: str | None = None,
                     dotenv_path: str | None = None,
                     drop_existing: bool = True,
-                    batch_size: int = 50_000) -> dict:
+                    batch_size: int = 50_000,
+                    sparse: bool = False,
+                    sentinels: Iterable[float] | None = None) -> dict:
     """
     Ingesta diretamente pelos paths explícitos dos três arquivos.
+    `sparse`/`sentinels` valem para STU e SCH (ver `insert_excel_to_collections`).
     Retorna {'STU_BRA.xlsx': [...], 'SCH_BRA.xlsx': [...], 'PISA2018_CODEBOOK.xlsx': [...]}
     """
     _, db = connect_mongo(db_name=db_name, uri=uri, dotenv_path=dotenv_path)
     summary: Dict[str, List[str]] = {}
 
-    created = insert_excel_to_collections(stu_path, db, drop_existing=drop_existing, batch_size=batch_size)
+    created = insert_excel_to_collections(stu_path, db, drop_existing=drop_existing, batch_size=batch_size,
+                                          sparse=sparse, sentinels=sentinels)
     summary[os.path.basename(stu_path)] = created
 
-    created = insert_excel_to_collections(sch_path, db, drop_existing=drop_existing, batch_size=batch_size)
+    created = insert_excel_to_collections(sch_path, db, drop_existing=drop_existing, batch_size=batch_size,
+                                          sparse=sparse, sentinels=sentinels)
     summary[os.path.basename(sch_path)] = created
 
     created = insert_excel_to_collections(codebook_path, db, drop_existing=drop_existing, batch_size=batch_size)
@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 import os, re, fnmatch
+from contextlib import contextmanager
 from typing import Dict, List, Tuple, Optional
 
 import numpy as np
 import pandas as pd
 
+from pisa_inventory import XlsxReader, default_catalog
+from pisa_indexes import MSSQL_FIELDS, apply_mssql_indexes, plan_indexes
+from pisa_sync import sync_mssql_table
+from profiling import instrument, stage
+
 # =================== drivers ===================
 _HAS_PYODBC = False
 _HAS_PYMSSQL = False
@@ -96,6 +102,52 @@ def connect_mssql(server: str,
         return "pyodbc", conn
     raise RuntimeError("Instale `pymssql` (mais simples) ou `pyodbc` + ODBC.")
 
+class _TxCursor:
+    """Cursor dentro de transação: o `with` só fecha (o do pyodbc faria commit ao sair)."""
+    def __init__(self, cur):
+        object.__setattr__(self, "_cur", cur)
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+    def __setattr__(self, name, value):
+        setattr(self._cur, name, value)
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self._cur.close()
+
+class _TxConn:
+    """Conexão vista pelos helpers (`_ensure_table`, `_insert_dataframe`) durante a transação."""
+    def __init__(self, conn):
+        self._conn = conn
+    def cursor(self):
+        return _TxCursor(self._conn.cursor())
+
+def _get_autocommit(backend: str, conn) -> bool:
+    return bool(conn.autocommit if backend == "pyodbc" else getattr(conn, "autocommit_state", True))
+
+def _set_autocommit(backend: str, conn, on: bool) -> None:
+    if backend == "pyodbc":
+        conn.autocommit = on
+    else:
+        conn.autocommit(on)  # pymssql: método
+
+@contextmanager
+def _transaction(backend: str, conn):
+    """
+    Uma transação explícita sobre a conexão (aberta com autocommit=True):
+    commit ao final, rollback em qualquer erro; o modo anterior é restaurado.
+    """
+    prev = _get_autocommit(backend, conn)
+    _set_autocommit(backend, conn, False)
+    try:
+        yield _TxConn(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _set_autocommit(backend, conn, prev)
+
 def ensure_database(server: str, database: str, user: str, password: str, **kwargs):
     backend, conn = connect_mssql(server, None, user, password, **kwargs)
     sql = f"IF DB_ID(N'{database}') IS NULL CREATE DATABASE {_quote_ident(database)};"
@@ -211,12 +263,13 @@ def _insert_dataframe(backend: str, conn, database: str, schema: str, table: str
     rows = [tuple(x) for x in df.itertuples(index=False, name=None)]
     if not rows:
         return
-    with conn.cursor() as cur:
+    with stage("pisa_ingest_mssql.executemany", rows=len(rows), table=table_clean), conn.cursor() as cur:
         if backend == "pyodbc" and hasattr(cur, "fast_executemany"):
             cur.fast_executemany = True
         for i in range(0, len(rows), batch_size):
             cur.executemany(sql, rows[i:i+batch_size])
 
+@instrument("pisa_ingest_mssql._read_excel_all_sheets")
 def _read_excel_all_sheets(xlsx_path: str) -> Dict[str, pd.DataFrame]:
     return pd.read_excel(xlsx_path, sheet_name=None, engine="openpyxl")
 
@@ -228,43 +281,21 @@ SCHOOL_CANON  = ["SCHOOLID", "SCMATEDU", "TCSHORT"]
 
 def _pick_sheet(xlsx_path: str) -> str:
     """Prefere 'data'; se não houver, tenta a primeira sheet que contenha 'data' no nome; senão a primeira."""
-    xls = pd.ExcelFile(xlsx_path, engine="openpyxl")
-    names = [str(s).strip() for s in xls.sheet_names]
-    if "data" in names: return "data"
-    for s in names:
-        if "data" in s.lower(): return s
-    return names[0]
+    return default_catalog().pick_sheet(xlsx_path)
+
+_STU_ALIASES = {"CNTSTUID": "STIDSTD", "CNTSCHID": "SCHOOLID"}
 
+@instrument("pisa_ingest_mssql._load_students_filtered")
 def _load_students_filtered(stu_path: str) -> pd.DataFrame:
-    sheet = _pick_sheet(stu_path)
-    df_all = pd.read_excel(stu_path, sheet_name=sheet, engine="openpyxl")
-    df_all = df_all.rename(columns=lambda c: c.strip() if isinstance(c,str) else c)
-
-    # sinônimos -> canônicos
-    id_aluno  = "STIDSTD"  if "STIDSTD"  in df_all.columns else ("CNTSTUID"  if "CNTSTUID"  in df_all.columns else None)
-    id_escola = "SCHOOLID" if "SCHOOLID" in df_all.columns else ("CNTSCHID" if "CNTSCHID" in df_all.columns else None)
-    if not id_escola:
+    # leitura projetada: só as colunas canônicas e os PVs saem do XML da aba
+    with XlsxReader(stu_path) as rd:
+        sheet = rd.pick_sheet()
+        pv_cols = [c for c in rd.header(sheet) if c and re.fullmatch(r"PV\d+READ", c)]
+        df_all = rd.read(sheet, columns=[*STUDENT_CANON, *pv_cols], aliases=_STU_ALIASES)
+    if "SCHOOLID" not in df_all.columns:
         raise RuntimeError("STU: não encontrei coluna de ID da escola (SCHOOLID/CNTSCHID).")
 
-    pv_cols = [c for c in df_all.columns if re.fullmatch(r"PV\d+READ", str(c))]
-    keep_map = {
-        "STIDSTD":  id_aluno,
-        "SCHOOLID": id_escola,
-        "W_FSTUWT": "W_FSTUWT" if "W_FSTUWT" in df_all.columns else None,
-        "ESCS":     "ESCS"     if "ESCS"     in df_all.columns else None,
-        "DISCLIMA": "DISCLIMA" if "DISCLIMA" in df_all.columns else None,
-        "ST004D01T":"ST004D01T" if "ST004D01T" in df_all.columns else None,
-        "REPEAT":   "REPEAT"   if "REPEAT"   in df_all.columns else None,
-        "LANGN":    "LANGN"    if "LANGN"    in df_all.columns else None,
-        "IMMIG":    "IMMIG"    if "IMMIG"    in df_all.columns else None,
-    }
-
-    out = pd.DataFrame()
-    for canon, real in keep_map.items():
-        if real is not None:
-            out[canon] = df_all[real]
-    for c in pv_cols:
-        out[c] = df_all[c]
+    out = df_all[[c for c in [*STUDENT_CANON, *pv_cols] if c in df_all.columns]].copy()
 
     # coerções
     for c in ["W_FSTUWT","ESCS","DISCLIMA", *pv_cols]:
@@ -275,17 +306,15 @@ def _load_students_filtered(stu_path: str) -> pd.DataFrame:
         out = out[out["SCHOOLID"].notna() & (out["SCHOOLID"]!="")]
     return _coerce_nulls(out)
 
+@instrument("pisa_ingest_mssql._load_schools_filtered")
 def _load_schools_filtered(sch_path: str) -> pd.DataFrame:
-    sheet = _pick_sheet(sch_path)
-    df_all = pd.read_excel(sch_path, sheet_name=sheet, engine="openpyxl")
-    df_all = df_all.rename(columns=lambda c: c.strip() if isinstance(c,str) else c)
-
-    id_escola = "SCHOOLID" if "SCHOOLID" in df_all.columns else ("CNTSCHID" if "CNTSCHID" in df_all.columns else None)
-    if not id_escola:
+    with XlsxReader(sch_path) as rd:
+        df_all = rd.read(rd.pick_sheet(), columns=SCHOOL_CANON, aliases={"CNTSCHID": "SCHOOLID"})
+    if "SCHOOLID" not in df_all.columns:
         raise RuntimeError("SCH: não encontrei coluna de ID da escola (SCHOOLID/CNTSCHID).")
 
     out = pd.DataFrame()
-    out["SCHOOLID"] = df_all[id_escola].astype(str).str.strip()
+    out["SCHOOLID"] = df_all["SCHOOLID"].astype(str).str.strip()
     for c in ("SCMATEDU","TCSHORT"):
         if c in df_all.columns:
             out[c] = pd.to_numeric(df_all[c], errors="coerce")
@@ -296,10 +325,9 @@ def _load_schools_filtered(sch_path: str) -> pd.DataFrame:
 
 def _read_codebook_sheets(xlsx_path: str) -> Dict[str, pd.DataFrame]:
     """Lê todas as sheets do codebook detectando a linha de cabeçalho real."""
-    xls = pd.ExcelFile(xlsx_path, engine="openpyxl")
     out: Dict[str, pd.DataFrame] = {}
 
-    for sheet_name in xls.sheet_names:
+    for sheet_name in default_catalog().sheet_names(xlsx_path):
         df_raw = pd.read_excel(xlsx_path, sheet_name=sheet_name, header=None, dtype=object, engine="openpyxl")
         sh_norm = str(sheet_name).strip().lower()
 
@@ -349,15 +377,23 @@ def ingest_required_to_mssql(parent_dir: str,
                              create_db_if_missing: bool = True,
                              drop_existing: bool = True,
                              batch_size: int = 50_000,
-                             include_codebook: bool = True) -> Dict[str, List[str]]:
+                             include_codebook: bool = True,
+                             columnstore: bool = False,
+                             mode: str = "reload") -> Dict[str, List[str]]:
     """
     Ingestão robusta:
       - Localiza STU/SCH/CODEBOOK.
-      - STU/SCH: lê sheet 'data' (ou melhor alternativa), faz mapeamento de sinônimos e detecção de PVs.
+      - STU/SCH: lê sheet 'data' (ou melhor alternativa) projetando só as colunas usadas
+        (ids, medidas e PVs; sinônimos CNTSTUID/CNTSCHID), sem materializar a aba inteira.
       - Cria tabelas com NVARCHAR(N<=450) para IDs e FLOAT para medidas.
-      - Cria índices em SCHOOLID/STIDSTD (se tipos permitirem).
+      - Após os INSERTs, cria os índices compostos/cobertos de `pisa_indexes`
+        (se tipos permitirem); `columnstore=True` acrescenta um CLUSTERED COLUMNSTORE.
+      - mode="sync": STU/SCH recebem só inserts/updates/deletes por chave (pisa_sync),
+        sem recriar tabelas nem índices; o codebook continua sendo recarregado.
       - Codebook: cria uma tabela por sheet (nomes sanitizados).
     """
+    if mode not in ("reload", "sync"):
+        raise ValueError("mode deve ser 'reload' ou 'sync'")
     if create_db_if_missing:
         ensure_database(server, database, user, password, prefer_pyodbc=prefer_pyodbc)
     backend, conn = connect_mssql(server, database, user, password, prefer_pyodbc=prefer_pyodbc)
@@ -367,16 +403,26 @@ def ingest_required_to_mssql(parent_dir: str,
 
     # ---- STU
     df_stu = _load_students_filtered(stu_path)
-    _ensure_table(backend, conn, database, schema, "STU_BRA", df_stu, drop_existing=drop_existing)
-    if not df_stu.empty:
-        _insert_dataframe(backend, conn, database, schema, "STU_BRA", df_stu, batch_size=batch_size)
+    if mode == "sync":
+        sync_mssql_table(backend, conn, database, schema, "STU_BRA", df_stu, batch_size=batch_size)
+    else:
+        _ensure_table(backend, conn, database, schema, "STU_BRA", df_stu, drop_existing=drop_existing, create_indexes=False)
+        if not df_stu.empty:
+            _insert_dataframe(backend, conn, database, schema, "STU_BRA", df_stu, batch_size=batch_size)
+            apply_mssql_indexes(conn, schema, "STU_BRA", plan_indexes(MSSQL_FIELDS, available=df_stu.columns, target="mssql"),
+                                columnstore=columnstore)
     results[os.path.basename(stu_path)] = ["STU_BRA"]
 
     # ---- SCH
     df_sch = _load_schools_filtered(sch_path)
-    _ensure_table(backend, conn, database, schema, "SCH_BRA", df_sch, drop_existing=drop_existing)
-    if not df_sch.empty:
-        _insert_dataframe(backend, conn, database, schema, "SCH_BRA", df_sch, batch_size=batch_size)
+    if mode == "sync":
+        sync_mssql_table(backend, conn, database, schema, "SCH_BRA", df_sch, batch_size=batch_size)
+    else:
+        _ensure_table(backend, conn, database, schema, "SCH_BRA", df_sch, drop_existing=drop_existing, create_indexes=False)
+        if not df_sch.empty:
+            _insert_dataframe(backend, conn, database, schema, "SCH_BRA", df_sch, batch_size=batch_size)
+            apply_mssql_indexes(conn, schema, "SCH_BRA", plan_indexes(MSSQL_FIELDS, available=df_sch.columns, target="mssql"),
+                                columnstore=columnstore)
     results[os.path.basename(sch_path)] = ["SCH_BRA"]
 
     # ---- CODEBOOK (opcional): uma tabela por sheet
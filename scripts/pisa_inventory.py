@@ -0,0 +1,655 @@
+# -*- coding: utf-8 -*-
+"""
+Inventário de planilhas .xlsx lido direto do zip (sem `pd.ExcelFile`).
+
+Um .xlsx é um zip de XMLs: o manifesto (`xl/workbook.xml` + rels) lista as abas;
+cada `xl/worksheets/sheetN.xml` traz `<dimension ref="A1:Z3001">` e a primeira
+linha (cabeçalho) logo no início. Este módulo lê só esses trechos, com parse
+incremental, então o custo não cresce com o tamanho da aba.
+
+- `scan_workbook(path)`: abas, cabeçalhos, dimensões e nº de linhas de um arquivo
+- `Catalog`: cache (em memória e opcionalmente JSON) invalidado por tamanho/mtime
+- `scan_folder(root)`: varre uma pasta inteira num pool de threads
+- `pick_sheet(path)`, `sheet_names(path)`, `sheet_header(path, sheet)`:
+  consultas instantâneas usadas pelos carregadores
+- `XlsxReader`: abre o zip uma vez, resolve aba/cabeçalho/sinônimos em memória
+  e converte só as colunas projetadas (colunas opcionais ausentes são puladas,
+  nunca há leitura completa de fallback); datas (estilo de data em styles.xml
+  ou células `t="d"`) saem como datetime, como em `pd.read_excel`
+
+Uso típico
+----------
+    from pisa_inventory import scan_folder, pick_sheet, default_catalog
+
+    cat = scan_folder("/content/drive/MyDrive/.../2018", max_workers=8,
+                      cache_path="outputs/xlsx_catalog.json")
+    cat.to_frame()                       # uma linha por aba
+    pick_sheet("STU/STU_BRA.xlsx")       # "data" (sem abrir o workbook de novo)
+
+    with XlsxReader("STU/STU_BRA.xlsx") as rd:
+        df = rd.read(rd.pick_sheet(), columns=["STIDSTD", "SCHOOLID", "ESCS", "PV1READ"],
+                     aliases={"CNTSTUID": "STIDSTD", "CNTSCHID": "SCHOOLID"}, required=["SCHOOLID"])
+"""
+
+from __future__ import annotations
+import glob
+import json
+import os
+import re
+import threading
+import zipfile
+from datetime import datetime, time, timedelta
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+from profiling import instrument
+
+
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+_REF_RE = re.compile(r"^([A-Z]+)(\d+)$")
+
+
+def _col_index(letters: str) -> int:
+    n = 0
+    for ch in letters:
+        n = n * 26 + (ord(ch) - 64)
+    return n - 1
+
+
+def _parse_dimension(ref: Optional[str]):
+    """'A1:Z3001' -> (n_rows, n_cols); None quando a dimensão não é informativa."""
+    if not ref or ":" not in ref:
+        return None
+    a, b = ref.split(":", 1)
+    ma, mb = _REF_RE.match(a), _REF_RE.match(b)
+    if not (ma and mb):
+        return None
+    return int(mb.group(2)) - int(ma.group(2)) + 1, _col_index(mb.group(1)) - _col_index(ma.group(1)) + 1
+
+
+def _sheet_targets(zf: zipfile.ZipFile) -> List[tuple]:
+    """[(nome_da_aba, caminho_no_zip)] na ordem do workbook."""
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    target = {}
+    for r in rels.iter(f"{_NS_PKG}Relationship"):
+        t = r.get("Target", "")
+        target[r.get("Id")] = t.lstrip("/") if t.startswith("/") else "xl/" + t
+    wb = ET.fromstring(zf.read("xl/workbook.xml"))
+    return [(s.get("name"), target.get(s.get(f"{_NS_REL}id")))
+            for s in wb.iter(f"{_NS_MAIN}sheet")]
+
+
+def _shared_strings(zf: zipfile.ZipFile, needed: Iterable[int]) -> Dict[int, str]:
+    """Lê sharedStrings.xml só até o maior índice pedido."""
+    needed = set(needed)
+    if not needed or "xl/sharedStrings.xml" not in zf.namelist():
+        return {}
+    last, out, i = max(needed), {}, 0
+    with zf.open("xl/sharedStrings.xml") as fh:
+        for _, el in ET.iterparse(fh, events=("end",)):
+            if el.tag != f"{_NS_MAIN}si":
+                continue
+            if i in needed:
+                out[i] = "".join(t.text or "" for t in el.iter(f"{_NS_MAIN}t"))
+            el.clear()
+            if i >= last:
+                break
+            i += 1
+    return out
+
+
+def _filled_cols(row) -> List[int]:
+    """Índices das colunas com valor numa `<row>` (células só com estilo não contam)."""
+    out = []
+    for i, c in enumerate(row.iter(f"{_NS_MAIN}c")):
+        if c.find(f"{_NS_MAIN}v") is None and c.find(f"{_NS_MAIN}is") is None:
+            continue
+        m = _REF_RE.match(c.get("r", ""))
+        out.append(_col_index(m.group(1)) if m else i)
+    return out
+
+
+def _first_row(zf: zipfile.ZipFile, member: str, count_rows: bool):
+    """
+    (dimension_ref, células da 1ª linha [(col, tipo, valor)], nº de linhas de dados,
+    nº de colunas). As contagens (None quando não feitas) vão até a última linha e a
+    última coluna com algum valor, como `pd.read_excel`: linhas vazias só com estilo
+    no fim da aba não contam; linhas em branco no meio, sim.
+    """
+    ref, cells = None, None
+    first_r = last_r = r = 0
+    width = 0
+    with zf.open(member) as fh:
+        for _, el in ET.iterparse(fh, events=("end",)):
+            tag = el.tag
+            if tag == f"{_NS_MAIN}dimension":
+                ref = el.get("ref")
+            elif tag == f"{_NS_MAIN}row":
+                r = int(el.get("r") or r + 1)
+                if cells is None:
+                    cells = []
+                    for c in el.iter(f"{_NS_MAIN}c"):
+                        m = _REF_RE.match(c.get("r", ""))
+                        col = _col_index(m.group(1)) if m else len(cells)
+                        t = c.get("t", "n")
+                        if t == "inlineStr":
+                            v = "".join(x.text or "" for x in c.iter(f"{_NS_MAIN}t"))
+                        else:
+                            vv = c.find(f"{_NS_MAIN}v")
+                            v = vv.text if vv is not None else None
+                        cells.append((col, t, v))
+                    first_r = last_r = r
+                    if not count_rows and _parse_dimension(ref):
+                        break
+                filled = _filled_cols(el)
+                if filled:
+                    last_r = r
+                    width = max(width, max(filled) + 1)
+                el.clear()
+    if cells is None:
+        return ref, [], (0 if count_rows or not _parse_dimension(ref) else None), 0
+    counted = count_rows or not _parse_dimension(ref)
+    return ref, cells, (last_r - first_r if counted else None), (width if counted else None)
+
+
+@instrument("pisa_inventory.scan_workbook", rows=None)
+def scan_workbook(path: str, count_rows: bool = False) -> dict:
+    """
+    Inventário de um .xlsx: para cada aba, cabeçalho (1ª linha), dimensão e nº de
+    linhas de dados. Linhas e colunas vêm de `<dimension>`; quando o arquivo não a
+    traz (ou `count_rows=True`) são contadas em streaming até a última linha e a
+    maior coluna com valor (mesmo formato de `pd.read_excel`).
+    """
+    st = os.stat(path)
+    sheets = []
+    with zipfile.ZipFile(path) as zf:
+        raw = []
+        for name, member in _sheet_targets(zf):
+            raw.append((name, *_first_row(zf, member, count_rows)))
+        sst = _shared_strings(zf, (int(v) for _, _, cells, _, _ in raw for _, t, v in cells if t == "s" and v))
+    for name, ref, cells, counted_rows, counted_cols in raw:
+        width = max((c for c, _, v in cells if v is not None), default=-1) + 1
+        header: List[Optional[str]] = [None] * width
+        for col, t, v in cells:
+            if v is not None:
+                header[col] = sst.get(int(v)) if t == "s" else v
+        dim = _parse_dimension(ref)
+        if counted_rows is not None:
+            n_rows, n_cols = counted_rows, counted_cols
+        else:
+            n_rows, n_cols = (max(dim[0] - 1, 0), dim[1]) if dim else (0, width)
+        sheets.append({
+            "name": name,
+            "dimension": ref,
+            "n_rows": n_rows if cells else 0,
+            "n_cols": n_cols,
+            "header": header,
+        })
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sheets": sheets}
+
+
+class Catalog:
+    """
+    Catálogo de workbooks (chave: caminho absoluto), invalidado por tamanho/mtime.
+    Com `cache_path` o catálogo é carregado/salvo em JSON.
+    """
+
+    def __init__(self, cache_path: Optional[str] = None) -> None:
+        self.cache_path = cache_path
+        self.entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, encoding="utf-8") as fh:
+                self.entries = {e["path"]: e for e in json.load(fh).get("workbooks", [])}
+
+    def _fresh(self, key: str) -> Optional[dict]:
+        e = self.entries.get(key)
+        if e is None:
+            return None
+        try:
+            st = os.stat(key)
+        except OSError:
+            return None
+        return e if (e["size"], e["mtime_ns"]) == (st.st_size, st.st_mtime_ns) else None
+
+    def get(self, path: str, count_rows: bool = False) -> dict:
+        """Entrada do workbook; reescaneia só quando o arquivo mudou."""
+        key = os.path.abspath(path)
+        with self._lock:
+            e = self._fresh(key)
+        if e is None:
+            e = scan_workbook(key, count_rows=count_rows)
+            with self._lock:
+                self.entries[key] = e
+        return e
+
+    def save(self, path: Optional[str] = None) -> Optional[str]:
+        path = path or self.cache_path
+        if not path:
+            return None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            data = {"workbooks": list(self.entries.values())}
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False)
+        return path
+
+    def sheet_names(self, path: str) -> List[str]:
+        return [s["name"] for s in self.get(path)["sheets"]]
+
+    def header(self, path: str, sheet: Optional[str] = None) -> List[Optional[str]]:
+        sheets = self.get(path)["sheets"]
+        for s in sheets:
+            if sheet is None or s["name"] == sheet:
+                return list(s["header"])
+        raise KeyError(f"Aba '{sheet}' não encontrada em {os.path.basename(path)}: {[s['name'] for s in sheets]}")
+
+    def pick_sheet(self, path: str, pref: Sequence[str] = ("data",), contains: Optional[str] = "data") -> str:
+        """
+        Mesma regra dos `_pick_sheet` dos carregadores: primeira aba de `pref`
+        presente; senão a primeira cujo nome contém `contains`; senão a primeira.
+        """
+        names = [str(s).strip() for s in self.sheet_names(path)]
+        for s in pref:
+            if s in names:
+                return s
+        if contains:
+            for s in names:
+                if contains in s.lower():
+                    return s
+        return names[0]
+
+    def to_frame(self) -> pd.DataFrame:
+        """Uma linha por aba: arquivo, aba, linhas, colunas, dimensão e cabeçalho."""
+        rows = []
+        for e in self.entries.values():
+            for s in e["sheets"]:
+                rows.append({"file": os.path.basename(e["path"]), "path": e["path"], "sheet": s["name"],
+                             "n_rows": s["n_rows"], "n_cols": s["n_cols"], "dimension": s["dimension"],
+                             "header": s["header"]})
+        return pd.DataFrame(rows, columns=["file", "path", "sheet", "n_rows", "n_cols", "dimension", "header"])
+
+
+_DEFAULT: Optional[Catalog] = None
+
+
+def default_catalog() -> Catalog:
+    """Catálogo do processo (JSON em $PISA_XLSX_CATALOG quando definido)."""
+    global _DEFAULT
+    if _DEFAULT is None:
+        _DEFAULT = Catalog(os.environ.get("PISA_XLSX_CATALOG"))
+    return _DEFAULT
+
+
+def scan_folder(root: str, pattern: str = "**/*.xlsx", max_workers: int = 8,
+                catalog: Optional[Catalog] = None, cache_path: Optional[str] = None,
+                count_rows: bool = False) -> Catalog:
+    """
+    Varre todos os .xlsx sob `root` em paralelo (threads) e devolve o catálogo.
+    Arquivos já catalogados e inalterados não são relidos; arquivos temporários
+    do Excel (`~$...`) são ignorados.
+    """
+    cat = catalog or (Catalog(cache_path) if cache_path else default_catalog())
+    paths = sorted(p for p in glob.glob(os.path.join(root, pattern), recursive=True)
+                   if not os.path.basename(p).startswith("~$"))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as ex:
+        list(ex.map(lambda p: cat.get(p, count_rows=count_rows), paths))
+    if cache_path or cat.cache_path:
+        cat.save(cache_path)
+    return cat
+
+
+def sheet_names(path: str) -> List[str]:
+    return default_catalog().sheet_names(path)
+
+
+def sheet_header(path: str, sheet: Optional[str] = None) -> List[Optional[str]]:
+    return default_catalog().header(path, sheet)
+
+
+def pick_sheet(path: str, pref: Sequence[str] = ("data",), contains: Optional[str] = "data") -> str:
+    return default_catalog().pick_sheet(path, pref, contains)
+
+
+# ------------------------------ Leitura projetada ---------------------------------
+
+_DIGITS = "0123456789"
+_FLOAT_RE = re.compile(r"^\s*[-+]?(\d+\.\d*|\.\d+|\d+)([eE][-+]?\d+)?\s*$")
+
+# mesmos marcadores de ausente que `pd.read_excel` reconhece por padrão
+_NA_STRINGS = frozenset({"", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+                         "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None",
+                         "n/a", "nan", "null"})
+
+
+# formatos embutidos de data/hora (os demais ids embutidos são numéricos)
+_BUILTIN_DATE_FMTS = {14: "mm-dd-yy", 15: "d-mmm-yy", 16: "d-mmm", 17: "mmm-yy", 18: "h:mm AM/PM",
+                      19: "h:mm:ss AM/PM", 20: "h:mm", 21: "h:mm:ss", 22: "m/d/yy h:mm",
+                      45: "mm:ss", 46: "[h]:mm:ss", 47: "mmss.0"}
+# mesmas regras do openpyxl (usado por `pd.read_excel`) para reconhecer formatos de data
+_FMT_STRIP_RE = re.compile(r'".*?"|\[(?!hh?\]|mm?\]|ss?\])[^\]]*\]')
+_FMT_DATE_RE = re.compile(r"(?<![_\\])[dmhysDMHYS]")
+_FMT_TIMEDELTA_RE = re.compile(r"^\[hh?\](:mm(:ss(\.0*)?)?)?;?$")
+_EPOCH_1900 = datetime(1899, 12, 30)
+_EPOCH_1904 = datetime(1904, 1, 1)
+
+
+def _is_date_format(fmt: Optional[str]) -> bool:
+    if fmt is None:
+        return False
+    return _FMT_DATE_RE.search(_FMT_STRIP_RE.sub("", fmt.split(";")[0])) is not None
+
+
+def _date_styles(zf: zipfile.ZipFile) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """
+    Índices de estilo (atributo `s` da célula) com formato de data e, entre eles,
+    os de duração (`[h]:mm:ss`), a partir de `numFmts` e `cellXfs` de styles.xml.
+    """
+    if "xl/styles.xml" not in zf.namelist():
+        return frozenset(), frozenset()
+    root = ET.fromstring(zf.read("xl/styles.xml"))
+    fmts: Dict[int, str] = dict(_BUILTIN_DATE_FMTS)
+    for nf in root.iter(f"{_NS_MAIN}numFmt"):
+        fmts[int(nf.get("numFmtId", -1))] = nf.get("formatCode", "")
+    dates, durations = set(), set()
+    xfs = root.find(f"{_NS_MAIN}cellXfs")
+    for i, xf in enumerate(xfs if xfs is not None else ()):
+        fmt = fmts.get(int(xf.get("numFmtId", 0)))
+        if _is_date_format(fmt):
+            dates.add(str(i))
+            if _FMT_TIMEDELTA_RE.match(fmt):
+                durations.add(str(i))
+    return frozenset(dates), frozenset(durations)
+
+
+def _date1904(zf: zipfile.ZipFile) -> bool:
+    pr = ET.fromstring(zf.read("xl/workbook.xml")).find(f"{_NS_MAIN}workbookPr")
+    return pr is not None and pr.get("date1904", "0").lower() in ("1", "true")
+
+
+def _from_serial(value: float, date1904: bool = False, duration: bool = False):
+    """Número de série do Excel -> datetime/time/timedelta (arredondado ao ms, como o openpyxl)."""
+    if duration:
+        return timedelta(milliseconds=round(value * 86_400_000))
+    day, fraction = divmod(value, 1)
+    diff = timedelta(milliseconds=round(fraction * 86_400_000))
+    if 0 <= value < 1 and diff.days == 0:
+        return (datetime.min + diff).time()
+    if 0 < value < 60 and not date1904:
+        day += 1  # 29/02/1900 fictício do Excel
+    return (_EPOCH_1904 if date1904 else _EPOCH_1900) + timedelta(days=day) + diff
+
+
+def _from_iso(v: str):
+    """Célula `t="d"`: data/hora ISO 8601 gravada como texto."""
+    try:
+        return datetime.fromisoformat(v.strip().rstrip("Z"))
+    except ValueError:
+        return time.fromisoformat(v.strip())
+
+
+def _cell_value(t: str, v: Optional[str], sst: List[str]):
+    if v is None:
+        return None
+    if t == "s":
+        return sst[int(v)]
+    if t in ("str", "inlineStr", "e"):
+        return v
+    if t == "b":
+        return v == "1"
+    if t == "d":
+        return _from_iso(v)
+    f = float(v)
+    return int(f) if f.is_integer() and "." not in v and "E" not in v.upper() else f
+
+
+class XlsxReader:
+    """
+    Leitor de um .xlsx com uma única abertura do arquivo.
+
+    O manifesto e as strings compartilhadas são lidos uma vez e reaproveitados;
+    `read` resolve o cabeçalho na primeira linha da própria passada de dados e só
+    converte as células das colunas projetadas. Colunas pedidas que não existem
+    são ignoradas (ou geram KeyError se estiverem em `required`).
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._zf = zipfile.ZipFile(path)
+        self._targets = _sheet_targets(self._zf)
+        self._sst: Optional[List[str]] = None
+        self._styles: Optional[Tuple[FrozenSet[str], FrozenSet[str], bool]] = None
+        self._headers: Dict[str, List[Optional[str]]] = {}
+
+    def close(self) -> None:
+        self._zf.close()
+
+    def __enter__(self) -> "XlsxReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def sheet_names(self) -> List[str]:
+        return [n for n, _ in self._targets]
+
+    def pick_sheet(self, pref: Sequence[str] = ("data",), contains: Optional[str] = "data") -> str:
+        """Mesma regra de `Catalog.pick_sheet`, sem reabrir o arquivo."""
+        names = [str(s).strip() for s in self.sheet_names]
+        for s in pref:
+            if s in names:
+                return s
+        if contains:
+            for s in names:
+                if contains in s.lower():
+                    return s
+        return names[0]
+
+    def _member(self, sheet: Union[str, int]) -> tuple:
+        if isinstance(sheet, int):
+            return self._targets[sheet]
+        for name, member in self._targets:
+            if name == sheet or str(name).strip() == sheet:
+                return name, member
+        raise KeyError(f"Aba '{sheet}' não encontrada em {os.path.basename(self.path)}: {self.sheet_names}")
+
+    def _shared(self) -> List[str]:
+        if self._sst is None:
+            self._sst = []
+            if "xl/sharedStrings.xml" in self._zf.namelist():
+                with self._zf.open("xl/sharedStrings.xml") as fh:
+                    for _, el in ET.iterparse(fh, events=("end",)):
+                        if el.tag == f"{_NS_MAIN}si":
+                            self._sst.append("".join(t.text or "" for t in el.iter(f"{_NS_MAIN}t")))
+                            el.clear()
+        return self._sst
+
+    def _date_styles(self) -> Tuple[FrozenSet[str], FrozenSet[str], bool]:
+        """(estilos de data, estilos de duração, sistema 1904), lidos uma vez."""
+        if self._styles is None:
+            self._styles = (*_date_styles(self._zf), _date1904(self._zf))
+        return self._styles
+
+    def header(self, sheet: Union[str, int] = 0) -> List[Optional[str]]:
+        """Cabeçalho (1ª linha) da aba; lê só o início do XML da aba."""
+        name, member = self._member(sheet)
+        if name not in self._headers:
+            _, cells, _, _ = _first_row(self._zf, member, count_rows=False)
+            width = max((c for c, _, _ in cells), default=-1) + 1
+            hdr: List[Optional[str]] = [None] * width
+            sst = self._shared() if any(t == "s" for _, t, _ in cells) else []
+            for col, t, v in cells:
+                hdr[col] = None if v is None else str(_cell_value(t, v, sst)).strip()
+            self._headers[name] = hdr
+        return list(self._headers[name])
+
+    @staticmethod
+    def resolve(header: Sequence[Optional[str]], columns: Iterable[str],
+                aliases: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """
+        {nome_canônico: nome_no_arquivo} para as colunas pedidas que existem.
+        `aliases` segue o formato {sinônimo: canônico} (ex.: {"CNTSTUID": "STIDSTD"});
+        o nome canônico tem prioridade sobre o sinônimo.
+        """
+        present = set(h for h in header if h is not None)
+        out: Dict[str, str] = {}
+        for c in columns:
+            if c in present:
+                out[c] = c
+                continue
+            for syn, canon in (aliases or {}).items():
+                if canon == c and syn in present:
+                    out[c] = syn
+                    break
+        return out
+
+    def read(self, sheet: Union[str, int] = 0, columns: Optional[Iterable[str]] = None,
+             aliases: Optional[Dict[str, str]] = None, required: Sequence[str] = ()) -> pd.DataFrame:
+        """
+        Lê só as colunas projetadas (nomes canônicos na saída, na ordem da aba).
+        `columns=None` lê todas as colunas com algum valor, como `pd.read_excel`:
+        colunas sem cabeçalho viram `Unnamed: N`, nomes repetidos ganham `.1`, `.2`...
+        Em ambos os casos as linhas vazias no fim da aba (só com estilo) são descartadas.
+        Números em células com formato de data viram datetime (ou time/timedelta),
+        também como `pd.read_excel`.
+        """
+        name, member = self._member(sheet)
+        sst = self._shared()
+        dates, durations, date1904 = self._date_styles()
+        project = columns is not None
+        cols: Optional[Dict[str, int]] = None  # letras da coluna -> posição na saída
+        letters: List[str] = []
+        names: List[Optional[str]] = []
+        data: List[List] = []
+        special: List[Dict[int, object]] = []  # células não numéricas: posição -> valor
+        n = last = 0                            # linhas lidas / até a última com valor
+        next_row = 0
+        with self._zf.open(member) as fh:
+            for _, el in ET.iterparse(fh, events=("end",)):
+                if el.tag != f"{_NS_MAIN}row":
+                    continue
+                r = int(el.get("r", next_row + 1))
+                if cols is None:
+                    hdr: Dict[str, str] = {}
+                    for c in el.iter(f"{_NS_MAIN}c"):
+                        vv = c.find(f"{_NS_MAIN}v") if c.get("t") != "inlineStr" else None
+                        v = vv.text if vv is not None else "".join(x.text or "" for x in c.iter(f"{_NS_MAIN}t"))
+                        if v is not None and v != "":
+                            hdr[c.get("r", "").rstrip(_DIGITS)] = str(_cell_value(c.get("t", "n"), v, sst)).strip()
+                    self._headers.setdefault(name, [hdr.get(k) for k in sorted(hdr, key=_col_index)])
+                    wanted = (self.resolve(hdr.values(), columns, aliases) if project
+                              else {h: h for h in hdr.values()})
+                    missing = [c for c in required if c not in wanted]
+                    if missing:
+                        raise KeyError(f"Colunas obrigatórias ausentes em {os.path.basename(self.path)}:{name}: {missing}")
+                    real_to_canon = {v: k for k, v in wanted.items()}
+                    letters = [k for k in sorted(hdr, key=_col_index) if hdr[k] in real_to_canon]
+                    cols = {k: i for i, k in enumerate(letters)}
+                    names = [real_to_canon[hdr[k]] for k in letters]
+                    data = [[] for _ in names]
+                    special = [{} for _ in names]
+                    next_row = r
+                    el.clear()
+                    continue
+                for _ in range(r - next_row - 1):  # linhas em branco no meio da aba
+                    for d in data:
+                        d.append(None)
+                    n += 1
+                row: List = [None] * len(names)
+                filled = False
+                for c in el.iter(f"{_NS_MAIN}c"):
+                    t = c.get("t", "n")
+                    if t == "inlineStr":
+                        v = "".join(x.text or "" for x in c.iter(f"{_NS_MAIN}t"))
+                    else:
+                        vv = c.find(f"{_NS_MAIN}v")
+                        v = vv.text if vv is not None else None
+                    if v is None:
+                        continue
+                    filled = True
+                    ref = c.get("r", "").rstrip(_DIGITS)
+                    j = cols.get(ref)
+                    if j is None:
+                        if project:
+                            continue
+                        # coluna sem cabeçalho (ou com cabeçalho vazio): entra como Unnamed
+                        j = cols[ref] = len(names)
+                        letters.append(ref)
+                        names.append(None)
+                        data.append([None] * n)
+                        special.append({})
+                        row.append(None)
+                    s = c.get("s")
+                    row[j] = ("date", v, s in durations) if t == "n" and s in dates else (t, v)
+                for j, cell in enumerate(row):
+                    if cell is None:
+                        data[j].append(None)
+                    elif cell[0] == "n":
+                        data[j].append(cell[1])
+                    elif cell[0] == "date":
+                        special[j][len(data[j])] = _from_serial(float(cell[1]), date1904, cell[2])
+                        data[j].append(None)
+                    else:
+                        special[j][len(data[j])] = _cell_value(cell[0], cell[1], sst)
+                        data[j].append(None)
+                n += 1
+                if filled:
+                    last = n
+                next_row = r
+                el.clear()
+        out = {}
+        order = sorted(range(len(names)), key=lambda j: _col_index(letters[j]))
+        labels = self._labels([names[j] for j in order], [letters[j] for j in order], project)
+        for label, j in zip(labels, order):
+            d, sp = data[j][:last], {i: v for i, v in special[j].items() if i < last}
+            if not sp:  # coluna só numérica (float() arredonda corretamente, como o openpyxl)
+                if d and None not in d and not any(("." in v or "E" in v or "e" in v) for v in d):
+                    out[label] = pd.Series([int(v) for v in d], dtype="int64")
+                else:
+                    out[label] = pd.Series([float(v) if v is not None else float("nan") for v in d],
+                                           dtype="float64")
+            else:
+                vals = [_cell_value("n", v, sst) for v in d]
+                for i, v in sp.items():
+                    vals[i] = None if isinstance(v, str) and v in _NA_STRINGS else v
+                col = pd.Series([_cell_value("n", v.strip(), sst) if isinstance(v, str) and _FLOAT_RE.match(v) else v
+                                 for v in vals],
+                                dtype=object)
+                try:  # como o parser do pandas: texto todo numérico vira número
+                    out[label] = pd.to_numeric(col)
+                except (ValueError, TypeError):
+                    out[label] = col.infer_objects()
+        return pd.DataFrame(out, columns=labels, index=pd.RangeIndex(last))
+
+    @staticmethod
+    def _labels(names: Sequence[Optional[str]], letters: Sequence[str], project: bool) -> List[str]:
+        """Rótulos de saída: `Unnamed: N` e repetidos com `.k`, como o parser do pandas."""
+        if project:
+            return list(names)
+        out: List[str] = []
+        seen: Dict[str, int] = {}
+        for nm, ref in zip(names, letters):
+            label = nm if nm is not None else f"Unnamed: {_col_index(ref)}"
+            if label in seen:
+                k = seen[label]
+                while f"{label}.{k}" in seen:
+                    k += 1
+                seen[label] = k + 1
+                label = f"{label}.{k}"
+            seen.setdefault(label, 1)
+            out.append(label)
+        return out
+
+
+__all__ = [
+    "XlsxReader",
+    "scan_workbook", "Catalog", "default_catalog", "scan_folder",
+    "sheet_names", "sheet_header", "pick_sheet",
+]
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Ligação STU × FLT × SCH por índices inteiros reutilizáveis.
+
+Substitui a sequência do notebook (inspeção manual do deslocamento do CNTSTUID
+no FLT, `merge(..., indicator=True)` para diagnóstico e depois
+`merge(validate=...)` para valer) por uma única passada que:
+
+1. detecta automaticamente deslocamentos constantes de ID (ex.: +50.000 no FLT);
+2. constrói índices hash sobre CNTSTUID/CNTSCHID (uma vez);
+3. calcula a cobertura (alunos só em STU, só em FLT, escolas sem alunos...);
+4. devolve mapas de posição de linha, de modo que juntar de novo — por exemplo,
+   a cada base imputada — seja só um `take` de arrays, sem novo merge.
+
+Uso típico
+----------
+    from pisa_linkage import link
+
+    lk = link(stu, flt, sch)            # detecta o deslocamento do FLT sozinho
+    print(lk.format_coverage())
+    students_final = lk.join(stu, flt, sch)
+
+    # mesma estrutura de linhas, outra imputação: sem merge
+    students_k = lk.join(imputations[k], flt, sch_imputations[k])
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+
+FLT_ID_OFFSET = 50_000  # deslocamento conhecido do PISA 2018 (FLT = STU + 50.000)
+_NA_KEY = np.iinfo(np.int64).min  # marcador de ID ausente/inválido
+
+
+# --------------------------------- Deslocamento ------------------------------------
+
+def _int_keys(values) -> np.ndarray:
+    """Converte uma coluna de IDs em int64 (NaN/inválidos viram _NA_KEY)."""
+    s = pd.to_numeric(pd.Series(values), errors="coerce")
+    return s.fillna(_NA_KEY).to_numpy(dtype=np.int64)
+
+
+def detect_id_offset(left_ids, right_ids,
+                     candidates: Iterable[int] = (0, FLT_ID_OFFSET, -FLT_ID_OFFSET),
+                     sample: int = 50_000) -> Tuple[int, float]:
+    """
+    Encontra o deslocamento constante `d` que maximiza o casamento `right - d ∈ left`.
+
+    Avalia os candidatos informados e os sugeridos pelos dados (diferença de
+    mínimos, máximos e medianas dos IDs únicos), numa amostra de `right`; em
+    empate prevalece o primeiro candidato informado.
+
+    Retorna
+    -------
+    (offset, taxa_de_casamento) — taxa sobre os IDs únicos amostrados de `right`.
+    """
+    left = np.unique(_int_keys(left_ids))
+    right = np.unique(_int_keys(right_ids))
+    left, right = left[left != _NA_KEY], right[right != _NA_KEY]
+    if left.size == 0 or right.size == 0:
+        return 0, 0.0
+    if right.size > sample:
+        right = right[np.linspace(0, right.size - 1, sample).astype(np.int64)]
+
+    # IDs densos (sequenciais) fazem d±1 casar quase tanto quanto d: em empate
+    # vencem os candidatos declarados, na ordem dada; os sugeridos pelos dados
+    # (por |d|) só entram se forem estritamente melhores.
+    cands = list(dict.fromkeys(int(c) for c in candidates))
+    cands += sorted({
+        int(right[0] - left[0]),
+        int(right[-1] - left[-1]),
+        int(right[right.size // 2] - left[left.size // 2]),
+    } - set(cands), key=abs)
+    best, best_hits = 0, -1
+    for d in cands:
+        hits = int(np.isin(right - d, left, assume_unique=True).sum())
+        if hits > best_hits:
+            best, best_hits = d, hits
+    return best, best_hits / right.size
+
+
+# ------------------------------------- Índice --------------------------------------
+
+class IdIndex:
+    """
+    Índice hash de chaves inteiras -> posição de linha (construído uma vez).
+
+    `positions(keys)` devolve a posição de cada chave no frame indexado, ou -1.
+    Linhas com ID ausente não entram no índice.
+    """
+
+    def __init__(self, keys, name: str = "id") -> None:
+        self.name = name
+        k = _int_keys(keys)
+        valid = k != _NA_KEY
+        self._rows = np.flatnonzero(valid)
+        self._index = pd.Index(k[valid])
+        self.size = len(k)
+
+    @property
+    def is_unique(self) -> bool:
+        return bool(self._index.is_unique)
+
+    def duplicated_count(self) -> int:
+        return int(self._index.duplicated().sum())
+
+    def positions(self, keys, offset: int = 0) -> np.ndarray:
+        """Posições (int64) de `keys - offset` no frame indexado; -1 quando ausente."""
+        if not self.is_unique:
+            raise ValueError(f"Índice '{self.name}' tem {self.duplicated_count()} chaves duplicadas; "
+                             "a ligação exige chaves únicas do lado indexado.")
+        q = _int_keys(keys)
+        if offset:
+            q = np.where(q != _NA_KEY, q - offset, _NA_KEY)
+        hit = self._index.get_indexer(q)
+        return np.where(hit >= 0, self._rows[hit], -1).astype(np.int64)
+
+    def contains(self, keys) -> np.ndarray:
+        """Máscara booleana: cada chave existe no índice?"""
+        return pd.Index(_int_keys(keys)).isin(self._index)
+
+
+# ------------------------------------- Ligação -------------------------------------
+
+@dataclass
+class Linkage:
+    """
+    Resultado da ligação STU × FLT × SCH.
+
+    stu_rows : posições das linhas de STU mantidas (inner com FLT, se houver FLT)
+    flt_rows : posições correspondentes em FLT (None se FLT não foi informado)
+    sch_rows : posições em SCH para cada linha mantida (-1 = escola ausente; None sem SCH)
+    """
+    stu_rows: np.ndarray
+    flt_rows: Optional[np.ndarray]
+    sch_rows: Optional[np.ndarray]
+    flt_offset: int = 0
+    stu_key: str = "CNTSTUID"
+    sch_key: str = "CNTSCHID"
+    coverage: Dict[str, object] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return int(self.stu_rows.size)
+
+    @staticmethod
+    def _gather(df: pd.DataFrame, pos: np.ndarray) -> pd.DataFrame:
+        """Seleciona linhas por posição; posições -1 viram linhas vazias (NaN)."""
+        if pos.size and pos.min() >= 0:
+            return df.take(pos).reset_index(drop=True)
+        return df.reset_index(drop=True).reindex(pos).reset_index(drop=True)
+
+    def join(self, stu: pd.DataFrame, flt: Optional[pd.DataFrame] = None,
+             sch: Optional[pd.DataFrame] = None,
+             suffixes: Tuple[str, str, str] = ("", "_flt", "_sch")) -> pd.DataFrame:
+        """
+        Junta os frames usando os mapas de posição (mesmo layout de linhas da ligação).
+
+        Os frames devem ter as mesmas linhas, na mesma ordem, dos usados em `link`
+        (ex.: bases imputadas derivadas de `stu`/`sch` por cópia). Chaves de FLT/SCH
+        não são repetidas; colunas homônimas recebem os sufixos.
+        """
+        parts = [self._gather(stu, self.stu_rows)]
+        seen = set(parts[0].columns)
+        for frame, rows, sfx, keys in (
+            (flt, self.flt_rows, suffixes[1], {self.stu_key, self.sch_key}),
+            (sch, self.sch_rows, suffixes[2], {self.sch_key}),
+        ):
+            if frame is None or rows is None:
+                continue
+            sub = self._gather(frame.drop(columns=[k for k in keys if k in frame.columns]), rows)
+            sub.columns = [f"{c}{sfx}" if c in seen else c for c in sub.columns]
+            seen.update(sub.columns)
+            parts.append(sub)
+        return pd.concat(parts, axis=1)
+
+    def format_coverage(self) -> str:
+        """Relatório de cobertura em texto (mesmo espírito das células do notebook)."""
+        c = self.coverage
+        lines = ["===== Cobertura da ligação STU × FLT × SCH ====="]
+        if "n_flt" in c:
+            lines += [
+                f"Deslocamento detectado no {self.stu_key} do FLT: {self.flt_offset:,} "
+                f"(casamento {100 * c['offset_match_rate']:.1f}%)",
+                f"   Combinados (STU x FLT): {c['stu_flt_both']:,}",
+                f"   Apenas em STU:          {c['stu_only']:,}",
+                f"   Apenas em FLT:          {c['flt_only']:,}",
+            ]
+            if c.get("school_mismatch"):
+                lines.append(f"   ATENÇÃO: {c['school_mismatch']:,} pares com {self.sch_key} divergente (descartados)")
+        if "n_sch" in c:
+            lines += [
+                f"Escolas repetidas em SCH: {c['sch_duplicates']}",
+                f"   Alunos com escola em SCH: {c['students_with_school']:,} de {len(self):,}",
+                f"   Escolas em ambos:         {c['schools_both']:,}",
+                f"   Escolas só em alunos:     {c['schools_only_students']:,}",
+                f"   Escolas só em SCH:        {c['schools_only_sch']:,}",
+            ]
+        return "\n".join(lines)
+
+
+def link(stu: pd.DataFrame,
+         flt: Optional[pd.DataFrame] = None,
+         sch: Optional[pd.DataFrame] = None,
+         stu_key: str = "CNTSTUID",
+         sch_key: str = "CNTSCHID",
+         flt_offset: Union[int, str, None] = "auto",
+         check_school: bool = True) -> Linkage:
+    """
+    Liga alunos (STU) ao FLT (1:1, inner) e à escola (N:1, left) numa passada.
+
+    Parâmetros
+    ----------
+    flt_offset : "auto" detecta o deslocamento de CNTSTUID; um inteiro força o valor.
+    check_school : exige que o par STU/FLT tenha o mesmo `sch_key` (como o merge
+        do notebook em ["CNTSTUID", "CNTSCHID"]).
+
+    Erros
+    -----
+    ValueError se CNTSTUID de FLT ou CNTSCHID de SCH não forem únicos
+    (equivalente a validate="one_to_one"/"many_to_one").
+    """
+    cov: Dict[str, object] = {"n_stu": len(stu)}
+    stu_rows = np.arange(len(stu), dtype=np.int64)
+    flt_rows = None
+    offset = 0
+
+    if flt is not None:
+        if flt_offset == "auto":
+            offset, rate = detect_id_offset(stu[stu_key], flt[stu_key])
+        else:
+            offset, rate = int(flt_offset or 0), float("nan")
+        stu_idx = IdIndex(stu[stu_key], name=f"STU.{stu_key}")
+        flt_idx = IdIndex(flt[stu_key].to_numpy(), name=f"FLT.{stu_key}")
+        if not stu_idx.is_unique:
+            raise ValueError(f"STU.{stu_key} tem {stu_idx.duplicated_count()} duplicatas (esperado 1:1).")
+        # posição em FLT de cada aluno de STU: procura (STU + offset) no índice do FLT
+        pos = flt_idx.positions(stu[stu_key].to_numpy(), offset=-offset)
+        mismatch = 0
+        if check_school and sch_key in stu.columns and sch_key in flt.columns:
+            ok = pos >= 0
+            same = _int_keys(stu[sch_key].to_numpy()[ok]) == _int_keys(flt[sch_key].to_numpy()[pos[ok]])
+            mismatch = int((~same).sum())
+            pos[np.flatnonzero(ok)[~same]] = -1
+        keep = pos >= 0
+        stu_rows, flt_rows = stu_rows[keep], pos[keep]
+        n_both = int(keep.sum())
+        cov.update({
+            "n_flt": len(flt), "flt_offset": offset, "offset_match_rate": rate,
+            "stu_flt_both": n_both, "stu_only": len(stu) - n_both, "flt_only": len(flt) - n_both,
+            "school_mismatch": mismatch,
+        })
+
+    sch_rows = None
+    if sch is not None:
+        sch_idx = IdIndex(sch[sch_key], name=f"SCH.{sch_key}")
+        cov["n_sch"] = len(sch)
+        cov["sch_duplicates"] = sch_idx.duplicated_count()
+        keys_stu = stu[sch_key].to_numpy()[stu_rows]
+        sch_rows = sch_idx.positions(keys_stu)
+        linked = _int_keys(keys_stu)
+        uniq_stu = np.unique(linked[linked != _NA_KEY])
+        uniq_sch = np.unique(_int_keys(sch[sch_key]))
+        uniq_sch = uniq_sch[uniq_sch != _NA_KEY]
+        both = np.intersect1d(uniq_stu, uniq_sch, assume_unique=True).size
+        cov.update({
+            "students_with_school": int((sch_rows >= 0).sum()),
+            "schools_both": int(both),
+            "schools_only_students": int(uniq_stu.size - both),
+            "schools_only_sch": int(uniq_sch.size - both),
+        })
+
+    return Linkage(stu_rows=stu_rows, flt_rows=flt_rows, sch_rows=sch_rows, flt_offset=offset,
+                   stu_key=stu_key, sch_key=sch_key, coverage=cov)
+
+
+__all__ = ["FLT_ID_OFFSET", "detect_id_offset", "IdIndex", "Linkage", "link"]
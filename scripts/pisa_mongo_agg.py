@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+Agregações no servidor (MongoDB) para os documentos de alunos de `pisa_prep`.
+
+Em vez de trazer todos os alunos para o pandas, `school_profile` e
+`quartil_summary` viram pipelines de agregação que devolvem apenas as linhas
+agregadas (uma por escola / uma por quartil). `engine="pandas"` calcula o mesmo
+resultado localmente com `estatisticas` (baixa só os campos necessários), para
+conferência contra um `mongod` local.
+
+Regras (iguais nos dois motores)
+--------------------------------
+- médias ponderadas por `W_FSTUWT`, usando só documentos com valor e peso numéricos;
+- campos-lista (ex.: `pv_read`) entram pela média do aluno entre os PVs;
+- quartis ponderados por `W_FSTUWT` (regra de `pisa_bins`; `weighted=False`:
+  interpolação linear como `pd.qcut`), intervalos (a, b];
+- `context` = média ponderada da escola anexada a cada aluno antes dos quartis
+  (o `disclima_mean_w` do notebook), via `$setWindowFields` (MongoDB >= 5.0);
+- cortes e somas usam a mesma população (mesmo prefixo de pipeline: contexto e
+  filtro numérico) e os cortes saem de um único estágio `$setWindowFields`.
+
+Uso típico
+----------
+    from pymongo import MongoClient
+    from pisa_prep import load_students_df, to_mongo_documents_students
+    from pisa_mongo_agg import load_students, school_profile, quartil_summary
+
+    col = MongoClient("mongodb://localhost:27017").pisa2018.students
+    load_students(col, to_mongo_documents_students(load_students_df(base_dir)))  # cria índices
+
+    perfil = school_profile(col)                     # 1 linha por SCHOOLID
+    quartis = quartil_summary(col)                   # 4 linhas
+    conf = quartil_summary(col, engine="pandas")     # mesmo resultado, calculado no pandas
+"""
+
+from __future__ import annotations
+import math
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+import estatisticas as estat
+from profiling import stage
+
+
+SCHOOL_KEY = "SCHOOLID"
+WEIGHT = "W_FSTUWT"
+
+SCHOOL_MEASURES: Dict[str, str] = {
+    "read_mean_w": "pv_read",
+    "escs_mean_w": "ESCS",
+    "disclima_mean_w": "DISCLIMA",
+}
+
+QUARTIL_MEASURES: Dict[str, str] = {
+    "READ_medio": "pv_read",
+    "DISCLIMA_medio": "DISCLIMA",
+}
+
+QUARTIL_CONTEXT: Dict[str, str] = {"clima_escola_medio": "DISCLIMA"}
+
+# Índices de apoio: agrupamento por escola e ordenação por ESCS (pontos de corte).
+AGG_INDEXES: List[List[tuple]] = [
+    [(SCHOOL_KEY, 1), ("ESCS", 1)],
+    [("ESCS", 1), (WEIGHT, 1)],
+]
+
+
+# ------------------------------------ Ingestão --------------------------------------
+
+def ensure_aggregation_indexes(collection, indexes: Sequence[Sequence[tuple]] = AGG_INDEXES) -> List[str]:
+    """Cria (se faltarem) os índices compostos usados pelas agregações; devolve os nomes."""
+    return [collection.create_index(list(keys)) for keys in indexes]
+
+
+def load_students(collection, docs: Iterable[dict], batch_size: int = 50_000,
+                  drop_existing: bool = True, create_indexes: bool = True) -> int:
+    """
+    Insere documentos de `to_mongo_documents_students` e cria os índices ao final
+    (depois da carga, para não pagar manutenção de índice a cada lote).
+    """
+    from pisa_prep import chunked
+
+    if drop_existing:
+        collection.drop()
+    n = 0
+    with stage("pisa_mongo_agg.insert_many", collection=collection.name) as st:
+        for batch in chunked(docs, batch_size):
+            collection.insert_many(batch, ordered=False)
+            n += len(batch)
+        st.rows = n
+    if create_indexes:
+        with stage("pisa_mongo_agg.create_index", collection=collection.name):
+            ensure_aggregation_indexes(collection)
+    return n
+
+
+# --------------------------------- Blocos de pipeline --------------------------------
+
+def _value(field: str) -> dict:
+    """Valor numérico do campo; listas (PVs) viram a média do aluno."""
+    ref = f"${field}"
+    return {"$cond": [{"$isArray": ref}, {"$avg": ref}, ref]}
+
+
+def _valid(expr, weight: str) -> dict:
+    return {"$and": [{"$isNumber": expr}, {"$isNumber": f"${weight}"}]}
+
+
+def _weighted_sums(measures: Dict[str, str], weight: str) -> Dict[str, dict]:
+    """Acumuladores Σw e Σw·x (só pares válidos) para cada medida."""
+    acc: Dict[str, dict] = {}
+    for i, field in enumerate(measures.values()):
+        x = _value(field)
+        acc[f"sw{i}"] = {"$sum": {"$cond": [_valid(x, weight), f"${weight}", 0]}}
+        acc[f"swx{i}"] = {"$sum": {"$cond": [_valid(x, weight), {"$multiply": [f"${weight}", x]}, 0]}}
+    return acc
+
+
+def _weighted_means(measures: Dict[str, str]) -> Dict[str, dict]:
+    return {
+        name: {"$cond": [{"$gt": [f"$sw{i}", 0]}, {"$divide": [f"$swx{i}", f"$sw{i}"]}, None]}
+        for i, name in enumerate(measures)
+    }
+
+
+def _numeric_filter(fields: Iterable[str]) -> dict:
+    """Documento com todos os campos numéricos (listas: ao menos um elemento numérico)."""
+    return {"$and": [{f: {"$type": "number"}} for f in dict.fromkeys(fields)]}
+
+
+def school_profile_pipeline(measures: Optional[Dict[str, str]] = None,
+                            school: str = SCHOOL_KEY,
+                            weight: str = WEIGHT,
+                            match: Optional[dict] = None) -> List[dict]:
+    """Pipeline de `school_profile`: uma linha por escola com n e médias ponderadas."""
+    measures = measures or SCHOOL_MEASURES
+    pipe: List[dict] = [{"$match": match}] if match else []
+    pipe += [
+        {"$group": {"_id": f"${school}", "n_students": {"$sum": 1}, **_weighted_sums(measures, weight)}},
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, school: "$_id", "n_students": 1, **_weighted_means(measures)}},
+    ]
+    return pipe
+
+
+def quartil_population(measures: Optional[Dict[str, str]] = None,
+                       context: Optional[Dict[str, str]] = None,
+                       var: str = "ESCS",
+                       school: str = SCHOOL_KEY,
+                       weight: str = WEIGHT,
+                       match: Optional[dict] = None) -> Tuple[List[dict], Dict[str, str]]:
+    """
+    Estágios que definem a população dos quartis (contexto da escola anexado antes
+    do filtro; depois, `var`, peso, medidas e contexto numéricos) e as medidas
+    finais ({nome: campo}, contexto incluído). Prefixo comum de `quartil_pipeline`
+    e dos cortes em `quartil_summary`.
+    """
+    measures = dict(measures or QUARTIL_MEASURES)
+    context = QUARTIL_CONTEXT if context is None else context
+    pipe: List[dict] = [{"$match": match}] if match else []
+    if context:
+        # média ponderada da escola, anexada a cada aluno (antes do filtro da base)
+        win = {}
+        for name, field in context.items():
+            x = _value(field)
+            win[f"_ctx_sw_{name}"] = {"$sum": {"$cond": [_valid(x, weight), f"${weight}", 0]}}
+            win[f"_ctx_swx_{name}"] = {"$sum": {"$cond": [_valid(x, weight), {"$multiply": [f"${weight}", x]}, 0]}}
+        pipe.append({"$setWindowFields": {"partitionBy": f"${school}", "output": win}})
+        pipe.append({"$set": {
+            f"_ctx_{name}": {"$cond": [{"$gt": [f"$_ctx_sw_{name}", 0]},
+                                       {"$divide": [f"$_ctx_swx_{name}", f"$_ctx_sw_{name}"]}, None]}
+            for name in context
+        }})
+        measures.update({name: f"_ctx_{name}" for name in context})
+    pipe.append({"$match": _numeric_filter([var, weight, *measures.values()])})
+    return pipe, measures
+
+
+def quartil_pipeline(cuts: Sequence[float],
+                     measures: Optional[Dict[str, str]] = None,
+                     context: Optional[Dict[str, str]] = None,
+                     var: str = "ESCS",
+                     school: str = SCHOOL_KEY,
+                     weight: str = WEIGHT,
+                     match: Optional[dict] = None) -> List[dict]:
+    """
+    Pipeline de `quartil_summary` para pontos de corte já conhecidos (ver `quantile_cuts`).
+    Saída: uma linha por quartil (`q` = 0..len(cuts)).
+    """
+    pipe, measures = quartil_population(measures, context, var, school, weight, match)
+    pipe += [
+        {"$set": {"_q": {"$switch": {
+            "branches": [{"case": {"$lte": [f"${var}", float(c)]}, "then": i} for i, c in enumerate(cuts)],
+            "default": len(cuts),
+        }}}},
+        {"$group": {"_id": "$_q", "n_alunos": {"$sum": 1}, "peso_expandido": {"$sum": f"${weight}"},
+                    **_weighted_sums(measures, weight)}},
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "q": "$_id", "n_alunos": 1, "peso_expandido": 1, **_weighted_means(measures)}},
+    ]
+    return pipe
+
+
+def quantile_cuts_stages(var: str = "ESCS", q: int = 4, weight: Optional[str] = None) -> List[dict]:
+    """
+    Estágios que reduzem a população a uma linha com os q − 1 cortes de `var`:
+    um único `$setWindowFields` ordenado por `var` (ordenação no servidor, com
+    `allowDiskUse`) e um `$group`. Com `weight`: soma acumulada de pesos e, por
+    corte, o menor valor com soma ≥ p·Σw (regra de `pisa_bins`). Sem peso: posição
+    de cada documento e os dois valores vizinhos de p·(n − 1) para a interpolação
+    linear de `pd.qcut` (feita em `_cuts_from_row`).
+    """
+    every = {"documents": ["unbounded", "unbounded"]}
+    if weight is not None:
+        window = {"_cw": {"$sum": f"${weight}", "window": {"documents": ["unbounded", "current"]}},
+                  "_tw": {"$sum": f"${weight}", "window": every}}
+        acc = {f"c{k}": {"$min": {"$cond": [{"$gte": ["$_cw", {"$multiply": ["$_tw", k / q]}]},
+                                            f"${var}", None]}}
+               for k in range(1, q)}
+    else:
+        window = {"_rank": {"$documentNumber": {}}, "_n": {"$count": {}, "window": every}}
+        acc = {"n": {"$first": "$_n"}}
+        for k in range(1, q):
+            lo = {"$floor": {"$multiply": [{"$subtract": ["$_n", 1]}, k / q]}}
+            for tag, rank in (("lo", {"$add": [lo, 1]}), ("hi", {"$min": [{"$add": [lo, 2]}, "$_n"]})):
+                acc[f"c{k}_{tag}"] = {"$max": {"$cond": [{"$eq": ["$_rank", rank]}, f"${var}", None]}}
+    return [{"$setWindowFields": {"sortBy": {var: 1}, "output": window}},
+            {"$group": {"_id": None, **acc}}]
+
+
+def _cuts_from_row(row: dict, q: int, weighted: bool) -> List[float]:
+    if weighted:
+        return [float(row[f"c{k}"]) for k in range(1, q)]
+    cuts = []
+    for k in range(1, q):
+        pos = k / q * (row["n"] - 1)
+        lo, hi = row[f"c{k}_lo"], row[f"c{k}_hi"]
+        cuts.append(float(lo + (hi - lo) * (pos - math.floor(pos))))
+    return cuts
+
+
+def quantile_cuts(collection, var: str = "ESCS", q: int = 4,
+                  match: Optional[dict] = None, weight: Optional[str] = None,
+                  population: Optional[List[dict]] = None) -> List[float]:
+    """
+    Pontos de corte exatos numa única agregação (`quantile_cuts_stages`):
+    ponderados por `weight` ou, sem peso, com interpolação linear (`Series.quantile`).
+
+    A população são os documentos de `match` com `var` (e peso) numéricos ou, com
+    `population`, os que saem desses estágios (ex.: `quartil_population`).
+    """
+    if population is None:
+        population = [{"$match": {"$and": [match or {}, _numeric_filter([var, *([weight] if weight else [])])]}}]
+    rows = list(collection.aggregate([*population, *quantile_cuts_stages(var, q, weight)], allowDiskUse=True))
+    if not rows:
+        raise ValueError(f"Nenhum documento com '{var}' numérico.")
+    return _cuts_from_row(rows[0], q, weight is not None)
+
+
+# ------------------------------------- Consultas -------------------------------------
+
+def _fetch_frame(collection, fields: Iterable[str], match: Optional[dict] = None) -> pd.DataFrame:
+    """Baixa só os campos pedidos; listas viram a média do aluno (igual a `_value`)."""
+    fields = list(dict.fromkeys(fields))
+    docs = collection.find(match or {}, {f: 1 for f in fields} | {"_id": 0})
+    df = pd.DataFrame.from_records(list(docs), columns=fields)
+    for f in fields:
+        if df[f].map(lambda v: isinstance(v, list)).any():
+            df[f] = df[f].map(lambda v: pd.to_numeric(pd.Series(v), errors="coerce").mean()
+                              if isinstance(v, list) else v)
+    return df
+
+
+def school_profile(collection,
+                   measures: Optional[Dict[str, str]] = None,
+                   school: str = SCHOOL_KEY,
+                   weight: str = WEIGHT,
+                   match: Optional[dict] = None,
+                   engine: str = "mongo") -> pd.DataFrame:
+    """
+    Perfil ponderado por escola calculado no servidor (`engine="mongo"`) ou no
+    pandas com `estatisticas.school_profile` (`engine="pandas"`).
+    """
+    measures = measures or SCHOOL_MEASURES
+    if engine == "mongo":
+        with stage("pisa_mongo_agg.school_profile", engine=engine):
+            rows = list(collection.aggregate(school_profile_pipeline(measures, school, weight, match),
+                                             allowDiskUse=True))
+        return pd.DataFrame(rows, columns=[school, "n_students", *measures])
+    if engine == "pandas":
+        with stage("pisa_mongo_agg.school_profile", engine=engine):
+            df = _fetch_frame(collection, [school, weight, *measures.values()], match)
+            out = estat.school_profile(df.rename(columns={v: k for k, v in measures.items()}),
+                                       school=school, weight=weight, measures={k: k for k in measures})
+        return out
+    raise ValueError("engine deve ser 'mongo' ou 'pandas'")
+
+
+def quartil_summary(collection,
+                    measures: Optional[Dict[str, str]] = None,
+                    context: Optional[Dict[str, str]] = None,
+                    var: str = "ESCS",
+                    school: str = SCHOOL_KEY,
+                    weight: str = WEIGHT,
+                    labels: Sequence[str] = estat.QUARTIL_LABELS,
+                    match: Optional[dict] = None,
+                    engine: str = "mongo",
+                    weighted: bool = True) -> pd.DataFrame:
+    """
+    Resumo ponderado por quartil de `var` (tabela `quartil_summary` do notebook).
+
+    A base é a mesma nos dois motores: documentos com `var`, peso, medidas e
+    contexto presentes; o contexto da escola é calculado antes do filtro. Os
+    cortes são ponderados por `weight`, como em `estatisticas.quartil_summary`
+    (`weighted=False`: quantis não ponderados de `pd.qcut`), e no motor "mongo"
+    saem da mesma população das somas (`quartil_population`).
+    """
+    measures = measures or QUARTIL_MEASURES
+    context = QUARTIL_CONTEXT if context is None else context
+    if engine == "mongo":
+        with stage("pisa_mongo_agg.quartil_summary", engine=engine):
+            population, _ = quartil_population(measures, context, var, school, weight, match)
+            cuts = quantile_cuts(collection, var, q=len(labels), weight=weight if weighted else None,
+                                 population=population)
+            rows = list(collection.aggregate(
+                quartil_pipeline(cuts, measures, context, var, school, weight, match), allowDiskUse=True))
+        out = pd.DataFrame(rows, columns=["q", "n_alunos", "peso_expandido", *measures, *context])
+        out.insert(0, "escs_quartil", pd.Categorical.from_codes(out.pop("q"), categories=list(labels)))
+        return out
+    if engine == "pandas":
+        with stage("pisa_mongo_agg.quartil_summary", engine=engine):
+            df = _fetch_frame(collection, [school, var, weight, *measures.values(), *context.values()], match)
+            cols = {}
+            for name, field in measures.items():
+                cols[name] = df[field]
+            for name, field in context.items():
+                prof = estat.wmeans_by(df, school, weight, {name: field}, count_name=None)
+                cols[name] = df[[school]].merge(prof, on=school, how="left")[name].to_numpy()
+            base = pd.DataFrame({var: df[var], weight: df[weight], **cols})
+            return estat.quartil_summary(base, var=var, weight=weight,
+                                         measures={k: k for k in cols}, labels=labels, weighted=weighted)
+    raise ValueError("engine deve ser 'mongo' ou 'pandas'")
+
+
+__all__ = [
+    "SCHOOL_MEASURES", "QUARTIL_MEASURES", "QUARTIL_CONTEXT", "AGG_INDEXES",
+    "ensure_aggregation_indexes", "load_students",
+    "school_profile_pipeline", "quartil_pipeline", "quartil_population",
+    "quantile_cuts_stages", "quantile_cuts",
+    "school_profile", "quartil_summary",
+]
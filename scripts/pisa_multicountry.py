@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Carga em lote de vários países do PISA 2018 com paralelismo por processos.
+
+Descobre todos os pares STU_<CNT>.xlsx / SCH_<CNT>.xlsx (e FLT_<CNT>.xlsx, se houver)
+sob a pasta base — mesma organização usada por `pisa_prep.discover_paths` —,
+lê cada país em um processo separado e grava a saída colunar particionada
+por país:
+
+    <out_dir>/stu/STU_<CNT>.parquet
+    <out_dir>/sch/SCH_<CNT>.parquet
+    <out_dir>/flt/FLT_<CNT>.parquet
+    <out_dir>/_manifest.json
+
+`MultiCountryDataset` expõe o conjunto combinado de forma preguiçosa: nada é
+lido até que um país (ou a concatenação) seja pedido, e análises por país
+(gradiente, ICC) podem rodar de forma independente com `map_countries`.
+
+Uso típico
+----------
+    from pisa_multicountry import load_countries, MultiCountryDataset
+
+    manifest = load_countries("pisa2018", "outputs/multicountry", max_workers=8)
+    ds = MultiCountryDataset("outputs/multicountry")
+    ds.countries                      # ['ARG', 'BRA', ...]
+    stu_bra = ds.load("BRA", "stu", columns=["CNTSCHID", "ESCS"])
+    for cnt, df in ds.iter_countries("stu"):
+        ...
+"""
+
+from __future__ import annotations
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+from micro_check import _read_excel_selected
+from pisa_inventory import pick_sheet
+from pisa_prep import _resolve_subdir, discover_paths
+
+
+# Colunas por nível (mesmas do notebook + pesos). Ausentes em algum país são ignoradas.
+DEFAULT_COLUMNS: Dict[str, List[str]] = {
+    "STU": ["CNTSTUID", "CNTSCHID", "ESCS", "DISCLIMA", "BELONG", "ST004D01T", "REPEAT",
+            "W_FSTUWT", "SENWT", "SCIE", "SCIE.SE", *[f"PV{i}READ" for i in range(1, 11)]],
+    "FLT": ["CNTSTUID", "CNTSCHID", "SENWT", "READ", "READ.SE", "MATH", "MATH.SE",
+            "JOYREAD", "SCREADCOMP"],
+    "SCH": ["CNTSCHID", "SC013Q01TA", "SC016Q01TA", "SC016Q02TA", "EDUSHORT", "STAFFSHORT"],
+}
+
+# caminho do arquivo ou (caminho, aba)
+PathSpec = Union[str, Tuple[str, str]]
+
+_FILE_RE = re.compile(r"^(STU|SCH|FLT)_([A-Za-z]{3})\.xlsx$", re.IGNORECASE)
+
+
+# ----------------------------------- Descoberta ------------------------------------
+
+def discover_countries(base_dir: str, require: Sequence[str] = ("STU", "SCH")) -> List[str]:
+    """
+    Lista os códigos de país (3 letras, caixa alta) que têm todos os níveis em `require`.
+    Procura em STU/, SCH/ e FLT/ (qualquer caixa), como `discover_paths`.
+    """
+    found: Dict[str, set] = {}
+    for kind in ("STU", "SCH", "FLT"):
+        d = _resolve_subdir(base_dir, kind)
+        if not os.path.isdir(d):
+            continue
+        for f in os.listdir(d):
+            m = _FILE_RE.match(f)
+            if m and m.group(1).upper() == kind:
+                found.setdefault(m.group(2).upper(), set()).add(kind)
+    return sorted(c for c, kinds in found.items() if set(require) <= kinds)
+
+
+def country_paths(base_dir: str, country: str) -> Dict[str, str]:
+    """{"STU": path, "SCH": path, "FLT": path (se existir)} para um país."""
+    stu_path, sch_path = discover_paths(base_dir, country=country)
+    paths = {"STU": stu_path, "SCH": sch_path}
+    flt_path = os.path.join(_resolve_subdir(base_dir, "FLT"), f"FLT_{country}.xlsx")
+    if os.path.exists(flt_path):
+        paths["FLT"] = flt_path
+    return paths
+
+
+# --------------------------------- Worker (processo) --------------------------------
+
+def _write_partition(df: pd.DataFrame, path: str, fmt: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    if fmt == "parquet":
+        df.to_parquet(tmp, index=False)
+    else:
+        df.reset_index(drop=True).to_feather(tmp)
+    os.replace(tmp, path)  # escrita atômica: partição parcial nunca fica visível
+
+
+def _parse_country(country: str, paths: Dict[str, PathSpec], columns: Dict[str, List[str]],
+                   out_dir: str, fmt: str, sheet: Optional[str] = None) -> dict:
+    """
+    Lê os níveis de um país e grava uma partição por nível.
+    `paths` mapeia nível -> caminho ou (caminho, aba); sem aba no mapa vale
+    `sheet` e, se também None, `pisa_inventory.pick_sheet` ("data" quando existe).
+    Roda no processo filho; devolve só um resumo pequeno (nada de DataFrames).
+    """
+    t0 = time.perf_counter()
+    info = {"country": country, "files": {}, "rows": {}, "error": None}
+    try:
+        for kind, spec in paths.items():
+            path, sh = spec if isinstance(spec, tuple) else (spec, sheet)
+            df = _read_excel_selected(path, sh or pick_sheet(path), set(columns.get(kind, [])), set())
+            keep = [c for c in columns.get(kind, []) if c in df.columns]
+            df = df.loc[:, keep] if keep else df
+            # CNT pode já vir da aba (STU traz CNT; leitura completa de fallback)
+            df["CNT"] = country
+            df = df[["CNT", *[c for c in df.columns if c != "CNT"]]]
+            out = os.path.join(out_dir, kind.lower(), f"{kind}_{country}.{fmt}")
+            _write_partition(df, out, fmt)
+            info["files"][kind] = os.path.relpath(out, out_dir)
+            info["rows"][kind] = int(len(df))
+    except Exception as e:
+        info["error"] = f"{type(e).__name__}: {e}"
+    info["seconds"] = time.perf_counter() - t0
+    return info
+
+
+# ------------------------------------ Carga em lote ---------------------------------
+
+def load_countries(base_dir: str,
+                   out_dir: str,
+                   countries: Optional[Sequence[str]] = None,
+                   columns: Optional[Dict[str, List[str]]] = None,
+                   max_workers: Optional[int] = None,
+                   fmt: str = "parquet",
+                   skip_existing: bool = False,
+                   sheet: Optional[str] = None,
+                   verbose: bool = True) -> dict:
+    """
+    Lê todos os países em paralelo (um processo por país) e grava as partições.
+
+    Parâmetros
+    ----------
+    countries : códigos a processar; padrão = todos de `discover_countries`.
+    columns : colunas por nível (sobrepõe DEFAULT_COLUMNS).
+    max_workers : processos simultâneos (padrão: os.cpu_count()).
+    fmt : 'parquet' ou 'feather'.
+    skip_existing : não relê países que já estão no manifesto sem erro.
+    sheet : aba lida em todos os arquivos; None escolhe por arquivo
+        (`pisa_inventory.pick_sheet`: "data" quando existe).
+
+    Retorna
+    -------
+    dict
+        Manifesto {"format", "columns", "countries": {CNT: {...}}}, também gravado
+        em <out_dir>/_manifest.json.
+    """
+    if fmt not in ("parquet", "feather"):
+        raise ValueError("fmt deve ser 'parquet' ou 'feather'")
+    cols = {**DEFAULT_COLUMNS, **(columns or {})}
+    countries = list(countries) if countries else discover_countries(base_dir)
+    os.makedirs(out_dir, exist_ok=True)
+
+    manifest = _read_manifest(out_dir) if skip_existing else {}
+    done = manifest.get("countries", {}) if manifest.get("format") == fmt else {}
+    todo = [c for c in countries if not (c in done and not done[c].get("error"))]
+
+    results: Dict[str, dict] = dict(done)
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        futs = {ex.submit(_parse_country, c, country_paths(base_dir, c), cols, out_dir, fmt, sheet): c
+                for c in todo}
+        for fut in as_completed(futs):
+            info = fut.result()
+            results[info["country"]] = info
+            if verbose:
+                status = f"ERRO {info['error']}" if info["error"] else \
+                    ", ".join(f"{k}={v}" for k, v in info["rows"].items())
+                print(f"[{info['country']}] {info['seconds']:.1f}s | {status}")
+
+    manifest = {"format": fmt, "columns": cols, "countries": dict(sorted(results.items()))}
+    with open(os.path.join(out_dir, "_manifest.json"), "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def _read_manifest(out_dir: str) -> dict:
+    path = os.path.join(out_dir, "_manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+# ------------------------------- Conjunto combinado ----------------------------------
+
+class MultiCountryDataset:
+    """
+    Visão preguiçosa das partições gravadas por `load_countries`, particionada por CNT.
+
+    Nada é lido na construção; cada método lê apenas os países/colunas pedidos.
+    """
+
+    def __init__(self, out_dir: str) -> None:
+        self.out_dir = out_dir
+        self.manifest = _read_manifest(out_dir)
+        if not self.manifest:
+            raise FileNotFoundError(f"Manifesto não encontrado em {out_dir} (rode load_countries).")
+        self.fmt = self.manifest["format"]
+
+    @property
+    def countries(self) -> List[str]:
+        return [c for c, info in self.manifest["countries"].items() if not info.get("error")]
+
+    def rows(self, level: str = "stu") -> Dict[str, int]:
+        kind = level.upper()
+        return {c: self.manifest["countries"][c]["rows"].get(kind, 0) for c in self.countries}
+
+    def path(self, country: str, level: str = "stu") -> str:
+        rel = self.manifest["countries"][country]["files"].get(level.upper())
+        if rel is None:
+            raise KeyError(f"{country}: nível '{level}' indisponível.")
+        return os.path.join(self.out_dir, rel)
+
+    def load(self, country: str, level: str = "stu", columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Lê a partição de um país (apenas as colunas pedidas)."""
+        path = self.path(country, level)
+        if self.fmt == "parquet":
+            return pd.read_parquet(path, columns=columns)
+        return pd.read_feather(path, columns=columns)
+
+    def iter_countries(self, level: str = "stu", columns: Optional[List[str]] = None,
+                       countries: Optional[Sequence[str]] = None) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """Itera (CNT, DataFrame) lendo um país por vez."""
+        for c in (countries or self.countries):
+            if level.upper() in self.manifest["countries"][c]["files"]:
+                yield c, self.load(c, level, columns)
+
+    def to_pandas(self, level: str = "stu", columns: Optional[List[str]] = None,
+                  countries: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Concatena os países pedidos (CNT como categoria)."""
+        parts = [df for _, df in self.iter_countries(level, columns, countries)]
+        if not parts:
+            return pd.DataFrame(columns=columns)
+        out = pd.concat(parts, ignore_index=True)
+        if "CNT" in out.columns:
+            out["CNT"] = out["CNT"].astype("category")
+        return out
+
+    def map_countries(self, func: Callable[[str, "MultiCountryDataset"], object],
+                      countries: Optional[Sequence[str]] = None,
+                      max_workers: Optional[int] = None) -> Dict[str, object]:
+        """
+        Executa `func(cnt, dataset)` por país em processos separados (ex.: ICC/gradiente).
+        `func` precisa ser importável (definida em módulo, não lambda).
+        """
+        targets = list(countries or self.countries)
+        out: Dict[str, object] = {}
+        with ProcessPoolExecutor(max_workers=max_workers) as ex:
+            futs = {ex.submit(func, c, self): c for c in targets}
+            for fut in as_completed(futs):
+                out[futs[fut]] = fut.result()
+        return dict(sorted(out.items()))
+
+    def __repr__(self) -> str:
+        return f"MultiCountryDataset({self.out_dir!r}, países={len(self.countries)}, formato={self.fmt})"
+
+
+__all__ = [
+    "DEFAULT_COLUMNS", "discover_countries", "country_paths",
+    "load_countries", "MultiCountryDataset",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Carga multi-país do PISA 2018 em partições colunares.")
+    ap.add_argument("base_dir")
+    ap.add_argument("out_dir")
+    ap.add_argument("--countries", nargs="*", default=None)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--format", choices=["parquet", "feather"], default="parquet")
+    ap.add_argument("--skip-existing", action="store_true")
+    args = ap.parse_args()
+
+    load_countries(args.base_dir, args.out_dir, countries=args.countries, max_workers=args.workers,
+                   fmt=args.format, skip_existing=args.skip_existing)
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Modo de armazenamento float32 (opcional) com salvaguardas de precisão.
+
+Os PVs, pesos e índices dos frames de alunos/escolas e as matrizes de
+delineamento dominam a memória nas cargas multi-país; em float64 ocupam o
+dobro do necessário para dados que vêm do PISA com 4–5 dígitos significativos.
+O modo float32 guarda esses blocos em 4 bytes e protege as contas sensíveis:
+
+- armazenamento: `to_float32` converte as colunas float64 (ids e chaves ficam
+  como estão); `pisa_prep.load_students_df(..., float32=True)` e
+  `DesignCache(dtype="float32")` usam o mesmo caminho;
+- acumulação: `compensated_sum`/`wsum`/`wmean` somam em blocos — soma par a par
+  (`np.sum`, em float64) dentro do bloco e soma compensada de Neumaier (Kahan)
+  entre blocos —, então o erro não cresce com n nem com a ordem dos dados, e
+  os temporários float64 têm só o tamanho de um bloco. `estatisticas.wavg` usa
+  esse caminho quando recebe float32;
+- resolução: os ajustes sempre resolvem em float64 (a matriz float32 é
+  promovida no momento do ajuste); `float32_safe` ainda recusa guardar em
+  float32 uma matriz cujas colunas perderiam resolução (desvio pequeno perto
+  da magnitude, ex.: um ano 2018 ± 0,5) ou cujo número de condição tornaria o
+  arredondamento de 4 bytes visível nos coeficientes;
+- `accuracy_report` roda os caminhos float64 e float32 lado a lado (médias
+  ponderadas, médias por escola, coeficientes WLS) e mostra erro absoluto,
+  relativo e a memória de cada um.
+
+Uso típico
+----------
+    import pisa_precision as prec
+
+    df_stu = prep.load_students_df(base_dir, float32=True)       # PVs/pesos em float32
+    estat.wavg(df_stu["PV1READ"], df_stu["W_FSTUWT"])             # soma compensada
+    cache32 = design.DesignCache(dtype="float32")
+
+    prec.accuracy_report(task2_base, weight="SENWT", measures=["READ", "ESCS"],
+                         by="CNTSCHID", formula="READ ~ ESCS_c + clima_escola_c")
+    # colunas: caminho, item, valor_f64, valor_f32, erro_abs, erro_rel
+"""
+
+from __future__ import annotations
+import math
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from profiling import stage
+
+
+# chaves/ids que nunca mudam de tipo (float32 não representa ids > 2**24)
+KEY_COLUMNS = ("CNTSCHID", "CNTSTUID", "SCHOOLID", "STIDSTD", "CNTRYID", "CNT")
+
+BLOCK = 65_536
+
+EPS32 = float(np.finfo(np.float32).eps)
+
+
+# ------------------------------------ Armazenamento ---------------------------------
+
+def to_float32(df: pd.DataFrame, cols: Optional[Sequence[str]] = None,
+               exclude: Iterable[str] = KEY_COLUMNS) -> pd.DataFrame:
+    """
+    Cópia de `df` com as colunas float64 (ou só `cols`) em float32.
+    Colunas inteiras, texto e `exclude` (ids) ficam como estão.
+    """
+    skip = set(exclude)
+    targets = [c for c in (cols if cols is not None else df.columns)
+               if c in df.columns and c not in skip and df[c].dtype == np.float64]
+    if not targets:
+        return df
+    return df.astype({c: np.float32 for c in targets})
+
+
+def float32_safe(X: np.ndarray, max_cond: float = 1e4, min_resolution: float = 1e-3) -> bool:
+    """
+    True se `X` pode ser guardada em float32 sem perda visível nos ajustes:
+    em cada coluna não constante o passo de float32 na magnitude da coluna fica
+    abaixo de `min_resolution`·desvio, e cond(X) com colunas escaladas é no
+    máximo `max_cond` (erro relativo nos coeficientes ~ eps32·cond).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    if X.size == 0:
+        return True
+    mag = np.nanmax(np.abs(X), axis=0)
+    sd = np.nanstd(X, axis=0)
+    varying = sd > 0
+    # passo relativo de float32 na magnitude da coluna, comparado ao desvio
+    if np.any(mag[varying] * EPS32 > min_resolution * sd[varying]):
+        return False
+    scale = np.where(mag > 0, mag, 1.0)
+    Xs = np.nan_to_num(X / scale)
+    s = np.linalg.svd(Xs[: min(len(Xs), 200_000)], compute_uv=False)
+    cond = s[0] / s[-1] if s[-1] > 0 else np.inf
+    return bool(cond <= max_cond)
+
+
+# ------------------------------------- Acumulação -----------------------------------
+
+def compensated_sum(x, block: int = BLOCK) -> float:
+    """
+    Soma de `x` (sem ausentes) por blocos: soma par a par em float64 dentro
+    do bloco e Neumaier (Kahan) entre blocos.
+    """
+    x = np.asarray(x)
+    total = 0.0
+    comp = 0.0
+    for i in range(0, len(x), block):
+        part = float(np.sum(x[i:i + block], dtype=np.float64))
+        t = total + part
+        if abs(total) >= abs(part):
+            comp += (total - t) + part
+        else:
+            comp += (part - t) + total
+        total = t
+    return total + comp
+
+
+def wsum(x, w, block: int = BLOCK) -> float:
+    """Σ w·x com produtos em float64 por bloco e acumulação compensada."""
+    x = np.asarray(x)
+    w = np.asarray(w)
+    if x.shape != w.shape:
+        raise ValueError(f"x e w com formatos diferentes: {x.shape} × {w.shape}")
+    total = 0.0
+    comp = 0.0
+    for i in range(0, len(x), block):
+        part = float(np.dot(x[i:i + block].astype(np.float64), w[i:i + block].astype(np.float64)))
+        t = total + part
+        if abs(total) >= abs(part):
+            comp += (total - t) + part
+        else:
+            comp += (part - t) + total
+        total = t
+    return total + comp
+
+
+def wmean(x, w, block: int = BLOCK) -> float:
+    """Média ponderada (mesma semântica de `np.average(x, weights=w)`)."""
+    sw = compensated_sum(w, block)
+    if sw == 0:
+        raise ZeroDivisionError("Weights sum to zero, can't be normalized")
+    return wsum(x, w, block) / sw
+
+
+# ---------------------------------- Relatório de precisão ---------------------------
+
+def _err_rows(path: str, items: Sequence[str], v64, v32) -> List[dict]:
+    rows = []
+    for item, a, b in zip(items, np.asarray(v64, dtype=float), np.asarray(v32, dtype=float)):
+        err = abs(a - b)
+        rows.append({"caminho": path, "item": item, "valor_f64": a, "valor_f32": b,
+                     "erro_abs": err, "erro_rel": err / abs(a) if a else (0.0 if err == 0 else math.inf)})
+    return rows
+
+
+def accuracy_report(df: pd.DataFrame,
+                    weight: str = "SENWT",
+                    measures: Sequence[str] = ("READ", "MATH", "SCIENCE", "ESCS"),
+                    by: Optional[str] = "CNTSCHID",
+                    formula: Optional[str] = None) -> pd.DataFrame:
+    """
+    Compara o caminho float64 com o float32 nos mesmos dados: médias ponderadas
+    (`wavg`), médias ponderadas por `by` (erro máximo entre grupos) e, com
+    `formula`, coeficientes de WLS com o delineamento guardado em float32.
+    A última linha traz a memória (MB) das colunas usadas em cada precisão.
+    """
+    import estatisticas as estat
+    import pisa_design as design
+
+    measures = [m for m in measures if m in df.columns]
+    cols = list(dict.fromkeys([*measures, weight, *([by] if by else [])]))
+    base = df[cols].dropna()
+    base32 = to_float32(base)
+    rows: List[dict] = []
+
+    with stage("pisa_precision.accuracy_report", rows=len(base), measures=len(measures)):
+        v64 = [estat.wavg(base[m], base[weight]) for m in measures]
+        v32 = [estat.wavg(base32[m], base32[weight]) for m in measures]
+        rows += _err_rows("wavg", measures, v64, v32)
+
+        if by:
+            spec = {m: m for m in measures}
+            g64 = estat.wmeans_by(base, by, weight, spec, count_name=None).set_index(by)
+            g32 = estat.wmeans_by(base32, by, weight, spec, count_name=None).set_index(by)
+            diff = (g64 - g32.reindex(g64.index)).abs()
+            worst = diff.max()
+            rows += [{"caminho": f"wmeans_by[{by}]", "item": m, "valor_f64": np.nan,
+                      "valor_f32": np.nan, "erro_abs": float(worst[m]),
+                      "erro_rel": float((diff[m] / g64[m].abs()).max())} for m in measures]
+
+        if formula:
+            data = df.dropna(subset=design.referenced_columns(formula, df) + [weight])
+            r64 = design.fit_wls(formula, data, weight, cache=design.DesignCache())
+            r32 = design.fit_wls(formula, to_float32(data), weight,
+                                 cache=design.DesignCache(dtype="float32"))
+            rows += _err_rows("fit_wls", list(r64.params.index), r64.params, r32.params)
+
+    mem64 = base.memory_usage(index=False, deep=True).sum() / 2**20
+    mem32 = base32.memory_usage(index=False, deep=True).sum() / 2**20
+    rows.append({"caminho": "memória (MB)", "item": ", ".join(cols), "valor_f64": mem64,
+                 "valor_f32": mem32, "erro_abs": np.nan, "erro_rel": np.nan})
+    return pd.DataFrame(rows)
+
+
+__all__ = [
+    "KEY_COLUMNS", "to_float32", "float32_safe", "compensated_sum", "wsum", "wmean",
+    "accuracy_report",
+]
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de grade de previsões para as curvas de efeito marginal (`escs_grid` ×
+`climate_levels`, e grades densas ESCS × clima × EDUSHORT × domínio).
+
+Em vez de montar um DataFrame por nível e chamar `model.predict`/`get_prediction`
+em cada um, o motor:
+
+- monta o produto cartesiano de todos os eixos de uma vez (np.repeat/np.tile);
+- avalia a especificação da fórmula do modelo uma única vez sobre a grade inteira;
+- calcula previsão e banda de confiança pelo método delta direto de β e Cov(β):
+      ŷ = Xβ,   se = sqrt(diag(X V Xᵀ)) = sqrt(Σ (X V) ∘ X),
+  com quantil t (df_resid) quando o ajuste usa t, senão normal — os mesmos
+  valores de `get_prediction(...).summary_frame()["mean_ci_*"]`;
+- memoriza os resultados por modelo ajustado (e por grade).
+
+Uso típico
+----------
+    from pisa_predict import predict_grid
+
+    pred_grid = predict_grid(
+        grad_full,
+        axes={"clima_escola_c": climate_levels, "ESCS_c": escs_grid},   # dict = rótulo -> valor
+        fixed={"DISCLIMA": task2_base["DISCLIMA"].mean(), "EDUSHORT_c": 0.0, "STAFFSHORT_c": 0.0,
+               "ST004D01T": task2_base["ST004D01T"].mean(), "REPEAT": 0},
+        label_columns={"clima_escola_c": "cenario"},
+    )
+    # colunas: eixos, fixos, cenario, pred, se, ci_low, ci_high
+"""
+
+from __future__ import annotations
+import hashlib
+import pickle
+import threading
+import weakref
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import pisa_design as design
+from profiling import stage
+
+try:
+    from scipy import stats as _stats
+except ImportError:  # pragma: no cover
+    _stats = None
+
+
+def _require() -> None:
+    if _stats is None:
+        raise RuntimeError("scipy não está instalado. Instale com: pip install scipy")
+    if design.patsy is None:
+        raise RuntimeError("patsy não está instalado. Instale com: pip install patsy")
+
+
+def _coef_and_cov(result) -> Tuple[pd.Series, np.ndarray]:
+    """β e Cov(β) dos efeitos fixos (MixedLM: descarta os componentes de variância)."""
+    if getattr(result, "fe_params", None) is not None:
+        b = result.fe_params
+        V = np.asarray(result.cov_params())[: len(b), : len(b)]
+    else:
+        b = result.params
+        V = np.asarray(result.cov_params())
+    return b, V
+
+
+def cartesian_frame(axes: Mapping[str, Any], fixed: Optional[Mapping[str, Any]] = None,
+                    label_columns: Optional[Mapping[str, str]] = None) -> pd.DataFrame:
+    """
+    Produto cartesiano dos eixos (o primeiro eixo varia mais devagar). Um eixo pode
+    ser uma sequência de valores ou um dict {rótulo: valor}; com `label_columns`
+    o rótulo vai para a coluna indicada. `fixed` entra como coluna constante.
+    """
+    names = list(axes)
+    values, labels = [], {}
+    for name in names:
+        v = axes[name]
+        if isinstance(v, Mapping):
+            labels[name] = np.asarray(list(v.keys()), dtype=object)
+            v = list(v.values())
+        values.append(np.asarray(v))
+    sizes = [len(v) for v in values]
+    total = int(np.prod(sizes)) if sizes else 1
+    cols: Dict[str, np.ndarray] = {}
+    reps = total
+    for name, v, n in zip(names, values, sizes):
+        reps //= n
+        tile = total // (n * reps)
+        idx = np.tile(np.repeat(np.arange(n), reps), tile)
+        cols[name] = v[idx]
+        if name in labels and label_columns and name in label_columns:
+            cols[label_columns[name]] = labels[name][idx]
+    for k, v in (fixed or {}).items():
+        cols[k] = np.full(total, v)
+    return pd.DataFrame(cols)
+
+
+def _grid_key(axes, fixed, label_columns, alpha) -> str:
+    def norm(v):
+        if isinstance(v, Mapping):
+            return ("map", tuple((str(k), float(x) if np.isscalar(x) else repr(x)) for k, x in v.items()))
+        arr = np.asarray(v)
+        return ("arr", str(arr.dtype), arr.tobytes() if arr.dtype != object else repr(arr.tolist()))
+    payload = (
+        tuple((k, norm(v)) for k, v in axes.items()),
+        tuple(sorted((k, repr(v)) for k, v in (fixed or {}).items())),
+        tuple(sorted((label_columns or {}).items())),
+        float(alpha),
+    )
+    return hashlib.blake2b(pickle.dumps(payload), digest_size=16).hexdigest()
+
+
+class PredictionEngine:
+    """Previsões e bandas de um modelo ajustado; resultados memorizados por grade."""
+
+    def __init__(self, result, max_cached: int = 32) -> None:
+        _require()
+        model = result.model
+        spec = design.model_spec(model)
+        if spec is None:
+            raise ValueError("O modelo não tem especificação de fórmula (ajuste via smf ou pisa_design).")
+        self.spec = spec
+        b, V = _coef_and_cov(result)
+        self.names = list(b.index)
+        self.beta = np.asarray(b, dtype=float)
+        self.cov = V
+        self.use_t = bool(getattr(result, "use_t", False))
+        self.df_resid = float(getattr(result, "df_resid", np.inf))
+        self.max_cached = max_cached
+        self._cache: Dict[str, pd.DataFrame] = {}
+        self._lock = threading.Lock()
+
+    def design(self, frame: pd.DataFrame) -> np.ndarray:
+        """
+        Matriz X da grade (uma avaliação da especificação para todas as linhas).
+        Colunas diferentes das do modelo são erro: preencher ou descartar termos
+        mudaria as previsões sem aviso.
+        """
+        X = design.design_for(self.spec, frame)
+        cols = [str(c) for c in X.columns]
+        if cols != self.names:
+            missing = [c for c in self.names if c not in cols]
+            extra = [c for c in cols if c not in self.names]
+            if missing or extra:
+                raise ValueError(f"Delineamento da grade difere do modelo: faltam {missing}, sobram {extra}.")
+            X = X.set_axis(cols, axis=1)[self.names]
+        return np.asarray(X, dtype=float)
+
+    def predict_frame(self, frame: pd.DataFrame, alpha: float = 0.05) -> pd.DataFrame:
+        """Acrescenta pred/se/ci_low/ci_high a um frame de cenários já montado."""
+        X = self.design(frame)
+        pred = X @ self.beta
+        se = np.sqrt(np.einsum("ij,ij->i", X @ self.cov, X))
+        if self.use_t and np.isfinite(self.df_resid):
+            q = _stats.t.ppf(1 - alpha / 2, self.df_resid)
+        else:
+            q = _stats.norm.ppf(1 - alpha / 2)
+        out = frame.copy()
+        out["pred"] = pred
+        out["se"] = se
+        out["ci_low"] = pred - q * se
+        out["ci_high"] = pred + q * se
+        return out
+
+    def grid(self, axes: Mapping[str, Any], fixed: Optional[Mapping[str, Any]] = None,
+             label_columns: Optional[Mapping[str, str]] = None, alpha: float = 0.05) -> pd.DataFrame:
+        key = _grid_key(axes, fixed, label_columns, alpha)
+        with self._lock:
+            hit = self._cache.get(key)
+        if hit is not None:
+            return hit.copy()
+        frame = cartesian_frame(axes, fixed, label_columns)
+        with stage("pisa_predict.grid", rows=len(frame)):
+            out = self.predict_frame(frame, alpha=alpha)
+        with self._lock:
+            if len(self._cache) >= self.max_cached:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = out
+        return out.copy()
+
+
+_ENGINES: "weakref.WeakKeyDictionary[Any, PredictionEngine]" = weakref.WeakKeyDictionary()
+_ENGINES_LOCK = threading.Lock()
+
+
+def engine_for(result) -> PredictionEngine:
+    """Motor memorizado por modelo ajustado (liberado junto com o resultado)."""
+    with _ENGINES_LOCK:
+        eng = _ENGINES.get(result)
+        if eng is None:
+            eng = PredictionEngine(result)
+            _ENGINES[result] = eng
+        return eng
+
+
+def predict_grid(result, axes: Mapping[str, Any], fixed: Optional[Mapping[str, Any]] = None,
+                 label_columns: Optional[Mapping[str, str]] = None, alpha: float = 0.05) -> pd.DataFrame:
+    """Grade cartesiana de previsões com bandas (delta) para um modelo ajustado."""
+    return engine_for(result).grid(axes, fixed, label_columns, alpha)
+
+
+def predict_grid_many(results: Mapping[str, Any], axes: Mapping[str, Any],
+                      fixed: Optional[Mapping[str, Any]] = None,
+                      label_columns: Optional[Mapping[str, str]] = None,
+                      alpha: float = 0.05, key_name: str = "dominio") -> pd.DataFrame:
+    """Mesma grade para vários modelos (ex.: um por domínio), empilhada com a coluna `key_name`."""
+    frames = [predict_grid(res, axes, fixed, label_columns, alpha).assign(**{key_name: key})
+              for key, res in results.items()]
+    return pd.concat(frames, ignore_index=True)
+
+
+__all__ = ["cartesian_frame", "PredictionEngine", "engine_for", "predict_grid", "predict_grid_many"]
@@ -4,8 +4,8 @@ Preparo de dados do PISA 2018 (Brasil) para inserção no MongoDB Atlas.
 
 Funções principais
 ------------------
-- load_students_df(base_dir): lê STU_BRA.xlsx com colunas necessárias
-- load_schools_df(base_dir):  lê SCH_BRA.xlsx com colunas necessárias
+- load_students_df(base_dir, country="BRA"): lê STU_<país>.xlsx com colunas necessárias
+- load_schools_df(base_dir, country="BRA"):  lê SCH_<país>.xlsx com colunas necessárias
 - to_mongo_documents_students(df_students): converte DF de alunos em lista de dicts
 - to_mongo_documents_schools(df_schools):  converte DF de escolas em lista de dicts
 - chunked(iterable, size):    gerador para enviar em lotes ao Mongo (insert_many)
@@ -40,6 +40,10 @@ from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import numpy as np
 import pandas as pd
 
+from pisa_inventory import XlsxReader
+from pisa_precision import to_float32
+from profiling import instrument
+
 
 # ----------------------------- Configuração de colunas -----------------------------
 
@@ -97,24 +101,20 @@ def discover_paths(base_dir: str, country: str = "BRA") -> Tuple[str, str]:
     return stu_path, sch_path
 
 
+@instrument("pisa_prep._read_excel_safe")
 def _read_excel_safe(path: str, wanted_cols: List[str]) -> pd.DataFrame:
     """
-    Lê Excel tentando carregar apenas as colunas desejadas.
-    Se alguma faltar, faz fallback: lê tudo e filtra as colunas existentes.
+    Lê Excel carregando apenas as colunas desejadas (primeira aba, uma abertura).
+    Colunas ausentes são avisadas e puladas, sem reler a aba inteira.
     """
     if not os.path.exists(path):
         raise FileNotFoundError(f"Arquivo não encontrado: {path}")
 
-    try:
-        df = pd.read_excel(path, usecols=wanted_cols)
-    except ValueError:
-        # Nem todas as colunas existem; lê tudo e filtra
-        df_all = pd.read_excel(path)
-        present = [c for c in wanted_cols if c in df_all.columns]
-        missing = [c for c in wanted_cols if c not in df_all.columns]
-        if missing:
-            print(f"[AVISO] Colunas ausentes em {os.path.basename(path)}: {missing}")
-        df = df_all.loc[:, present]
+    with XlsxReader(path) as rd:
+        df = rd.read(0, columns=wanted_cols)
+    missing = [c for c in wanted_cols if c not in df.columns]
+    if missing:
+        print(f"[AVISO] Colunas ausentes em {os.path.basename(path)}: {missing}")
     return df
 
 
@@ -128,11 +128,16 @@ def _ensure_columns(df: pd.DataFrame, required: List[str], where: str) -> None:
         )
 
 
-def _coerce_numeric(df: pd.DataFrame, cols: List[str]) -> pd.DataFrame:
-    """Converte colunas a numérico (quando possível), preservando NaN."""
+def _coerce_numeric(df: pd.DataFrame, cols: List[str], float32: bool = False) -> pd.DataFrame:
+    """
+    Converte colunas a numérico (quando possível), preservando NaN.
+    Com `float32=True` as colunas contínuas ficam em float32 (ver pisa_precision).
+    """
     for c in cols:
         if c in df.columns:
             df[c] = pd.to_numeric(df[c], errors="coerce")
+    if float32:
+        df = to_float32(df, cols)
     return df
 
 
@@ -154,29 +159,33 @@ def chunked(iterable: Iterable[dict], size: int) -> Iterator[List[dict]]:
 
 # ------------------------- Carregamento e seleção de dados ------------------------
 
-def load_students_df(base_dir: str) -> pd.DataFrame:
+def load_students_df(base_dir: str, country: str = "BRA", float32: bool = False) -> pd.DataFrame:
     """
-    Carrega o DataFrame de alunos (Brasil, 2018) com as colunas essenciais.
+    Carrega o DataFrame de alunos (2018) com as colunas essenciais.
 
     Parâmetros
     ----------
     base_dir : str
         Pasta '2018' (ex.: '/content/.../PISA data.../2018').
+    country : str
+        Código de 3 letras do país (STU_<country>.xlsx); padrão 'BRA'.
+    float32 : bool
+        Guarda peso, índices e PVs em float32 (metade da memória).
 
     Retorna
     -------
     pd.DataFrame
         DataFrame apenas com colunas relevantes para a análise e posterior inserção.
     """
-    stu_path, _ = discover_paths(base_dir, country="BRA")
+    stu_path, _ = discover_paths(base_dir, country=country)
     df = _read_excel_safe(stu_path, STUDENT_COLS)
 
     # valida mínimas para o projeto (SCHOOLID, ESCS e PVs)
-    _ensure_columns(df, ["SCHOOLID", "ESCS"] + PV_READ_COLS, "STU_BRA.xlsx")
+    _ensure_columns(df, ["SCHOOLID", "ESCS"] + PV_READ_COLS, f"STU_{country}.xlsx")
 
     # Tipagem: força numérico nas colunas contínuas
     numeric_cols = ["W_FSTUWT", "ESCS", "DISCLIMA"] + PV_READ_COLS
-    df = _coerce_numeric(df, numeric_cols)
+    df = _coerce_numeric(df, numeric_cols, float32=float32)
 
     # Normaliza SCHOOLID para string (estável como chave textual)
     if "SCHOOLID" in df.columns:
@@ -188,27 +197,31 @@ def load_students_df(base_dir: str) -> pd.DataFrame:
     return df.reset_index(drop=True)
 
 
-def load_schools_df(base_dir: str) -> pd.DataFrame:
+def load_schools_df(base_dir: str, country: str = "BRA", float32: bool = False) -> pd.DataFrame:
     """
-    Carrega o DataFrame de escolas (Brasil, 2018) com as colunas essenciais.
+    Carrega o DataFrame de escolas (2018) com as colunas essenciais.
 
     Parâmetros
     ----------
     base_dir : str
         Pasta '2018' (ex.: '/content/.../PISA data.../2018').
+    country : str
+        Código de 3 letras do país (SCH_<country>.xlsx); padrão 'BRA'.
+    float32 : bool
+        Guarda os índices numéricos em float32.
 
     Retorna
     -------
     pd.DataFrame
         DataFrame de escolas, sem duplicatas por SCHOOLID.
     """
-    _, sch_path = discover_paths(base_dir, country="BRA")
+    _, sch_path = discover_paths(base_dir, country=country)
     df = _read_excel_safe(sch_path, SCHOOL_COLS)
 
-    _ensure_columns(df, ["SCHOOLID"], "SCH_BRA.xlsx")
+    _ensure_columns(df, ["SCHOOLID"], f"SCH_{country}.xlsx")
 
     # Tipagem: converte índices numéricos
-    df = _coerce_numeric(df, ["SCMATEDU", "TCSHORT"])
+    df = _coerce_numeric(df, ["SCMATEDU", "TCSHORT"], float32=float32)
 
     # Normaliza SCHOOLID para string
     df["SCHOOLID"] = df["SCHOOLID"].astype(str)
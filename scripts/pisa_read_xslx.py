@@ -4,16 +4,11 @@ import re
 import pandas as pd
 from IPython.display import display
 
+from pisa_inventory import default_catalog
+
 def _pick_sheet(xlsx_path: str) -> str:
-    """Prefere 'data'; senão, primeira sheet com 'data' no nome; senão a primeira."""
-    xls = pd.ExcelFile(xlsx_path, engine="openpyxl")
-    names = [str(s).strip() for s in xls.sheet_names]
-    if "data" in names:
-        return "data"
-    for s in names:
-        if "data" in s.lower():
-            return s
-    return names[0]
+    """Prefere 'data'; senão, primeira sheet com 'data' no nome; senão a primeira (via catálogo)."""
+    return default_catalog().pick_sheet(xlsx_path)
 
 def _read_codebook_sheet(xlsx_path: str, sheet_name: str) -> pd.DataFrame:
     """Detecta linha de cabeçalho real (NAME/VARLABEL), descarta título acima e normaliza."""
@@ -63,8 +58,7 @@ def peek_xlsx(path: str, sheet: str|None=None, *, codebook: bool=False, top: int
 
     if codebook:
         # quando codebook=True + sheet=None: percorre todas as sheets
-        xls = pd.ExcelFile(path, engine="openpyxl")
-        targets = xls.sheet_names if sheet is None else [sheet]
+        targets = default_catalog().sheet_names(path) if sheet is None else [sheet]
         for sh in targets:
             df = _read_codebook_sheet(path, sh)
             print(f"{path.split('/')[-1]} :: {sh}  => {list(df.columns)[:max_cols_print]}")
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Representação esparsa dos blocos largos de questionário (itens `ST*`, `SC016Q0*`...).
+
+Ao ingerir abas STU/SCH completas (centenas de colunas de itens, a maioria com
+muitos ausentes ou sentinelas) cada coluna vira float64 denso e cada NaN vira um
+campo `None` explícito no Mongo. Este módulo oferece o caminho esparso:
+
+- em memória: colunas numéricas com muitos ausentes -> `pd.SparseDtype` (só os
+  valores presentes são guardados); códigos de item inteiros com poucos níveis e
+  textos repetitivos -> `category` (int8/int16 por célula);
+- documentos: `iter_documents` emite cada linha só com os campos não nulos;
+- colunar: `write_columnar` grava parquet com bitmap de validade (nulos não ocupam
+  valor) e categorias dicionarizadas;
+- relatório: `memory_report` compara bytes denso × esparso por aba.
+
+Uso típico
+----------
+    from pisa_sparse import sparsify, iter_documents, write_columnar
+
+    sparse_df, report = sparsify(df_stu, sheet="STU_BRA", sentinels=NEG_SENTINELS)
+    report        # sheet, rows, columns, dense_bytes, sparse_bytes, saved_bytes, saved_pct...
+    db["STU_BRA"].insert_many(iter_documents(sparse_df))      # sem campos None
+    write_columnar(sparse_df, "outputs/stu_bra.parquet")
+"""
+
+from __future__ import annotations
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from profiling import stage
+
+
+# ids e pesos (inclusive os replicados W_FSTURWT*) nunca são esparsificados
+KEEP_COLUMNS = ("CNT", "CNTRYID", "CNTSCHID", "CNTSTUID", "STIDSTD", "SCHOOLID",
+                "W_FSTUWT", "SENWT", "W_SCHGRNRABWT")
+KEEP_PREFIXES = ("W_FSTURWT",)
+
+
+def default_keep(columns: Iterable[Any]) -> List[Any]:
+    """Colunas de `columns` que são ids ou pesos (`KEEP_COLUMNS`/`KEEP_PREFIXES`)."""
+    return [c for c in columns
+            if str(c) in KEEP_COLUMNS or str(c).startswith(KEEP_PREFIXES)]
+
+
+def _dense_bytes(df: pd.DataFrame) -> int:
+    """Bytes da mesma tabela com todas as colunas numéricas em float64 denso."""
+    total = 0
+    for c in df.columns:
+        s = df[c]
+        if (isinstance(s.dtype, pd.SparseDtype) or pd.api.types.is_numeric_dtype(s)
+                or (isinstance(s.dtype, pd.CategoricalDtype)
+                    and pd.api.types.is_numeric_dtype(s.cat.categories))):
+            total += len(s) * 8
+        else:
+            total += int(s.astype(object).memory_usage(index=False, deep=True))
+    return total
+
+
+def densify(s: pd.Series) -> pd.Series:
+    """Volta uma coluna esparsa/categórica para o tipo denso equivalente."""
+    if isinstance(s.dtype, pd.SparseDtype):
+        return s.sparse.to_dense()
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        cats = s.cat.categories
+        if pd.api.types.is_integer_dtype(cats) and s.isna().any():
+            return s.astype("float64")     # inteiro com ausentes (sentinelas): como no caminho denso
+        return s.astype(cats.dtype)
+    return s
+
+
+def sparsify(df: pd.DataFrame,
+             sheet: str = "",
+             null_threshold: float = 0.5,
+             max_levels: int = 32,
+             sentinels: Optional[Iterable[float]] = None,
+             keep: Optional[Sequence[str]] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Converte colunas largas para a forma esparsa/categórica.
+
+    - numérica com fração de ausentes >= `null_threshold` -> Sparse[float64, nan];
+    - numérica inteira com até `max_levels` valores distintos (códigos de item) ->
+      category, com as categorias no dtype original (int64 continua int64);
+    - texto com até `max_levels` valores distintos -> category.
+    Colunas de dtype inteiro tentam primeiro a forma categórica (a esparsa seria
+    float64). `sentinels` (ex.: NEG_SENTINELS) são tratados como ausentes antes
+    da escolha. Colunas em `keep` (ids, pesos; padrão `default_keep`) ficam
+    intocadas. Retorna (frame, relatório).
+    """
+    sent = list(sentinels or [])
+    keep = set(default_keep(df.columns) if keep is None else keep)
+    out: Dict[str, pd.Series] = {}
+    n_sparse = n_cat = 0
+    with stage("pisa_sparse.sparsify", rows=len(df), cols=df.shape[1], sheet=sheet):
+        for c in df.columns:
+            s = df[c]
+            if c in keep:
+                out[c] = s
+                continue
+            if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+                v = s.astype("float64")
+                if sent:
+                    v = v.mask(v.isin(sent))
+                null_frac = float(v.isna().mean()) if len(v) else 0.0
+                present = v.dropna()
+                coded = (len(present) > 0 and bool((present % 1 == 0).all())
+                         and present.nunique() <= max_levels)
+                is_int = pd.api.types.is_integer_dtype(s)
+                if null_frac >= null_threshold and not (is_int and coded):
+                    out[c] = v.astype(pd.SparseDtype("float64", np.nan))
+                    n_sparse += 1
+                    continue
+                if coded:
+                    # categorias no dtype original: códigos int64 continuam inteiros
+                    cats = pd.Index(np.unique(present.to_numpy())).astype(s.dtype)
+                    out[c] = pd.Series(pd.Categorical(s.where(v.notna()), categories=cats),
+                                       index=s.index)
+                    n_cat += 1
+                    continue
+                out[c] = v if sent else s
+            elif s.dtype == object or pd.api.types.is_string_dtype(s):
+                if s.nunique(dropna=True) <= max_levels:
+                    out[c] = s.astype("category")
+                    n_cat += 1
+                else:
+                    out[c] = s
+            else:
+                out[c] = s
+        res = pd.DataFrame(out, index=df.index)
+    report = memory_report(df, res, sheet)
+    report.update(sparse_columns=n_sparse, categorical_columns=n_cat)
+    return res, report
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame, sheet: str = "") -> Dict[str, Any]:
+    """Bytes da forma densa (float64) × bytes reais da forma esparsa."""
+    dense = _dense_bytes(before)
+    sparse = int(after.memory_usage(index=False, deep=True).sum())
+    return {
+        "sheet": sheet, "rows": int(len(after)), "columns": int(after.shape[1]),
+        "dense_bytes": dense, "sparse_bytes": sparse, "saved_bytes": dense - sparse,
+        "saved_pct": round(100.0 * (dense - sparse) / dense, 1) if dense else 0.0,
+    }
+
+
+def report_frame(reports: Iterable[Dict[str, Any]]) -> pd.DataFrame:
+    """Relatórios de várias abas numa tabela (MB para leitura rápida)."""
+    df = pd.DataFrame(list(reports))
+    for c in ("dense_bytes", "sparse_bytes", "saved_bytes"):
+        if c in df.columns:
+            df[c.replace("_bytes", "_mb")] = df[c] / 2**20
+    return df
+
+
+def _py_values(s: pd.Series) -> Tuple[List[Any], np.ndarray]:
+    """Valores como escalares Python (BSON não aceita numpy) + máscara de presentes."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        cats = s.cat.categories.tolist()       # escalares Python no tipo das categorias
+        codes = s.cat.codes.to_numpy()
+        return [cats[k] if k >= 0 else None for k in codes.tolist()], codes >= 0
+    s = densify(s)
+    ok = s.notna().to_numpy()
+    if pd.api.types.is_float_dtype(s):
+        vals = s.to_numpy(dtype="float64").tolist()
+    else:
+        vals = s.tolist()
+    return vals, ok
+
+
+def iter_documents(df: pd.DataFrame, batch_rows: int = 50_000) -> Iterator[Dict[str, Any]]:
+    """
+    Documentos linha a linha sem os campos nulos (NaN/None/NA são omitidos).
+    Processa `batch_rows` linhas por vez para não densificar a tabela inteira.
+    """
+    names = [str(c) for c in df.columns]
+    for start in range(0, len(df), batch_rows):
+        part = df.iloc[start:start + batch_rows]
+        cols = [_py_values(part[c]) for c in part.columns]
+        mask = np.column_stack([ok for _, ok in cols]) if cols else np.zeros((len(part), 0), bool)
+        values = [v for v, _ in cols]
+        for i in range(len(part)):
+            yield {names[j]: values[j][i] for j in np.flatnonzero(mask[i])}
+
+
+def write_columnar(df: pd.DataFrame, path: str, compression: str = "zstd",
+                   row_group_size: int = 100_000) -> str:
+    """
+    Parquet com nulos em bitmap de validade e categorias dicionarizadas; colunas
+    esparsas são densificadas um row group por vez. Requer pyarrow.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:  # pragma: no cover
+        raise RuntimeError("pyarrow não está instalado. Instale com: pip install pyarrow") from e
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    writer = None
+    try:
+        for start in range(0, max(len(df), 1), row_group_size):
+            part = df.iloc[start:start + row_group_size]
+            part = pd.DataFrame({c: densify(part[c]) if isinstance(part[c].dtype, pd.SparseDtype)
+                                 else part[c] for c in part.columns})
+            table = pa.Table.from_pandas(part, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema, compression=compression)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp, path)
+    return path
+
+
+__all__ = ["KEEP_COLUMNS", "default_keep", "sparsify", "densify", "memory_report", "report_frame", "iter_documents", "write_columnar"]
@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+"""
+Curvas de especificação: grade declarativa de modelos (desfecho × controles ×
+interações × subamostra × tipo de ajuste) ajustada em paralelo, com checkpoint
+em disco e saída numa tabela arrumada de coeficientes.
+
+A tabela de resultados do README é uma grade feita à mão (3 domínios × WLS
+básico/completo + variantes MixedLM). Aqui a grade é declarada uma vez:
+
+    SpecGrid(outcomes=["READ", "MATH", "SCIENCE"],
+             base=["ESCS_c"],                                    # sempre presentes
+             controls=["ST004D01T", "C(REPEAT)", "EDUSHORT_c", "STAFFSHORT_c"],   # todos os subconjuntos
+             interactions=["ESCS_c:clima_escola_c"],             # com e sem cada uma
+             subsamples={"Todos": None, "Meninas": "ST004D01T == 1"})
+
+e `run_grid` cuida do resto:
+
+- trabalho de delineamento compartilhado: por subamostra, a amostra analítica é
+  comum a todas as especificações (linhas com todas as colunas da grade
+  presentes, como se espera numa curva de especificação) e a matriz do RHS
+  completo é avaliada uma única vez (`pisa_design.DesignCache`); cada modelo usa
+  só um recorte de colunas dessa matriz. O recorte é escolhido pelos nomes das
+  colunas que o patsy daria à fórmula do próprio modelo (uma vez por conjunto
+  de termos): quando a codificação muda — ex.: `clima:C(REPEAT)` sem o efeito
+  principal vira posto completo — e as colunas não existem na matriz comum,
+  o modelo recebe um delineamento próprio;
+- agendamento: as especificações viram blocos pequenos, ordenados do mais caro
+  para o mais barato (linhas × colunas², MixedLM pesa mais), numa fila única do
+  `ProcessPoolExecutor`: o processo que termina pega o próximo bloco, então
+  nenhum fica ocioso enquanto outro acumula trabalho. As matrizes vão para cada
+  processo uma vez (inicializador), não a cada tarefa;
+- checkpoint: cada bloco concluído é acrescentado a `<checkpoint_dir>/specs.jsonl`.
+  O id da especificação inclui a impressão digital dos dados, então reexecutar
+  a mesma grade retoma de onde parou e dados alterados não reaproveitam nada.
+
+Uso típico
+----------
+    import pisa_specgrid as specgrid
+
+    grid = specgrid.SpecGrid(outcomes=["READ", "MATH", "SCIENCE"], base=["ESCS_c"],
+                             controls=["ST004D01T", "C(REPEAT)", "EDUSHORT_c", "STAFFSHORT_c"],
+                             interactions=["ESCS_c:clima_escola_c"],
+                             subsamples={"Todos": None, "Escolas pequenas": "n_students < 20"})
+    len(grid)                                   # 3 × 16 × 2 × 2 = 192 modelos
+    spec_results = specgrid.run_grid(grid, task2_base, checkpoint_dir="outputs/specgrid",
+                                     max_workers=8)
+    # colunas: spec_id, outcome, subsample, kind, controls, interactions, n_controls,
+    #          formula, term, estimate, se, t, p, ci_low, ci_high, nobs, r2, aic, converged, error
+    curve = specgrid.spec_curve(spec_results, "ESCS_c")     # ordenada, com rank
+"""
+
+from __future__ import annotations
+import hashlib
+import itertools
+import json
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import pisa_design as design
+from profiling import stage
+
+try:
+    import statsmodels.api as sm
+    from patsy import ModelDesc, design_matrix_builders
+    from scipy import stats as _stats
+except ImportError:  # pragma: no cover
+    sm = None
+
+
+def _require() -> None:
+    if sm is None:
+        raise RuntimeError("statsmodels/patsy/scipy não estão instalados. Instale com: pip install statsmodels")
+
+
+KINDS = ("wls", "mixedlm")
+RESULT_COLUMNS = [
+    "spec_id", "outcome", "subsample", "kind", "controls", "interactions", "n_controls",
+    "formula", "term", "estimate", "se", "t", "p", "ci_low", "ci_high",
+    "nobs", "r2", "aic", "converged", "error",
+]
+
+
+# ------------------------------------- Grade ----------------------------------------
+
+@dataclass(frozen=True)
+class Spec:
+    """Uma especificação da grade."""
+    outcome: str
+    base: Tuple[str, ...]
+    controls: Tuple[str, ...]
+    interactions: Tuple[str, ...]
+    subsample: str
+    kind: str = "wls"
+    re_formula: Optional[str] = None
+
+    @property
+    def terms(self) -> Tuple[str, ...]:
+        return (*self.base, *self.controls, *self.interactions)
+
+    @property
+    def formula(self) -> str:
+        return f"{self.outcome} ~ {' + '.join(self.terms) or '1'}"
+
+
+@dataclass
+class SpecGrid:
+    """
+    Grade declarativa. `controls` entra por todos os subconjuntos (de
+    `min_controls` até todos) ou, com `control_sets`, só pelos conjuntos dados;
+    cada interação entra ou não (produto). `subsamples` mapeia nome -> None
+    (todos), expressão de `DataFrame.query` ou máscara booleana.
+    """
+    outcomes: Sequence[str]
+    base: Sequence[str] = ("ESCS_c",)
+    controls: Sequence[str] = ()
+    interactions: Sequence[str] = ()
+    subsamples: Mapping[str, Any] = field(default_factory=lambda: {"Todos": None})
+    kinds: Sequence[str] = ("wls",)
+    control_sets: Optional[Sequence[Sequence[str]]] = None
+    min_controls: int = 0
+    weight: Optional[str] = "SENWT"
+    group: Optional[str] = "CNTSCHID"
+    re_formula: Optional[str] = None
+
+    def __post_init__(self) -> None:
+        bad = set(self.kinds) - set(KINDS)
+        if bad:
+            raise ValueError(f"tipos desconhecidos: {sorted(bad)} (use {KINDS})")
+        if "mixedlm" in self.kinds and not self.group:
+            raise ValueError("MixedLM na grade exige `group`.")
+
+    def _control_sets(self) -> List[Tuple[str, ...]]:
+        if self.control_sets is not None:
+            return [tuple(c) for c in self.control_sets]
+        ctl = list(self.controls)
+        return [c for r in range(self.min_controls, len(ctl) + 1)
+                for c in itertools.combinations(ctl, r)]
+
+    def _interaction_sets(self) -> List[Tuple[str, ...]]:
+        inter = list(self.interactions)
+        return [tuple(t for t, on in zip(inter, flags) if on)
+                for flags in itertools.product((False, True), repeat=len(inter))]
+
+    def specs(self) -> List[Spec]:
+        return [Spec(o, tuple(self.base), c, i, s, k, self.re_formula if k == "mixedlm" else None)
+                for s in self.subsamples for k in self.kinds for o in self.outcomes
+                for c in self._control_sets() for i in self._interaction_sets()]
+
+    def all_terms(self) -> List[str]:
+        sets = self._control_sets()
+        ctl = list(dict.fromkeys(t for c in sets for t in c))
+        return list(dict.fromkeys([*self.base, *ctl, *self.interactions]))
+
+    def __len__(self) -> int:
+        return (len(self.subsamples) * len(self.kinds) * len(self.outcomes)
+                * len(self._control_sets()) * 2 ** len(self.interactions))
+
+
+# ------------------------------- Delineamento comum ---------------------------------
+
+def _term_names(term: str) -> List[str]:
+    """Nomes de termo do patsy para um termo da grade (ex.: 'C(REPEAT)')."""
+    return [t.name() for t in ModelDesc.from_formula(term).rhs_termlist if t.name() != "Intercept"]
+
+
+def _design_columns(rhs: str, data: pd.DataFrame) -> List[str]:
+    """
+    Colunas que `dmatrix(rhs, data)` teria (níveis sobre o frame completo, como
+    no `DesignCache`), sem construir a matriz.
+    """
+    frame = data[design.referenced_columns(rhs, data)].reset_index(drop=True)
+    (builder,) = design_matrix_builders([ModelDesc.from_formula(rhs).rhs_termlist],
+                                        lambda: iter([frame]), 0)
+    return list(builder.column_names)
+
+
+def _subsample_mask(data: pd.DataFrame, sel: Any) -> np.ndarray:
+    if sel is None:
+        return np.ones(len(data), dtype=bool)
+    if isinstance(sel, str):
+        return data.eval(sel).fillna(False).to_numpy(dtype=bool)
+    return np.asarray(sel, dtype=bool)
+
+
+def _shared_designs(grid: SpecGrid, data: pd.DataFrame,
+                    cache: Optional[design.DesignCache]) -> Dict[str, Dict[str, Any]]:
+    """
+    Por subamostra: X do RHS completo (uma avaliação), colunas de cada termo,
+    matriz de desfechos, pesos e grupos, já na amostra analítica comum. Cada
+    conjunto de termos da grade recebe as posições das suas colunas em X ou,
+    se a codificação da fórmula própria não estiver em X, uma matriz própria
+    (`extra`).
+    """
+    cache = cache or design.default_cache()
+    terms = grid.all_terms()
+    term_sets = list(dict.fromkeys(s.terms for s in grid.specs()))
+    set_names = {ts: _design_columns(" + ".join(ts) or "1", data) for ts in term_sets}
+    rhs = " + ".join(terms) or "1"
+    needed = design.referenced_columns(" ".join([rhs, *grid.outcomes, grid.re_formula or ""]), data)
+    needed += [c for c in (grid.weight, grid.group) if c and c not in needed]
+    complete = data[needed].notna().all(axis=1).to_numpy()
+    out: Dict[str, Dict[str, Any]] = {}
+    for name, sel in grid.subsamples.items():
+        mask = complete & _subsample_mask(data, sel)
+        dm = cache.get(rhs, data, mask)
+        info = dm.spec.term_name_slices
+        cols = {"Intercept": list(range(info["Intercept"].start, info["Intercept"].stop))
+                if "Intercept" in info else []}
+        for t in terms:
+            idx: List[int] = []
+            for tn in _term_names(t):
+                if tn not in info:
+                    raise ValueError(f"termo {t!r} não encontrado no delineamento ({list(info)})")
+                idx += list(range(info[tn].start, info[tn].stop))
+            cols[t] = idx
+        rows = dm.rows
+        pos = {n: j for j, n in enumerate(dm.columns)}
+        layouts: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        extra: Dict[str, np.ndarray] = {}
+        for ts, names in set_names.items():
+            if all(n in pos for n in names):
+                layouts[ts] = {"cols": [pos[n] for n in names], "names": names, "design": None}
+                continue
+            sub = cache.get(" + ".join(ts) or "1", data, mask)
+            if not np.array_equal(sub.rows, rows):
+                raise ValueError(f"amostra do delineamento próprio de {ts} difere da amostra comum")
+            key = f"d{len(extra)}"
+            extra[key] = np.ascontiguousarray(sub.dense())
+            layouts[ts] = {"cols": [], "names": list(sub.columns), "design": key}
+        Y = np.column_stack([pd.to_numeric(data[o], errors="coerce").to_numpy(dtype=float)[rows]
+                             for o in grid.outcomes])
+        w = (pd.to_numeric(data[grid.weight], errors="coerce").to_numpy(dtype=float)[rows]
+             if grid.weight else None)
+        g = pd.factorize(data[grid.group].to_numpy()[rows])[0] if grid.group else None
+        out[name] = {
+            "X": np.ascontiguousarray(dm.dense()), "names": dm.columns, "cols": cols,
+            "layouts": layouts, "extra": extra,
+            "Y": Y, "outcomes": list(grid.outcomes), "w": w, "g": g,
+            "fingerprint": design.fingerprint(data.iloc[rows], needed),
+        }
+    return out
+
+
+def spec_id(spec: Spec, fingerprint: str, weight: Optional[str], group: Optional[str]) -> str:
+    payload = (spec.kind, " ".join(spec.formula.split()), spec.re_formula, spec.subsample,
+               weight, group, fingerprint)
+    return hashlib.blake2b(repr(payload).encode(), digest_size=12).hexdigest()
+
+
+# ------------------------------------ Workers ---------------------------------------
+
+_SHARED: Dict[str, Dict[str, Any]] = {}
+
+
+def _init_worker(shared: Dict[str, Dict[str, Any]]) -> None:
+    global _SHARED
+    _SHARED = shared
+
+
+def _fit_one(task: Dict[str, Any], alpha: float) -> List[Dict[str, Any]]:
+    sh = _SHARED[task["subsample"]]
+    X = sh["extra"][task["design"]] if task["design"] else sh["X"][:, task["cols"]]
+    names = task["names"]
+    y = sh["Y"][:, sh["outcomes"].index(task["outcome"])]
+    meta = {k: task[k] for k in ("spec_id", "outcome", "subsample", "kind", "controls",
+                                 "interactions", "n_controls", "formula")}
+    try:
+        if np.linalg.matrix_rank(X) < X.shape[1]:
+            raise np.linalg.LinAlgError("delineamento com posto incompleto nesta subamostra "
+                                        "(termo constante ou colinear)")
+        if task["kind"] == "wls":
+            w = sh["w"] if sh["w"] is not None else np.ones(len(y))
+            res = sm.WLS(y, X, weights=w).fit()
+            params, bse, pvals = res.params, res.bse, res.pvalues
+            df_resid, r2, converged = res.df_resid, res.rsquared, True
+        else:
+            Z = np.ones((len(y), 1))
+            if task["re_cols"]:
+                Z = np.column_stack([Z, sh["X"][:, task["re_cols"]]])
+            res = sm.MixedLM(y, X, groups=sh["g"], exog_re=Z).fit(reml=False, method="lbfgs")
+            k = X.shape[1]
+            params, bse = np.asarray(res.fe_params), np.asarray(res.bse)[:k]
+            pvals = np.asarray(res.pvalues)[:k]
+            df_resid, r2, converged = np.inf, np.nan, bool(res.converged)
+        q = _stats.t.ppf(1 - alpha / 2, df_resid) if np.isfinite(df_resid) else _stats.norm.ppf(1 - alpha / 2)
+        params, bse, pvals = np.asarray(params), np.asarray(bse), np.asarray(pvals)
+        return [{**meta, "term": n, "estimate": b, "se": s, "t": b / s if s > 0 else np.nan, "p": p,
+                 "ci_low": b - q * s, "ci_high": b + q * s, "nobs": int(len(y)), "r2": r2,
+                 "aic": float(res.aic), "converged": converged, "error": None}
+                for n, b, s, p in zip(names, params, bse, pvals)]
+    except Exception as e:
+        return [{**meta, "term": None, "estimate": np.nan, "se": np.nan, "t": np.nan, "p": np.nan,
+                 "ci_low": np.nan, "ci_high": np.nan, "nobs": int(len(y)), "r2": np.nan,
+                 "aic": np.nan, "converged": False, "error": f"{type(e).__name__}: {e}"}]
+
+
+def _run_chunk(tasks: List[Dict[str, Any]], alpha: float) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # convergência fica na coluna `converged`
+        for t in tasks:
+            rows.extend(_fit_one(t, alpha))
+    return rows
+
+
+# ------------------------------------- Execução -------------------------------------
+
+def _tasks(grid: SpecGrid, shared: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    tasks = []
+    for s in grid.specs():
+        sh = shared[s.subsample]
+        layout = sh["layouts"][s.terms]
+        re_cols: List[int] = []
+        if s.kind == "mixedlm" and s.re_formula:
+            for t in s.re_formula.strip().lstrip("~").split("+"):
+                t = t.strip()
+                if t and t != "1":
+                    re_cols += sh["cols"].get(t) or [sh["names"].index(t)]
+        n, k = len(sh["X"]), len(layout["names"])
+        tasks.append({
+            "spec_id": spec_id(s, sh["fingerprint"], grid.weight, grid.group),
+            "outcome": s.outcome, "subsample": s.subsample, "kind": s.kind,
+            "controls": " + ".join(s.controls), "interactions": " + ".join(s.interactions),
+            "n_controls": len(s.controls), "formula": s.formula,
+            "cols": layout["cols"], "names": layout["names"], "design": layout["design"],
+            "re_cols": re_cols,
+            "cost": n * k * k * (20 if s.kind == "mixedlm" else 1),
+        })
+    return tasks
+
+
+def _load_checkpoint(path: str) -> List[Dict[str, Any]]:
+    rows = []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    try:
+                        rows.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        pass  # linha truncada por interrupção: o bloco será refeito
+    return rows
+
+
+def _append_checkpoint(path: Optional[str], rows: Iterable[Dict[str, Any]]) -> None:
+    if not path:
+        return
+    with open(path, "a", encoding="utf-8") as fh:
+        for r in rows:
+            fh.write(json.dumps({k: (None if isinstance(v, float) and not np.isfinite(v) else v)
+                                 for k, v in r.items()}, ensure_ascii=False, default=float) + "\n")
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def run_grid(grid: SpecGrid,
+             data: pd.DataFrame,
+             checkpoint_dir: Optional[str] = None,
+             max_workers: Optional[int] = None,
+             chunk_size: int = 8,
+             alpha: float = 0.05,
+             cache: Optional[design.DesignCache] = None) -> pd.DataFrame:
+    """
+    Ajusta todas as especificações da grade e devolve a tabela arrumada
+    (uma linha por especificação × termo; falhas viram uma linha com `error`).
+    `max_workers=1` roda no próprio processo (útil para depurar).
+    """
+    _require()
+    with stage("pisa_specgrid.designs", rows=len(data), subsamples=len(grid.subsamples)):
+        shared = _shared_designs(grid, data, cache)
+    tasks = _tasks(grid, shared)
+
+    ckpt = None
+    done_rows: List[Dict[str, Any]] = []
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        ckpt = os.path.join(checkpoint_dir, "specs.jsonl")
+        wanted = {t["spec_id"] for t in tasks}
+        done_rows = [r for r in _load_checkpoint(ckpt) if r.get("spec_id") in wanted]
+    done = {r["spec_id"] for r in done_rows}
+    todo = sorted((t for t in tasks if t["spec_id"] not in done), key=lambda t: -t["cost"])
+    chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+    print(f"[specgrid] {len(tasks)} especificações; {len(done)} do checkpoint, {len(todo)} a ajustar "
+          f"em {len(chunks)} blocos")
+
+    rows = list(done_rows)
+    with stage("pisa_specgrid.fit", specs=len(todo), workers=max_workers):
+        if max_workers == 1 or len(chunks) <= 1:
+            _init_worker(shared)
+            for ch in chunks:
+                out = _run_chunk(ch, alpha)
+                _append_checkpoint(ckpt, out)
+                rows.extend(out)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                     initargs=(shared,)) as ex:
+                futs = [ex.submit(_run_chunk, ch, alpha) for ch in chunks]
+                for fut in as_completed(futs):
+                    out = fut.result()
+                    _append_checkpoint(ckpt, out)
+                    rows.extend(out)
+
+    table = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    order = {t["spec_id"]: i for i, t in enumerate(tasks)}
+    table["_o"] = table["spec_id"].map(order)
+    return (table.sort_values(["_o"], kind="stable").drop(columns="_o")
+            .reset_index(drop=True))
+
+
+def spec_curve(table: pd.DataFrame, term: str = "ESCS_c") -> pd.DataFrame:
+    """Linhas de um termo ordenadas pela estimativa, com `rank` (eixo x da curva)."""
+    cur = table[table["term"] == term].sort_values("estimate", kind="stable").reset_index(drop=True)
+    cur.insert(0, "rank", np.arange(1, len(cur) + 1))
+    return cur
+
+
+__all__ = ["KINDS", "RESULT_COLUMNS", "Spec", "SpecGrid", "spec_id", "run_grid", "spec_curve"]
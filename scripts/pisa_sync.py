@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+Sincronização incremental (estilo CDC) de planilhas -> MongoDB / SQL Server.
+
+Em vez de `drop_existing=True` (apagar e recarregar tabela e índices), compara a
+aba nova com um instantâneo guardado no próprio destino — hash de cada linha por
+chave primária (`CNTSTUID`, `CNTSCHID`...) — e aplica só as diferenças:
+
+- chave nova            -> insert
+- chave com hash novo   -> update (linha inteira)
+- chave que sumiu       -> delete
+
+Instantâneos
+------------
+- MongoDB:    coleção `_sync__<coleção>` ({_id: chave, k: valores, h: hash}) +
+              metadados em `_pisa_sync` (colunas, chave)
+- SQL Server: tabela `<tabela>__sync` (k, h) + metadados em `_pisa_sync`,
+              gravados na mesma transação das alterações
+
+Sem instantâneo, ele é reconstruído a partir do conteúdo atual do destino (a
+primeira sincronização sobre uma carga antiga não reescreve nada que não mudou).
+Se o conjunto de colunas ou a chave mudar, a coleção/tabela é recarregada por
+inteiro. Abas sem chave (ex.: `fields`) só são recarregadas quando a impressão
+digital da aba (`sheet_hash`, que conta linhas repetidas) muda.
+
+Uso típico
+----------
+    from ingest_xlsx_to_mongo import connect_mongo, insert_xlsx_to_mongo
+    client, db = connect_mongo("pisa2018", uri="mongodb://localhost:27017")
+    insert_xlsx_to_mongo("pisa2018/sch/SCH_BRA.xlsx", db, mode="sync")
+
+    from pisa_ingest_mssql import ingest_required_to_mssql
+    ingest_required_to_mssql(parent_dir, server, database, user, password, mode="sync")
+"""
+
+from __future__ import annotations
+import json
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from profiling import stage
+
+
+KEY_CANDIDATES = ("CNTSTUID", "STIDSTD", "CNTSCHID", "SCHOOLID")
+META_NAME = "_pisa_sync"
+
+Key = Union[str, Sequence[str]]
+
+
+# -------------------------------------- Hashes --------------------------------------
+
+def detect_key(df: pd.DataFrame, candidates: Sequence[str] = KEY_CANDIDATES) -> Optional[List[str]]:
+    """Primeira coluna candidata presente, sem ausentes e sem duplicatas (ou None)."""
+    for c in candidates:
+        if c in df.columns and df[c].notna().all() and df[c].is_unique:
+            return [c]
+    return None
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Forma canônica para o hash: coluna numérica (ou texto 100% numérico) -> float64,
+    demais -> texto; ausentes unificados. Assim a mesma linha gera o mesmo hash
+    lida do Excel, do MongoDB (int/None) ou do SQL Server (NVARCHAR/FLOAT).
+    """
+    out = {}
+    for c in df.columns:
+        s = df[c]
+        if pd.api.types.is_bool_dtype(s) or pd.api.types.is_numeric_dtype(s):
+            out[c] = s.astype(float)
+            continue
+        num = pd.to_numeric(s, errors="coerce")
+        if num.notna().sum() == s.notna().sum():
+            out[c] = num.astype(float)
+        else:
+            out[c] = s.astype(object).where(s.notna(), None).map(lambda v: None if v is None else str(v))
+    return pd.DataFrame(out, index=df.index)
+
+
+def row_hashes(df: pd.DataFrame, columns: Optional[Sequence[str]] = None) -> np.ndarray:
+    """Hash (int64) de cada linha sobre `columns` (padrão: todas), estável entre sessões."""
+    cols = list(columns) if columns is not None else list(df.columns)
+    if not cols:
+        return np.zeros(len(df), dtype=np.int64)
+    h = pd.util.hash_pandas_object(_normalize(df[cols]), index=False).to_numpy()
+    return h.view(np.int64)
+
+
+def key_strings(df: pd.DataFrame, key: Sequence[str]) -> np.ndarray:
+    """Chave canônica em texto (independe de int/float/str na origem)."""
+    norm = _normalize(df[list(key)])
+    parts = [norm[c].map(lambda v: repr(v)) for c in key]
+    out = parts[0]
+    for p in parts[1:]:
+        out = out + "|" + p
+    return out.to_numpy(dtype=object)
+
+
+def sheet_hash(df: pd.DataFrame) -> str:
+    """
+    Impressão digital da aba inteira, independente da ordem das linhas: blake2b
+    dos hashes de linha ordenados, mais o nº de linhas. Linhas repetidas contam
+    (um XOR cancelaria pares iguais).
+    """
+    import hashlib
+
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(len(df)).encode())
+    h.update(np.sort(row_hashes(df)).tobytes())
+    return h.hexdigest()
+
+
+def frame_signature(df: pd.DataFrame, key: Optional[Sequence[str]]) -> dict:
+    return {"columns": [str(c) for c in df.columns], "key": list(key) if key else None}
+
+
+def reload_reason(meta: Optional[dict], sig: dict) -> Optional[str]:
+    """
+    Motivo para recarregar por inteiro (ou None): colunas ou chave diferentes das
+    do último sync — o instantâneo está indexado pela chave antiga.
+    """
+    if meta is None:
+        return None
+    if meta.get("columns") != sig["columns"]:
+        return "colunas mudaram"
+    if meta.get("key") != sig["key"]:
+        return "chave mudou"
+    return None
+
+
+# --------------------------------------- Diff ---------------------------------------
+
+@dataclass
+class SyncPlan:
+    """Diferenças entre a aba nova e o instantâneo."""
+    inserts: pd.DataFrame
+    updates: pd.DataFrame
+    delete_keys: List[str]
+    new_snapshot: pd.DataFrame  # colunas: k (texto), h (int64), pos (linha na aba nova)
+    unchanged: int
+
+    @property
+    def is_noop(self) -> bool:
+        return self.inserts.empty and self.updates.empty and not self.delete_keys
+
+    def summary(self) -> Dict[str, int]:
+        return {"inserts": len(self.inserts), "updates": len(self.updates),
+                "deletes": len(self.delete_keys), "unchanged": self.unchanged}
+
+
+def diff(df: pd.DataFrame, key: Sequence[str], snapshot: Optional[pd.Series]) -> SyncPlan:
+    """
+    Compara `df` com o instantâneo (Series hash indexada pela chave em texto).
+    Erro se a chave tiver ausentes ou duplicatas na aba nova.
+    """
+    key = list(key)
+    if df[key].isna().any().any():
+        raise ValueError(f"Chave {key} tem valores ausentes; não é possível sincronizar por chave.")
+    k = key_strings(df, key)
+    if pd.Index(k).has_duplicates:
+        raise ValueError(f"Chave {key} tem duplicatas na planilha nova.")
+    h = row_hashes(df)
+    snap = snapshot if snapshot is not None else pd.Series(dtype=np.int64)
+
+    pos = snap.index.get_indexer(k)
+    is_new = pos < 0
+    changed = np.zeros(len(df), dtype=bool)
+    changed[~is_new] = snap.to_numpy(dtype=np.int64)[pos[~is_new]] != h[~is_new]
+    gone = snap.index.difference(pd.Index(k))
+    return SyncPlan(
+        inserts=df.iloc[np.flatnonzero(is_new)],
+        updates=df.iloc[np.flatnonzero(changed)],
+        delete_keys=[str(x) for x in gone],
+        new_snapshot=pd.DataFrame({"k": k, "h": h, "pos": np.arange(len(df))}),
+        unchanged=int((~is_new & ~changed).sum()),
+    )
+
+
+# -------------------------------------- MongoDB -------------------------------------
+
+def _mongo_meta(db, name: str) -> Optional[dict]:
+    return db[META_NAME].find_one({"_id": name})
+
+
+def _mongo_snapshot(db, name: str, df_new: pd.DataFrame, key: List[str]) -> Optional[pd.Series]:
+    """Lê o instantâneo; se não houver, reconstrói a partir da coleção atual."""
+    snap_col = db[f"_sync__{name}"]
+    if _mongo_meta(db, name) is not None:
+        docs = list(snap_col.find({}, {"h": 1}))
+        return pd.Series([d["h"] for d in docs], index=[d["_id"] for d in docs], dtype=np.int64)
+    if db[name].estimated_document_count() == 0:
+        return None
+    cur = db[name].find({}, {c: 1 for c in df_new.columns} | {"_id": 0})
+    old = pd.DataFrame.from_records(list(cur), columns=list(df_new.columns))
+    if old[key].isna().any().any():
+        return None
+    return pd.Series(row_hashes(old), index=key_strings(old, key), dtype=np.int64)
+
+
+def _key_filter(rec: dict, key: List[str]) -> dict:
+    return {c: rec[c] for c in key}
+
+
+def sync_mongo_collection(db, name: str, df: pd.DataFrame, key: Optional[Key] = None,
+                          batch_size: int = 50_000, verbose: bool = True) -> Dict[str, int]:
+    """
+    Sincroniza uma coleção com `df`; devolve contagens de inserts/updates/deletes.
+    `key=None` detecta a chave (KEY_CANDIDATES); sem chave, recarrega só se a aba mudou.
+    """
+    from pymongo import DeleteOne, InsertOne, ReplaceOne
+    from ingest_xlsx_to_mongo import _chunked, _to_records
+
+    key = [key] if isinstance(key, str) else (list(key) if key else detect_key(df))
+    sig = frame_signature(df, key)
+    meta = _mongo_meta(db, name)
+    col, snap_col = db[name], db[f"_sync__{name}"]
+
+    def _reload(reason: str) -> Dict[str, int]:
+        col.drop()
+        snap_col.drop()
+        recs = _to_records(df)
+        with stage("pisa_sync.mongo.reload", rows=len(recs), collection=name):
+            for batch in _chunked(recs, batch_size):
+                col.insert_many(batch, ordered=False)
+        return {"inserts": len(recs), "updates": 0, "deletes": 0, "unchanged": 0, "reload": reason}
+
+    reason = reload_reason(meta, sig)
+    if key is None:
+        digest = sheet_hash(df)
+        if meta and reason is None and meta.get("sheet_hash") == digest:
+            stats = {"inserts": 0, "updates": 0, "deletes": 0, "unchanged": len(df)}
+        else:
+            stats = _reload("sem chave")
+        db[META_NAME].replace_one({"_id": name}, {"_id": name, **sig, "sheet_hash": digest}, upsert=True)
+    elif reason is not None:
+        stats = _reload(reason)
+        plan = diff(df, key, None)
+        _write_mongo_snapshot(snap_col, plan, df, key, full=True, batch_size=batch_size)
+        db[META_NAME].replace_one({"_id": name}, {"_id": name, **sig}, upsert=True)
+    else:
+        with stage("pisa_sync.diff", rows=len(df), collection=name):
+            plan = diff(df, key, _mongo_snapshot(db, name, df, key))
+        ops = [InsertOne(r) for r in _to_records(plan.inserts)]
+        ops += [ReplaceOne(_key_filter(r, key), r, upsert=True) for r in _to_records(plan.updates)]
+        if plan.delete_keys:
+            stored = {d["_id"]: d["k"] for d in snap_col.find({"_id": {"$in": plan.delete_keys}}, {"k": 1})}
+            if not stored:  # instantâneo reconstruído: valores de chave vêm da própria coleção
+                old = pd.DataFrame.from_records(list(col.find({}, {c: 1 for c in key} | {"_id": 0})), columns=key)
+                stored = dict(zip(key_strings(old, key), _to_records(old)))
+                stored = {k: [v[c] for c in key] for k, v in stored.items()}
+            ops += [DeleteOne(dict(zip(key, stored[k]))) for k in plan.delete_keys if k in stored]
+        with stage("pisa_sync.mongo.bulk_write", rows=len(ops), collection=name):
+            for batch in _chunked(ops, batch_size):
+                col.bulk_write(batch, ordered=False)
+        _write_mongo_snapshot(snap_col, plan, df, key, full=meta is None, batch_size=batch_size)
+        db[META_NAME].replace_one({"_id": name}, {"_id": name, **sig}, upsert=True)
+        stats = plan.summary()
+
+    if verbose:
+        print(f"[sync] {name}: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+    return stats
+
+
+def _write_mongo_snapshot(snap_col, plan: SyncPlan, df: pd.DataFrame, key: List[str],
+                          full: bool, batch_size: int) -> None:
+    from pymongo import DeleteOne, UpdateOne
+    from ingest_xlsx_to_mongo import _chunked, _to_records
+
+    snap = plan.new_snapshot
+    if full:
+        rows = snap
+        snap_col.drop()
+    else:
+        touched = set(map(str, key_strings(plan.inserts, key))) | set(map(str, key_strings(plan.updates, key)))
+        rows = snap[snap["k"].isin(touched)]
+    keyvals = _to_records(df[key].iloc[rows["pos"].to_numpy()])
+    ops = [UpdateOne({"_id": k}, {"$set": {"h": int(h), "k": [kv[c] for c in key]}}, upsert=True)
+           for k, h, kv in zip(rows["k"], rows["h"], keyvals)]
+    ops += [DeleteOne({"_id": k}) for k in plan.delete_keys]
+    for batch in _chunked(ops, batch_size):
+        snap_col.bulk_write(batch, ordered=False)
+
+
+def sync_xlsx_to_mongo(xlsx_path: str, db, batch_size: int = 50_000,
+                       keys: Optional[Dict[str, Key]] = None, verbose: bool = True) -> List[str]:
+    """
+    Versão incremental de `insert_xlsx_to_mongo` (mesmos nomes de coleção).
+    `keys` = {nome_da_aba: chave} sobrepõe a detecção automática.
+    """
+    import os
+    from ingest_xlsx_to_mongo import _read_all_sheets, _sanitize_for_collection
+
+    base = os.path.splitext(os.path.basename(xlsx_path))[0]
+    sheets = _read_all_sheets(xlsx_path)
+    created = []
+    for sheet_name, df in sheets.items():
+        col_name = _sanitize_for_collection(base if len(sheets) == 1 else f"{base}__{sheet_name}")
+        sync_mongo_collection(db, col_name, df, key=(keys or {}).get(sheet_name),
+                              batch_size=batch_size, verbose=verbose)
+        created.append(col_name)
+    return created
+
+
+# ------------------------------------ SQL Server ------------------------------------
+
+def _mssql_exists(cur, schema: str, table: str) -> bool:
+    cur.execute(f"SELECT OBJECT_ID(N'{schema}.{table}', 'U')")
+    return cur.fetchone()[0] is not None
+
+
+def _mssql_read(cur, schema: str, table: str, columns: Sequence[str]) -> pd.DataFrame:
+    from pisa_ingest_mssql import _quote_ident
+    cur.execute("SELECT " + ", ".join(_quote_ident(c) for c in columns)
+                + f" FROM {_quote_ident(schema)}.{_quote_ident(table)}")
+    return pd.DataFrame.from_records([tuple(r) for r in cur.fetchall()], columns=list(columns))
+
+
+def sync_mssql_table(backend: str, conn, database: str, schema: str, table: str, df: pd.DataFrame,
+                     key: Optional[Key] = None, batch_size: int = 50_000,
+                     verbose: bool = True) -> Dict[str, int]:
+    """
+    Sincroniza uma tabela (formato de `_ensure_table`/`_insert_dataframe`) com `df`.
+
+    Deletes, updates, inserts e o instantâneo (`<tabela>__sync` + `_pisa_sync`)
+    vão numa única transação: uma falha no meio desfaz tudo, e o instantâneo só
+    passa a valer junto com o commit das alterações. Na criação (ou recarga) da
+    tabela, os índices de `pisa_indexes` são criados depois do commit; numa
+    sincronização incremental os índices existentes são preservados.
+    """
+    from pisa_indexes import MSSQL_FIELDS, apply_mssql_indexes, plan_indexes
+    from pisa_ingest_mssql import (_ensure_table, _insert_dataframe, _quote_ident,
+                                   _safe_columns, _sanitize_table, _transaction)
+
+    df = _safe_columns(df)
+    table = _sanitize_table(table)
+    key = [key] if isinstance(key, str) else (list(key) if key else detect_key(df))
+    if key is None:
+        raise ValueError(f"{table}: nenhuma chave encontrada ({', '.join(KEY_CANDIDATES)}); use o modo de recarga.")
+    sig = frame_signature(df, key)
+    ph = "?" if backend == "pyodbc" else "%s"
+    t = f"{_quote_ident(schema)}.{_quote_ident(table)}"
+    snap_t = f"{_quote_ident(schema)}.{_quote_ident(table + '__sync')}"
+    meta_t = f"{_quote_ident(schema)}.{_quote_ident(META_NAME)}"
+
+    def _write_snapshot(tx, plan: SyncPlan, full: bool) -> None:
+        with tx.cursor() as cur:
+            if full:
+                cur.execute(f"IF OBJECT_ID(N'{schema}.{table}__sync', 'U') IS NOT NULL DROP TABLE {snap_t};")
+                cur.execute(f"CREATE TABLE {snap_t} (k NVARCHAR(450) NOT NULL PRIMARY KEY, h BIGINT NOT NULL);")
+                rows = plan.new_snapshot
+            else:
+                touched = set(map(str, key_strings(plan.inserts, key))) | set(map(str, key_strings(plan.updates, key)))
+                rows = plan.new_snapshot[plan.new_snapshot["k"].isin(touched)]
+                gone = [(k,) for k in plan.delete_keys] + [(k,) for k in rows["k"]]
+                for i in range(0, len(gone), batch_size):
+                    cur.executemany(f"DELETE FROM {snap_t} WHERE k = {ph}", gone[i:i + batch_size])
+            vals = [(str(k), int(h)) for k, h in zip(rows["k"], rows["h"])]
+            for i in range(0, len(vals), batch_size):
+                cur.executemany(f"INSERT INTO {snap_t} (k, h) VALUES ({ph}, {ph})", vals[i:i + batch_size])
+            cur.execute(f"DELETE FROM {meta_t} WHERE tbl = {ph}", (table,))
+            cur.execute(f"INSERT INTO {meta_t} (tbl, sig) VALUES ({ph}, {ph})", (table, json.dumps(sig)))
+
+    with _transaction(backend, conn) as tx:
+        with tx.cursor() as cur:
+            cur.execute(f"IF OBJECT_ID(N'{schema}.{META_NAME}', 'U') IS NULL "
+                        f"CREATE TABLE {meta_t} (tbl NVARCHAR(256) NOT NULL PRIMARY KEY, sig NVARCHAR(MAX) NULL);")
+            cur.execute(f"SELECT sig FROM {meta_t} WHERE tbl = {ph}", (table,))
+            row = cur.fetchone()
+            meta = json.loads(row[0]) if row else None
+            exists = _mssql_exists(cur, schema, table)
+
+        reason = "tabela nova" if not exists else reload_reason(meta, sig)
+        if reason is not None:
+            _ensure_table(backend, tx, database, schema, table, df, drop_existing=True, create_indexes=False)
+            _insert_dataframe(backend, tx, database, schema, table, df, batch_size=batch_size)
+            _write_snapshot(tx, diff(df, key, None), full=True)
+            stats = {"inserts": len(df), "updates": 0, "deletes": 0, "unchanged": 0, "reload": reason}
+        else:
+            with tx.cursor() as cur:
+                if meta is not None:
+                    cur.execute(f"SELECT k, h FROM {snap_t}")
+                    got = cur.fetchall()
+                    snapshot = pd.Series([int(h) for _, h in got], index=[str(k) for k, _ in got], dtype=np.int64)
+                else:
+                    old = _mssql_read(cur, schema, table, list(df.columns))
+                    snapshot = pd.Series(row_hashes(old), index=key_strings(old, key), dtype=np.int64)
+            with stage("pisa_sync.diff", rows=len(df), table=table):
+                plan = diff(df, key, snapshot)
+
+            where = " AND ".join(f"{_quote_ident(c)} = {ph}" for c in key)
+            non_key = [c for c in df.columns if c not in key]
+            with stage("pisa_sync.mssql.executemany",
+                       rows=sum(plan.summary()[k] for k in ("inserts", "updates", "deletes")),
+                       table=table), tx.cursor() as cur:
+                if backend == "pyodbc" and hasattr(cur, "fast_executemany"):
+                    cur.fast_executemany = True
+                if plan.delete_keys:
+                    # valores de chave vêm do destino (tipos do SQL), casados pela chave canônica
+                    old_keys = _mssql_read(cur, schema, table, key)
+                    ks = pd.Series(range(len(old_keys)), index=key_strings(old_keys, key))
+                    rows = old_keys.iloc[ks.reindex(plan.delete_keys).dropna().astype(int).to_numpy()]
+                    params = [tuple(r) for r in rows.itertuples(index=False, name=None)]
+                    for i in range(0, len(params), batch_size):
+                        cur.executemany(f"DELETE FROM {t} WHERE {where}", params[i:i + batch_size])
+                if not plan.updates.empty and non_key:
+                    upd = plan.updates.replace({np.nan: None})
+                    sets = ", ".join(f"{_quote_ident(c)} = {ph}" for c in non_key)
+                    params = [tuple(r) for r in upd[non_key + key].itertuples(index=False, name=None)]
+                    for i in range(0, len(params), batch_size):
+                        cur.executemany(f"UPDATE {t} SET {sets} WHERE {where}", params[i:i + batch_size])
+            if not plan.inserts.empty:
+                _insert_dataframe(backend, tx, database, schema, table, plan.inserts.replace({np.nan: None}),
+                                  batch_size=batch_size)
+            _write_snapshot(tx, plan, full=meta is None)
+            stats = plan.summary()
+
+    if reason is not None and not df.empty:
+        # tabela recriada: mesmos índices da carga completa (fora da transação)
+        apply_mssql_indexes(conn, schema, table, plan_indexes(MSSQL_FIELDS, available=df.columns, target="mssql"),
+                            verbose=verbose)
+
+    if verbose:
+        print(f"[sync] {schema}.{table}: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+    return stats
+
+
+__all__ = [
+    "KEY_CANDIDATES", "detect_key", "row_hashes", "key_strings", "sheet_hash", "reload_reason",
+    "SyncPlan", "diff",
+    "sync_mongo_collection", "sync_xlsx_to_mongo", "sync_mssql_table",
+]
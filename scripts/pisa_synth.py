@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+Gerador de dados sintéticos com o formato dos microdados PISA 2018 (STU/FLT/SCH).
+
+Serve para testes de escala e benchmarks sem depender dos arquivos reais
+(que não crescem além do Brasil). Reproduz:
+- nomes de colunas usados pelos scripts e pelo notebook (CNTSTUID, CNTSCHID,
+  W_FSTUWT, SENWT, ESCS, DISCLIMA, PV1READ..., EDUSHORT, STAFFSHORT, ...);
+- convenção de IDs: CNTSCHID/CNTSTUID = CNTRYID * 10^k + sequência, e
+  o deslocamento de +50.000 no CNTSTUID do FLT;
+- escalas da exportação usada no projeto (ESCS guardado como (x + 5) * 1000,
+  DISCLIMA/JOYREAD/SCREADCOMP como (x + 5) * 100, EDUSHORT/STAFFSHORT como (x + 5) * 10);
+- rótulos textuais (ST004D01T = "Male"/"Female", REPEAT = "Did not repeat a  grade"...);
+- agrupamento de alunos em escolas (ICC configurável), sentinelas negativas
+  (-9..-5) nos itens de questionário e taxas de ausência por coluna.
+
+Uso típico
+----------
+    from pisa_synth import SynthConfig, generate, write_workbooks, write_columnar
+
+    frames = generate(SynthConfig(n_students=100_000, n_schools=5_000, seed=7))
+    write_workbooks(frames, "/tmp/pisa_synth")          # stu/STU_BRA.xlsx, flt/..., sch/...
+    write_columnar(frames, "/tmp/pisa_synth_parquet")   # STU_BRA.parquet, ...
+"""
+
+from __future__ import annotations
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# ----------------------------- Convenções do PISA 2018 -----------------------------
+
+FLT_ID_OFFSET = 50_000          # FLT_BRA.CNTSTUID = STU_BRA.CNTSTUID + 50.000
+NEG_SENTINELS = (-9, -8, -7, -6, -5)
+XLSX_MAX_ROWS = 1_048_575       # limite do Excel (descontando o cabeçalho)
+
+# código ISO -> (rótulo gravado em CNT/CNTRYID na aba `data`, CNTRYID numérico)
+COUNTRIES: Dict[str, Tuple[str, int]] = {
+    "BRA": ("Brazil", 76),
+    "ARG": ("Argentina", 32),
+    "CHL": ("Chile", 152),
+    "COL": ("Colombia", 170),
+    "MEX": ("Mexico", 484),
+    "PRT": ("Portugal", 620),
+    "URY": ("Uruguay", 858),
+}
+
+SEX_LABELS = ("Female", "Male")
+REPEAT_LABELS = ("Did not repeat a  grade", "Repeated a  grade")
+IMMIG_LABELS = ("Native", "Second-Generation", "First-Generation")
+SCHOOL_TYPE_LABELS = (
+    "A public school (Managed by a public education authority, government agency, or governing board)",
+    "A private school (Managed by a non-government org; e.g. a church, trade union, business, "
+    "or other private institution.)",
+)
+COMMUNITY_LABELS = (
+    "A village, hamlet or rural area (fewer than 3 000 people)",
+    "A small town (3 000 to about 15 000 people)",
+    "A town (15 000 to about 100 000 people)",
+    "A city (100 000 to about 1 000 000 people)",
+    "A large city (1 000 000 to about 10 000 000 people)",
+)
+REGIONS = ("North", "Northeast", "Southeast", "South", "Middle-West")
+
+# taxas de ausência próximas às observadas em SCH_BRA.xlsx / STU_BRA.xlsx
+DEFAULT_MISSING: Dict[str, float] = {
+    "ESCS": 0.02, "DISCLIMA": 0.05, "BELONG": 0.06,
+    "JOYREAD": 0.08, "SCREADCOMP": 0.08, "LANGN": 0.03, "IMMIG": 0.04,
+    "SC013Q01TA": 0.064, "SC016Q01TA": 0.099, "SC016Q02TA": 0.288,
+    "EDUSHORT": 0.07, "STAFFSHORT": 0.075, "SCHSIZE": 0.109, "STRATIO": 0.129,
+}
+
+
+@dataclass
+class SynthConfig:
+    """
+    Parâmetros do gerador.
+
+    n_students / n_schools : tamanho da amostra (alunos distribuídos entre escolas
+        com tamanhos desiguais, como na amostragem em dois estágios).
+    icc : fração da variância das proficiências entre escolas.
+    flt_share : fração dos alunos do STU que também aparecem no FLT.
+    pv_domains : domínios com 10 valores plausíveis (PV1<DOM>..PV10<DOM>); fora de
+        READ/MATH/SCIE (ex.: GLCM, FLIT) usam um traço latente genérico.
+    n_items : quantidade de itens de questionário ST* extras (blocos largos).
+    sentinel_rate : fração de sentinelas negativas nos itens de questionário.
+    missing : taxa de ausência por coluna (sobrepõe DEFAULT_MISSING).
+    legacy_ids : acrescenta STIDSTD/SCHOOLID/SCMATEDU/TCSHORT usados por pisa_prep.
+    """
+    n_students: int = 10_691
+    n_schools: int = 597
+    country: str = "BRA"
+    seed: int = 2018
+    icc: float = 0.40
+    flt_share: float = 0.95
+    pv_domains: Sequence[str] = ("READ",)
+    n_items: int = 0
+    sentinel_rate: float = 0.01
+    missing: Dict[str, float] = field(default_factory=dict)
+    legacy_ids: bool = True
+
+
+# --------------------------------- Utilidades -------------------------------------
+
+def _id_base(cntryid: int, n: int) -> int:
+    """Base dos IDs (CNTRYID * 10^k), com k >= 5 e espaço para n + deslocamento do FLT."""
+    k = max(5, len(str(n + FLT_ID_OFFSET)))
+    return cntryid * 10 ** k
+
+
+def _school_sizes(rng: np.random.Generator, n_students: int, n_schools: int) -> np.ndarray:
+    """Número de alunos por escola (soma exata = n_students, mínimo 1 por escola)."""
+    if n_schools <= 0 or n_students < n_schools:
+        raise ValueError("n_schools deve ser >= 1 e <= n_students")
+    props = rng.gamma(shape=4.0, scale=1.0, size=n_schools)
+    extra = rng.multinomial(n_students - n_schools, props / props.sum())
+    return extra + 1
+
+
+def _apply_missing(rng: np.random.Generator, df: pd.DataFrame, rates: Dict[str, float]) -> None:
+    for col, rate in rates.items():
+        if col in df.columns and rate > 0:
+            mask = rng.random(len(df)) < rate
+            if mask.any():
+                if pd.api.types.is_integer_dtype(df[col]) or pd.api.types.is_bool_dtype(df[col]):
+                    df[col] = df[col].astype("float64")
+                df.loc[mask, col] = np.nan
+
+
+def _labels(rng: np.random.Generator, labels: Sequence[str], p: Sequence[float], n: int) -> np.ndarray:
+    return np.asarray(labels, dtype=object)[rng.choice(len(labels), size=n, p=p)]
+
+
+# ---------------------------------- Geração ----------------------------------------
+
+def generate(cfg: Optional[SynthConfig] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Gera as três bases sintéticas.
+
+    Retorna
+    -------
+    dict
+        {"STU": DataFrame, "FLT": DataFrame, "SCH": DataFrame}
+    """
+    cfg = cfg or SynthConfig()
+    rng = np.random.default_rng(cfg.seed)
+    label, cntryid = COUNTRIES.get(cfg.country, (cfg.country, 999))
+    n, m = cfg.n_students, cfg.n_schools
+
+    base = _id_base(cntryid, max(n, m))
+    sch_ids = base + np.arange(1, m + 1, dtype=np.int64)
+    sizes = _school_sizes(rng, n, m)
+    school_of = np.repeat(np.arange(m), sizes)
+
+    # ----- nível escola
+    private = rng.random(m) < 0.18
+    escs_school = rng.normal(-1.1, 0.55, m) + 0.9 * private
+    clima_school = rng.normal(0.0, 0.35, m) + 0.25 * private
+    edushort = rng.normal(0.3, 1.0, m) - 0.8 * private
+    staffshort = rng.normal(0.1, 1.0, m) - 0.5 * private
+    sd_total = 95.0
+    u_school = rng.normal(0.0, np.sqrt(cfg.icc) * sd_total * 0.6, m)
+    region = rng.integers(0, len(REGIONS), m)
+
+    sch = pd.DataFrame({
+        "CNTSCHID": sch_ids,
+        "CNTRYID": label,
+        "CNT": label,
+        "STRATUM": [
+            f"{cfg.country} - stratum {2 * r + 1 + int(p):02d}: {REGIONS[r]},{'Private' if p else 'Public State'}"
+            for r, p in zip(region, private)
+        ],
+        "SC001Q01TA": _labels(rng, COMMUNITY_LABELS, (0.08, 0.17, 0.33, 0.27, 0.15), m),
+        "SC013Q01TA": np.where(private, SCHOOL_TYPE_LABELS[1], SCHOOL_TYPE_LABELS[0]).astype(object),
+        "SC016Q01TA": np.where(private, rng.integers(1, 5, m), rng.integers(15, 21, m)).astype("float64"),
+        "SC016Q02TA": np.where(private, rng.integers(15, 20, m), 1).astype("float64"),
+        "SC016Q03TA": rng.integers(1, 3, m).astype("float64"),
+        "SC016Q04TA": rng.integers(1, 3, m).astype("float64"),
+        "EDUSHORT": np.round((edushort + 5) * 10),
+        "STAFFSHORT": np.round((staffshort + 5) * 10),
+        "SCHSIZE": np.clip(np.round(rng.normal(210, 115, m)), 1, None),
+        "STRATIO": np.clip(np.round(rng.normal(255, 145, m)), 1, None),
+        "SENWT": np.round(rng.lognormal(1.7, 0.8, m), 5),
+    })
+
+    # ----- nível aluno
+    male = rng.random(n) < 0.49
+    escs = escs_school[school_of] + rng.normal(0.0, 0.85, n)
+    repeat = rng.random(n) < np.clip(0.34 - 0.08 * escs, 0.05, 0.7)
+    disclima = clima_school[school_of] + rng.normal(0.0, 0.9, n)
+    belong = np.clip(rng.normal(5.0, 1.6, n), 0, 10)
+    joyread = rng.normal(0.2, 0.9, n)
+    screadcomp = rng.normal(-0.2, 0.9, n)
+
+    escs_c = escs - escs.mean()
+    sd_within = np.sqrt(1 - cfg.icc) * sd_total * 0.8
+    latent = {
+        "READ": 413 + 28 * escs_c + 30 * (escs_school[school_of] - escs_school.mean())
+                + 6 * disclima - 35 * repeat - 12 * male,
+        "MATH": 384 + 30 * escs_c + 32 * (escs_school[school_of] - escs_school.mean())
+                - 38 * repeat + 10 * male,
+        "SCIE": 404 + 29 * escs_c + 30 * (escs_school[school_of] - escs_school.mean())
+                - 36 * repeat,
+    }
+    for dom in cfg.pv_domains:
+        if dom not in latent:
+            latent[dom] = (400 + 28 * escs_c + 30 * (escs_school[school_of] - escs_school.mean())
+                           - 35 * repeat)
+    for dom in latent:
+        latent[dom] = latent[dom] + u_school[school_of] + rng.normal(0.0, sd_within, n)
+
+    w = np.round(rng.lognormal(3.8, 0.6, m)[school_of] * rng.uniform(0.9, 1.1, n), 5)
+    stu_ids = base + np.arange(1, n + 1, dtype=np.int64)
+
+    stu = pd.DataFrame({
+        "CNTRYID": label,
+        "CNT": label,
+        "CNTSCHID": sch_ids[school_of],
+        "CNTSTUID": stu_ids,
+        "ST004D01T": np.where(male, SEX_LABELS[1], SEX_LABELS[0]).astype(object),
+        "REPEAT": np.where(repeat, REPEAT_LABELS[1], REPEAT_LABELS[0]).astype(object),
+        "LANGN": np.where(rng.random(n) < 0.97, "Portuguese", "Another language").astype(object),
+        "IMMIG": _labels(rng, IMMIG_LABELS, (0.96, 0.02, 0.02), n),
+        "ESCS": np.round((escs + 5) * 1000),
+        "DISCLIMA": np.round((disclima + 5) * 100),
+        "BELONG": np.round(belong * 100),
+        "W_FSTUWT": w,
+        "SENWT": np.round(w * 5000.0 / w.sum(), 5),
+    })
+    for dom in cfg.pv_domains:
+        for k in range(1, 11):
+            stu[f"PV{k}{dom}"] = np.round(latent[dom] + rng.normal(0.0, 25.0, n), 3)
+    stu["SCIE"] = np.round(latent["SCIE"], 3)
+    stu["SCIE.SE"] = np.round(rng.uniform(18, 32, n), 3)
+    for j in range(1, cfg.n_items + 1):
+        stu[f"ST{j:03d}Q01TA"] = rng.integers(1, 5, n).astype("float64")
+
+    # ----- FLT: subconjunto dos alunos, IDs deslocados
+    in_flt = np.flatnonzero(rng.random(n) < cfg.flt_share)
+    flt = pd.DataFrame({
+        "CNTRYID": label,
+        "CNT": label,
+        "CNTSCHID": stu["CNTSCHID"].to_numpy()[in_flt],
+        "CNTSTUID": stu_ids[in_flt] + FLT_ID_OFFSET,
+        "SENWT": stu["SENWT"].to_numpy()[in_flt],
+        "READ": np.round(latent["READ"][in_flt], 3),
+        "READ.SE": np.round(rng.uniform(18, 32, in_flt.size), 3),
+        "MATH": np.round(latent["MATH"][in_flt], 3),
+        "MATH.SE": np.round(rng.uniform(18, 32, in_flt.size), 3),
+        "JOYREAD": np.round((joyread[in_flt] + 5) * 100),
+        "SCREADCOMP": np.round((screadcomp[in_flt] + 5) * 100),
+    })
+
+    if cfg.legacy_ids:
+        stu.insert(0, "STIDSTD", stu["CNTSTUID"].astype(str))
+        stu.insert(1, "SCHOOLID", stu["CNTSCHID"].astype(str))
+        sch.insert(0, "SCHOOLID", sch["CNTSCHID"].astype(str))
+        sch["SCMATEDU"] = np.round(edushort, 4)
+        sch["TCSHORT"] = np.round(staffshort, 4)
+
+    # ----- sentinelas (itens de questionário) e ausências
+    rates = {**DEFAULT_MISSING, **cfg.missing}
+    for df in (stu, flt, sch):
+        item_cols = [c for c in df.columns if c[:2] in ("ST", "SC") and c[2:5].isdigit()
+                     and pd.api.types.is_float_dtype(df[c])]
+        if cfg.sentinel_rate > 0:
+            for c in item_cols:
+                mask = rng.random(len(df)) < cfg.sentinel_rate
+                df.loc[mask, c] = rng.choice(NEG_SENTINELS, size=int(mask.sum()))
+        _apply_missing(rng, df, rates)
+
+    return {"STU": stu, "FLT": flt, "SCH": sch}
+
+
+# ---------------------------------- Escrita ----------------------------------------
+
+def _fields_sheet(df: pd.DataFrame) -> pd.DataFrame:
+    """Aba `fields` mínima (col, type), no mesmo espírito da exportação original."""
+    return pd.DataFrame({
+        "col": list(df.columns),
+        "type": ["double" if pd.api.types.is_numeric_dtype(df[c]) else "character" for c in df.columns],
+    })
+
+
+def write_workbooks(frames: Dict[str, pd.DataFrame], out_dir: str, country: str = "BRA") -> Dict[str, str]:
+    """
+    Grava <out_dir>/stu/STU_<CNT>.xlsx, flt/FLT_<CNT>.xlsx e sch/SCH_<CNT>.xlsx
+    com as abas `data` e `fields` (layout esperado por discover_paths/_pick_sheet).
+    Retorna {"STU": path, ...}.
+    """
+    paths: Dict[str, str] = {}
+    for kind, df in frames.items():
+        if len(df) > XLSX_MAX_ROWS:
+            raise ValueError(f"{kind}: {len(df)} linhas excedem o limite do Excel ({XLSX_MAX_ROWS}).")
+        sub = os.path.join(out_dir, kind.lower())
+        os.makedirs(sub, exist_ok=True)
+        path = os.path.join(sub, f"{kind}_{country}.xlsx")
+        with pd.ExcelWriter(path, engine="openpyxl") as xw:
+            df.to_excel(xw, sheet_name="data", index=False)
+            _fields_sheet(df).to_excel(xw, sheet_name="fields", index=False)
+        paths[kind] = path
+    return paths
+
+
+def write_columnar(frames: Dict[str, pd.DataFrame], out_dir: str, country: str = "BRA",
+                   fmt: str = "parquet") -> Dict[str, str]:
+    """
+    Grava as bases em formato colunar (`parquet` ou `feather`; requer pyarrow)
+    ou `csv` como alternativa sem dependências. Retorna {"STU": path, ...}.
+    """
+    if fmt not in ("parquet", "feather", "csv"):
+        raise ValueError("fmt deve ser 'parquet', 'feather' ou 'csv'")
+    if fmt != "csv":
+        try:
+            import pyarrow  # noqa: F401
+        except Exception as e:
+            raise RuntimeError("pyarrow não está instalado. Rode: pip install pyarrow") from e
+    os.makedirs(out_dir, exist_ok=True)
+    paths: Dict[str, str] = {}
+    for kind, df in frames.items():
+        path = os.path.join(out_dir, f"{kind}_{country}.{fmt}")
+        if fmt == "parquet":
+            df.to_parquet(path, index=False)
+        elif fmt == "feather":
+            df.reset_index(drop=True).to_feather(path)
+        else:
+            df.to_csv(path, index=False)
+        paths[kind] = path
+    return paths
+
+
+__all__ = [
+    "SynthConfig", "generate", "write_workbooks", "write_columnar",
+    "FLT_ID_OFFSET", "NEG_SENTINELS", "COUNTRIES",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Gera microdados sintéticos no formato PISA 2018.")
+    ap.add_argument("out_dir")
+    ap.add_argument("--students", type=int, default=10_691)
+    ap.add_argument("--schools", type=int, default=597)
+    ap.add_argument("--country", default="BRA")
+    ap.add_argument("--seed", type=int, default=2018)
+    ap.add_argument("--format", choices=["xlsx", "parquet", "feather", "csv"], default="xlsx")
+    args = ap.parse_args()
+
+    frames = generate(SynthConfig(n_students=args.students, n_schools=args.schools,
+                                  country=args.country, seed=args.seed))
+    if args.format == "xlsx":
+        out = write_workbooks(frames, args.out_dir, country=args.country)
+    else:
+        out = write_columnar(frames, args.out_dir, country=args.country, fmt=args.format)
+    for kind, path in out.items():
+        print(f"[OK] {kind}: {path} | linhas={len(frames[kind])}")
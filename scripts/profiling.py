@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentação por estágio (profiling) para os scripts do projeto PISA.
+
+Mede, por chamada: tempo de relógio (wall), tempo de CPU, variação do pico de
+memória residente (RSS) e número de linhas processadas. Os registros ficam em
+um registro global (`REGISTRY`) e podem ser exportados como JSON ou como
+arquivo de trace do Chrome (abrir em chrome://tracing ou https://ui.perfetto.dev).
+
+Desligado por padrão: quando inativo, `stage` e `instrument` custam apenas
+uma checagem de flag. Ative com `enable()` ou com a variável de ambiente
+PISA_PROFILE=1.
+
+Uso típico
+----------
+    import profiling as prof
+    prof.enable()
+
+    @prof.instrument("carga.stu")
+    def carregar(path): ...
+
+    with prof.stage("school_profile", rows=len(students_final)):
+        ...
+
+    print(prof.summary())
+    prof.export_json("outputs/profile.json")
+    prof.export_chrome_trace("outputs/profile.trace.json")
+"""
+
+from __future__ import annotations
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource  # indisponível no Windows
+except Exception:
+    resource = None
+
+
+# --------------------------------- Estado global ---------------------------------
+
+_ENABLED: bool = os.environ.get("PISA_PROFILE", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def enable() -> None:
+    """Liga a coleta de métricas."""
+    global _ENABLED
+    _ENABLED = True
+
+
+def disable() -> None:
+    """Desliga a coleta (registros já feitos são mantidos)."""
+    global _ENABLED
+    _ENABLED = False
+
+
+def is_enabled() -> bool:
+    return _ENABLED
+
+
+def _peak_rss_kb() -> Optional[int]:
+    """Pico de RSS do processo em KB (None se a plataforma não expõe)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reporta em bytes; Linux em KB
+    return int(peak // 1024) if sys.platform == "darwin" else int(peak)
+
+
+# ----------------------------------- Registro ------------------------------------
+
+@dataclass
+class StageRecord:
+    """Uma chamada medida."""
+    name: str
+    start_s: float                 # instante de início (perf_counter, relativo à origem do registro)
+    wall_s: float
+    cpu_s: float
+    rss_peak_delta_kb: Optional[int]
+    rows: Optional[int]
+    pid: int
+    tid: int
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+class ProfileRegistry:
+    """Registro thread-safe dos estágios medidos."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self.records: List[StageRecord] = []
+
+    def add(self, rec: StageRecord) -> None:
+        with self._lock:
+            self.records.append(rec)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.records = []
+            self._origin = time.perf_counter()
+
+    def to_dicts(self) -> List[dict]:
+        with self._lock:
+            return [asdict(r) for r in self.records]
+
+
+REGISTRY = ProfileRegistry()
+
+
+def reset() -> None:
+    """Limpa os registros acumulados."""
+    REGISTRY.clear()
+
+
+# ------------------------------ Estágio e decorator ------------------------------
+
+class _NullStage:
+    """Handle inerte devolvido quando a coleta está desligada."""
+    __slots__ = ()
+
+    def __setattr__(self, key, value) -> None:
+        pass
+
+
+_NULL = _NullStage()
+
+
+class stage:
+    """
+    Context manager que mede um bloco de código.
+
+    Parâmetros
+    ----------
+    name : str
+        Nome do estágio (ex.: "imputacao.students").
+    rows : int | None
+        Linhas processadas; pode ser ajustado dentro do bloco via `handle.rows = n`.
+    **meta
+        Metadados livres (coleção, arquivo, fórmula...), exportados no JSON/trace.
+    """
+    __slots__ = ("name", "rows", "meta", "_t0", "_c0", "_r0", "_on")
+
+    def __init__(self, name: str, rows: Optional[int] = None, **meta: Any) -> None:
+        self.name = name
+        self.rows = rows
+        self.meta = meta
+        self._on = False
+
+    def __enter__(self):
+        if not _ENABLED:
+            return _NULL
+        self._on = True
+        self._r0 = _peak_rss_kb()
+        self._c0 = time.process_time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if not self._on:
+            return False
+        t1 = time.perf_counter()
+        c1 = time.process_time()
+        r1 = _peak_rss_kb()
+        meta = dict(self.meta)
+        if exc_type is not None:
+            meta["error"] = exc_type.__name__
+        REGISTRY.add(StageRecord(
+            name=self.name,
+            start_s=self._t0 - REGISTRY._origin,
+            wall_s=t1 - self._t0,
+            cpu_s=c1 - self._c0,
+            rss_peak_delta_kb=(r1 - self._r0) if (r1 is not None and self._r0 is not None) else None,
+            rows=int(self.rows) if self.rows is not None else None,
+            pid=os.getpid(),
+            tid=threading.get_ident(),
+            meta=meta,
+        ))
+        return False
+
+
+def count_rows(result: Any) -> Optional[int]:
+    """
+    Heurística de contagem de linhas para o retorno de uma função:
+    DataFrame/lista -> len; dict de DataFrames (várias abas) -> soma dos len.
+    """
+    if isinstance(result, dict):
+        total = 0
+        for v in result.values():
+            if not hasattr(v, "shape"):
+                return None
+            total += len(v)
+        return total
+    if hasattr(result, "shape") or isinstance(result, (list, tuple)):
+        return len(result)
+    return None
+
+
+def instrument(name: Optional[str] = None,
+               rows: Optional[Callable[[Any], Optional[int]]] = count_rows):
+    """
+    Decorator que mede cada chamada da função como um estágio.
+
+    Aceita uso com ou sem argumentos:
+        @instrument
+        @instrument("pisa_prep.read_excel")
+    `rows` recebe o retorno da função e devolve a contagem de linhas (ou None).
+    """
+    def deco(func: Callable) -> Callable:
+        label = name if isinstance(name, str) else f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return func(*args, **kwargs)
+            with stage(label) as st:
+                out = func(*args, **kwargs)
+                st.rows = rows(out) if rows is not None else None
+            return out
+        return wrapper
+
+    if callable(name):  # @instrument sem parênteses
+        return deco(name)
+    return deco
+
+
+# ----------------------------------- Exportação ----------------------------------
+
+def summary():
+    """
+    Agrega os registros por estágio: chamadas, tempos totais, linhas e linhas/s.
+    Retorna um pd.DataFrame ordenado pelo tempo total de relógio.
+    """
+    import pandas as pd
+
+    recs = REGISTRY.to_dicts()
+    cols = ["stage", "calls", "wall_s", "cpu_s", "rss_peak_delta_kb", "rows", "rows_per_s"]
+    if not recs:
+        return pd.DataFrame(columns=cols)
+    df = pd.DataFrame(recs).rename(columns={"name": "stage"})
+    out = (
+        df.groupby("stage", as_index=False)
+        .agg(calls=("wall_s", "size"), wall_s=("wall_s", "sum"), cpu_s=("cpu_s", "sum"),
+             rss_peak_delta_kb=("rss_peak_delta_kb", "sum"), rows=("rows", "sum"))
+    )
+    out["rows_per_s"] = out["rows"] / out["wall_s"].where(out["wall_s"] > 0)
+    return out.sort_values("wall_s", ascending=False).reset_index(drop=True)[cols]
+
+
+def export_json(path: Optional[str] = None) -> dict:
+    """Exporta os registros brutos como JSON (e devolve o dict)."""
+    payload = {"records": REGISTRY.to_dicts()}
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh, ensure_ascii=False, indent=2, default=str)
+    return payload
+
+
+def export_chrome_trace(path: str) -> dict:
+    """
+    Exporta no formato Trace Event do Chrome (eventos 'X', tempos em µs).
+    CPU, RSS e linhas vão em `args` de cada evento.
+    """
+    events = []
+    for r in REGISTRY.to_dicts():
+        args = {"cpu_s": r["cpu_s"], "rss_peak_delta_kb": r["rss_peak_delta_kb"], "rows": r["rows"]}
+        args.update(r["meta"])
+        events.append({
+            "name": r["name"],
+            "cat": "pisa",
+            "ph": "X",
+            "ts": r["start_s"] * 1e6,
+            "dur": r["wall_s"] * 1e6,
+            "pid": r["pid"],
+            "tid": r["tid"],
+            "args": args,
+        })
+    payload = {"traceEvents": events, "displayTimeUnit": "ms"}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(payload, fh, ensure_ascii=False, default=str)
+    return payload
+
+
+__all__ = [
+    "enable", "disable", "is_enabled", "reset",
+    "stage", "instrument", "count_rows",
+    "REGISTRY", "StageRecord", "summary", "export_json", "export_chrome_trace",
+]
@@ -2,6 +2,8 @@ from pathlib import Path
 import pandas as pd
 import sys
 
+from pisa_inventory import default_catalog, scan_folder
+
 
 # Carregamento consistente da aba `data`
 def load_sheet(path: Path, usecols):
@@ -26,8 +28,10 @@ def inspect_workbook(path: Path):
     Args:
         path: Caminho para o arquivo Excel
     """
-    xls = pd.ExcelFile(path)
-    print(f"{path.name} -> abas disponíveis: {xls.sheet_names}")
+    entry = default_catalog().get(str(path))
+    print(f"{Path(path).name} -> abas disponíveis: {[s['name'] for s in entry['sheets']]}")
+    for s in entry["sheets"]:
+        print(f"  {s['name']}: {s['n_rows']} linhas x {s['n_cols']} colunas ({s['dimension']})")
     # meta = pd.read_excel(path, sheet_name="fields", nrows=5)
     # display(meta[["col", "lbl"]])
 
@@ -35,20 +39,23 @@ def inspect_workbook(path: Path):
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Uso: python read_excel_sheets.py <caminho_para_arquivo.xlsx>")
+        print("Uso: python read_excel_sheets.py <arquivo.xlsx | pasta> [catalogo.json]")
         sys.exit(1)
     
     file_path = sys.argv[1]
     
     try:
-        xls = pd.ExcelFile(file_path)
-        sheet_names = xls.sheet_names
-        print(f"Sheet names in {file_path}: {sheet_names}")
+        if Path(file_path).is_dir():
+            cat = scan_folder(file_path, cache_path=sys.argv[2] if len(sys.argv) > 2 else None)
+            print(cat.to_frame()[["file", "sheet", "n_rows", "n_cols"]].to_string(index=False))
+            sys.exit(0)
+
+        entry = default_catalog().get(file_path)
+        print(f"Sheet names in {file_path}: {[s['name'] for s in entry['sheets']]}")
         
-        for sheet in sheet_names:
-            print(f"\n--- Content of sheet: {sheet} ---\n")
-            df = pd.read_excel(xls, sheet_name=sheet)
-            print(df.head())
+        for s in entry["sheets"]:
+            print(f"\n--- Header of sheet: {s['name']} ({s['n_rows']} rows) ---\n")
+            print(s["header"])
     
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
\ No newline at end of file
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+import micro_check
+import pisa_audit as audit
+
+
+def _chunks(n=3000, size=500, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "CNTSTUID": rng.integers(0, 2500, n),           # ids repetidos entre blocos
+        "W_FSTUWT": rng.uniform(-0.5, 3, n),
+        "ESCS": rng.normal(0, 3, n),
+        "X": rng.normal(-1, 1, n),
+    })
+    return df, [df.iloc[i:i + size] for i in range(0, n, size)]
+
+
+def test_unique_bounded_state_matches_pandas(tmp_path):
+    df, chunks = _chunks()
+    vc = df["CNTSTUID"].value_counts()
+    expect = (int(vc[vc > 1].sum()), len(vc))
+    for max_keys in (100, 10_000):
+        eng = audit.AuditEngine([audit.Unique("CNTSTUID")], max_keys=max_keys, spill_dir=str(tmp_path))
+        chk = eng.run(iter(chunks))["checks"][0]
+        assert (chk["duplicated"], chk["distinct"]) == expect
+    assert not any(tmp_path.iterdir())      # despejos removidos ao final
+
+
+def test_positive_and_range_only_on_configured_columns():
+    df, chunks = _chunks()
+    rules = [audit.Positive("W_FSTUWT"), audit.Range("ESCS", -6, 6), audit.NullRate(["X"])]
+    eng = audit.AuditEngine(rules)
+    st = eng._new_state()
+    for ch in chunks:
+        eng._update(st, ch)
+    j = {c: k for k, c in enumerate(eng.numeric_cols)}
+    assert st["nonpositive"][j["W_FSTUWT"]] == int((df["W_FSTUWT"] <= 0).sum())
+    assert st["nonpositive"][j["X"]] == 0 and st["nonpositive"][j["ESCS"]] == 0
+    assert st["out_of_range"][j["ESCS"]] == int(((df["ESCS"] < -6) | (df["ESCS"] > 6)).sum())
+    assert st["out_of_range"][j["X"]] == 0
+    rpt = eng._finalize(st, None)
+    pos = [c for c in rpt["checks"] if c["rule"] == "positive"]
+    assert len(pos) == 1 and np.isclose(pos[0]["sum"], df["W_FSTUWT"].sum())
+
+
+def test_micro_check_uses_rule_engine(tmp_path, capsys):
+    df = pd.DataFrame({"CNTSTUID": [1, 2, 2], "CNTSCHID": [10, 10, 11], "W_FSTUWT": [1.0, 2.0, 0.0],
+                       "ESCS": [0.1, 7.0, -0.5], "PV1READ": [400.0, None, 410.0]})
+    path = tmp_path / "SCH_STU_BRA.xlsx"
+    df.to_excel(path, sheet_name="data", index=False)
+    aliases = {"CNTSTUID": "CNTSTUID.STU", "ESCS": "ESCS.STU"}
+    canon = ["CNTSCHID", "CNTSTUID.STU", "W_FSTUWT", "ESCS.STU"]
+    out = micro_check.audit_sch_stu(str(path), "data", canon, aliases, ["PV1READ"], [])
+    printed = capsys.readouterr().out
+    assert list(out.columns) == canon and str(out["CNTSCHID"].dtype) == "Int64"
+    assert "unique[CNTSTUID.STU]: ⚠️ duplicated=2" in printed
+    assert "positive[W_FSTUWT]: ⚠️" in printed and "range[ESCS.STU]" in printed
+    _, rpt = audit.audit_sch_stu(str(path), "data", canon, aliases, ["PV1READ"], [], return_frame=False)
+    assert not rpt["passed"]
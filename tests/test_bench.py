@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+pytest.importorskip("statsmodels")
+
+import pisa_bench as bench
+
+
+def test_default_run_times_loader_and_mixedlm(tmp_path):
+    only = ["loader.pisa_prep.schools", "model.mixedlm_null"]
+    res = bench.run(sizes=[360], only=only, repeats=1, verbose=False, out_dir=str(tmp_path))
+    assert bench.DEFAULT_CAPS == {}
+    assert res.set_index("bench")["status"].to_dict() == {name: "ok" for name in only}
+
+    quick = bench.run(sizes=[360], only=only, repeats=1, verbose=False, quick=True, caps={"loader": 100})
+    assert quick.set_index("bench")["status"].to_dict() == {
+        "loader.pisa_prep.schools": "skipped (cap=100)", "model.mixedlm_null": "ok"}
+
+    (saved,) = tmp_path.glob("bench_*.json")
+    params = json.loads(saved.read_text(encoding="utf-8"))["params"]
+    assert params["quick"] is False and params["caps"] == {}
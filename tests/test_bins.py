@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+import estatisticas as estat
+import pisa_bins as bins
+import pisa_groupby as gb
+
+
+def _students(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    escs = rng.normal(0, 1, n)
+    # peso correlacionado com ESCS: quartis ponderados ≠ quartis da amostra
+    w = np.exp(0.8 * escs + rng.normal(0, 0.3, n))
+    return pd.DataFrame({"ESCS": escs, "SENWT": w,
+                         "READ": 420 + 40 * escs + rng.normal(0, 60, n),
+                         "DISCLIMA": rng.normal(0, 1, n), "BELONG": rng.normal(0, 1, n)})
+
+
+def _blocks(df, size=450):
+    return [df.iloc[i:i + size] for i in range(0, len(df), size)]
+
+
+def _brute_force_cut(x, w, p):
+    order = np.argsort(x)
+    for xi, cw in zip(x[order], np.cumsum(w[order])):
+        if cw >= p * w.sum():
+            return xi
+
+
+def test_weighted_quantiles_match_brute_force():
+    df = _students(300)
+    x, w = df["ESCS"].to_numpy(), df["SENWT"].to_numpy()
+    cuts = bins.weighted_quantiles(x, w, [0.25, 0.5, 0.75])
+    assert list(cuts) == [_brute_force_cut(x, w, p) for p in (0.25, 0.5, 0.75)]
+    np.testing.assert_array_equal(bins.weighted_quantiles(x, None, [0.5]), np.quantile(x, [0.5]))
+
+
+def test_assign_bins_splits_expanded_population():
+    df = _students()
+    q = bins.assign_bins(df, "ESCS", weight="SENWT", cache=bins.BinCache())
+    share = df["SENWT"].groupby(q, observed=True).sum() / df["SENWT"].sum()
+    np.testing.assert_allclose(share.to_numpy(), 0.25, atol=0.02)
+    assert df.groupby(q, observed=True).size().iloc[0] > len(df) // 4   # Q1 tem pesos menores
+
+    unweighted = bins.assign_bins(df, "ESCS", weight="SENWT", weighted=False, cache=bins.BinCache())
+    qcut = pd.qcut(df["ESCS"], 4, labels=list(estat.QUARTIL_LABELS))
+    np.testing.assert_array_equal(unweighted.cat.codes.to_numpy(), qcut.cat.codes.to_numpy())
+
+
+def test_cache_reuses_cuts_for_same_population():
+    df = _students(500)
+    cache = bins.BinCache()
+    bins.assign_bins(df, "ESCS", cache=cache)
+    bins.assign_bins(df.copy(), "ESCS", cache=cache)
+    bins.assign_bins(df.iloc[1:], "ESCS", cache=cache)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_quartil_summary_paths_agree_by_default():
+    df = _students()
+    measures = {"READ": "READ", "DISCLIMA": "DISCLIMA", "BELONG": "BELONG"}
+    mem = estat.quartil_summary(df, measures=measures)
+    chunked = estat.quartil_summary(lambda: _blocks(df), measures=measures)
+    dom = bins.binned_summary(df, "ESCS", domains={"Leitura": "READ"},
+                              measures={"DISCLIMA": "DISCLIMA"}, cache=bins.BinCache())
+
+    np.testing.assert_array_equal(mem["n_alunos"], chunked["n_alunos"])
+    np.testing.assert_array_equal(mem["n_alunos"], dom["n_alunos"])
+    np.testing.assert_allclose(mem["peso_expandido"], dom["peso_expandido"])
+    np.testing.assert_allclose(mem["READ"], chunked["READ"])
+    np.testing.assert_allclose(mem["READ"], dom["score_medio"])
+    np.testing.assert_allclose(mem["DISCLIMA"], dom["DISCLIMA"])
+    np.testing.assert_allclose(mem["peso_expandido"] / df["SENWT"].sum(), 0.25, atol=0.02)
+
+    old = estat.quartil_summary(df, measures=measures, weighted=False)
+    assert list(old["n_alunos"]) == list(pd.qcut(df["ESCS"], 4).value_counts(sort=False))
+    old_chunked = gb.quartil_summary(lambda: _blocks(df), measures=measures, weighted=False)
+    np.testing.assert_array_equal(old["n_alunos"], old_chunked["n_alunos"])
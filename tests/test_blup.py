@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+smf = pytest.importorskip("statsmodels.formula.api")
+
+import pisa_blup as blup
+
+
+def _schools(G=40, seed=11):
+    rng = np.random.default_rng(seed)
+    n = rng.integers(3, 40, G)                                  # escolas pequenas encolhem mais
+    g = np.repeat(np.arange(100, 100 + G), n)
+    u0, u1 = rng.normal(0, 25, G), rng.normal(0, 8, G)
+    escs = rng.normal(0, 1, g.size)
+    k = g - 100
+    read = 450 + u0[k] + (30 + u1[k]) * escs + rng.normal(0, 40, g.size)
+    return pd.DataFrame({"CNTSCHID": g, "ESCS_c": escs, "READ": read})
+
+
+def test_blups_match_statsmodels_random_effects():
+    df = _schools()
+    res = smf.mixedlm("READ ~ ESCS_c", df, groups="CNTSCHID", re_formula="~ESCS_c").fit(reml=True)
+    eff = blup.random_effects(res)
+
+    ref = pd.DataFrame(res.random_effects).T.sort_index()
+    assert list(eff.groups) == list(ref.index) and eff.names == list(ref.columns)
+    np.testing.assert_allclose(eff.blup, ref.to_numpy(), rtol=1e-6, atol=1e-8)
+    ref_cov = np.stack([res.random_effects_cov[g].to_numpy() for g in ref.index])
+    np.testing.assert_allclose(eff.cond_cov, ref_cov, rtol=1e-6, atol=1e-8)
+    np.testing.assert_array_equal(eff.n, df.groupby("CNTSCHID").size().to_numpy())
+
+    # ajuste "do disco": sem modelo vivo, y/X/Z reconstruídos dos dados
+    stored = types.SimpleNamespace(formula="READ ~ ESCS_c", re_formula="~ESCS_c", groups="CNTSCHID",
+                                   fe_params=res.fe_params, cov_re=res.cov_re, scale=res.scale)
+    np.testing.assert_allclose(blup.random_effects(stored, df).blup, eff.blup, rtol=1e-9)
+
+    pytest.importorskip("scipy")
+    rank = blup.rank_schools(eff, slope="ESCS_c")
+    assert len(rank) == len(ref) and rank["perfil"].isin(blup.PERFIS).all()
+    assert (rank["intercepto_lo"] < rank["intercepto_re"]).all()
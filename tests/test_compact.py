@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import pisa_compact as compact
+from pisa_prep import PV_READ_COLS, to_mongo_documents_students
+
+
+def _students(n=40, seed=2):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"STIDSTD": [f"BR{i:05d}" for i in range(n)],
+                       "SCHOOLID": rng.choice(["7600001", "7600002", "7600003"], n),
+                       "W_FSTUWT": rng.uniform(1, 50, n), "ESCS": rng.normal(size=n),
+                       "DISCLIMA": rng.normal(size=n), "ST004D01T": rng.choice([1.0, 2.0], n),
+                       "REPEAT": rng.choice([0.0, 1.0, np.nan], n),
+                       "LANGN": rng.choice(["Portuguese", "Other"], n), "IMMIG": rng.choice([1.0, 2.0, 3.0], n)})
+    for c in PV_READ_COLS:
+        df[c] = rng.normal(420, 90, n)
+    df.loc[3, ["ESCS", "PV2READ"]] = np.nan                 # ausentes: omitidos e restaurados como None
+    return df
+
+
+def test_compact_round_trip_through_mongo():
+    df = _students()
+    db = mongomock.MongoClient().db
+    assert compact.write_compact(db, "students_c", df, pv_dtype="float64", student_as_id=True) == len(df)
+    assert "e" not in db["students_c"].find_one({"_id": "BR00003"})
+
+    plain = {d["STIDSTD"]: d for d in to_mongo_documents_students(df)}
+    got = compact.read_compact(db, "students_c")
+    assert len(got) == len(df) and all(doc == plain[doc["STIDSTD"]] for doc in got)
+
+    query = {"SCHOOLID": "7600002", "controls.lang_home": "Other"}
+    sub = compact.read_compact(db, "students_c", query)
+    ref = df[(df["SCHOOLID"] == "7600002") & (df["LANGN"] == "Other")]
+    assert sorted(d["STIDSTD"] for d in sub) == sorted(ref["STIDSTD"])
+
+
+def test_float32_pvs_lose_only_float32_precision():
+    df = _students()
+    docs, schema = compact.encode_students(df)
+    back = compact.decode_students(docs, schema)
+    pv = np.array([[np.nan if v is None else v for v in d["pv_read"]] for d in back])
+    np.testing.assert_allclose(pv, df[PV_READ_COLS].to_numpy(), rtol=1e-7)
+    assert len(docs[0]["p"]) == 4 * len(PV_READ_COLS)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import pisa_cycles as cycles
+
+
+def _xlsx(path, df, sheet="data"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_excel(path, sheet_name=sheet, index=False)
+
+
+def _tree(base, drop_id=False):
+    rng = np.random.default_rng(4)
+    # 2012: nomes antigos; o codebook lista CNTSCHID, mas os arquivos trazem SCHOOLID
+    d = os.path.join(base, "pisa2012")
+    _xlsx(os.path.join(d, "PISA2012_CODEBOOK.xlsx"),
+          pd.DataFrame({"NAME": ["CNTSCHID", "CNTSTUID", "ESCS", "SCMATEDU"]}))
+    stu = pd.DataFrame({"SCHOOLID": [1, 1, 2, 2], "StIDStd": [11, 12, 21, 22],
+                        "ESCS": rng.normal(size=4), "ST04Q01": [1, 2, 1, 2],
+                        "W_FSTUWT": [10.0, 30.0, 20.0, 40.0], "PV1READ": rng.normal(400, 50, 4)})
+    _xlsx(os.path.join(d, "STU", "STU_BRA.xlsx"), stu.drop(columns="StIDStd") if drop_id else stu)
+    _xlsx(os.path.join(d, "SCH", "SCH_BRA.xlsx"),
+          pd.DataFrame({"SCHOOLID": [1, 2], "SCMATEDU": [0.5, -1.0], "TCSHORT": [0.1, 0.2]}))
+    # 2018: nomes atuais, dois países
+    d = os.path.join(base, "pisa2018")
+    for cnt in ("ARG", "BRA"):
+        _xlsx(os.path.join(d, "STU", f"STU_{cnt}.xlsx"),
+              pd.DataFrame({"CNTSCHID": [1, 2, 3], "CNTSTUID": [1, 2, 3], "ESCS": [0.1, 0.2, 0.3],
+                            "ST004D01T": [1, 2, 1], "SENWT": [1.0, 2.0, 3.0], "PV1READ": [400.0, 410, 420]}))
+        _xlsx(os.path.join(d, "SCH", f"SCH_{cnt}.xlsx"),
+              pd.DataFrame({"CNTSCHID": [1, 2, 3], "EDUSHORT": [0.3, -0.2, 1.1], "STAFFSHORT": [0.0, 1.0, 2.0]}))
+
+
+def test_rename_table_candidates_and_required():
+    got = cycles.rename_table("stu", ["SCHOOLID", "StIDStd", "CNTSTUID", "ST04Q01"])
+    assert got == {"SCHOOLID": "CNTSCHID", "CNTSTUID": "CNTSTUID", "ST04Q01": "ST004D01T"}
+    assert cycles.rename_table("stu", ["SCHOOLID", "STIDSTD"])["STIDSTD"] == "CNTSTUID"
+    sch = cycles.rename_table("sch", ["SCHOOLID", "SCMATEDU", "TCSHORT"])
+    assert "EDUSHORT" not in sch.values()                 # SCMATEDU é outro construto
+    with pytest.raises(KeyError, match="CNTSTUID"):
+        cycles.rename_table("stu", ["SCHOOLID", "ESCS"], source="STU_BRA.xlsx")
+
+
+def test_load_cycles_partitions_and_pushdown(tmp_path):
+    base, out = str(tmp_path / "dados"), str(tmp_path / "out")
+    _tree(base)
+    manifest = cycles.load_cycles(base, out, max_workers=2, verbose=False)
+    assert manifest["cycles"]["2012"]["rename"]["STU"]["CNTSCHID"] == "CNTSCHID"   # do codebook
+    assert manifest["cycles"]["2012"]["countries"]["BRA"]["rename"]["STU"]["SCHOOLID"] == "CNTSCHID"
+    for level, cycle, cnt in [("stu", 2012, "BRA"), ("sch", 2018, "ARG"), ("sch", 2018, "BRA")]:
+        assert os.path.exists(os.path.join(out, level, f"cycle={cycle}", f"CNT={cnt}", "part-0.parquet"))
+
+    ds = cycles.CrossCycleDataset(out)
+    assert ds.cycles == [2012, 2018] and ds.countries(2018) == ["ARG", "BRA"]
+    old = ds.load("stu", columns=["CNTSCHID", "CNTSTUID", "SENWT", "ST004D01T"], cycles=[2012])
+    assert old["CNTSCHID"].tolist() == [1, 1, 2, 2] and old["CNTSTUID"].notna().all()
+    assert old["SENWT"].sum() == pytest.approx(5000.0) and old["ST004D01T"].tolist() == ["1", "2", "1", "2"]
+    sch = ds.load("sch", columns=["EDUSHORT", "STAFFSHORT"])
+    assert sch.loc[sch["cycle"] == 2012, "EDUSHORT"].isna().all()
+    assert sch.loc[sch["cycle"] == 2018, "EDUSHORT"].notna().all()
+
+    flt = ds._filter([2018], ["BRA"], None)
+    frags = list(ds.dataset("stu").get_fragments(filter=flt))
+    assert [os.path.relpath(f.path, out) for f in frags] == [os.path.join("stu", "cycle=2018", "CNT=BRA", "part-0.parquet")]
+    assert ds.load("stu", columns=["ESCS"], cycles=[2018], countries=["BRA"]).shape[0] == 3
+
+
+def test_missing_id_in_file_is_an_error(tmp_path):
+    base, out = str(tmp_path / "dados"), str(tmp_path / "out")
+    _tree(base, drop_id=True)                             # codebook lista CNTSTUID; o arquivo não traz
+    manifest = cycles.load_cycles(base, out, cycles=[2012], max_workers=1, verbose=False)
+    err = manifest["cycles"]["2012"]["countries"]["BRA"]["error"]
+    assert err.startswith("KeyError") and "CNTSTUID" in err
+    assert not os.path.exists(os.path.join(out, "stu", "cycle=2012", "CNT=BRA", "part-0.parquet"))
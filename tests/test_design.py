@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+smf = pytest.importorskip("statsmodels.formula.api")
+
+import pisa_design as design
+import pisa_fitstore as fitstore
+import pisa_predict as predict
+
+FORMULA = "READ ~ ESCS_c + C(REPEAT) + ESCS_c:clima"
+
+
+def _data(n=800, seed=2):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"ESCS_c": rng.normal(size=n), "clima": rng.normal(size=n),
+                       "REPEAT": rng.choice([0.0, 1.0], size=n), "SENWT": rng.uniform(0.5, 2, n),
+                       "CNTSCHID": rng.integers(1, 40, n)})
+    df["READ"] = 450 + 30 * df["ESCS_c"] - 20 * df["REPEAT"] + rng.normal(0, 40, n)
+    df.loc[::37, "ESCS_c"] = np.nan
+    return df
+
+
+def test_cached_wls_matches_smf_and_predicts():
+    df = _data()
+    ref = smf.wls(FORMULA, df, weights=df["SENWT"]).fit()
+    got = design.fit_wls(FORMULA, df, "SENWT", cache=design.DesignCache())
+    pd.testing.assert_series_equal(got.params, ref.params, rtol=1e-10)
+    new = df.head(20)
+    np.testing.assert_allclose(got.predict(new), ref.predict(new))
+
+
+def test_prediction_engine_and_stored_fit_use_public_patsy():
+    df = _data()
+    res = design.fit_wls(FORMULA, df, "SENWT", cache=design.DesignCache())
+    grid = predict.predict_grid(res, {"ESCS_c": [-1.0, 0.0, 1.0], "REPEAT": [0.0, 1.0]}, fixed={"clima": 0.0})
+    X = pd.DataFrame({"ESCS_c": grid["ESCS_c"], "REPEAT": grid["REPEAT"], "clima": 0.0})
+    np.testing.assert_allclose(grid["pred"], res.predict(X))
+
+    store = fitstore.FitStore(root=None)
+    fit = store.fit_wls(FORMULA, df, "SENWT")
+    np.testing.assert_allclose(fit.predict(X), res.predict(X))
+
+
+def test_fit_store_key_depends_on_weight_order():
+    df = _data()
+    w = df["SENWT"].to_numpy()
+    key = fitstore.FitStore.make_key("wls", FORMULA, df, weights=w)
+    assert key == fitstore.FitStore.make_key("wls", FORMULA, df, weights=w.copy())
+    assert key != fitstore.FitStore.make_key("wls", FORMULA, df, weights=w[::-1])
+    g = df["CNTSCHID"].to_numpy()
+    assert (fitstore.FitStore.make_key("mixedlm", FORMULA, df, groups=g)
+            != fitstore.FitStore.make_key("mixedlm", FORMULA, df, groups=np.roll(g, 1)))
+
+
+@pytest.mark.parametrize("dropped", [2.0, 0.0], ids=["nivel", "referencia"])
+def test_masked_design_matches_smf_on_subset(dropped):
+    df = _data()
+    df["REPEAT"] = np.where(df["clima"] > 0.8, 2.0, df["REPEAT"])    # 3 níveis no frame completo
+    tercil = pd.qcut(df["clima"], 3, labels=["baixo", "medio", "alto"])
+    mask = (tercil != "alto") & df["REPEAT"].ne(dropped)             # subconjunto sem um nível
+    sub = df[mask]
+    ref = smf.wls(FORMULA, sub, weights=sub["SENWT"]).fit()
+    cache = design.DesignCache()
+    got = design.fit_wls(FORMULA, df, "SENWT", cache=cache, mask=mask.to_numpy())
+    pd.testing.assert_series_equal(got.params, ref.params, rtol=1e-8)
+    assert got.nobs == ref.nobs
+    design.fit_wls(FORMULA.replace("READ", "SENWT"), df, "SENWT", cache=cache, mask=mask.to_numpy())
+    assert cache.stats()["hits"] == 1                                # mesmo subconjunto, outro desfecho
+
+
+def test_fit_store_mask_keys_and_fits_the_subset():
+    df = _data()
+    df["REPEAT"] = np.where(df["clima"] > 0.8, 2.0, df["REPEAT"])
+    mask = (df["clima"] <= 0.8).to_numpy()                           # sem o nível 2.0
+    sub = df[mask]
+    store = fitstore.FitStore(root=None)
+    fit = store.fit_wls(FORMULA, df, df["SENWT"].to_numpy(), mask=mask)
+    assert fit.key == fitstore.FitStore.make_key("wls", FORMULA, sub, weights=sub["SENWT"].to_numpy(),
+                                                     fit_options={})
+    ref = smf.wls(FORMULA, sub, weights=sub["SENWT"]).fit()
+    pd.testing.assert_series_equal(fit.params, ref.params, rtol=1e-8, check_names=False)
+    assert store.fit_wls(FORMULA, sub, sub["SENWT"].to_numpy()) is fit
+    assert store.fits == 1
+
+
+def test_prediction_engine_rejects_mismatched_grid_design():
+    df = _data()
+    res = design.fit_wls(FORMULA, df, "SENWT", cache=design.DesignCache())
+    eng = predict.PredictionEngine(res)
+    grid = pd.DataFrame({"ESCS_c": [0.0, 1.0], "REPEAT": [0.0, 1.0], "clima": 0.0})
+    expected = res.predict(grid).to_numpy()
+
+    eng.names = eng.names[::-1]                                      # só a ordem muda: reordena
+    eng.beta = eng.beta[::-1]
+    eng.cov = eng.cov[::-1, ::-1]
+    np.testing.assert_allclose(eng.predict_frame(grid)["pred"], expected)
+
+    eng.spec = design.build_design("ESCS_c + clima", df)[1]         # outra especificação
+    with pytest.raises(ValueError, match=r"faltam .*C\(REPEAT\).*sobram \['clima'\]"):
+        eng.design(grid)
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+import exploratory as ex
+
+
+def test_unobserved_categories_not_counted(capsys):
+    s = pd.Series(pd.Categorical(["a", "b", "a", None], categories=["a", "b", "c", "d"]))
+    df = pd.DataFrame({"x": s})
+    perfil = ex.perfil_categoricas([df.iloc[:2], df.iloc[2:]])
+    p = perfil.colunas["x"]
+    assert p.distintos() == 2 and p.missing == 1
+    assert dict(p.top(10)) == {"a": 2, "b": 1}
+
+    ex.resumo_categoricas(df)
+    out = capsys.readouterr().out
+    assert "(níveis: 2, missing: 1)" in out
+    assert "  c " not in out and "  d " not in out
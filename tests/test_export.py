@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+import pisa_export as export
+
+
+def _students(n=3000, seed=6):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"CNTSCHID": rng.integers(1, 120, n), "ESCS": rng.normal(size=n),
+                       "quartil": rng.choice(["Q1", "Q2", "Q3", "Q4"], n),
+                       "perfil": pd.Categorical(rng.choice(["Eficaz", "Sem destaque"], n)),
+                       "REPEAT": pd.arrays.SparseArray(rng.choice([0.0, 1.0], n, p=[0.9, 0.1]))})
+    df.loc[::7, "ESCS"] = np.nan
+    return df
+
+
+def _plain(df):
+    """Valores comparáveis: esparsas densas, textos/categorias como object."""
+    cols = {}
+    for c in df.columns:
+        s = df[c]
+        if isinstance(s.dtype, pd.SparseDtype):
+            s = s.sparse.to_dense()
+        elif isinstance(s.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(s):
+            s = s.astype(object)
+        cols[c] = s.to_numpy()
+    return pd.DataFrame(cols)
+
+
+def test_export_round_trip_and_manifest(tmp_path):
+    df = _students()
+    out = str(tmp_path / "arrow")
+    manifest = export.export_frames({"students_final": df}, out, sort_by={"students_final": ["CNTSCHID"]},
+                                    row_group_size=500)
+    info = manifest["tables"]["students_final"]
+    assert info["rows"] == len(df) and info["files"] == {"arrow": "students_final.arrow",
+                                                         "parquet": "students_final.parquet"}
+    assert info["schema"]["quartil"].startswith("dictionary")
+
+    ipc = export.read_table(os.path.join(out, "students_final.arrow")).to_pandas()
+    pd.testing.assert_frame_equal(_plain(ipc), _plain(df))
+    pq_df = export.read_table(os.path.join(out, "students_final.parquet")).to_pandas()
+    ref = df.sort_values("CNTSCHID", kind="stable")
+    pd.testing.assert_frame_equal(_plain(pq_df), _plain(ref))
+
+    stats = export.row_group_stats(os.path.join(out, "students_final.parquet"), "CNTSCHID")
+    assert len(stats) == 6 and (stats["min"].to_numpy()[1:] >= stats["max"].to_numpy()[:-1]).all()
+
+    export.export_frames({"resumo": df.head(3)}, out, formats=("parquet",))
+    assert sorted(export._read_manifest(out)["tables"]) == ["resumo", "students_final"]
+    with pytest.raises(ValueError, match="formatos"):
+        export.export_frames({"x": df}, out, formats=("csv",))
+
+
+def test_server_streams_the_exported_tables(tmp_path):
+    df = _students(1000)
+    out = str(tmp_path / "arrow")
+    export.export_frames({"students_final": df}, out)
+    with export.ArrowServer(root=out, batch_rows=128) as srv:
+        assert export.list_tables(port=srv.port)["students_final"]["rows"] == len(df)
+        batches = list(export.iter_batches("students_final", port=srv.port, columns=["CNTSCHID", "ESCS"]))
+        assert len(batches) == 8 and all(b.num_rows <= 128 for b in batches)
+        got = export.fetch("students_final", port=srv.port).to_pandas()
+        pd.testing.assert_frame_equal(_plain(got), _plain(df))
+        with pytest.raises(RuntimeError, match="tabela desconhecida"):
+            export.fetch("nada", port=srv.port)
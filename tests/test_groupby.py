@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+import pisa_groupby as gb
+
+
+def _chunks(n_schools=3000, per_school=4, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = np.repeat(np.arange(1, n_schools + 1), per_school)
+    df = pd.DataFrame({"CNTSCHID": ids,
+                       "SENWT": rng.uniform(0.5, 2.0, len(ids)),
+                       "READ": rng.normal(450, 90, len(ids))}).sample(frac=1, random_state=seed)
+    half = len(df) // 2
+    a = df.iloc[:half].copy()                                   # int64
+    b = df.iloc[half:].copy()
+    b["CNTSCHID"] = b["CNTSCHID"].astype("float64")             # como num bloco com id ausente
+    b = pd.concat([b, pd.DataFrame({"CNTSCHID": [np.nan], "SENWT": [1.0], "READ": [500.0]})])
+    return df, [a, b]
+
+
+def test_spill_mixed_key_dtypes_matches_in_memory():
+    df, chunks = _chunks()
+    mem = gb.aggregate(chunks, "CNTSCHID", "SENWT", {"READ": "READ"}, count_name="n")
+    spill = gb.aggregate(chunks, "CNTSCHID", "SENWT", {"READ": "READ"}, count_name="n",
+                         max_groups=500, partitions=8)
+    assert len(mem) == len(spill) == 3000
+    assert not spill["CNTSCHID"].duplicated().any()
+    pd.testing.assert_frame_equal(mem, spill, check_exact=False, rtol=1e-10)
+
+    ref = (df.assign(wx=df["SENWT"] * df["READ"]).groupby("CNTSCHID")[["wx", "SENWT"]].sum())
+    np.testing.assert_allclose(spill["READ"].to_numpy(), (ref["wx"] / ref["SENWT"]).to_numpy())
+    assert spill["n"].sum() == len(df)
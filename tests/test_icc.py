@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+import pisa_icc as icc
+
+
+def _sample(J=3000, per_school=50, seed=8):
+    """
+    População com ICC = 0,25 (var_entre 0,25, var_intra 0,49 + 0,26). Dentro da
+    escola, o estrato s=0 tem escore menor e é amostrado com prob. 0,2 (peso 5):
+    sem pesos a variância intra encolhe e o ICC sai inflado.
+    """
+    rng = np.random.default_rng(seed)
+    school = np.repeat(np.arange(J), per_school)
+    s = rng.integers(0, 2, school.size)
+    y = rng.normal(0, 0.5, J)[school] + 0.7 * (2 * s - 1) + rng.normal(0, np.sqrt(0.26), school.size)
+    keep = (s == 1) | (rng.random(school.size) < 0.2)
+    return pd.DataFrame({"CNTSCHID": school[keep], "Y": y[keep], "SENWT": np.where(s[keep] == 1, 1.0, 5.0),
+                         "sexo": rng.integers(1, 3, keep.sum())})
+
+
+def test_weighted_icc_recovers_population_value():
+    df = _sample()
+    w = icc.variance_components(df, ["Y"], weight="SENWT").iloc[0]
+    u = icc.variance_components(df, ["Y"]).iloc[0]
+    assert w["ICC"] == pytest.approx(0.25, abs=0.012)
+    assert w["var_intra"] == pytest.approx(0.75, rel=0.06)
+    assert u["ICC"] > w["ICC"] + 0.04                       # amostra informativa: viés sem pesos
+    assert (w["n_alunos"], w["n_escolas"]) == (len(df), 3000)
+
+    # sem pesos: ANOVA clássica de um fator para grupos desbalanceados
+    g = df.groupby("CNTSCHID")["Y"]
+    n, N, J = g.size(), len(df), g.ngroups
+    ms_e = (n * (g.mean() - df["Y"].mean()) ** 2).sum() / (J - 1)
+    ms_i = ((df["Y"] - g.transform("mean")) ** 2).sum() / (N - J)
+    n0 = (N - (n ** 2).sum() / N) / (J - 1)
+    assert u["n0"] == pytest.approx(n0) and u["var_intra"] == pytest.approx(ms_i)
+    assert u["var_entre"] == pytest.approx((ms_e - ms_i) / n0)
+
+
+def test_subgroups_match_separate_calls_and_weights_are_scale_free():
+    df = _sample(J=120)
+    df.loc[df.index[::9], "Y"] = np.nan
+    table = icc.variance_components(df, ["Y", "SENWT"], by="sexo", weight="SENWT")
+    for sexo, sub in df.groupby("sexo"):
+        alone = icc.variance_components(sub, ["Y", "SENWT"], weight="SENWT")
+        got = table[table["sexo"] == sexo].drop(columns="sexo").reset_index(drop=True)
+        pd.testing.assert_frame_equal(got, alone)
+    scaled = icc.variance_components(df.assign(SENWT=df["SENWT"] * 37.5), ["Y"], weight="SENWT")
+    base = icc.variance_components(df, ["Y"], weight="SENWT")
+    np.testing.assert_allclose(scaled[icc.STAT_COLUMNS].to_numpy(float),
+                               base[icc.STAT_COLUMNS].to_numpy(float), rtol=1e-10)
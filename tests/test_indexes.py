@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from pisa_indexes import MSSQL_FIELDS, mssql_index_statements, plan_indexes
+
+# tamanhos de `sys.columns.max_length` da STU_BRA de pisa_ingest_mssql
+COLUMNS = {"STIDSTD": 510, "SCHOOLID": 510, "ESCS": 8, "W_FSTUWT": 8, "DISCLIMA": 8,
+           "ST004D01T": 510, "REPEAT": 510}
+
+
+def test_oversized_key_moves_columns_to_include(capsys):
+    notes = {}
+    stmts = dict(mssql_index_statements("dbo", "STU_BRA", plan_indexes(MSSQL_FIELDS, target="mssql"),
+                                        COLUMNS, notes=notes))
+    sql = stmts["IX_STU_BRA_sex_repeat"]
+    assert sql is not None
+    assert "([ST004D01T] ASC, [ESCS] ASC) INCLUDE ([REPEAT], [W_FSTUWT])" in sql
+    assert "IX_STU_BRA_sex_repeat" in notes
+    assert "IX_STU_BRA_sex_repeat" in capsys.readouterr().out
+
+
+def test_missing_key_column_is_reported():
+    notes = {}
+    cols = {k: v for k, v in COLUMNS.items() if k != "ESCS"}
+    stmts = dict(mssql_index_statements("dbo", "STU_BRA", plan_indexes(MSSQL_FIELDS, target="mssql"),
+                                        cols, notes=notes))
+    assert stmts["IX_STU_BRA_escs"] is None
+    assert "ESCS" in notes["IX_STU_BRA_escs"]
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+import pandas as pd
+import pytest
+
+import ingest_async_mongo as iam
+import ingest_xlsx_to_mongo as ixm
+
+
+class _Collection:
+    def __init__(self, db, name):
+        self.db, self.name = db, name
+
+    async def insert_many(self, batch, ordered=False):
+        if self.db.fail:
+            raise RuntimeError("falha de escrita")
+        self.db.docs.setdefault(self.name, []).extend(batch)
+
+
+class _Db:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.docs = {}
+
+    def __getitem__(self, name):
+        return _Collection(self, name)
+
+    async def list_collection_names(self):
+        return list(self.docs)
+
+
+class _EmptyReader:
+    path = "vazio.xlsx"
+    sheet_names = []
+
+    def __init__(self, path):
+        pass
+
+    def close(self):
+        pass
+
+
+def _pending_tasks():
+    return [t for t in asyncio.all_tasks() if t is not asyncio.current_task() and not t.done()]
+
+
+def _workbook(path, sheets):
+    with pd.ExcelWriter(path) as xw:
+        for name in sheets:
+            pd.DataFrame({"CNTSCHID": [1, 2, 3], "X": [0.5, None, 2.0]}).to_excel(xw, sheet_name=name, index=False)
+
+
+def test_sheets_read_from_one_open_reader(tmp_path, monkeypatch):
+    path = tmp_path / "SCH_BRA.xlsx"
+    _workbook(path, ["a", "b"])
+    opened = []
+
+    class Reader(iam.XlsxReader):
+        def __init__(self, p):
+            opened.append(p)
+            super().__init__(p)
+
+    monkeypatch.setattr(iam, "XlsxReader", Reader)
+    db = _Db()
+    created = asyncio.run(iam.insert_xlsx_to_mongo_async(str(path), db, verbose=False))
+    assert created == ["SCH_BRA__a", "SCH_BRA__b"] and len(opened) == 1
+    assert db.docs["SCH_BRA__a"][1] == {"CNTSCHID": 2, "X": None}
+
+
+def test_workbook_without_sheets(tmp_path, monkeypatch):
+    path = tmp_path / "vazio.xlsx"
+    path.write_bytes(b"")
+    monkeypatch.setattr(iam, "XlsxReader", _EmptyReader)
+    with pytest.raises(ValueError, match="sem abas"):
+        asyncio.run(iam.insert_xlsx_to_mongo_async(str(path), _Db(), verbose=False))
+
+
+def test_prefetch_cancelled_when_write_fails(tmp_path, monkeypatch):
+    path = tmp_path / "livro.xlsx"
+    _workbook(path, ["a", "b"])
+
+    def slow_read(reader, sheet):
+        if sheet == "b":
+            time.sleep(0.2)
+        return [{"x": 1}]
+
+    monkeypatch.setattr(iam, "_read_sheet_records", slow_read)
+
+    async def main():
+        with pytest.raises(RuntimeError, match="falha de escrita"):
+            await iam.insert_xlsx_to_mongo_async(str(path), _Db(fail=True), verbose=False)
+        await asyncio.sleep(0)
+        return _pending_tasks()
+
+    assert asyncio.run(main()) == []
+
+
+def test_run_ingest_folder_inside_running_loop(monkeypatch):
+    async def fake(*args, **kwargs):
+        await asyncio.sleep(0)
+        return {"ok": list(args)}
+
+    monkeypatch.setattr(iam, "ingest_folder_of_excels_async", fake)
+
+    async def notebook_cell():   # como no Jupyter: já existe um loop rodando
+        return iam.run_ingest_folder("pasta", "db")
+
+    assert asyncio.run(notebook_cell()) == {"ok": ["pasta", "db"]}
+
+
+def test_connect_mongo_reuses_client():
+    uri = "mongodb://localhost:1/?serverSelectionTimeoutMS=10"
+    c1, db1 = ixm.connect_mongo("a", uri=uri)
+    c2, db2 = ixm.connect_mongo("b", uri=uri)
+    try:
+        assert c1 is c2 and db1.name == "a" and db2.name == "b"
+    finally:
+        ixm.close_mongo_clients()
+    c3, _ = ixm.connect_mongo("a", uri=uri)
+    assert c3 is not c1
+    ixm.close_mongo_clients()
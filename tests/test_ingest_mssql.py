@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+import pisa_ingest_mssql as ms
+import pisa_inventory
+
+
+def test_students_read_projected(tmp_path, monkeypatch):
+    n = 50
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({
+        "CNTSCHID": rng.integers(1, 6, n), "CNTSTUID": np.arange(1, n + 1),
+        "W_FSTUWT": rng.uniform(1, 3, n), "ESCS": rng.normal(size=n),
+        **{f"IT{j:03d}Q01TA": rng.integers(1, 5, n) for j in range(30)},
+        "PV1READ": rng.normal(400, 90, n), "PV2READ": rng.normal(400, 90, n),
+    })
+    path = tmp_path / "STU_BRA.xlsx"
+    df.to_excel(path, sheet_name="data", index=False)
+
+    asked = []
+    read = pisa_inventory.XlsxReader.read
+
+    def spy(self, sheet=0, columns=None, **kw):
+        asked.append(columns)
+        return read(self, sheet, columns=columns, **kw)
+
+    monkeypatch.setattr(pisa_inventory.XlsxReader, "read", spy)
+    out = ms._load_students_filtered(str(path))
+    assert asked and all(c is not None and not any(x.startswith("IT0") for x in c) for c in asked)
+    assert list(out.columns) == ["STIDSTD", "SCHOOLID", "W_FSTUWT", "ESCS", "PV1READ", "PV2READ"]
+    assert out["STIDSTD"].tolist() == [str(i) for i in range(1, n + 1)]
+    np.testing.assert_allclose(out["PV2READ"].astype(float), df["PV2READ"])
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import glob
+import os
+
+import pandas as pd
+import pytest
+
+from pisa_inventory import XlsxReader, scan_workbook
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pisa2018")
+WORKBOOKS = sorted(glob.glob(os.path.join(DATA, "**", "*.xlsx"), recursive=True))
+
+
+@pytest.mark.parametrize("path", WORKBOOKS, ids=os.path.basename)
+@pytest.mark.parametrize("count_rows", [False, True])
+def test_scan_shape_matches_read_excel(path, count_rows):
+    for sheet in scan_workbook(path, count_rows=count_rows)["sheets"]:
+        ref = pd.read_excel(path, sheet_name=sheet["name"])
+        assert (sheet["n_rows"], sheet["n_cols"]) == ref.shape, sheet["name"]
+
+
+@pytest.mark.parametrize("path", WORKBOOKS, ids=os.path.basename)
+def test_reader_matches_read_excel(path):
+    with XlsxReader(path) as rd:
+        for sheet in rd.sheet_names:
+            ref = pd.read_excel(path, sheet_name=sheet)
+            pd.testing.assert_frame_equal(rd.read(sheet), ref)
+            named = [c for c in ref.columns if not str(c).startswith("Unnamed")][:5]
+            pd.testing.assert_frame_equal(rd.read(sheet, columns=named), ref[named])
+
+
+@pytest.mark.parametrize("iso_dates", [False, True], ids=["serial", "t=d"])
+def test_reader_converts_date_cells(tmp_path, iso_dates):
+    from datetime import datetime, timedelta
+
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    wb.iso_dates = iso_dates                      # True: células `t="d"` com texto ISO 8601
+    ws = wb.active
+    ws.title = "data"
+    ws.append(["CNTSTUID", "DATA_TESTE", "INICIO", "NOTA"])
+    rows = [(1, datetime(2018, 5, 3), datetime(2018, 5, 3, 9, 30), 0.5),
+            (2, None, datetime(1900, 2, 10, 12, 0), 1.25),
+            (3, datetime(2018, 6, 1), datetime(2018, 6, 1, 14, 15, 30), 2.0)]
+    for r in rows:
+        ws.append(list(r))
+    for (_, dt, ts, nota) in ws.iter_rows(min_row=2):
+        dt.number_format = "dd/mm/yyyy"           # formato personalizado (numFmts)
+        nota.number_format = "0.00"               # numérico: continua número
+    ws.append([4, None, None, timedelta(hours=30)])
+    ws["D5"].number_format = "[h]:mm:ss"
+    path = tmp_path / "datas.xlsx"
+    wb.save(path)
+
+    with XlsxReader(str(path)) as rd:
+        got = rd.read("data")
+        proj = rd.read("data", columns=["DATA_TESTE", "CNTSTUID"])
+    ref = pd.read_excel(path, sheet_name="data")
+    pd.testing.assert_frame_equal(got, ref)
+    pd.testing.assert_frame_equal(proj, ref[["CNTSTUID", "DATA_TESTE"]])
+    assert got["DATA_TESTE"].dtype.kind == "M" and got["INICIO"].iloc[1] == pd.Timestamp(1900, 2, 10, 12)
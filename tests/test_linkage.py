@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+import pisa_linkage as linkage
+
+
+def _frames(seed=9):
+    rng = np.random.default_rng(seed)
+    stu = pd.DataFrame({"CNTSTUID": np.arange(1, 201), "CNTSCHID": rng.integers(1, 16, 200),
+                        "ESCS": rng.normal(size=200)})
+    flt = stu.sample(frac=0.9, random_state=seed)[["CNTSTUID", "CNTSCHID"]].copy()
+    flt["READ"] = rng.normal(450, 90, len(flt))
+    flt["CNTSTUID"] += linkage.FLT_ID_OFFSET                       # deslocamento do FLT 2018
+    flt.iloc[:3, flt.columns.get_loc("CNTSCHID")] += 100           # escola divergente: descartados
+    flt = pd.concat([flt, pd.DataFrame({"CNTSTUID": [999_999], "CNTSCHID": [1], "READ": [500.0]})])
+    sch = pd.DataFrame({"CNTSCHID": np.arange(2, 20), "EDUSHORT": rng.normal(size=18)})
+    return stu, flt.reset_index(drop=True), sch
+
+
+def test_link_matches_notebook_merges():
+    stu, flt, sch = _frames()
+    lk = linkage.link(stu, flt, sch)
+    assert lk.flt_offset == linkage.FLT_ID_OFFSET
+
+    flt_fix = flt.assign(CNTSTUID=flt["CNTSTUID"] - linkage.FLT_ID_OFFSET)
+    ref = (stu.merge(flt_fix, on=["CNTSTUID", "CNTSCHID"], how="inner", validate="one_to_one")
+              .merge(sch, on="CNTSCHID", how="left", validate="many_to_one"))
+    got = lk.join(stu, flt, sch)
+    key = ["CNTSTUID"]
+    pd.testing.assert_frame_equal(got.sort_values(key).reset_index(drop=True),
+                                  ref[got.columns].sort_values(key).reset_index(drop=True))
+
+    cov = lk.coverage
+    assert cov["stu_flt_both"] == len(ref) and cov["school_mismatch"] == 3
+    assert cov["flt_only"] == len(flt) - len(ref)
+    assert cov["students_with_school"] == int(ref["EDUSHORT"].notna().sum())
+    assert "Deslocamento detectado" in lk.format_coverage()
+
+
+def test_link_rejects_duplicate_school_keys():
+    stu, flt, sch = _frames()
+    with pytest.raises(ValueError, match="duplicadas"):
+        linkage.link(stu, flt, pd.concat([sch, sch.head(1)]))
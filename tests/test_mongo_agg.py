@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import numbers
+
+import numpy as np
+import pandas as pd
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import pisa_mongo_agg as agg
+
+
+class _Windowed:
+    """
+    Coleção mongomock que também entende `$setWindowFields` (o mongomock não
+    implementa): esses estágios são avaliados em Python, o resto no mongomock.
+    """
+
+    def __init__(self, docs):
+        self._db = mongomock.MongoClient().db
+        self._col = self._db["students"]
+        self._col.insert_many([dict(d) for d in docs])
+        self.calls = []
+
+    def find(self, *args, **kwargs):
+        self.calls.append("find")
+        return self._col.find(*args, **kwargs)
+
+    def _run(self, docs, stages):
+        tmp = self._db["tmp"]
+        tmp.drop()
+        if docs:
+            tmp.insert_many(docs)
+        return list(tmp.aggregate(stages)) if stages else list(tmp.find())
+
+    def _eval(self, docs, expr):
+        return [d.get("__v") for d in self._run(docs, [{"$project": {"__v": expr}}])]
+
+    def _window(self, docs, spec):
+        keys = self._eval(docs, spec["partitionBy"]) if "partitionBy" in spec else [None] * len(docs)
+        order = list(range(len(docs)))
+        for field, _ in spec.get("sortBy", {}).items():
+            order.sort(key=lambda i: docs[i][field])
+        parts = {}
+        for i in order:
+            parts.setdefault(keys[i], []).append(i)
+        for name, op in spec["output"].items():
+            vals = self._eval(docs, op["$sum"]) if "$sum" in op else [0] * len(docs)
+            vals = [v if isinstance(v, numbers.Number) else 0 for v in vals]
+            running = op.get("window", {}).get("documents", ["unbounded", "unbounded"])[1] == "current"
+            for idx in parts.values():
+                total, acc = sum(vals[i] for i in idx), 0
+                for r, i in enumerate(idx, 1):
+                    acc += vals[i]
+                    docs[i][name] = (r if "$documentNumber" in op else len(idx) if "$count" in op
+                                     else acc if running else total)
+        return docs
+
+    def aggregate(self, pipeline, **kwargs):
+        self.calls.append("aggregate")
+        docs, segment = list(self._col.find()), []
+        for st in pipeline:
+            if "$setWindowFields" in st:
+                docs = self._window(self._run(docs, segment), st["$setWindowFields"])
+                segment = []
+            else:
+                segment.append(st)
+        return iter(self._run(docs, segment))
+
+
+def _docs(n=600, seed=5):
+    rng = np.random.default_rng(seed)
+    school = rng.integers(1, 25, n)
+    escs = rng.normal(0, 1, n)
+    out = []
+    for i in range(n):
+        d = {"SCHOOLID": int(school[i]), "ESCS": float(escs[i]),
+             "W_FSTUWT": float(np.exp(0.7 * escs[i] + rng.normal(0, 0.2))),
+             "pv_read": [float(v) for v in 420 + 35 * escs[i] + rng.normal(0, 50, 3)]}
+        if i % 5:                                   # 1 em 5 sem DISCLIMA (a escola ainda tem média)
+            d["DISCLIMA"] = float(rng.normal())
+        out.append(d)
+    return out
+
+
+@pytest.mark.parametrize("weighted", [True, False])
+def test_mongo_quartiles_match_pandas_engine(weighted):
+    col = _Windowed(_docs())
+    measures = {"READ_medio": "pv_read"}
+    got = agg.quartil_summary(col, measures=measures, weighted=weighted)
+    assert col.calls == ["aggregate", "aggregate"]            # cortes: 1 agregação, sem sort/skip
+    ref = agg.quartil_summary(col, measures=measures, weighted=weighted, engine="pandas")
+    np.testing.assert_array_equal(got["n_alunos"], ref["n_alunos"])
+    for c in ["peso_expandido", "READ_medio", "clima_escola_medio"]:
+        np.testing.assert_allclose(got[c], ref[c], rtol=1e-9)
+    assert list(got["escs_quartil"]) == list(ref["escs_quartil"])
+    share = got["peso_expandido"] / got["peso_expandido"].sum()
+    if weighted:
+        np.testing.assert_allclose(share, 0.25, atol=0.03)
+    else:
+        assert got["n_alunos"].max() - got["n_alunos"].min() <= 1
+
+
+def test_quantile_cuts_single_stage():
+    docs = _docs(200)
+    col = _Windowed(docs)
+    x = np.array([d["ESCS"] for d in docs])
+    np.testing.assert_allclose(agg.quantile_cuts(col, "ESCS", q=4), np.quantile(x, [0.25, 0.5, 0.75]))
+    stages = agg.quantile_cuts_stages("ESCS", 4, weight="W_FSTUWT")
+    assert [next(iter(s)) for s in stages] == ["$setWindowFields", "$group"]
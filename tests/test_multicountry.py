@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pandas as pd
+
+import pisa_multicountry as mc
+
+
+def _write(path, sheet):
+    df = pd.DataFrame({"CNT": ["BRA"] * 3, "CNTSCHID": [1, 2, 3], "ESCS": [0.1, -0.2, 0.3]})
+    with pd.ExcelWriter(path) as xw:
+        df.to_excel(xw, sheet_name=sheet, index=False)
+
+
+def test_parse_country_with_cnt_column_and_custom_sheet(tmp_path):
+    stu, sch = tmp_path / "STU_BRA.xlsx", tmp_path / "SCH_BRA.xlsx"
+    _write(stu, "Planilha1")
+    _write(sch, "escolas")
+    cols = {"STU": ["CNT", "CNTSCHID", "ESCS"], "SCH": ["CNTSCHID"]}
+    info = mc._parse_country("BRA", {"STU": str(stu), "SCH": (str(sch), "escolas")}, cols,
+                             str(tmp_path / "out"), "parquet")
+    assert info["error"] is None, info["error"]
+    out = pd.read_parquet(os.path.join(tmp_path / "out", info["files"]["STU"]))
+    assert list(out.columns) == ["CNT", "CNTSCHID", "ESCS"]
+    out = pd.read_parquet(os.path.join(tmp_path / "out", info["files"]["SCH"]))
+    assert list(out.columns) == ["CNT", "CNTSCHID"] and (out["CNT"] == "BRA").all()
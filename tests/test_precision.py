@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pisa_precision as prec
+
+
+def _float32_sample(n=300_000, seed=7):
+    rng = np.random.default_rng(seed)
+    x = (450 + 90 * rng.standard_normal(n)).astype(np.float32)
+    w = rng.uniform(0.1, 60.0, n).astype(np.float32)
+    return x, w
+
+
+def test_compensated_sum_and_wmean_match_float64_reference():
+    x, w = _float32_sample()
+    exact = math.fsum(x.astype(np.float64))
+    for block in (prec.BLOCK, 1000):
+        assert prec.compensated_sum(x, block) == pytest.approx(exact, rel=1e-14)
+        ref = np.average(x.astype(np.float64), weights=w.astype(np.float64))
+        assert prec.wmean(x, w, block) == pytest.approx(ref, rel=1e-12)
+    # acumular em float32 perde dígitos que o caminho compensado mantém
+    assert abs(float(np.cumsum(x)[-1]) - exact) > abs(prec.compensated_sum(x) - exact)
+    with pytest.raises(ZeroDivisionError):
+        prec.wmean(x[:3], np.zeros(3, dtype=np.float32))
+
+
+def test_float32_safe_rejects_year_and_ill_conditioned_columns():
+    rng = np.random.default_rng(1)
+    n = 2000
+    ones, z = np.ones(n), rng.standard_normal(n)
+    assert prec.float32_safe(np.column_stack([ones, z, rng.choice([0.0, 1.0], n)]))
+    year = 2018 + rng.uniform(-0.5, 0.5, n)                       # passo float32 em 2018 ≈ 1e-4
+    assert not prec.float32_safe(np.column_stack([ones, year]))
+    near = z + 1e-6 * rng.standard_normal(n)                       # quase colinear: cond ≫ 1e4
+    assert not prec.float32_safe(np.column_stack([ones, z, near]))
+
+
+def test_design_cache_float32_wls_matches_float64():
+    pytest.importorskip("statsmodels")
+    import pisa_design as design
+
+    rng = np.random.default_rng(3)
+    n = 5000
+    df = pd.DataFrame({"ESCS_c": rng.standard_normal(n), "clima": rng.standard_normal(n),
+                       "REPEAT": rng.choice([0.0, 1.0, 2.0], n), "SENWT": rng.uniform(0.5, 2, n)})
+    df["READ"] = 450 + 30 * df["ESCS_c"] - 15 * df["clima"] - 20 * df["REPEAT"] + rng.normal(0, 40, n)
+    formula = "READ ~ ESCS_c * clima + C(REPEAT)"
+
+    c64 = design.DesignCache(sparse=False)
+    c32 = design.DesignCache(sparse=False, dtype="float32")
+    r64 = design.fit_wls(formula, df, "SENWT", cache=c64)
+    r32 = design.fit_wls(formula, df, "SENWT", cache=c32)
+    assert c32.get("ESCS_c * clima + C(REPEAT)", df).matrix.dtype == np.float32
+    np.testing.assert_allclose(r32.params, r64.params, rtol=1e-5, atol=1e-4)
+    np.testing.assert_allclose(r32.bse, r64.bse, rtol=1e-4)
+
+    df["ANO"] = 2018 + rng.uniform(-0.5, 0.5, n)                  # recusado: fica em float64
+    assert c32.get("ESCS_c + ANO", df).matrix.dtype == np.float64
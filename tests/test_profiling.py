@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pandas as pd
+import pytest
+
+import profiling as prof
+
+
+@pytest.fixture
+def profiling_on():
+    was = prof.is_enabled()
+    prof.reset()
+    prof.enable()
+    yield
+    prof.reset()
+    if not was:
+        prof.disable()
+
+
+def test_disabled_stage_records_nothing():
+    was = prof.is_enabled()
+    prof.disable()
+    prof.reset()
+    try:
+        with prof.stage("nada", rows=10) as st:
+            st.rows = 5
+        assert prof.REGISTRY.to_dicts() == [] and prof.summary().empty
+    finally:
+        if was:
+            prof.enable()
+
+
+def test_stages_and_instrument_are_recorded(profiling_on, tmp_path):
+    @prof.instrument("carga.abas")
+    def carregar():
+        return {"a": pd.DataFrame({"x": range(3)}), "b": pd.DataFrame({"x": range(4)})}
+
+    carregar()
+    carregar()
+    with prof.stage("agrega", colecao="students") as st:
+        st.rows = 100
+    with pytest.raises(KeyError):
+        with prof.stage("falha"):
+            raise KeyError("x")
+
+    recs = {r["name"]: r for r in prof.REGISTRY.to_dicts()}
+    assert recs["carga.abas"]["rows"] == 7 and recs["agrega"]["meta"] == {"colecao": "students"}
+    assert recs["falha"]["meta"] == {"error": "KeyError"}
+    summ = prof.summary().set_index("stage")
+    assert summ.loc["carga.abas", "calls"] == 2 and summ.loc["carga.abas", "rows"] == 14
+
+    trace = prof.export_chrome_trace(str(tmp_path / "t.json"))
+    assert {e["name"] for e in trace["traceEvents"]} == {"carga.abas", "agrega", "falha"}
+    assert json.loads((tmp_path / "t.json").read_text(encoding="utf-8"))["traceEvents"][0]["ph"] == "X"
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+from pisa_sparse import densify, iter_documents, sparsify
+
+
+def _sheet(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "CNTSTUID": np.arange(1, n + 1),
+        "W_FSTUWT": rng.uniform(1, 3, n),
+        "ST004D01T": rng.choice([1, 2], n),
+        "SC001Q01TA": rng.choice([100, 200, 300], n),
+        "ST097Q01TA": np.where(rng.random(n) < 0.8, np.nan, rng.choice([1.0, 2.0, 3.0, 4.0], n)),
+        "LANGN": rng.choice(["por", "spa"], n),
+        "ESCS": rng.normal(size=n),
+    })
+
+
+def test_densify_restores_original_dtypes():
+    df = _sheet()
+    sdf, _ = sparsify(df)
+    assert sdf["CNTSTUID"].dtype == df["CNTSTUID"].dtype      # ids ficam intocados
+    assert sdf["W_FSTUWT"].dtype == df["W_FSTUWT"].dtype
+    for c in df.columns:
+        pd.testing.assert_series_equal(densify(sdf[c]), df[c])
+
+
+def test_documents_keep_integer_codes():
+    df = _sheet()
+    docs = list(iter_documents(sparsify(df)[0]))
+    assert len(docs) == len(df)
+    first = docs[0]
+    for c in ("CNTSTUID", "ST004D01T", "SC001Q01TA"):
+        assert type(first[c]) is int
+    assert all("ST097Q01TA" not in d for d, v in zip(docs, df["ST097Q01TA"]) if np.isnan(v))
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+smf = pytest.importorskip("statsmodels.formula.api")
+
+import pisa_design as design
+import pisa_specgrid as specgrid
+
+
+def _data(n=1500, seed=1):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "ESCS_c": rng.normal(size=n),
+        "clima": rng.normal(size=n),
+        "REPEAT": rng.choice([0.0, 1.0, 2.0], size=n, p=[0.7, 0.2, 0.1]),
+        "SENWT": rng.uniform(0.5, 2.0, n),
+        "CNTSCHID": rng.integers(1, 60, n),
+    })
+    df["READ"] = 450 + 30 * df["ESCS_c"] + 5 * df["clima"] * df["REPEAT"] + rng.normal(0, 50, n)
+    return df
+
+
+def test_interaction_without_main_effect_matches_own_formula():
+    df = _data()
+    grid = specgrid.SpecGrid(outcomes=["READ"], base=["ESCS_c"], controls=["clima", "C(REPEAT)"],
+                             interactions=["clima:C(REPEAT)"])
+    table = specgrid.run_grid(grid, df, max_workers=1, cache=design.DesignCache())
+    assert table["error"].isna().all()
+    for formula, rows in table.groupby("formula"):
+        ref = smf.wls(formula, df, weights=df["SENWT"]).fit()
+        got = rows.set_index("term")["estimate"]
+        assert list(got.index) == list(ref.params.index), formula
+        np.testing.assert_allclose(got.to_numpy(), ref.params.to_numpy(), rtol=1e-8)
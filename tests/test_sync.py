@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+import pisa_sync as sync
+
+
+def _frame(n=50):
+    return pd.DataFrame({"CNTSCHID": np.arange(1, n + 1), "CNTSTUID": np.arange(101, n + 101),
+                         "SC001": np.arange(n) % 4, "NOME": [f"e{i}" for i in range(n)]})
+
+
+def test_sheet_hash_counts_duplicate_rows():
+    df = _frame()
+    dup = pd.concat([df, df.iloc[[3, 3]]], ignore_index=True)
+    assert sync.sheet_hash(df) != sync.sheet_hash(dup)
+    assert sync.sheet_hash(df) == sync.sheet_hash(df.sample(frac=1, random_state=0))
+
+
+def test_reload_reason_detects_key_change():
+    df = _frame()
+    meta = sync.frame_signature(df, ["CNTSCHID"])
+    assert sync.reload_reason(meta, sync.frame_signature(df, ["CNTSCHID"])) is None
+    assert sync.reload_reason(meta, sync.frame_signature(df, ["CNTSTUID"])) == "chave mudou"
+    assert sync.reload_reason(meta, sync.frame_signature(df.drop(columns="NOME"), ["CNTSCHID"])) == "colunas mudaram"
+    assert sync.reload_reason(None, sync.frame_signature(df, ["CNTSCHID"])) is None
+
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    """
+    Banco mongomock. O `bulk_write` do mongomock não aceita as operações do
+    pymongo 4.9+ (argumento `sort`); aqui cada operação é aplicada uma a uma.
+    """
+    mongomock = pytest.importorskip("mongomock")
+    from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateOne
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        for op in requests:
+            if isinstance(op, InsertOne):
+                self.insert_one(op._doc)
+            elif isinstance(op, ReplaceOne):
+                self.replace_one(op._filter, op._doc, upsert=bool(op._upsert))
+            elif isinstance(op, UpdateOne):
+                self.update_one(op._filter, op._doc, upsert=bool(op._upsert))
+            elif isinstance(op, DeleteOne):
+                self.delete_one(op._filter)
+            else:
+                raise TypeError(type(op))
+
+    monkeypatch.setattr(mongomock.Collection, "bulk_write", bulk_write)
+    return mongomock.MongoClient()["pisa"]
+
+
+def _docs(col):
+    return pd.DataFrame(list(col.find({}, {"_id": 0}))).sort_values("CNTSCHID").reset_index(drop=True)
+
+
+def test_mongo_sync_roundtrip(mongo_db):
+    db = mongo_db
+    df = _frame()
+    sync.sync_mongo_collection(db, "SCH", df, key="CNTSCHID", verbose=False)
+
+    new = df.drop(index=[0, 1]).copy()
+    new.loc[5, "SC001"] = 9
+    new = pd.concat([new, pd.DataFrame({"CNTSCHID": [999], "CNTSTUID": [9999], "SC001": [1], "NOME": ["x"]})])
+    stats = sync.sync_mongo_collection(db, "SCH", new, key="CNTSCHID", verbose=False)
+    assert stats == {"inserts": 1, "updates": 1, "deletes": 2, "unchanged": len(df) - 3}
+    pd.testing.assert_frame_equal(_docs(db["SCH"]), new.sort_values("CNTSCHID").reset_index(drop=True),
+                                  check_dtype=False)
+
+    stats = sync.sync_mongo_collection(db, "SCH", new, key="CNTSTUID", verbose=False)
+    assert stats["reload"] == "chave mudou"
+    stats = sync.sync_mongo_collection(db, "SCH", new, key="CNTSTUID", verbose=False)
+    assert stats["unchanged"] == len(new)
+
+
+def test_mongo_keyless_sync_sees_duplicate_pair(mongo_db):
+    db = mongo_db
+    df = _frame()[["SC001", "NOME"]]
+    sync.sync_mongo_collection(db, "fields", df, verbose=False)
+    assert sync.sync_mongo_collection(db, "fields", df, verbose=False)["unchanged"] == len(df)
+    dup = pd.concat([df, df.iloc[[0, 0]]], ignore_index=True)
+    stats = sync.sync_mongo_collection(db, "fields", dup, verbose=False)
+    assert stats.get("reload") == "sem chave"
+    assert db["fields"].count_documents({}) == len(dup)
+
+
+class _FakeCursor:
+    """Cursor no estilo pyodbc: sair do `with` faz commit se autocommit=False."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.fast_executemany = False
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self.conn.log.append(sql)
+        if "SELECT OBJECT_ID" in sql:
+            self._rows = [(None,)]
+        elif "sys.columns" in sql:
+            self._rows = [(c, 8) for c in self.conn.columns]
+        else:
+            self._rows = []
+
+    def executemany(self, sql, rows):
+        self.conn.log.append(sql)
+        if self.conn.fail_on and self.conn.fail_on in sql:
+            raise RuntimeError("falha simulada")
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None and not self.conn.autocommit:
+            self.conn.commit()
+
+
+class _FakeConn:
+    def __init__(self, columns, fail_on=None):
+        self.autocommit = True
+        self.columns = columns
+        self.fail_on = fail_on
+        self.log = []
+
+    def cursor(self):
+        return _FakeCursor(self)
+
+    def commit(self):
+        self.log.append("COMMIT")
+
+    def rollback(self):
+        self.log.append("ROLLBACK")
+
+
+def test_mssql_sync_is_one_transaction():
+    df = _frame()
+    conn = _FakeConn(df.columns, fail_on="SCH_BRA__sync] (k, h)")
+    with pytest.raises(RuntimeError, match="falha simulada"):
+        sync.sync_mssql_table("pyodbc", conn, "db", "dbo", "SCH_BRA", df, key="CNTSCHID", verbose=False)
+    assert "COMMIT" not in conn.log and conn.log[-1] == "ROLLBACK"
+    assert any(s.startswith("INSERT INTO [dbo].[SCH_BRA]") for s in conn.log)   # desfeito pelo rollback
+    assert not any("CREATE INDEX" in s for s in conn.log)
+    assert conn.autocommit is True
+
+
+def test_mssql_first_sync_creates_indexes_after_commit():
+    df = _frame().rename(columns={"CNTSCHID": "SCHOOLID", "CNTSTUID": "STIDSTD"})   # nomes da carga SQL
+    conn = _FakeConn(df.columns)
+    stats = sync.sync_mssql_table("pyodbc", conn, "db", "dbo", "SCH_BRA", df, key="SCHOOLID", verbose=False)
+    assert stats["reload"] == "tabela nova"
+    assert conn.log.count("COMMIT") == 1
+    commit = conn.log.index("COMMIT")
+    assert any("SCH_BRA__sync] (k, h)" in s for s in conn.log[:commit])
+    idx = [i for i, s in enumerate(conn.log) if "CREATE" in s and "INDEX" in s]
+    assert idx and min(idx) > commit
+    assert conn.autocommit is True
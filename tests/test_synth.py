@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+import pisa_synth as synth
+
+
+def test_any_pv_domain():
+    cfg = synth.SynthConfig(n_students=300, n_schools=20, seed=7, pv_domains=("READ", "MATH", "GLCM"))
+    stu = synth.generate(cfg)["STU"]
+    for dom in ("READ", "MATH", "GLCM"):
+        assert all(f"PV{k}{dom}" in stu.columns for k in range(1, 11))
+    assert stu["PV1GLCM"].notna().mean() > 0.5
+    assert 250 < stu["PV1GLCM"].mean() < 550